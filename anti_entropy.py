@@ -0,0 +1,191 @@
+import bisect
+import logging
+import threading
+
+import requests
+
+from merkle import TOKEN_BITS
+
+
+class AntiEntropy:
+    """
+    Servizio di anti-entropy eseguito dal coordinatore: per ogni coppia di repliche confronta periodicamente i
+    Merkle tree dei nodi, limitandosi ai range di token che entrambe devono contenere, e trasferisce solo le
+    chiavi dei range divergenti, insieme alle loro versioni.
+    """
+    def __init__(self, hash_ring, transport, interval=30, batch_size=500):
+        """
+        Inizializza il servizio di anti-entropy.
+        :param hash_ring: ring di consistent hashing del coordinatore
+        :param transport: trasporto con pool di connessioni verso i nodi
+        :param interval: intervallo (in secondi) tra due cicli di sincronizzazione
+        :param batch_size: numero massimo di chiavi trasferite per richiesta
+        """
+        self.hash_ring = hash_ring
+        self.transport = transport
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+        self.keys_repaired = 0  # numero totale di chiavi trasferite tra repliche
+
+    def shared_ranges(self):
+        """
+        Raggruppa i range del ring per coppia (replica primaria, altra replica).
+        Confrontando ogni replica con la primaria, un ciclo basta per far convergere tutte le repliche.
+        :return: dizionario (primaria, replica) -> lista di intervalli di token [inizio, fine]
+        """
+        pairs = {}
+        for start, end, nodes in self.hash_ring.get_ranges():
+            for replica in nodes[1:]:
+                pairs.setdefault((nodes[0], replica), []).append((start, end))
+        return pairs
+
+    def fetch_hashes(self, node, indices):
+        """
+        Legge dal nodo gli hash dei nodi del Merkle tree indicati.
+        :param node: coppia indirizzo-porta del nodo
+        :param indices: indici dei nodi dell'albero
+        :return: tupla (profondità dell'albero, lista degli hash)
+        """
+        response = self.transport.post(node, "/merkle/hashes", json={"indices": indices})
+        response.raise_for_status()
+        data = response.json()
+        return data['depth'], data['hashes']
+
+    def fetch_digests(self, node, leaves, ranges):
+        """
+        Legge dal nodo i digest delle chiavi delle foglie indicate, limitati ai range condivisi.
+        :param node: coppia indirizzo-porta del nodo
+        :param leaves: indici delle foglie
+        :param ranges: lista di intervalli di token [inizio, fine]
+        :return: dizionario chiave -> digest
+        """
+        response = self.transport.post(node, "/merkle/digests", json={"leaves": leaves, "ranges": ranges})
+        response.raise_for_status()
+        return response.json()['digests']
+
+    @staticmethod
+    def candidate_leaves(ranges, depth):
+        """
+        Calcola le foglie del Merkle tree che intersecano i range indicati.
+        :param ranges: lista di intervalli di token [inizio, fine]
+        :param depth: profondità dell'albero
+        :return: lista ordinata degli indici delle foglie
+        """
+        shift = TOKEN_BITS - depth
+        leaves = set()
+        for start, end in ranges:
+            leaves.update(range(start >> shift, (end >> shift) + 1))
+        return sorted(leaves)
+
+    def divergent_leaves(self, primary, replica, ranges):
+        """
+        Scende i due Merkle tree dalla radice, visitando solo i sottoalberi che contengono foglie dei range
+        condivisi e i cui hash differiscono.
+        :param primary: replica primaria
+        :param replica: altra replica
+        :param ranges: lista di intervalli di token [inizio, fine] condivisi
+        :return: lista delle foglie divergenti
+        """
+        depth, _ = self.fetch_hashes(primary, [1])
+        candidates = self.candidate_leaves(ranges, depth)
+        num_leaves = 1 << depth
+
+        def intersects(index):
+            # Intervallo di foglie coperto dal nodo index dell'albero
+            level = index.bit_length() - 1
+            width = num_leaves >> level
+            lo = (index - (1 << level)) * width
+            pos = bisect.bisect_left(candidates, lo)
+            return pos < len(candidates) and candidates[pos] < lo + width
+
+        frontier = [1]
+        divergent = []
+        while frontier:
+            _, primary_hashes = self.fetch_hashes(primary, frontier)
+            replica_depth, replica_hashes = self.fetch_hashes(replica, frontier)
+            if replica_depth != depth:
+                raise ValueError(f"Merkle depth mismatch between {primary} ({depth}) and {replica} ({replica_depth})")
+            next_frontier = []
+            for index, primary_hash, replica_hash in zip(frontier, primary_hashes, replica_hashes):
+                if primary_hash == replica_hash:
+                    continue
+                if index >= num_leaves:
+                    divergent.append(index - num_leaves)
+                else:
+                    next_frontier.extend(child for child in (2 * index, 2 * index + 1) if intersects(child))
+            frontier = next_frontier
+        return divergent
+
+    def transfer(self, source, target, keys):
+        """
+        Copia le chiavi indicate da un nodo all'altro, a blocchi di batch_size chiavi.
+        :param source: nodo da cui leggere i valori
+        :param target: nodo su cui scriverli
+        :param keys: lista delle chiavi da copiare
+        """
+        for i in range(0, len(keys), self.batch_size):
+            chunk = keys[i:i + self.batch_size]
+            response = self.transport.post(source, "/mget", json={"keys": chunk})
+            response.raise_for_status()
+            data = response.json()
+            values = data['values']
+            if values:
+                response = self.transport.put(target, "/mput", json={"items": values, "versions": data['versions']})
+                response.raise_for_status()
+                self.keys_repaired += len(values)
+
+    def sync_pair(self, primary, replica, ranges):
+        """
+        Sincronizza una coppia di repliche sui range condivisi. Le chiavi mancanti o diverse vengono inviate in
+        entrambe le direzioni: il nodo che le riceve mantiene il valore con la versione più recente.
+        :param primary: replica primaria
+        :param replica: altra replica
+        :param ranges: lista di intervalli di token [inizio, fine] condivisi
+        :return: numero di chiavi trasferite
+        """
+        leaves = self.divergent_leaves(primary, replica, ranges)
+        if not leaves:
+            return 0
+        primary_digests = self.fetch_digests(primary, leaves, ranges)
+        replica_digests = self.fetch_digests(replica, leaves, ranges)
+        to_replica = [key for key, digest in primary_digests.items() if replica_digests.get(key) != digest]
+        to_primary = [key for key, digest in replica_digests.items() if primary_digests.get(key) != digest]
+        self.transfer(primary, replica, to_replica)
+        self.transfer(replica, primary, to_primary)
+        if to_replica or to_primary:
+            logging.info(f"Anti-entropy {primary} <-> {replica}: {len(leaves)} divergent leaves, "
+                         f"{len(to_replica)} keys pushed, {len(to_primary)} keys pulled")
+        return len(to_replica) + len(to_primary)
+
+    def run_once(self):
+        """
+        Esegue un ciclo completo di anti-entropy su tutte le coppie di repliche.
+        :return: numero di chiavi trasferite
+        """
+        repaired = 0
+        for (primary, replica), ranges in self.shared_ranges().items():
+            try:
+                repaired += self.sync_pair(primary, replica, ranges)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.error(f"Anti-entropy between {primary} and {replica} failed: {e}")
+        return repaired
+
+    def run(self):
+        """
+        Esegue i cicli di anti-entropy ogni interval secondi finché il servizio non viene fermato.
+        """
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        """
+        Avvia il servizio in un thread in background.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        """
+        Ferma il servizio.
+        """
+        self.stopped.set()
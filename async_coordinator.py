@@ -0,0 +1,935 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from urllib.parse import quote
+
+import aiohttp
+from aiohttp import web
+
+from blob import CHUNK_SIZE, CODECS, IDENTITY, ValueTooLarge, accepts
+from expiry import live_value, parse_ttl, with_ttl
+from replication import (MISSING, QUORUM, STREAM_ABORT, STREAM_QUEUE_SIZE, ConsistencyUnavailable, Replication,
+                         StreamAborted, StreamsExhausted, count_found, parse_consistency, required_replicas, split_reads)
+from write_batching import AsyncWriteBatcher
+
+
+async def limit_stream(chunks, max_size):
+    """
+    Versione asincrona di blob.limit_size.
+    :param chunks: iteratore asincrono di blocchi di byte
+    :param max_size: numero massimo di byte (0 per non limitarlo)
+    :return: generatore asincrono degli stessi blocchi
+    """
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if max_size and total > max_size:
+            raise ValueTooLarge(f"value larger than {max_size} bytes")
+        yield chunk
+
+
+async def transcode_stream(chunks, codec):
+    """
+    Comprime o decomprime uno stream asincrono; zlib e lzma rilasciano il GIL, quindi ogni blocco viene elaborato
+    nell'executor per non bloccare l'event loop.
+    :param chunks: iteratore asincrono di blocchi di byte
+    :param codec: compressore o decompressore di una delle CODECS
+    :return: generatore asincrono dei blocchi elaborati
+    """
+    loop = asyncio.get_running_loop()
+    process = codec.compress if hasattr(codec, 'compress') else codec.decompress
+    async for chunk in chunks:
+        data = await loop.run_in_executor(None, process, chunk)
+        if data:
+            yield data
+    if hasattr(codec, 'flush'):
+        data = codec.flush()
+        if data:
+            yield data
+
+
+async def prepend_stream(head, chunks):
+    """
+    Restituisce un blocco già letto seguito dal resto dello stream.
+    :param head: blocco già letto (può essere vuoto)
+    :param chunks: iteratore asincrono dei blocchi successivi
+    :return: generatore asincrono
+    """
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def iter_response(response):
+    """
+    Restituisce il corpo di una risposta aiohttp a blocchi e la rilascia alla fine.
+    :param response: risposta aperta
+    :return: generatore asincrono dei blocchi
+    """
+    try:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.release()
+
+
+class AsyncReplication:
+    """
+    Versione asincrona della replicazione: le richieste verso le repliche sono coroutine che condividono
+    un'unica sessione aiohttp con connessioni keep-alive.
+    """
+    def __init__(self, replication, max_connections_per_node=10, rpc_timeout=5.0, clock=None):
+        """
+        Inizializza la replicazione asincrona.
+        :param replication: istanza di Replication da cui leggere i quorum correnti
+        :param max_connections_per_node: numero massimo di connessioni aperte verso ciascun nodo
+        :param rpc_timeout: timeout (in secondi) di ogni richiesta verso un nodo
+        :param clock: orologio in secondi con cui misurare le richieste e pianificare le hedged read
+                      (default: time.perf_counter), sostituibile con il tempo virtuale di una simulazione
+        """
+        self.clock = clock or time.perf_counter
+        self.replication = replication  # i quorum restano condivisi con la modalità sincrona (update_quorum)
+        self.metrics = replication.metrics
+        self.selector = replication.selector
+        self.max_connections_per_node = max_connections_per_node
+        self.rpc_timeout = rpc_timeout
+        self.timeout = aiohttp.ClientTimeout(total=rpc_timeout)
+        # I blob possono richiedere più di rpc_timeout in totale: il timeout si applica a ogni lettura dal socket
+        self.stream_timeout = aiohttp.ClientTimeout(sock_connect=rpc_timeout, sock_read=rpc_timeout)
+        self.session = None
+        self.background = set()  # scritture ancora in corso dopo il raggiungimento del quorum
+        self.streams = 0  # upload di blob in corso, al massimo replication.max_streams
+        self.batcher = AsyncWriteBatcher(self.write_many_to_node, max_batch=replication.write_batch_size,
+                                         max_delay=replication.write_batch_delay,
+                                         metrics=self.metrics) if replication.write_batch_size > 0 else None
+
+    async def open(self):
+        """
+        Apre la sessione HTTP condivisa; va chiamato all'interno dell'event loop.
+        """
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.max_connections_per_node)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        """
+        Attende le scritture in background e chiude la sessione HTTP.
+        """
+        if self.batcher is not None:
+            await self.batcher.close()
+        if self.background:
+            await asyncio.gather(*self.background, return_exceptions=True)
+        await self.session.close()
+
+    async def _quorum(self, coroutines, quorum, accept):
+        """
+        Esegue le coroutine in parallelo e restituisce i risultati validi appena se ne ottengono quorum.
+        Le coroutine non ancora terminate proseguono in background.
+        :param coroutines: coroutine da eseguire
+        :param quorum: numero di risultati validi necessari
+        :param accept: funzione che indica se un risultato è valido
+        :return: lista dei risultati validi ricevuti
+        """
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        results = []
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            if accept(result):
+                results.append(result)
+            if len(results) >= quorum:
+                break
+        for task in tasks:
+            if not task.done():
+                self.background.add(task)
+                task.add_done_callback(self.background.discard)
+        return results
+
+    async def write_to_node(self, node, key, value, version=0):
+        """
+        Scrive il valore di una chiave su un nodo.
+        :param node: coppia indirizzo-porta del nodo su cui scrivere il valore
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param version: versione del valore
+        :return: True se la scrittura ha avuto successo, False altrimenti
+        """
+        began = self.clock()
+        failed = False
+        self.selector.begin(node)
+        try:
+            async with self.session.put(f"http://{node}/put", json={"key": key, "value": value, "version": version}) as response:
+                response.raise_for_status()
+            self.metrics.observe('rpc.put', self.clock() - began)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failed = True
+            self.metrics.incr('rpc.put.errors')
+            logging.error(f"Failed to write to node {node}: {e}")
+            if self.replication.hints is not None:
+                self.replication.hints.add(node, key, value, version)
+            return False
+        finally:
+            self.selector.end(node, self.clock() - began, read=False, failed=failed)
+
+    async def replicate_write(self, key, value, nodes, version=0, level=None, with_acks=False, pending=0):
+        """
+        Replica il valore di una chiave su più nodi; le scritture oltre il livello di consistenza proseguono in
+        background.
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param nodes: lista di coppie indirizzo-porta dei nodi su cui replicare il valore
+        :param version: versione del valore
+        :param level: livello di consistenza (vedi parse_consistency), None per quorum_write
+        :param with_acks: se True restituisce la tupla (esito, repliche che hanno confermato)
+        :param pending: numero di nuovi proprietari in nodes durante un ribilanciamento (vedi required_replicas)
+        :return: True se il livello di consistenza è stato raggiunto, False altrimenti
+        """
+        required = required_replicas(level, self.replication.quorum_write, len(nodes), self.replication.replication_factor,
+                                     pending)
+        began = self.clock()
+        write = self.batcher.write if self.batcher is not None else self.write_to_node
+        results = await self._quorum((write(node, key, value, version) for node in nodes), required, bool)
+        self.metrics.observe('quorum.write', self.clock() - began)
+        success = len(results) >= required
+        return (success, len(results)) if with_acks else success
+
+    async def read_from_node(self, node, key, digest=False):
+        """
+        Legge il valore di una chiave da un nodo, oppure solo la sua versione.
+        :param node: coppia indirizzo-porta del nodo da cui leggere il valore
+        :param key: chiave da leggere
+        :param digest: se True il nodo restituisce solo la versione
+        :return: tupla (valore, versione), (None, MISSING) se il nodo non ha la chiave, None in caso di errore
+        """
+        params = {"key": key, "digest": 1} if digest else {"key": key}
+        name = 'rpc.digest' if digest else 'rpc.get'
+        began = self.clock()
+        failed = False
+        self.selector.begin(node)
+        try:
+            async with self.session.get(f"http://{node}/get", params=params) as response:
+                if response.status == 404:
+                    record = None, MISSING
+                else:
+                    response.raise_for_status()
+                    data = await response.json()
+                    record = data.get('value'), data['version']
+            self.metrics.observe(name, self.clock() - began)
+            return record
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failed = True
+            self.metrics.incr(f"{name}.errors")
+            logging.error(f"Failed to read from node {node}: {e}")
+            return None
+        finally:
+            self.selector.end(node, self.clock() - began, failed=failed)
+
+    async def get_from_replicas(self, key, nodes, with_version=False, level=None, with_acks=False):
+        """
+        Legge il valore di una chiave con read_quorum.
+        :param key: chiave da leggere
+        :param nodes: lista di coppie indirizzo-porta dei nodi da cui leggere il valore
+        :param with_version: se True restituisce la tupla (valore, versione)
+        :param level: livello di consistenza (vedi parse_consistency), None per quorum_read
+        :param with_acks: se True restituisce la tupla (risultato, repliche che hanno restituito la chiave)
+        :return: valore della chiave, None se nessuna replica la restituisce
+        :raises ConsistencyUnavailable: se il livello di consistenza non può essere raggiunto
+        """
+        required = required_replicas(level, self.replication.quorum_read, len(nodes), self.replication.replication_factor)
+        if required > len(nodes):
+            raise ConsistencyUnavailable(f"consistency level {level or QUORUM} needs {required} replicas, "
+                                         f"{len(nodes)} online", 0)
+        record, found = await self.read_quorum(key, nodes, required)
+        if record is None and found:
+            raise ConsistencyUnavailable(f"key found on {found} replicas, consistency level {level or QUORUM} "
+                                         f"needs {required}", found)
+        result = record if with_version or record is None else record[0]
+        return (result, found) if with_acks else result
+
+    async def read_quorum(self, key, nodes, quorum):
+        """
+        Legge il valore di una chiave dalle quorum repliche migliori secondo il ReplicaSelector: valore
+        completo dalla prima, solo la versione dalle altre. Una replica che fallisce o non ha la chiave viene
+        sostituita dalla successiva e una risposta più lenta del ritardo delle hedged read viene duplicata.
+        Le repliche non aggiornate vengono riparate in background dalla coda di read repair.
+        :param key: chiave da leggere
+        :param nodes: lista di coppie indirizzo-porta dei nodi da cui leggere il valore
+        :param quorum: numero di repliche che devono restituire la chiave
+        :return: tupla ((valore, versione), repliche che hanno restituito la chiave); il record è None se le
+                 repliche che hanno la chiave sono meno di quorum
+        """
+        if not nodes:
+            return None, 0
+
+        began = self.clock()
+        ranked = self.selector.rank(nodes)
+        spare = iter(ranked[quorum:])
+        pending = {}  # task -> (nodo, solo versione)
+
+        def send(node, digest):
+            if node is None:
+                return None
+            task = asyncio.ensure_future(self.read_from_node(node, key, digest))
+            pending[task] = (node, digest)
+            return task
+
+        for i, node in enumerate(ranked[:quorum]):
+            send(node, i > 0)
+        versions = {}
+        record = None
+        hedge = None
+        delay = self.selector.hedge_delay()
+        hedge_at = began + delay if delay is not None else None
+        while pending and not (record is not None and count_found(versions) >= quorum):
+            timeout = max(hedge_at - self.clock(), 0) if hedge is None and hedge_at is not None else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedge = send(next(spare, None), record is not None) or False
+                if hedge:
+                    self.metrics.incr('hedge.fired')
+                continue
+            for task in done:
+                node, digest = pending.pop(task)
+                result = task.result()
+                if result is not None:
+                    versions[node] = result[1]
+                    if not digest and result[1] != MISSING:
+                        record = result
+                if result is None or result[1] == MISSING:
+                    send(next(spare, None), digest)
+        if hedge:
+            won = hedge.done() and any(task is not hedge for task in pending)
+            self.selector.record_hedge(won)
+            if won:
+                self.metrics.incr('hedge.won')
+        for task in pending:
+            # Le letture ancora in corso proseguono in background e aggiornano le statistiche delle repliche
+            self.background.add(task)
+            task.add_done_callback(self.background.discard)
+        self.metrics.observe('quorum.read', self.clock() - began)
+        found = count_found(versions)
+        if found < quorum:
+            return None, found
+
+        latest_node = max(versions, key=versions.get)
+        if record is None or record[1] < versions[latest_node]:
+            self.metrics.incr('read.refetch')
+            record = await self.read_from_node(latest_node, key)
+            if record is None or record[1] == MISSING:
+                return None, found
+        value, version = record
+        stale = [node for node, node_version in versions.items() if node_version < version]
+        if stale:
+            self.replication.read_repair.submit(key, value, version, stale)
+        return (value, version), found
+
+    async def has_value(self, node, key):
+        """
+        Verifica se il nodo ha il valore specificato.
+        :param node: nodo su cui verificare la chiave
+        :param key: chiave da verificare
+        :return: True se il nodo ha il valore, False altrimenti
+        """
+        result = await self.read_from_node(node, key, digest=True)
+        return result is not None and result[1] != MISSING
+
+    async def write_many_to_node(self, node, items, versions=None):
+        """
+        Scrive più coppie chiave-valore su un nodo con una sola richiesta.
+        :param node: coppia indirizzo-porta del nodo
+        :param items: dizionario chiave-valore da scrivere
+        :param versions: dizionario chiave-versione
+        :return: True se la scrittura ha avuto successo, False altrimenti
+        """
+        began = self.clock()
+        try:
+            async with self.session.put(f"http://{node}/mput", json={"items": items, "versions": versions or {}}) as response:
+                response.raise_for_status()
+            self.metrics.observe('rpc.mput', self.clock() - began)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.incr('rpc.mput.errors')
+            logging.error(f"Failed to write {len(items)} keys to node {node}: {e}")
+            self.replication.add_hints(node, items, versions)
+            return False
+
+    async def replicate_write_many(self, items, key_nodes, versions=None, pending=None):
+        """
+        Replica più chiavi con una richiesta bulk per nodo e applica il quorum di scrittura a ogni chiave.
+        :param items: dizionario chiave-valore da scrivere
+        :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+        :param versions: dizionario chiave-versione
+        :param pending: dizionario chiave -> numero di nuovi proprietari tra i suoi nodi durante un ribilanciamento
+        :return: dizionario che mappa ogni chiave a True se il quorum di scrittura è stato raggiunto
+        """
+        versions = versions or {}
+        pending = pending or {}
+        began = self.clock()
+        node_keys = Replication.group_by_node(key_nodes)
+        nodes = list(node_keys)
+        results = await asyncio.gather(*(
+            self.write_many_to_node(node, {key: items[key] for key in node_keys[node]},
+                                    {key: versions[key] for key in node_keys[node] if key in versions})
+            for node in nodes
+        ))
+        success_count = {key: 0 for key in items}
+        for node, ok in zip(nodes, results):
+            if ok:
+                for key in node_keys[node]:
+                    success_count[key] += 1
+        self.metrics.observe('quorum.write_many', self.clock() - began)
+        return {key: count >= self.replication.quorum_write + pending.get(key, 0) for key, count in success_count.items()}
+
+    async def stream_to_node(self, node, key, chunks, version, encoding=IDENTITY):
+        """
+        Scrive un blob su un nodo inviandone il contenuto a blocchi.
+        :param node: coppia indirizzo-porta del nodo
+        :param key: chiave da scrivere
+        :param chunks: iteratore asincrono dei blocchi del blob, già codificati con encoding
+        :param version: versione del valore
+        :param encoding: codifica del contenuto
+        :return: True se la scrittura ha avuto successo, False altrimenti
+        """
+        headers = {"X-Version": str(version)}
+        if encoding != IDENTITY:
+            headers["Content-Encoding"] = encoding
+        began = self.clock()
+        try:
+            async with self.session.put(f"http://{node}/blob/{quote(key, safe='')}", data=chunks, headers=headers,
+                                        timeout=self.stream_timeout) as response:
+                response.raise_for_status()
+            self.metrics.observe('rpc.put_blob', self.clock() - began)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError, StreamAborted) as e:
+            self.metrics.incr('rpc.put_blob.errors')
+            logging.error(f"Failed to stream blob {key} to node {node}: {e}")
+            return False
+
+    async def _feed(self, feed):
+        """
+        Restituisce i blocchi accodati per una replica fino alla fine dello stream.
+        :param feed: coda dei blocchi della replica
+        :return: generatore asincrono dei blocchi
+        """
+        while True:
+            try:
+                chunk = await asyncio.wait_for(feed.get(), self.rpc_timeout)
+            except asyncio.TimeoutError:
+                raise StreamAborted("timed out waiting for the next chunk")
+            if chunk is None:
+                return
+            if chunk is STREAM_ABORT:
+                raise StreamAborted("write aborted")
+            yield chunk
+
+    async def _offer(self, feed, chunk):
+        """
+        Accoda un blocco per una replica, attendendo al massimo il timeout delle RPC.
+        :param feed: coda dei blocchi della replica
+        :param chunk: blocco da accodare (None per la fine dello stream)
+        :return: True se il blocco è stato accodato, False se la replica non sta leggendo
+        """
+        try:
+            await asyncio.wait_for(feed.put(chunk), self.rpc_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @staticmethod
+    def _abort(feed):
+        """
+        Interrompe lo stream di una replica, svuotando la coda se necessario.
+        :param feed: coda dei blocchi della replica
+        """
+        while feed.full():
+            feed.get_nowait()
+        feed.put_nowait(STREAM_ABORT)
+
+    async def replicate_stream(self, key, chunks, nodes, version, encoding=IDENTITY, pending=0):
+        """
+        Replica un blob inoltrando ogni blocco a tutte le repliche appena viene letto, come Replication.replicate_stream.
+        :param key: chiave da scrivere
+        :param chunks: iteratore asincrono dei blocchi del blob; le sue eccezioni interrompono tutte le scritture
+        :param nodes: lista dei nodi responsabili
+        :param version: versione del valore
+        :param encoding: codifica del contenuto
+        :param pending: numero di nuovi proprietari in nodes durante un ribilanciamento (vedi required_replicas)
+        :return: True se almeno quorum_write scritture hanno avuto successo, False altrimenti
+        :raises StreamsExhausted: se replication.max_streams upload sono già in corso: ogni upload tiene occupata una
+                                  connessione per replica, tolta alle altre richieste
+        """
+        if self.streams >= self.replication.max_streams:
+            self.metrics.incr('blob.rejected')
+            raise StreamsExhausted(f"{self.replication.max_streams} blob uploads already in progress")
+        quorum = self.replication.quorum_write + pending
+        began = self.clock()
+        feeds = {node: asyncio.Queue(maxsize=STREAM_QUEUE_SIZE) for node in nodes}
+        tasks = {node: asyncio.ensure_future(self.stream_to_node(node, key, self._feed(feed), version, encoding))
+                 for node, feed in feeds.items()}
+        # L'upload resta conteggiato finché terminano tutti gli stream, anche quelli ancora in corso dopo il quorum
+        self.streams += 1
+        remaining = [len(tasks)]
+
+        def release(_):
+            remaining[0] -= 1
+            if not remaining[0]:
+                self.streams -= 1
+
+        if not tasks:
+            self.streams -= 1
+        for task in tasks.values():
+            task.add_done_callback(release)
+        try:
+            async for chunk in chunks:
+                for node, feed in list(feeds.items()):
+                    if tasks[node].done() or not await self._offer(feed, chunk):
+                        self._abort(feed)
+                        del feeds[node]
+        except BaseException:
+            for feed in feeds.values():
+                self._abort(feed)
+            raise
+        for feed in feeds.values():
+            await self._offer(feed, None)
+        results = await self._quorum(tasks.values(), quorum, bool)
+        self.metrics.observe('quorum.write_blob', self.clock() - began)
+        return len(results) >= quorum
+
+    async def newest_replica(self, key, nodes):
+        """
+        Individua la replica con la versione più recente di una chiave leggendo solo le versioni.
+        :param key: chiave da leggere
+        :param nodes: lista dei nodi responsabili
+        :return: tupla (nodo, versione), (None, MISSING) se la chiave non esiste, None se il quorum non è stato raggiunto
+        """
+        async def read_version(node):
+            return node, await self.read_from_node(node, key, digest=True)
+
+        quorum = self.replication.quorum_read
+        began = self.clock()
+        results = await self._quorum((read_version(node) for node in self.selector.rank(nodes)), quorum,
+                                     lambda result: result[1] is not None)
+        self.metrics.observe('quorum.read_blob', self.clock() - began)
+        if len(results) < quorum:
+            return None
+        node, (_, version) = max(results, key=lambda result: result[1][1])
+        return (node, version) if version != MISSING else (None, MISSING)
+
+    async def stream_from_node(self, node, key):
+        """
+        Apre la lettura in streaming di un blob da un nodo, senza decomprimerlo.
+        :param node: coppia indirizzo-porta del nodo
+        :param key: chiave da leggere
+        :return: risposta aperta (da rilasciare dopo l'uso), None se il nodo non è raggiungibile
+        """
+        try:
+            return await self.session.get(f"http://{node}/blob/{quote(key, safe='')}", auto_decompress=False,
+                                          timeout=self.stream_timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.incr('rpc.get_blob.errors')
+            logging.error(f"Failed to read blob {key} from node {node}: {e}")
+            return None
+
+    async def read_many_from_node(self, node, keys, digest_keys=()):
+        """
+        Legge i valori di più chiavi da un nodo con una sola richiesta.
+        :param node: coppia indirizzo-porta del nodo
+        :param keys: lista delle chiavi da leggere per intero
+        :param digest_keys: lista delle chiavi di cui leggere solo la versione
+        :return: tupla (chiave -> valore, chiave -> versione), None se la lettura ha avuto esito negativo
+        """
+        began = self.clock()
+        try:
+            async with self.session.post(f"http://{node}/mget", json={"keys": keys, "digest_keys": list(digest_keys)}) as response:
+                response.raise_for_status()
+                data = await response.json()
+            self.metrics.observe('rpc.mget', self.clock() - began)
+            return data['values'], data['versions']
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.incr('rpc.mget.errors')
+            logging.error(f"Failed to read {len(keys) + len(digest_keys)} keys from node {node}: {e}")
+            return None
+
+    async def _read_many(self, full, digest=None):
+        """
+        Esegue in parallelo le letture bulk verso più nodi.
+        :param full: dizionario nodo -> chiavi da leggere per intero
+        :param digest: dizionario nodo -> chiavi di cui leggere solo la versione
+        :return: dizionario nodo -> risposta di read_many_from_node
+        """
+        digest = digest or {}
+        nodes = list(set(full) | set(digest))
+        results = await asyncio.gather(*(self.read_many_from_node(node, full.get(node, []), digest.get(node, [])) for node in nodes))
+        return dict(zip(nodes, results))
+
+    async def get_many_from_replicas(self, key_nodes):
+        """
+        Legge più chiavi con una richiesta bulk per nodo e applica quorum e versioni a ogni chiave.
+        :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+        :return: dizionario che mappa ogni chiave al suo valore, o a None se il quorum non è stato raggiunto
+        """
+        began = self.clock()
+        full, digest = split_reads(key_nodes)
+        versions, records, refetch = self.replication.collect_many(key_nodes, await self._read_many(full, digest))
+        self.metrics.observe('quorum.read_many', self.clock() - began)
+        return self.replication.finish_many(versions, records, await self._read_many(refetch) if refetch else {})
+
+
+class AsyncCoordinator:
+    """
+    Modalità di servizio asincrona del coordinatore: gli handler HTTP e le richieste alle repliche sono coroutine
+    eseguite su un unico event loop. L'interfaccia HTTP/JSON è la stessa della modalità a thread.
+    """
+    def __init__(self, coordinator, max_connections_per_node=10, rpc_timeout=5.0, access_log=False, clock=None):
+        """
+        Inizializza la modalità asincrona a partire da un coordinatore esistente.
+        :param coordinator: istanza di Coordinator di cui riutilizzare ring, fattore di replica e quorum
+        :param max_connections_per_node: numero massimo di connessioni aperte verso ciascun nodo
+        :param rpc_timeout: timeout (in secondi) di ogni richiesta verso un nodo
+        :param access_log: se True registra nel log ogni richiesta HTTP
+        :param clock: orologio delle richieste alle repliche (vedi AsyncReplication)
+        """
+        self.coordinator = coordinator
+        self.access_log = access_log
+        self.replication = AsyncReplication(coordinator.replication, max_connections_per_node, rpc_timeout, clock)
+
+    def responsible_nodes(self, key):
+        """
+        Restituisce i nodi responsabili della chiave (lookup in memoria, non bloccante).
+        :param key: chiave di cui trovare i nodi
+        :return: lista dei nodi responsabili
+        """
+        return self.coordinator.read_nodes(key)
+
+    async def put(self, key, value, ttl=None, level=None, with_acks=False):
+        """
+        Scrive il valore della chiave su più nodi.
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param ttl: durata in secondi dopo la quale la chiave scade (None per nessuna scadenza)
+        :param level: livello di consistenza della scrittura (vedi parse_consistency), None per quorum_write
+        :param with_acks: se True restituisce la tupla (esito, repliche che hanno confermato)
+        :return: True se il livello di consistenza è stato raggiunto, False altrimenti
+        """
+        self.coordinator.hot_keys.add(key)
+        if ttl:
+            value = with_ttl(value, ttl)
+        version = self.coordinator.clock.now()
+        self.coordinator.hint_offline_owners({key: value}, {key: version})
+        nodes, pending = self.coordinator.write_nodes(key)
+        success, acks = await self.replication.replicate_write(key, value, nodes, version, level, with_acks=True,
+                                                               pending=pending)
+        self.coordinator.update_cache({key: value}, {key: version}, {key: success})
+        return (success, acks) if with_acks else success
+
+    async def get(self, key, use_cache=True, level=None, with_acks=False):
+        """
+        Legge il valore della chiave da più nodi e restituisce la prima risposta valida ricevuta.
+        :param key: chiave da leggere
+        :param use_cache: se False la chiave viene letta dalle repliche anche se è in cache
+        :param level: livello di consistenza della lettura (vedi parse_consistency), None per quorum_read
+        :param with_acks: se True restituisce la tupla (valore, repliche che hanno restituito la chiave), come
+                          Coordinator.get
+        :return: valore della chiave, None se nessuna replica la restituisce
+        :raises ConsistencyUnavailable: se il livello di consistenza non può essere raggiunto
+        """
+        self.coordinator.hot_keys.add(key)
+        cache = self.coordinator.cache
+        if cache is not None and use_cache and level is None:
+            value = cache.get(key)
+            if value is not None:
+                value = live_value(value)
+                if value is not None:
+                    return (value, None) if with_acks else value
+                cache.invalidate(key)  # scaduta mentre era in cache
+        record, found = await self.replication.get_from_replicas(key, self.responsible_nodes(key), with_version=True,
+                                                                 level=level, with_acks=True)
+        if cache is not None and level in (None, QUORUM):
+            self.coordinator.fill_cache(key, record)
+        value = live_value(record[0]) if record is not None else None
+        return (value, found) if with_acks else value
+
+    async def mput(self, items):
+        """
+        Scrive più chiavi raggruppandole per nodo responsabile.
+        :param items: dizionario chiave-valore da scrivere
+        :return: dizionario che mappa ogni chiave a True se il quorum di scrittura è stato raggiunto
+        """
+        for key in items:
+            self.coordinator.hot_keys.add(key)
+        targets = {key: self.coordinator.write_nodes(key) for key in items}
+        key_nodes = {key: nodes for key, (nodes, _) in targets.items()}
+        versions = {key: self.coordinator.clock.now() for key in items}
+        self.coordinator.hint_offline_owners(items, versions)
+        results = await self.replication.replicate_write_many(items, key_nodes, versions,
+                                                              {key: pending for key, (_, pending) in targets.items()})
+        self.coordinator.update_cache(items, versions, results)
+        return results
+
+    async def mget(self, keys):
+        """
+        Legge più chiavi raggruppandole per nodo responsabile.
+        :param keys: lista delle chiavi da leggere
+        :return: dizionario che mappa ogni chiave al suo valore, o a None se il quorum non è stato raggiunto
+        """
+        for key in keys:
+            self.coordinator.hot_keys.add(key)
+        key_nodes = {key: self.responsible_nodes(key) for key in keys}
+        values = await self.replication.get_many_from_replicas(key_nodes)
+        return {key: live_value(value) for key, value in values.items()}
+
+    async def put_blob(self, key, chunks, encoding=IDENTITY):
+        """
+        Scrive un blob su più nodi in streaming, comprimendolo come Coordinator.put_blob.
+        :param key: chiave da scrivere
+        :param chunks: iteratore asincrono dei blocchi del corpo della richiesta
+        :param encoding: codifica con cui il client ha inviato il corpo
+        :return: True se almeno quorum_write scritture hanno avuto successo, False altrimenti
+        :raises ValueTooLarge: se il corpo supera max_value_size
+        :raises StreamsExhausted: se max_blob_streams upload sono già in corso
+        """
+        coordinator = self.coordinator
+        coordinator.hot_keys.add(key)
+        chunks = limit_stream(chunks, coordinator.max_value_size)
+        if encoding == IDENTITY and coordinator.compression != IDENTITY:
+            head = bytearray()
+            async for chunk in chunks:
+                head += chunk
+                if len(head) >= coordinator.compression_threshold:
+                    break
+            compressible = len(head) >= coordinator.compression_threshold
+            chunks = prepend_stream(bytes(head), chunks)
+            if compressible:
+                encoding = coordinator.compression
+                chunks = transcode_stream(chunks, CODECS[encoding][0]())
+        version = coordinator.clock.now()
+        nodes, pending = coordinator.write_nodes(key)
+        success = await self.replication.replicate_stream(key, chunks, nodes, version, encoding, pending)
+        if coordinator.cache is not None:
+            coordinator.cache.invalidate(key)
+        return success
+
+    async def get_blob(self, key, accept_encoding=None):
+        """
+        Legge un blob dalla replica più recente tra quorum_read repliche, come Coordinator.get_blob.
+        :param key: chiave da leggere
+        :param accept_encoding: header Accept-Encoding del client
+        :return: tupla (stato HTTP, header, generatore asincrono dei blocchi); i blocchi sono None in caso di errore
+        """
+        self.coordinator.hot_keys.add(key)
+        located = await self.replication.newest_replica(key, self.responsible_nodes(key))
+        if located is None:
+            return 503, {}, None
+        node, version = located
+        if node is None:
+            return 404, {}, None
+        response = await self.replication.stream_from_node(node, key)
+        if response is None:
+            return 503, {}, None
+        if response.status != 200:
+            response.release()
+            return response.status, {}, None
+        encoding = response.headers.get('Content-Encoding', IDENTITY)
+        headers = {"X-Version": str(version)}
+        chunks = iter_response(response)
+        if accepts(accept_encoding, encoding):
+            headers["Content-Length"] = response.headers['Content-Length']
+            if encoding != IDENTITY:
+                headers["Content-Encoding"] = encoding
+        else:
+            chunks = transcode_stream(chunks, CODECS[encoding][1]())
+        return 200, headers, chunks
+
+    def create_app(self):
+        """
+        Crea l'applicazione aiohttp con gli stessi endpoint della modalità a thread.
+        :return: applicazione aiohttp
+        """
+        metrics = self.coordinator.metrics
+
+        # Misura il tempo di gestione di ogni richiesta, per endpoint
+        @web.middleware
+        async def timing(request, handler):
+            began = time.perf_counter()
+            response = await handler(request)
+            metrics.observe(f"request.{handler.__name__}", time.perf_counter() - began)
+            metrics.incr(f"responses.{response.status // 100}xx")
+            return response
+
+        app = web.Application(middlewares=[timing])
+
+        # Endpoint per PUT (scrittura)
+        async def put(request):
+            data = await request.json()
+            try:
+                level = parse_consistency(data.get('consistency'), self.coordinator.replication_factor)
+                ttl = parse_ttl(data.get('ttl'))
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+            success, acks = await self.put(request.match_info['key'], data['value'], ttl, level, with_acks=True)
+            consistency = {"level": level or QUORUM, "achieved": acks}
+            if success:
+                return web.json_response({"status": "success", "consistency": consistency})
+            return web.json_response({"status": "failure", "consistency": consistency}, status=500)
+
+        # Endpoint per GET (lettura)
+        async def get(request):
+            try:
+                level = parse_consistency(request.query.get('consistency'), self.coordinator.replication_factor)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+            try:
+                value, acks = await self.get(request.match_info['key'], use_cache=request.query.get('fresh') != '1',
+                                             level=level, with_acks=True)
+            except ConsistencyUnavailable as e:
+                return web.json_response({"value": None, "error": str(e),
+                                          "consistency": {"level": level or QUORUM, "achieved": e.achieved}},
+                                         status=503)
+            consistency = {"level": level or QUORUM, "achieved": acks}
+            if value is not None:
+                return web.json_response({"value": value, "consistency": consistency})
+            return web.json_response({"value": None, "consistency": consistency}, status=404)
+
+        # Endpoint per scrivere un blob: il corpo viene inoltrato alle repliche a blocchi
+        async def put_blob(request):
+            encoding = request.headers.get('Content-Encoding', IDENTITY)
+            if encoding != IDENTITY and encoding not in CODECS:
+                return web.json_response({"error": f"Unsupported encoding {encoding}"}, status=415)
+            max_value_size = self.coordinator.max_value_size
+            if max_value_size and (request.content_length or 0) > max_value_size:
+                return web.json_response({"error": "Value too large"}, status=413)
+            try:
+                success = await self.put_blob(request.match_info['key'], request.content.iter_chunked(CHUNK_SIZE), encoding)
+            except ValueTooLarge as e:
+                return web.json_response({"error": str(e)}, status=413)
+            except StreamsExhausted as e:
+                return web.json_response({"error": str(e)}, status=503)
+            if success:
+                return web.json_response({"status": "success"})
+            return web.json_response({"status": "failure"}, status=500)
+
+        # Endpoint per leggere un blob in streaming
+        async def get_blob(request):
+            status, headers, chunks = await self.get_blob(request.match_info['key'], request.headers.get('Accept-Encoding'))
+            if chunks is None:
+                return web.json_response({"value": None}, status=status)
+            response = web.StreamResponse(headers={**headers, "Content-Type": "application/octet-stream"})
+            await response.prepare(request)
+            async for chunk in chunks:
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+
+        # Endpoint per MPUT (scrittura di più chiavi)
+        async def mput(request):
+            results = await self.mput((await request.json())['items'])
+            return web.json_response({
+                "status": "success" if all(results.values()) else "failure",
+                "results": {key: "success" if ok else "failure" for key, ok in results.items()},
+            })
+
+        # Endpoint per MGET (lettura di più chiavi)
+        async def mget(request):
+            return web.json_response({"values": await self.mget((await request.json())['keys'])})
+
+        # Endpoint per la scansione ordinata delle chiavi, in streaming come JSON lines. Il generatore del
+        # coordinatore fa richieste bloccanti: viene consumato nell'executor a blocchi di righe
+        async def scan(request):
+            try:
+                after = self.coordinator.decode_cursor(request.query.get('cursor'))
+                limit = int(request.query.get('limit', 1000))
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+            lines = self.coordinator.scan_page(request.query.get('start'), request.query.get('end'),
+                                               request.query.get('prefix'), after, limit)
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            loop = asyncio.get_running_loop()
+            while True:
+                chunk = await loop.run_in_executor(None, lambda: list(itertools.islice(lines, 500)))
+                if not chunk:
+                    break
+                await response.write(''.join(json.dumps(line) + '\n' for line in chunk).encode())
+            await response.write_eof()
+            return response
+
+        # Endpoint per notificare un nodo offline
+        async def node_offline(request):
+            node_id = (await request.json())['node']
+            self.coordinator.remove_node(node_id)
+            return web.json_response({"status": "node removed"})
+
+        # Endpoint per notificare un nodo tornato online; il rinvio degli hint è bloccante e va in un thread
+        async def node_online(request):
+            node_id = (await request.json())['node']
+            asyncio.get_running_loop().run_in_executor(None, self.coordinator.restore_node_with_retry, node_id)
+            return web.json_response({"status": "node restore started"})
+
+        # Endpoint di gestione della membership: il trasferimento dei dati avviene nel thread del coordinatore
+        async def add_node(request):
+            data = await request.json()
+            if self.coordinator.join_node(data['node'], data.get('weight', 1.0)):
+                return web.json_response({"status": "rebalance started"}, status=202)
+            return web.json_response({"status": "failure"}, status=409)
+
+        async def decommission_node(request):
+            if self.coordinator.decommission_node((await request.json())['node']):
+                return web.json_response({"status": "rebalance started"}, status=202)
+            return web.json_response({"status": "failure"}, status=409)
+
+        async def topology(request):
+            if request.query.get('epoch') == str(self.coordinator.epoch):
+                return web.json_response({"epoch": self.coordinator.epoch})
+            return web.json_response(self.coordinator.get_topology())
+
+        async def cache_invalidate(request):
+            self.coordinator.invalidate_cache((await request.json())['versions'])
+            return web.json_response({"status": "success"})
+
+        async def cache_stats(request):
+            cache = self.coordinator.cache
+            return web.json_response(cache.stats() if cache is not None else {})
+
+        async def get_metrics(request):
+            return web.json_response(self.coordinator.get_metrics(request.query.get('buckets') == '1'))
+
+        async def rebalance_status(request):
+            return web.json_response(self.coordinator.get_rebalance_status())
+
+        async def on_startup(_app):
+            await self.replication.open()
+
+        async def on_cleanup(_app):
+            await self.replication.close()
+
+        app.router.add_put('/put/{key}', put)
+        app.router.add_get('/get/{key}', get)
+        app.router.add_put('/blob/{key}', put_blob)
+        app.router.add_get('/blob/{key}', get_blob)
+        app.router.add_put('/mput', mput)
+        app.router.add_post('/mget', mget)
+        app.router.add_get('/scan', scan)
+        app.router.add_post('/node_offline', node_offline)
+        app.router.add_post('/node_online', node_online)
+        app.router.add_post('/add_node', add_node)
+        app.router.add_post('/decommission_node', decommission_node)
+        app.router.add_get('/rebalance_status', rebalance_status)
+        app.router.add_post('/cache_invalidate', cache_invalidate)
+        app.router.add_get('/cache_stats', cache_stats)
+        app.router.add_get('/topology', topology)
+        app.router.add_get('/metrics', get_metrics)
+        app.on_startup.append(on_startup)
+        app.on_cleanup.append(on_cleanup)
+        return app
+
+    def start(self):
+        """
+        Avvia il server asincrono sull'indirizzo del coordinatore (blocca fino all'interruzione).
+        """
+        host, port = self.coordinator.address.split(':')
+        access_log = logging.getLogger('aiohttp.access') if self.access_log else None
+        # I corpi compressi dei blob vengono inoltrati così come arrivano, senza decomprimerli
+        web.run_app(self.create_app(), host=host, port=int(port), print=None, access_log=access_log,
+                    handler_args={'auto_decompress': False})
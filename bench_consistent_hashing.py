@@ -0,0 +1,95 @@
+import argparse
+import hashlib
+import random
+import time
+
+from consistent_hashing import ConsistentHashing
+
+
+class LinearConsistentHashing(ConsistentHashing):
+    """
+    Implementazione di riferimento con la ricerca lineare sul ring, usata solo come termine di confronto.
+    """
+    def get_nodes(self, key, count):
+        """
+        Restituisce i nodi corrispondenti alla chiave scorrendo linearmente la lista ordinata degli hash.
+        :param key: chiave per la quale trovare i nodi corrispondenti
+        :param count: numero di nodi da restituire
+        :return: lista di coppie indirizzo-porta dei nodi corrispondenti alla chiave
+        """
+        nodes = []
+        key_hash = int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+        for i, node_hash in enumerate(self.sorted_nodes):
+            if key_hash <= node_hash:
+                start_idx = i
+                break
+        else:
+            start_idx = 0
+        while len(nodes) < count:
+            node = self.ring[self.sorted_nodes[start_idx % len(self.sorted_nodes)]]
+            if self.nodes_status[node] and node not in nodes:
+                nodes.append(node)
+            start_idx += 1
+        return nodes
+
+
+def build_ring(cls, num_nodes, num_virtual_nodes, replication_factor, offline):
+    """
+    Costruisce un ring con num_nodes nodi fisici e ne porta offline una parte.
+    :param cls: classe del ring da istanziare
+    :param num_nodes: numero di nodi fisici
+    :param num_virtual_nodes: numero di nodi virtuali per nodo fisico
+    :param replication_factor: numero di nodi restituiti per ogni chiave
+    :param offline: lista dei nodi da marcare come offline
+    :return: istanza del ring
+    """
+    ring = cls(num_virtual_nodes=num_virtual_nodes, preference_size=replication_factor)
+    for i in range(num_nodes):
+        ring.add_node(f"10.0.{i // 256}.{i % 256}:8000")
+    for node in offline:
+        ring.remove_node(node)
+    return ring
+
+
+def measure(ring, keys, replication_factor):
+    """
+    Misura il numero di lookup al secondo sul ring dato.
+    :param ring: istanza del ring
+    :param keys: chiavi da cercare
+    :param replication_factor: numero di nodi richiesti per ogni chiave
+    :return: lookup al secondo
+    """
+    start = time.perf_counter()
+    for key in keys:
+        ring.get_nodes(key, replication_factor)
+    return len(keys) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmark of ConsistentHashing.get_nodes")
+    parser.add_argument('--nodes', type=str, default='10,100,1000', help='Comma separated physical node counts')
+    parser.add_argument('--virtual_nodes', type=int, default=3, help='Virtual nodes per physical node')
+    parser.add_argument('--replication_factor', type=int, default=3, help='Nodes returned per lookup')
+    parser.add_argument('--lookups', type=int, default=20000, help='Lookups per measurement')
+    parser.add_argument('--offline_fraction', type=float, default=0.1, help='Fraction of nodes marked offline')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    keys = [f"key-{rnd.getrandbits(64)}" for _ in range(args.lookups)]
+
+    print(f"{'nodes':>6} {'linear ops/s':>14} {'table ops/s':>14} {'speedup':>8}")
+    for num_nodes in (int(n) for n in args.nodes.split(',')):
+        all_nodes = [f"10.0.{i // 256}.{i % 256}:8000" for i in range(num_nodes)]
+        offline = rnd.sample(all_nodes, int(num_nodes * args.offline_fraction))
+        linear = build_ring(LinearConsistentHashing, num_nodes, args.virtual_nodes, args.replication_factor, offline)
+        table = build_ring(ConsistentHashing, num_nodes, args.virtual_nodes, args.replication_factor, offline)
+
+        # Verifica che le due implementazioni restituiscano gli stessi nodi
+        for key in keys[:1000]:
+            assert linear.get_nodes(key, args.replication_factor) == table.get_nodes(key, args.replication_factor), key
+
+        linear_rate = measure(linear, keys, args.replication_factor)
+        table_rate = measure(table, keys, args.replication_factor)
+        print(f"{num_nodes:>6} {linear_rate:>14,.0f} {table_rate:>14,.0f} {table_rate / linear_rate:>7.1f}x")
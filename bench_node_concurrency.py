@@ -0,0 +1,113 @@
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from metrics import LatencyHistogram
+from node import Node
+from storage import DictStorage, LogStorage
+
+
+def worker(node, keys, read_proportion, duration, seed, start, results):
+    """
+    Esegue letture e scritture casuali sul nodo per duration secondi.
+    :param node: istanza di Node
+    :param keys: chiavi precaricate
+    :param read_proportion: frazione delle operazioni che sono letture
+    :param duration: durata della misura in secondi
+    :param seed: seme del generatore casuale del thread
+    :param start: evento che avvia tutti i thread insieme
+    :param results: lista in cui aggiungere la coppia (istogramma letture, istogramma scritture)
+    """
+    rnd = random.Random(seed)
+    reads, writes = LatencyHistogram(), LatencyHistogram()
+    start.wait()
+    deadline = time.perf_counter() + duration
+    while True:
+        key = rnd.choice(keys)
+        began = time.perf_counter()
+        if began >= deadline:
+            break
+        if rnd.random() < read_proportion:
+            node.retrieve_versioned(key)
+            reads.record((time.perf_counter() - began) * 1e6)
+        else:
+            # Versioni crescenti in tutti i thread, come quelle dell'HLC del coordinatore
+            version = time.perf_counter_ns()
+            node.store(key, {"field0": key, "seq": version}, version)
+            writes.record((time.perf_counter() - began) * 1e6)
+    results.append((reads, writes))
+
+
+def run(node, keys, threads, read_proportion, duration, seed):
+    """
+    Misura throughput e latenze con il numero di thread indicato.
+    :param node: istanza di Node
+    :param keys: chiavi precaricate
+    :param threads: numero di thread concorrenti
+    :param read_proportion: frazione delle operazioni che sono letture
+    :param duration: durata della misura in secondi
+    :param seed: seme dei generatori casuali
+    :return: tupla (operazioni al secondo, istogramma letture, istogramma scritture)
+    """
+    start = threading.Event()
+    results = []
+    workers = [threading.Thread(target=worker, args=(node, keys, read_proportion, duration, seed + i, start, results))
+               for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.set()
+    for thread in workers:
+        thread.join()
+    reads, writes = LatencyHistogram(), LatencyHistogram()
+    for thread_reads, thread_writes in results:
+        reads.merge(thread_reads)
+        writes.merge(thread_writes)
+    return (reads.count + writes.count) / duration, reads, writes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrency benchmark of mixed reads and writes on one Node instance")
+    parser.add_argument('--threads', type=str, default='1,4,16,64', help='Comma separated thread counts')
+    parser.add_argument('--read_proportion', type=float, default=0.9, help='Fraction of operations that are reads')
+    parser.add_argument('--keys', type=int, default=10000, help='Keys loaded before the measurement')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds per measurement')
+    parser.add_argument('--storage', choices=['dict', 'log'], default='dict', help='Storage backend of the node')
+    parser.add_argument('--partitions', type=int, default=0, help='Partitions of the node (0 keeps the node default)')
+    parser.add_argument('--switch_interval', type=float, default=0, help='GIL switch interval in seconds (0 keeps the interpreter default of 5ms)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+
+    args = parser.parse_args()
+
+    # Con il GIL un thread interrotto mentre tiene un lock lo rilascia solo dopo un giro completo degli altri thread
+    # eseguibili, quindi la coda delle latenze dipende dall'intervallo di switch
+    if args.switch_interval:
+        sys.setswitchinterval(args.switch_interval)
+
+    data_dir = tempfile.mkdtemp(prefix='bench-node-') if args.storage == 'log' else None
+    storage = LogStorage(data_dir) if data_dir else DictStorage()
+    options = {"num_partitions": args.partitions} if args.partitions else {}
+    node = Node("127.0.0.1:0", "127.0.0.1:0", storage=storage, **options)
+    keys = [f"user{i}" for i in range(args.keys)]
+    for key in keys:
+        node.store(key, {"field0": key, "seq": 0}, 0)
+
+    try:
+        print(f"{'threads':>7} {'ops/s':>10} {'read p50':>9} {'read p99':>9} {'write p50':>10} {'write p99':>10} "
+              f"{'lock wait p99':>14}")
+        for threads in (int(n) for n in args.threads.split(',')):
+            node.metrics.histograms.clear()
+            rate, reads, writes = run(node, keys, threads, args.read_proportion, args.duration, args.seed)
+            lock_wait = LatencyHistogram()
+            for name, histogram in node.metrics.histograms.items():
+                if name.startswith('lock_wait.'):
+                    lock_wait.merge(histogram)
+            print(f"{threads:>7} {rate:>10,.0f} {reads.percentile(50):>7}us {reads.percentile(99):>7}us "
+                  f"{writes.percentile(50):>8}us {writes.percentile(99):>8}us {lock_wait.percentile(99):>12}us")
+    finally:
+        storage.close()
+        if data_dir:
+            shutil.rmtree(data_dir)
@@ -0,0 +1,464 @@
+import argparse
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from metrics import LatencyHistogram
+from transport import NodeTransport
+
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+
+
+class ZipfianGenerator:
+    """
+    Generatore di indici con distribuzione di Zipf (algoritmo di Gray et al. usato da YCSB). Con scrambled=True
+    il rango viene passato per un hash FNV, così le chiavi più richieste sono sparse su tutto il ring invece di
+    essere contigue.
+    """
+    def __init__(self, items, theta=0.99, scrambled=True):
+        """
+        Inizializza il generatore.
+        :param items: numero di elementi
+        :param theta: parametro di asimmetria (0.99 come YCSB)
+        :param scrambled: se True gli indici vengono mescolati con un hash
+        """
+        self.items = items
+        self.theta = theta
+        self.scrambled = scrambled
+        self.zetan = sum(1 / i ** theta for i in range(1, items + 1))
+        self.alpha = 1 / (1 - theta)
+        zeta2 = 1 + 0.5 ** theta
+        self.half_pow_theta = 0.5 ** theta
+        self.eta = (1 - (2 / items) ** (1 - theta)) / (1 - zeta2 / self.zetan)
+
+    def next(self, rnd):
+        """
+        Estrae un indice.
+        :param rnd: istanza di random.Random del thread chiamante
+        :return: indice tra 0 e items - 1
+        """
+        u = rnd.random()
+        uz = u * self.zetan
+        if uz < 1:
+            rank = 0
+        elif uz < 1 + self.half_pow_theta:
+            rank = 1
+        else:
+            rank = min(int(self.items * (self.eta * u - self.eta + 1) ** self.alpha), self.items - 1)
+        if not self.scrambled:
+            return rank
+        # Hash FNV-1a a 64 bit del rango
+        h = FNV_OFFSET
+        for byte in rank.to_bytes(8, 'little'):
+            h = ((h ^ byte) * FNV_PRIME) & 0xFFFFFFFFFFFFFFFF
+        return h % self.items
+
+
+class UniformGenerator:
+    """
+    Generatore di indici con distribuzione uniforme.
+    """
+    def __init__(self, items):
+        """
+        Inizializza il generatore.
+        :param items: numero di elementi
+        """
+        self.items = items
+
+    def next(self, rnd):
+        """
+        Estrae un indice.
+        :param rnd: istanza di random.Random del thread chiamante
+        :return: indice tra 0 e items - 1
+        """
+        return rnd.randrange(self.items)
+
+
+class LocalCluster:
+    """
+    Cluster locale avviato come processi separati: coordinatore, nodo di tolleranza ai guasti e N nodi.
+    """
+    def __init__(self, num_nodes, base_port=7000, replication_factor=3, quorum_write=2, quorum_read=2,
+                 coordinator_args='', node_args='', log_dir=None, slow_node_latency=0):
+        """
+        Inizializza la configurazione del cluster.
+        :param num_nodes: numero di nodi
+        :param base_port: porta del coordinatore; il nodo di tolleranza ai guasti usa base_port + 1 e i nodi
+                          base_port + 10 in poi
+        :param replication_factor: fattore di replica
+        :param quorum_write: quorum di scrittura
+        :param quorum_read: quorum di lettura
+        :param coordinator_args: argomenti aggiuntivi del coordinatore
+        :param node_args: argomenti aggiuntivi dei nodi
+        :param log_dir: directory dei log dei processi (default: directory temporanea)
+        :param slow_node_latency: ritardo artificiale (in secondi) di ogni richiesta al primo nodo, 0 per nessuno
+        """
+        self.coordinator = f"127.0.0.1:{base_port}"
+        self.fault_tolerance = f"127.0.0.1:{base_port + 1}"
+        self.nodes = [f"127.0.0.1:{base_port + 10 + i}" for i in range(num_nodes)]
+        self.replication_factor = replication_factor
+        self.quorum_write = quorum_write
+        self.quorum_read = quorum_read
+        self.coordinator_args = shlex.split(coordinator_args)
+        self.node_args = shlex.split(node_args)
+        self.slow_node_latency = slow_node_latency
+        self.log_dir = log_dir or tempfile.mkdtemp(prefix='kv-bench-')
+        self.processes = {}  # indirizzo -> processo
+
+    def _spawn(self, name, address, args):
+        """
+        Avvia un processo del cluster con l'output rediretto su un file di log.
+        :param name: script da eseguire
+        :param address: indirizzo del processo, usato come chiave e nel nome del log
+        :param args: argomenti da riga di comando
+        """
+        log = open(os.path.join(self.log_dir, f"{address.replace(':', '_')}.log"), 'w')
+        self.processes[address] = subprocess.Popen([sys.executable, name] + args, stdout=log, stderr=subprocess.STDOUT,
+                                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        log.close()
+
+    def start(self, timeout=30):
+        """
+        Avvia il cluster e attende che coordinatore e nodi rispondano.
+        :param timeout: tempo massimo di attesa (in secondi)
+        """
+        nodes = ','.join(self.nodes)
+        self._spawn('coordinator.py', self.coordinator, [
+            '--address', self.coordinator, '--nodes', nodes, '--replication_factor', str(self.replication_factor),
+            '--quorum_write', str(self.quorum_write), '--quorum_read', str(self.quorum_read),
+        ] + self.coordinator_args)
+        self._spawn('fault_tolerance.py', self.fault_tolerance, [
+            '--address', self.fault_tolerance, '--all_nodes', nodes, '--coordinator_address', self.coordinator,
+        ])
+        for i, node in enumerate(self.nodes):
+            slow = ['--inject_latency', str(self.slow_node_latency)] if i == 0 and self.slow_node_latency > 0 else []
+            self._spawn('node.py', node, ['--node', node, '--fault_tolerance_address', self.fault_tolerance] + self.node_args + slow)
+
+        deadline = time.monotonic() + timeout
+        for address, path in [(self.coordinator, '/rebalance_status')] + [(node, '/get?key=ping') for node in self.nodes]:
+            while True:
+                try:
+                    requests.get(f"http://{address}{path}", timeout=1)
+                    break
+                except requests.exceptions.RequestException:
+                    if time.monotonic() > deadline:
+                        self.stop()
+                        raise RuntimeError(f"{address} did not start, see the logs in {self.log_dir}")
+                    time.sleep(0.2)
+
+    def kill_node(self, node):
+        """
+        Termina bruscamente un nodo (SIGKILL), simulando un guasto.
+        :param node: indirizzo del nodo
+        """
+        self.processes[node].send_signal(signal.SIGKILL)
+
+    def stop(self):
+        """
+        Termina tutti i processi del cluster.
+        """
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Workload:
+    """
+    Carico di lavoro in stile YCSB sul coordinatore: una fase di caricamento delle chiavi e una fase di
+    esecuzione con un mix di letture e aggiornamenti. In modalità closed loop ogni thread invia la richiesta
+    successiva appena riceve la risposta; in modalità open loop le richieste partono a istanti prefissati
+    (target ops/s) e la latenza è misurata dall'istante previsto, così i ritardi accumulati non vengono nascosti
+    (coordinated omission).
+    """
+    def __init__(self, coordinator, record_count=10000, read_proportion=0.95, distribution='zipfian', value_size=100,
+                 threads=16, target=0, seed=42):
+        """
+        Inizializza il carico di lavoro.
+        :param coordinator: indirizzo del coordinatore (IP:porta)
+        :param record_count: numero di chiavi
+        :param read_proportion: frazione delle operazioni che sono letture (il resto sono aggiornamenti)
+        :param distribution: distribuzione delle chiavi, 'zipfian' o 'uniform'
+        :param value_size: dimensione dei valori in byte
+        :param threads: numero di thread client
+        :param target: operazioni al secondo complessive in modalità open loop, 0 per il closed loop
+        :param seed: seme dei generatori casuali
+        """
+        self.coordinator = coordinator
+        self.record_count = record_count
+        self.read_proportion = read_proportion
+        self.value_size = value_size
+        self.threads = threads
+        self.target = target
+        self.seed = seed
+        self.keys = ZipfianGenerator(record_count) if distribution == 'zipfian' else UniformGenerator(record_count)
+        self.transport = NodeTransport(max_connections_per_node=threads)
+
+    @staticmethod
+    def key(index):
+        """
+        Restituisce il nome della chiave di indice dato.
+        :param index: indice della chiave
+        :return: nome della chiave
+        """
+        return f"user{index:010d}"
+
+    def value(self, rnd):
+        """
+        Genera un valore casuale della dimensione configurata.
+        :param rnd: istanza di random.Random del thread chiamante
+        :return: stringa di value_size caratteri
+        """
+        return ''.join(rnd.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=self.value_size))
+
+    def load(self, batch_size=500):
+        """
+        Carica tutte le chiavi con scritture bulk.
+        :param batch_size: numero di chiavi per richiesta
+        :return: dizionario con chiavi caricate, errori e durata
+        """
+        rnd = random.Random(self.seed)
+        value = self.value(rnd)
+        start, errors = time.monotonic(), 0
+        for first in range(0, self.record_count, batch_size):
+            items = {self.key(i): value for i in range(first, min(first + batch_size, self.record_count))}
+            try:
+                response = self.transport.put(self.coordinator, '/mput', json={"items": items})
+                response.raise_for_status()
+            except requests.exceptions.RequestException:
+                errors += len(items)
+        return {"records": self.record_count, "errors": errors, "seconds": round(time.monotonic() - start, 3)}
+
+    def coordinator_metrics(self):
+        """
+        Legge contatori e statistiche delle repliche dal coordinatore alla fine dell'esecuzione.
+        :return: dizionario con contatori e statistiche delle repliche, None se /metrics non è disponibile
+        """
+        try:
+            response = self.transport.get(self.coordinator, '/metrics')
+            response.raise_for_status()
+            data = response.json()
+            return {"counters": data.get("counters"), "replicas": data.get("replicas")}
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+    def worker(self, index, start, stop_at, result):
+        """
+        Esegue le operazioni di un thread fino all'istante stop_at.
+        :param index: indice del thread
+        :param start: istante (monotonic) di inizio della fase di esecuzione
+        :param stop_at: istante (monotonic) di fine della fase di esecuzione
+        :param result: dizionario in cui scrivere istogrammi, errori e operazioni per secondo del thread
+        """
+        rnd = random.Random(self.seed + index + 1)
+        value = self.value(rnd)
+        histograms = {"read": LatencyHistogram(), "update": LatencyHistogram()}
+        errors = {"read": 0, "update": 0}
+        timeline = {}  # secondo -> operazioni completate
+        interval = self.threads / self.target if self.target > 0 else 0
+        intended = start + rnd.random() * interval  # istante previsto della prossima richiesta (open loop)
+        while True:
+            if interval:
+                delay = intended - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                began = intended
+                intended += interval
+            else:
+                began = time.monotonic()
+            if began >= stop_at:
+                break
+            key = self.key(self.keys.next(rnd))
+            operation = "read" if rnd.random() < self.read_proportion else "update"
+            try:
+                if operation == "read":
+                    response = self.transport.get(self.coordinator, f"/get/{key}")
+                else:
+                    response = self.transport.put(self.coordinator, f"/put/{key}", json={"value": value})
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            finished = time.monotonic()
+            histograms[operation].record((finished - began) * 1e6)
+            if not ok:
+                errors[operation] += 1
+            second = int(finished - start)
+            timeline[second] = timeline.get(second, 0) + 1
+        result.update(histograms=histograms, errors=errors, timeline=timeline)
+
+    def run(self, duration, on_second=None):
+        """
+        Esegue la fase di esecuzione con tutti i thread.
+        :param duration: durata (in secondi)
+        :param on_second: funzione chiamata a ogni secondo trascorso con il numero del secondo (es. per guasti)
+        :return: dizionario con throughput, latenze ed errori per operazione e operazioni per secondo
+        """
+        start = time.monotonic()
+        stop_at = start + duration
+        results = [{} for _ in range(self.threads)]
+        workers = [threading.Thread(target=self.worker, args=(i, start, stop_at, results[i]), daemon=True)
+                   for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for second in range(1, int(duration) + 1):
+            time.sleep(max(0.0, start + second - time.monotonic()))
+            if on_second is not None and second < duration:
+                on_second(second)
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - start
+
+        operations, total, timeline = {}, LatencyHistogram(), [0] * (int(duration) + 1)
+        for name in ("read", "update"):
+            histogram = LatencyHistogram()
+            for result in results:
+                histogram.merge(result["histograms"][name])
+            total.merge(histogram)
+            errors = sum(result["errors"][name] for result in results)
+            operations[name] = dict(histogram.summary(), errors=errors, ops_per_sec=round(histogram.count / elapsed, 1))
+        for result in results:
+            for second, count in result["timeline"].items():
+                timeline[min(second, len(timeline) - 1)] += count
+        errors = sum(op["errors"] for op in operations.values())
+        operations["total"] = dict(total.summary(), errors=errors, ops_per_sec=round(total.count / elapsed, 1))
+        return {"seconds": round(elapsed, 3), "operations": operations, "timeline": timeline}
+
+
+def print_hedges(report):
+    """
+    Stampa le statistiche delle hedged read e delle repliche riportate dal coordinatore.
+    :param report: risultati dell'esecuzione
+    """
+    replicas = (report.get("coordinator") or {}).get("replicas")
+    if not replicas:
+        return
+    print(f"hedged reads: {replicas['hedges']} fired, {replicas['hedge_wins']} won, delay {replicas['hedge_delay_ms']} ms")
+    for node, stats in replicas["nodes"].items():
+        print(f"{node:>24} latency {stats['latency_ms']:>8.2f} ms, outstanding {stats['outstanding']}")
+
+
+def git_commit():
+    """
+    Restituisce il commit corrente del repository, per confrontare i risultati nel tempo.
+    :return: hash del commit, None se non disponibile
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    """
+    Stampa il riepilogo dei risultati e, se presente, la differenza rispetto a un'esecuzione precedente.
+    :param report: risultati dell'esecuzione
+    :param baseline: risultati di un'esecuzione precedente (None per nessun confronto)
+    """
+    print(f"{'operation':>10} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'max ms':>8} {'errors':>7}")
+    for name, op in report["run"]["operations"].items():
+        print(f"{name:>10} {op['ops_per_sec']:>10,.1f} {op['p50_us'] / 1000:>8.2f} {op['p95_us'] / 1000:>8.2f} "
+              f"{op['p99_us'] / 1000:>8.2f} {op['p999_us'] / 1000:>8.2f} {op['max_us'] / 1000:>8.2f} {op['errors']:>7}")
+    print(f"ops per second: {report['run']['timeline']}")
+    for event in report["events"]:
+        print(f"event at {event['second']}s: {event['event']}")
+    if baseline is not None:
+        current, previous = report["run"]["operations"]["total"], baseline["run"]["operations"]["total"]
+        for field in ("ops_per_sec", "p50_us", "p99_us", "p999_us"):
+            if previous[field]:
+                change = (current[field] - previous[field]) / previous[field] * 100
+                print(f"{field:>12}: {previous[field]:>12,} -> {current[field]:>12,} ({change:+.1f}%)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="YCSB-style load generator and latency benchmark for the key-value store")
+    parser.add_argument('--coordinator_address', help='Benchmark an already running cluster instead of starting a local one')
+    parser.add_argument('--nodes', type=int, default=3, help='Number of nodes of the local cluster')
+    parser.add_argument('--base_port', type=int, default=7000, help='Coordinator port of the local cluster (fault tolerance +1, nodes +10 onwards)')
+    parser.add_argument('--replication_factor', type=int, default=3, help='Replication factor of the local cluster')
+    parser.add_argument('--quorum_write', type=int, default=2, help='Quorum write value of the local cluster')
+    parser.add_argument('--quorum_read', type=int, default=2, help='Quorum read value of the local cluster')
+    parser.add_argument('--coordinator_args', default='', help='Extra arguments for the coordinator of the local cluster')
+    parser.add_argument('--node_args', default='', help='Extra arguments for the nodes of the local cluster')
+    parser.add_argument('--log_dir', help='Directory of the local cluster logs (default: a temporary directory)')
+    parser.add_argument('--records', type=int, default=10000, help='Number of keys loaded before the run')
+    parser.add_argument('--read_proportion', type=float, default=0.95, help='Fraction of reads, the rest are updates')
+    parser.add_argument('--distribution', choices=['zipfian', 'uniform'], default='zipfian', help='Key request distribution')
+    parser.add_argument('--value_size', type=int, default=100, help='Value size in bytes')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent client threads')
+    parser.add_argument('--target', type=float, default=0, help='Open loop: total operations per second to issue (0 runs a closed loop)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of the run phase')
+    parser.add_argument('--kill_node_after', type=int, default=0, help='Kill a node (SIGKILL) this many seconds into the run (0 disables it)')
+    parser.add_argument('--kill_node', help='Address of the node to kill (default: the first node)')
+    parser.add_argument('--slow_node_latency', type=float, default=0, help='Milliseconds of artificial delay added to every request of the first node (0 disables it)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+
+    args = parser.parse_args()
+
+    cluster = None
+    if args.coordinator_address:
+        coordinator = args.coordinator_address
+    else:
+        cluster = LocalCluster(args.nodes, args.base_port, args.replication_factor, args.quorum_write, args.quorum_read,
+                               args.coordinator_args, args.node_args, args.log_dir, args.slow_node_latency / 1000)
+        print(f"Starting a local cluster of {args.nodes} nodes, logs in {cluster.log_dir}")
+        cluster.start()
+        coordinator = cluster.coordinator
+
+    workload = Workload(coordinator, args.records, args.read_proportion, args.distribution, args.value_size,
+                        args.threads, args.target, args.seed)
+    events = []
+
+    def on_second(second):
+        # Guasto di un nodo a metà dell'esecuzione (solo per il cluster locale)
+        if cluster is not None and args.kill_node_after and second == int(args.kill_node_after):
+            node = args.kill_node or cluster.nodes[0]
+            cluster.kill_node(node)
+            events.append({"second": second, "event": f"killed node {node}"})
+
+    try:
+        print(f"Loading {args.records} records...")
+        loaded = workload.load()
+        print(f"Running for {args.duration}s with {args.threads} threads "
+              f"({'open loop at %g ops/s' % args.target if args.target else 'closed loop'})...")
+        run = workload.run(args.duration, on_second)
+        coordinator_metrics = workload.coordinator_metrics()
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "commit": git_commit(),
+        "config": vars(args),
+        "load": loaded,
+        "run": run,
+        "events": events,
+        "coordinator": coordinator_metrics,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print_hedges(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import lzma
+import zlib
+
+BLOB_FIELD = '$blob'  # campo che identifica un blob nella sua forma JSON, riservato
+CHUNK_SIZE = 64 * 1024  # dimensione dei blocchi con cui i blob vengono letti, inoltrati e inviati
+IDENTITY = 'identity'  # codifica di un blob non compresso
+
+# Codifiche supportate, con i nomi usati negli header Content-Encoding e Accept-Encoding:
+# nome -> (costruttore del compressore, costruttore del decompressore)
+CODECS = {
+    'deflate': (lambda: zlib.compressobj(6), zlib.decompressobj),
+    'xz': (lzma.LZMACompressor, lzma.LZMADecompressor),
+}
+
+
+class ValueTooLarge(Exception):
+    """
+    Eccezione sollevata quando un valore supera la dimensione massima consentita.
+    """
+
+
+class Blob:
+    """
+    Valore binario memorizzato così come è stato ricevuto, eventualmente compresso con una delle CODECS.
+    I dati possono essere bytes, bytearray o una memoryview e non vengono mai convertiti in JSON lungo il percorso
+    /blob; solo i percorsi interni basati su JSON (read repair, anti-entropy, ribilanciamento, scansioni) usano la
+    forma {"$blob": base64, "encoding": codifica}.
+    """
+    __slots__ = ('data', 'encoding', '_etag')
+
+    def __init__(self, data, encoding=IDENTITY):
+        """
+        :param data: contenuto del blob, già codificato con encoding
+        :param encoding: codifica del contenuto ("identity" o una delle CODECS)
+        """
+        self.data = data
+        self.encoding = encoding
+        self._etag = None
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def etag(self):
+        """
+        Digest del contenuto e della codifica, calcolato alla prima richiesta.
+        :return: digest esadecimale
+        """
+        if self._etag is None:
+            digest = hashlib.md5(self.encoding.encode('utf-8') + b'\0')
+            digest.update(self.data)
+            self._etag = digest.hexdigest()
+        return self._etag
+
+    def chunks(self, size=CHUNK_SIZE):
+        """
+        Restituisce il contenuto a blocchi, copiando un blocco alla volta invece dell'intero valore (WSGI accetta
+        solo bytes).
+        :param size: dimensione dei blocchi
+        :return: generatore di bytes
+        """
+        view = memoryview(self.data)
+        for offset in range(0, len(view), size):
+            yield bytes(view[offset:offset + size])
+
+    def to_json(self):
+        """
+        :return: forma JSON del blob
+        """
+        return {BLOB_FIELD: base64.b64encode(self.data).decode('ascii'), 'encoding': self.encoding}
+
+
+def from_json(value):
+    """
+    Converte la forma JSON di un blob nel Blob corrispondente; gli altri valori restano invariati.
+    :param value: valore ricevuto in JSON
+    :return: Blob oppure il valore originale
+    """
+    if isinstance(value, dict) and BLOB_FIELD in value:
+        return Blob(base64.b64decode(value[BLOB_FIELD]), value.get('encoding', IDENTITY))
+    return value
+
+
+def json_default(value):
+    """
+    Funzione default di json.dumps per serializzare i Blob.
+    :param value: oggetto non serializzabile
+    :return: forma JSON del blob
+    """
+    if isinstance(value, Blob):
+        return value.to_json()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def digest_default(value):
+    """
+    Funzione default di json.dumps per confrontare o calcolare il digest di un valore: un Blob è rappresentato dal
+    suo etag, così non serve codificarne il contenuto.
+    :param value: oggetto non serializzabile
+    :return: rappresentazione del blob
+    """
+    if isinstance(value, Blob):
+        return {BLOB_FIELD: value.etag, 'encoding': value.encoding}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def accepts(header, encoding):
+    """
+    Verifica se un header Accept-Encoding accetta la codifica indicata.
+    :param header: valore dell'header (None se assente)
+    :param encoding: codifica da verificare
+    :return: True se la codifica è accettata con qualità maggiore di zero
+    """
+    if encoding == IDENTITY:
+        return True
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() in (encoding, '*'):
+            quality = params.strip()
+            return not quality.startswith('q=') or float(quality[2:] or 0) > 0
+    return False
+
+
+def compress(chunks, encoding):
+    """
+    Comprime uno stream di blocchi.
+    :param chunks: iterabile di blocchi di byte
+    :param encoding: una delle CODECS
+    :return: generatore di blocchi compressi
+    """
+    compressor = CODECS[encoding][0]()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def decompress(chunks, encoding):
+    """
+    Decomprime uno stream di blocchi.
+    :param chunks: iterabile di blocchi compressi
+    :param encoding: una delle CODECS
+    :return: generatore di blocchi decompressi
+    """
+    decompressor = CODECS[encoding][1]()
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if hasattr(decompressor, 'flush'):
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+def limit_size(chunks, max_size):
+    """
+    Inoltra uno stream di blocchi e solleva ValueTooLarge appena supera la dimensione massima.
+    :param chunks: iterabile di blocchi di byte
+    :param max_size: numero massimo di byte (0 per non limitarlo)
+    :return: generatore degli stessi blocchi
+    """
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if max_size and total > max_size:
+            raise ValueTooLarge(f"value larger than {max_size} bytes")
+        yield chunk
@@ -0,0 +1,500 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from client import SmartClient
+from expiry import expires_at, live_value, parse_ttl, with_ttl
+from replication import parse_consistency
+
+CHUNK = 1000  # record di input raggruppati per calcolare la posizione del checkpoint
+
+
+def read_jsonl(f):
+    """
+    Legge un file JSONL con un oggetto {"key": ..., "value": ...} per riga; "ttl" (secondi) o "expires" (istante
+    assoluto, come nell'export) sono facoltativi. Le righe vuote vengono ignorate.
+    :param f: file di testo aperto in lettura
+    :return: generatore di righe (ancora da decodificare) con il loro numero
+    """
+    for line_number, line in enumerate(f, 1):
+        if line.strip():
+            yield line_number, line
+
+
+def parse_jsonl(line_number, line):
+    """
+    Decodifica una riga JSONL.
+    :param line_number: numero della riga, per i messaggi di errore
+    :param line: riga letta dal file
+    :return: tupla (chiave, valore da scrivere)
+    :raises ValueError: se la riga non è un oggetto con key e value o se ttl non è un numero positivo
+    """
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"line {line_number}: invalid JSON ({e})")
+    if not isinstance(record, dict) or 'key' not in record or 'value' not in record:
+        raise ValueError(f"line {line_number}: expected an object with key and value")
+    value = record['value']
+    if record.get('expires') is not None:
+        value = with_ttl(value, 0, now=record['expires'])
+    elif record.get('ttl') is not None:
+        try:
+            value = with_ttl(value, parse_ttl(record['ttl']))
+        except ValueError as e:
+            raise ValueError(f"line {line_number}: {e}")
+    return str(record['key']), value
+
+
+def read_csv(f, key_column):
+    """
+    Legge un file CSV con intestazione.
+    :param f: file di testo aperto in lettura
+    :param key_column: colonna che contiene la chiave
+    :return: generatore di righe (dizionari colonna -> valore) con il loro numero
+    :raises ValueError: se l'intestazione non contiene la colonna della chiave
+    """
+    reader = csv.DictReader(f)
+    if reader.fieldnames is None or key_column not in reader.fieldnames:
+        raise ValueError(f"CSV header has no key column {key_column!r}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_csv(key_column):
+    """
+    Crea il decodificatore delle righe CSV. Se oltre alla chiave c'è solo la colonna "value" il valore è la stringa
+    della colonna, altrimenti è il dizionario delle altre colonne.
+    :param key_column: colonna che contiene la chiave
+    :return: funzione (numero di riga, riga) -> (chiave, valore da scrivere)
+    """
+    def parse(line_number, row):
+        if row.get(key_column) in (None, ''):
+            raise ValueError(f"line {line_number}: empty key")
+        fields = {column: value for column, value in row.items() if column != key_column}
+        if list(fields) == ['value']:
+            return row[key_column], fields['value']
+        return row[key_column], fields
+    return parse
+
+
+def read_records(f, fmt, key_column='key', offset=0):
+    """
+    Pipeline di lettura: salta i primi offset record senza decodificarli (ripresa da un checkpoint) e
+    restituisce gli altri uno alla volta, senza caricare il file in memoria.
+    :param f: file di testo aperto in lettura
+    :param fmt: formato del file, jsonl o csv
+    :param key_column: colonna della chiave (solo csv)
+    :param offset: numero di record già importati
+    :return: generatore di tuple (indice del record, chiave, valore)
+    """
+    if fmt == 'csv':
+        rows, parse = read_csv(f, key_column), parse_csv(key_column)
+    else:
+        rows, parse = read_jsonl(f), parse_jsonl
+    for index, (line_number, row) in enumerate(itertools.islice(rows, offset, None), offset):
+        key, value = parse(line_number, row)
+        yield index, key, value
+
+
+def load_checkpoint(path, source):
+    """
+    Legge il checkpoint di un import interrotto.
+    :param path: file del checkpoint
+    :param source: file di input dell'import
+    :return: numero di record già importati (0 se il checkpoint non esiste)
+    :raises ValueError: se il checkpoint appartiene a un altro file di input
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return 0
+    if data['input'] != os.path.abspath(source):
+        raise ValueError(f"checkpoint {path} belongs to {data['input']}, not to {source}")
+    return data['offset']
+
+
+def save_checkpoint(path, data):
+    """
+    Scrive il checkpoint su un file temporaneo e lo sostituisce a quello precedente, così un'interruzione durante
+    la scrittura non lascia un checkpoint incompleto.
+    :param path: file del checkpoint
+    :param data: contenuto del checkpoint
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class ImportProgress:
+    """
+    Tiene traccia dei record letti e di quelli scritti per calcolare il checkpoint: i record vengono scritti fuori
+    ordine (ogni insieme di repliche ha il suo blocco), quindi il checkpoint è il primo record non ancora scritto.
+    Invece di un insieme di indici conta i record in sospeso per blocchi di CHUNK record di input.
+    """
+    def __init__(self, offset):
+        """
+        :param offset: indice del primo record da importare
+        """
+        self.offset = offset
+        self.next_index = offset  # indice del prossimo record da leggere
+        self.pending = {}  # blocco di input -> record letti e non ancora scritti
+        self.lock = threading.Lock()
+
+    def read(self, index):
+        """
+        Registra un record letto.
+        :param index: indice del record
+        """
+        with self.lock:
+            chunk = index // CHUNK
+            self.pending[chunk] = self.pending.get(chunk, 0) + 1
+            self.next_index = index + 1
+
+    def written(self, indices):
+        """
+        Registra i record scritti.
+        :param indices: indici dei record
+        """
+        with self.lock:
+            for index in indices:
+                chunk = index // CHUNK
+                self.pending[chunk] -= 1
+                if not self.pending[chunk]:
+                    del self.pending[chunk]
+
+    def watermark(self):
+        """
+        Restituisce il checkpoint: tutti i record precedenti sono stati scritti (alcuni successivi possono esserlo già,
+        e vengono riscritti alla ripresa con una versione più recente e lo stesso valore).
+        :return: indice del primo record non ancora scritto
+        """
+        with self.lock:
+            if not self.pending:
+                return self.next_index
+            return max(min(self.pending) * CHUNK, self.offset)
+
+
+class BulkImporter:
+    """
+    Import parallelo di grandi quantità di chiavi direttamente sulle repliche. I record letti dalla pipeline vengono
+    raggruppati per insieme di repliche responsabili (dal ring scaricato dallo SmartClient) e ogni blocco di
+    batch_size record viene inviato con una richiesta /mput per replica. Al massimo max_in_flight blocchi sono in
+    volo: quando sono tutti occupati la lettura si ferma (backpressure), quindi la memoria usata è limitata a
+    max_buffered + max_in_flight * batch_size record qualunque sia la dimensione del file.
+    """
+    def __init__(self, client, batch_size=500, max_in_flight=8, max_buffered=50000, consistency=None, retries=3,
+                 checkpoint=None, checkpoint_interval=1.0):
+        """
+        :param client: SmartClient collegato al cluster
+        :param batch_size: record per richiesta bulk
+        :param max_in_flight: blocchi inviati in parallelo
+        :param max_buffered: record in attesa nei buffer degli insiemi di repliche prima di svuotare il più grande
+        :param consistency: livello di consistenza delle scritture (None per il quorum del cluster)
+        :param retries: nuovi tentativi di un blocco le cui chiavi non hanno raggiunto il livello di consistenza
+        :param checkpoint: file in cui salvare il checkpoint (None per non salvarlo)
+        :param checkpoint_interval: intervallo (in secondi) tra due salvataggi del checkpoint
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_buffered = max_buffered
+        self.level = parse_consistency(consistency, client.replication_factor)
+        self.retries = retries
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='bulk')
+        self.slots = threading.BoundedSemaphore(max_in_flight)  # blocchi in volo
+        self.lock = threading.Lock()
+        self.progress = None
+        self.source = None
+        self.failed = None  # primo errore definitivo, che ferma l'import
+        self.stats = {}
+
+    def write_batch(self, batch):
+        """
+        Scrive un blocco di record. I nodi vengono ricalcolati al momento dell'invio, così un blocco rimasto nel buffer
+        durante un cambio di topologia va ai proprietari aggiornati. Le chiavi che non raggiungono il livello di
+        consistenza vengono ritentate dopo aver riletto la topologia, con le stesse versioni.
+        :param batch: lista di tuple (indice del record, chiave, valore, versione)
+        """
+        try:
+            # a parità di chiave vince il record successivo, che ha anche la versione più recente
+            items = {key: value for _, key, value, _ in batch}
+            versions = {key: version for _, key, _, version in batch}
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(min(0.1 * 2 ** attempt, 5))
+                    with self.lock:
+                        self.stats['retries'] += 1
+                self.client.check_topology()
+                targets = {key: self.client.write_nodes(key) for key in items}
+                key_nodes = {key: nodes for key, (nodes, _) in targets.items()}
+                results = self.client.replication.replicate_write_many(
+                    items, key_nodes, versions, self.level, {key: pending for key, (_, pending) in targets.items()})
+                items = {key: items[key] for key, ok in results.items() if not ok}
+                if not items:
+                    break
+            self.client.invalidate_cache(versions)
+            if items:
+                raise RuntimeError(f"{len(items)} of {len(batch)} keys did not reach the consistency level "
+                                   f"after {self.retries + 1} attempts (e.g. {next(iter(items))})")
+            self.progress.written([index for index, _, _, _ in batch])
+            with self.lock:
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+        except Exception as e:
+            with self.lock:
+                self.failed = self.failed or e
+        finally:
+            self.slots.release()
+
+    def submit(self, batch):
+        """
+        Invia un blocco, attendendo che si liberi un posto se max_in_flight blocchi sono già in volo.
+        :param batch: lista di tuple (indice del record, chiave, valore, versione)
+        """
+        self.slots.acquire()
+        self.executor.submit(self.write_batch, batch)
+
+    def save(self, final=False):
+        """
+        Salva il checkpoint.
+        :param final: True alla fine dell'import
+        """
+        if self.checkpoint is None:
+            return
+        save_checkpoint(self.checkpoint, {
+            "input": os.path.abspath(self.source), "offset": self.progress.watermark(),
+            "written": self.stats['written'], "complete": final and self.failed is None, "time": time.time(),
+        })
+
+    def run(self, records, source, offset=0):
+        """
+        Importa i record.
+        :param records: iterabile di tuple (indice del record, chiave, valore), per esempio da read_records
+        :param source: file di input, registrato nel checkpoint
+        :param offset: indice del primo record (da un checkpoint)
+        :return: dizionario con record letti e scritti, blocchi, tentativi ripetuti, durata, velocità e checkpoint
+        :raises RuntimeError: se un blocco non viene scritto dopo tutti i tentativi (il checkpoint resta valido)
+        """
+        self.progress = ImportProgress(offset)
+        self.source = source
+        self.failed = None
+        self.stats = {"read": 0, "written": 0, "batches": 0, "retries": 0}
+        buffers = {}  # insieme di repliche -> record in attesa
+        buffered = 0
+        began = last_save = time.monotonic()
+        try:
+            for index, key, value in records:
+                if self.failed is not None:
+                    break
+                self.progress.read(index)
+                self.stats['read'] += 1
+                self.client.check_topology()
+                nodes = tuple(self.client.write_nodes(key)[0])
+                buffer = buffers.setdefault(nodes, [])
+                # La versione viene assegnata in ordine di lettura: tra due record della stessa chiave vince sempre il
+                # successivo, qualunque sia l'ordine in cui i blocchi vengono scritti o ritentati
+                buffer.append((index, key, value, self.client.clock.now()))
+                buffered += 1
+                if len(buffer) >= self.batch_size:
+                    batch = buffers.pop(nodes)
+                    buffered -= len(batch)
+                    self.submit(batch)
+                elif buffered > self.max_buffered:
+                    # Troppi insiemi di repliche parzialmente pieni: si invia il buffer più grande
+                    largest = max(buffers, key=lambda nodes: len(buffers[nodes]))
+                    batch = buffers.pop(largest)
+                    buffered -= len(batch)
+                    self.submit(batch)
+                if time.monotonic() - last_save >= self.checkpoint_interval:
+                    last_save = time.monotonic()
+                    self.save()
+                    print(f"Imported {self.stats['written']} records, checkpoint at record {self.progress.watermark()}")
+            if self.failed is None:
+                for batch in buffers.values():
+                    self.submit(batch)
+        finally:
+            # Attende i blocchi in volo occupando tutti i posti
+            for _ in range(self.max_in_flight):
+                self.slots.acquire()
+            for _ in range(self.max_in_flight):
+                self.slots.release()
+            self.save(final=True)
+        elapsed = time.monotonic() - began
+        self.stats.update({"elapsed_s": round(elapsed, 3), "checkpoint": self.progress.watermark(),
+                           "records_per_s": round(self.stats['written'] / elapsed, 1) if elapsed > 0 else 0.0})
+        if self.failed is not None:
+            raise RuntimeError(f"Import stopped at record {self.progress.watermark()}: {self.failed}")
+        return self.stats
+
+
+class BulkExporter:
+    """
+    Export in streaming del contenuto del cluster in JSONL, un range di token del ring alla volta: ogni range viene
+    letto a pagine con /scan dalla prima replica che risponde e ogni pagina viene scritta appena letta, quindi la
+    memoria usata è limitata a una pagina (page_size chiavi) indipendentemente dalla dimensione del range.
+    Le chiavi scadute non vengono esportate; quelle con scadenza riportano l'istante assoluto in "expires".
+    Ogni range viene letto da una sola replica: le chiavi che mancano su quella replica (per esempio scritte
+    mentre era offline e non ancora riparate dall'anti-entropy) non vengono esportate.
+    """
+    def __init__(self, client, page_size=1000, checkpoint=None):
+        """
+        :param client: SmartClient collegato al cluster
+        :param page_size: chiavi lette per richiesta
+        :param checkpoint: file in cui salvare il primo token non ancora esportato (None per non salvarlo)
+        """
+        self.client = client
+        self.page_size = page_size
+        self.checkpoint = checkpoint
+
+    def scan(self, node, start, end):
+        """
+        Legge un range di token da un nodo, a pagine.
+        :param node: nodo da cui leggere
+        :param start: primo token del range
+        :param end: ultimo token del range
+        :return: generatore di pagine (chiave -> valore)
+        """
+        after = -1
+        while after is not None:
+            response = self.client.transport.post(node, "/scan", json={"ranges": [[start, end]], "after": after,
+                                                                        "limit": self.page_size})
+            response.raise_for_status()
+            data = response.json()
+            yield data['values']
+            after = data['next']
+
+    def export_range(self, out, start, end, nodes):
+        """
+        Esporta un range dalla prima replica che risponde. Ogni pagina viene scritta appena letta; se una replica
+        fallisce a metà range il file viene troncato alla posizione di inizio del range prima di passare alla replica
+        successiva, così nessuna chiave viene esportata due volte. Il file deve quindi supportare seek e truncate.
+        :param out: file di testo in cui scrivere
+        :param start: primo token del range
+        :param end: ultimo token del range
+        :param nodes: repliche del range
+        :return: numero di chiavi esportate
+        :raises requests.exceptions.RequestException: se nessuna replica risponde
+        """
+        position = out.tell()
+        error = None
+        for node in nodes:
+            written = 0
+            try:
+                now = time.time()
+                for values in self.scan(node, start, end):
+                    lines = []
+                    for key, value in values.items():
+                        live = live_value(value, now)
+                        if live is None and expires_at(value) is not None:
+                            continue  # scaduta
+                        record = {"key": key, "value": live}
+                        if expires_at(value) is not None:
+                            record["expires"] = expires_at(value)
+                        lines.append(json.dumps(record) + '\n')
+                    out.writelines(lines)
+                    written += len(lines)
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to export range [{start}, {end}] from {node}: {e}")
+                error = e
+                # scarta le pagine già scritte da questa replica
+                out.seek(position)
+                out.truncate()
+                continue
+            return written
+        raise error or requests.exceptions.ConnectionError(f"no replica for range [{start}, {end}]")
+
+    def run(self, out, offset=0):
+        """
+        Esporta tutti i range del ring a partire dal token offset. Il checkpoint è un token e non un indice di range,
+        quindi resta valido anche se la topologia cambia tra un'esecuzione e la successiva.
+        :param out: file di testo in cui scrivere
+        :param offset: primo token da esportare (da un checkpoint)
+        :return: dizionario con range e chiavi esportati, durata e velocità
+        """
+        self.client.refresh_topology()
+        ranges = [(max(start, offset), end, nodes[:self.client.replication_factor])
+                  for start, end, nodes in sorted(self.client.ring.get_ranges()) if end >= offset and nodes]
+        exported = 0
+        began = time.monotonic()
+        for start, end, nodes in ranges:
+            exported += self.export_range(out, start, end, nodes)
+            if self.checkpoint is not None:
+                out.flush()
+                save_checkpoint(self.checkpoint, {"output": os.path.abspath(out.name), "offset": end + 1,
+                                                  "position": out.tell(), "written": exported,
+                                                  "complete": end == ranges[-1][1], "time": time.time()})
+        elapsed = time.monotonic() - began
+        return {"ranges": len(ranges), "written": exported, "elapsed_s": round(elapsed, 3),
+                "records_per_s": round(exported / elapsed, 1) if elapsed > 0 else 0.0}
+
+
+# Esempio di utilizzo: import ed export di un dataset
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Parallel bulk import and streaming export of the cluster data")
+    parser.add_argument('--coordinator_address', required=True, help='The address of the coordinator (IP:port)')
+    parser.add_argument('--operation', required=True, choices=['import', 'export'], help='The operation to perform')
+    parser.add_argument('--file', required=True, help='Input file of the import, output file of the export (JSONL)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='Input format (default: from the file extension)')
+    parser.add_argument('--key_column', default='key', help='For csv: column holding the key; the value is the "value" column or the other columns as an object')
+    parser.add_argument('--batch_size', type=int, default=500, help='Records per bulk request (keys per page for export)')
+    parser.add_argument('--max_in_flight', type=int, default=8, help='Batches written in parallel; reading blocks when all are in flight')
+    parser.add_argument('--max_buffered', type=int, default=50000, help='Records waiting in the per-replica-set buffers before the largest is flushed')
+    parser.add_argument('--consistency', help='Consistency level of the writes: ONE, QUORUM, ALL or a number of replicas (default: the cluster quorum)')
+    parser.add_argument('--retries', type=int, default=3, help='Retries of a batch whose keys did not reach the consistency level')
+    parser.add_argument('--checkpoint', help='Checkpoint file, saved while running (default: FILE.checkpoint)')
+    parser.add_argument('--checkpoint_interval', type=float, default=1.0, help='Seconds between two checkpoint saves of the import')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted import or export from its checkpoint')
+
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or args.file + '.checkpoint'
+    client = SmartClient(coordinator_url=args.coordinator_address)
+
+    if args.operation == 'import':
+        fmt = args.format or ('csv' if args.file.endswith('.csv') else 'jsonl')
+        try:
+            offset = load_checkpoint(checkpoint, args.file) if args.resume else 0
+            importer = BulkImporter(client, args.batch_size, args.max_in_flight, args.max_buffered, args.consistency,
+                                    args.retries, checkpoint, args.checkpoint_interval)
+        except ValueError as e:
+            parser.error(str(e))
+        if offset:
+            print(f"Resuming {args.file} from record {offset}")
+        with open(args.file, newline='') as f:
+            try:
+                stats = importer.run(read_records(f, fmt, args.key_column, offset), args.file, offset)
+            except (RuntimeError, ValueError) as e:
+                print(f"IMPORT failed: {e}. Run again with --resume to continue from the checkpoint {checkpoint}")
+                sys.exit(1)
+        print(f"IMPORT Response: {stats}")
+    else:
+        offset, position = 0, 0
+        if args.resume and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                data = json.load(f)
+            offset, position = data['offset'], data['position']
+            print(f"Resuming export from token {offset}")
+        exporter = BulkExporter(client, args.batch_size, checkpoint)
+        with open(args.file, 'r+' if position else 'w') as f:
+            f.seek(position)
+            f.truncate()  # scarta le righe di un range interrotto
+            try:
+                stats = exporter.run(f, offset)
+            except requests.exceptions.RequestException as e:
+                print(f"EXPORT failed: {e}. Run again with --resume to continue from the checkpoint {checkpoint}")
+                sys.exit(1)
+        print(f"EXPORT Response: {stats}")
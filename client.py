@@ -1,7 +1,17 @@
 import argparse
+import json
+import threading
+import time
 
 import requests
 
+from blob import CHUNK_SIZE, IDENTITY, Blob, compress
+from consistent_hashing import ConsistentHashing
+from expiry import live_value, parse_ttl, with_ttl
+from replication import QUORUM, ConsistencyUnavailable, Replication, parse_consistency
+from transport import NodeTransport
+from versioning import HybridLogicalClock
+
 
 class Client:
     """
@@ -14,36 +24,331 @@ class Client:
         """
         self.coordinator_url = coordinator_url
 
-    def put(self, key, value):
+    def put(self, key, value, ttl=None, consistency=None):
         """
         Invia una richiesta PUT al coordinatore per scrivere un valore.
         :param key: chiave da scrivere
         :param value: valore da scrivere
-        :return: risposta del coordinatore alla richiesta PUT (True/False)
+        :param ttl: durata in secondi dopo la quale la chiave scade (None per nessuna scadenza)
+        :param consistency: ONE, QUORUM, ALL o numero di repliche che devono confermare (None per il quorum del coordinatore)
+        :return: risposta del coordinatore alla richiesta PUT, con il livello di consistenza raggiunto
         """
         url = f"http://{self.coordinator_url}/put/{key}"
+        body = {"value": value}
+        if ttl:
+            body["ttl"] = ttl
+        if consistency is not None:
+            body["consistency"] = consistency
         try:
-            response = requests.put(url, json={"value": value})
+            response = requests.put(url, json=body)
             response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
             return response.json()  # restituisce la risposta del coordinatore come dizionario JSON solo se la richiesta ha avuto successo
         except requests.exceptions.RequestException as e:
             print(f"Failed to PUT data: {e}")
             return None  # restituisce None se la richiesta ha avuto esito negativo
 
-    def get(self, key):
+    def get(self, key, fresh=False, consistency=None, with_consistency=False):
         """
         Invia una richiesta GET al coordinatore per leggere un valore.
         :param key: chiave da leggere
+        :param fresh: se True il coordinatore legge dalle repliche con il quorum anche se la chiave è in cache
+        :param consistency: ONE, QUORUM, ALL o numero di repliche che devono rispondere (None per il quorum del coordinatore)
+        :param with_consistency: se True restituisce la tupla (valore, livello di consistenza raggiunto)
         :return: valore della chiave se la richiesta GET ha avuto successo, None altrimenti
         """
         url = f"http://{self.coordinator_url}/get/{key}"
+        params = {}
+        if fresh:
+            params["fresh"] = 1
+        if consistency is not None:
+            params["consistency"] = consistency
         try:
-            response = requests.get(url)
+            response = requests.get(url, params=params or None)
             response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
-            return response.json().get('value')  # restituisce il valore della chiave solo se la richiesta ha avuto successo
+            data = response.json()
+            # restituisce il valore della chiave solo se la richiesta ha avuto successo
+            return (data.get('value'), data.get('consistency')) if with_consistency else data.get('value')
         except requests.exceptions.RequestException as e:
             print(f"Failed to GET data: {e}")
-            return None  # restituisce None se la richiesta ha avuto esito negativo
+            return (None, None) if with_consistency else None  # la richiesta ha avuto esito negativo
+
+    def mput(self, items):
+        """
+        Invia una richiesta MPUT al coordinatore per scrivere più valori con un solo round trip.
+        :param items: dizionario chiave-valore da scrivere
+        :return: risposta del coordinatore con l'esito per ogni chiave, None in caso di errore
+        """
+        url = f"http://{self.coordinator_url}/mput"
+        try:
+            response = requests.put(url, json={"items": items})
+            response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to MPUT data: {e}")
+            return None
+
+    def mget(self, keys):
+        """
+        Invia una richiesta MGET al coordinatore per leggere più valori con un solo round trip.
+        :param keys: lista delle chiavi da leggere
+        :return: dizionario chiave-valore (None per le chiavi non trovate), None in caso di errore
+        """
+        url = f"http://{self.coordinator_url}/mget"
+        try:
+            response = requests.post(url, json={"keys": list(keys)})
+            response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+            return response.json().get('values')
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to MGET data: {e}")
+            return None
+
+    def put_blob(self, key, source, encoding=IDENTITY):
+        """
+        Invia un valore binario al coordinatore in streaming (chunked transfer encoding), senza caricarlo in memoria.
+        :param key: chiave da scrivere
+        :param source: bytes oppure file aperto in modalità binaria
+        :param encoding: codifica con cui comprimere il corpo prima dell'invio ("identity" per lasciare la
+                         compressione al coordinatore)
+        :return: risposta del coordinatore, None in caso di errore
+        """
+        url = f"http://{self.coordinator_url}/blob/{key}"
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            chunks = Blob(source).chunks()
+        else:
+            chunks = iter(lambda: source.read(CHUNK_SIZE), b'')
+        headers = {}
+        if encoding != IDENTITY:
+            chunks = compress(chunks, encoding)
+            headers["Content-Encoding"] = encoding
+        try:
+            response = requests.put(url, data=chunks, headers=headers)
+            response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to PUT blob: {e}")
+            return None
+
+    def get_blob(self, key, target=None):
+        """
+        Legge un valore binario dal coordinatore in streaming; se il coordinatore lo invia compresso con deflate
+        viene decompresso durante la lettura.
+        :param key: chiave da leggere
+        :param target: file aperto in scrittura binaria in cui copiare il valore (None per restituirlo)
+        :return: contenuto del valore (True se è stato scritto in target), None in caso di errore
+        """
+        url = f"http://{self.coordinator_url}/blob/{key}"
+        try:
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+                if target is None:
+                    return response.content
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    target.write(chunk)
+                return True
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to GET blob: {e}")
+            return None
+
+    def scan(self, prefix=None, start=None, end=None, page_size=1000):
+        """
+        Scorre in ordine le chiavi del cluster, pagina per pagina, seguendo il cursore restituito dal coordinatore.
+        Le pagine vengono lette in streaming, quindi in memoria resta una sola riga alla volta.
+        :param prefix: prefisso delle chiavi (None per tutte)
+        :param start: prima chiave del range (inclusa, None per nessun limite)
+        :param end: fine del range (esclusa, None per nessun limite)
+        :param page_size: numero massimo di chiavi per pagina
+        :return: generatore di tuple (chiave, valore) in ordine di chiave
+        """
+        url = f"http://{self.coordinator_url}/scan"
+        params = {"prefix": prefix, "start": start, "end": end, "limit": page_size}
+        while True:
+            try:
+                with requests.get(url, params=params, stream=True) as response:
+                    response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+                    cursor = None
+                    for line in response.iter_lines():
+                        record = json.loads(line)
+                        if 'cursor' in record:
+                            cursor = record['cursor']
+                        else:
+                            yield record['key'], record['value']
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to SCAN data: {e}")
+                return
+            if cursor is None:
+                return
+            params["cursor"] = cursor
+
+
+class SmartClient(Client):
+    """
+    Client che conosce la topologia del cluster: scarica il ring dal coordinatore, calcola localmente i nodi
+    responsabili di ogni chiave e legge e scrive direttamente sulle repliche con la logica di quorum, senza
+    passare dal coordinatore. La topologia viene riletta quando cambia l'epoca pubblicata dal coordinatore
+    (controllata ogni refresh_interval secondi) o quando una richiesta verso un nodo fallisce. Se il coordinatore
+    ha una cache delle letture, dopo ogni scrittura le versioni scritte gli vengono inviate su /cache_invalidate.
+    """
+    def __init__(self, coordinator_url, refresh_interval=5.0):
+        """
+        Inizializza il client e scarica la topologia.
+        :param coordinator_url: URL del coordinatore in formato "indirizzo:porta"
+        :param refresh_interval: intervallo (in secondi) tra due controlli dell'epoca della topologia
+        """
+        super().__init__(coordinator_url)
+        self.refresh_interval = refresh_interval
+        self.transport = NodeTransport()
+        self.replication = Replication(1, 1, transport=self.transport)  # quorum aggiornati dalla topologia
+        self.clock = HybridLogicalClock()  # assegna la versione alle scritture
+        self.epoch = None
+        self.replication_factor = None
+        self.ring = None
+        self.pending_ring = None
+        self.coordinator_cache = False  # il coordinatore ha una cache delle letture da invalidare
+        self.last_refresh = 0.0
+        self.last_failures = 0
+        self.lock = threading.Lock()
+        self.refresh_topology()
+
+    def refresh_topology(self):
+        """
+        Rilegge la topologia dal coordinatore; se l'epoca non è cambiata il coordinatore restituisce solo l'epoca.
+        """
+        params = {"epoch": self.epoch} if self.epoch is not None else None
+        response = requests.get(f"http://{self.coordinator_url}/topology", params=params)
+        response.raise_for_status()
+        data = response.json()
+        self.last_refresh = time.monotonic()
+        self.last_failures = self.transport.failures
+        if 'ring' not in data:
+            return
+        self.ring = ConsistentHashing.from_topology(data['ring'])
+        self.pending_ring = ConsistentHashing.from_topology(data['pending_ring']) if data['pending_ring'] else None
+        self.replication_factor = data['replication_factor']
+        self.coordinator_cache = data.get('cache', False)
+        self.replication.reset_quorum(data['quorum_write'], data['quorum_read'], data['replication_factor'])
+        self.epoch = data['epoch']
+
+    def check_topology(self):
+        """
+        Rilegge la topologia se è passato refresh_interval dall'ultimo controllo o se nel frattempo una richiesta
+        verso un nodo è fallita. Se il coordinatore non risponde si continua con la topologia nota.
+        """
+        if self.transport.failures == self.last_failures and time.monotonic() - self.last_refresh < self.refresh_interval:
+            return
+        with self.lock:
+            if self.transport.failures == self.last_failures and time.monotonic() - self.last_refresh < self.refresh_interval:
+                return  # un altro thread ha già aggiornato la topologia
+            try:
+                self.refresh_topology()
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to refresh topology: {e}")
+                self.last_refresh = time.monotonic()
+                self.last_failures = self.transport.failures
+
+    def write_nodes(self, key):
+        """
+        Restituisce i nodi a cui inviare una scrittura, compresi i nuovi proprietari durante un ribilanciamento, come
+        Coordinator.write_nodes.
+        :param key: chiave da scrivere
+        :return: tupla (lista dei nodi responsabili, numero di nuovi proprietari in coda alla lista)
+        """
+        nodes = self.ring.get_nodes(key, self.replication_factor)
+        pending = []
+        if self.pending_ring is not None:
+            pending = [node for node in self.pending_ring.get_nodes(key, self.replication_factor) if node not in nodes]
+        return nodes + pending, len(pending)
+
+    def invalidate_cache(self, versions):
+        """
+        Invalida nella cache del coordinatore le chiavi scritte direttamente sulle repliche. Se il coordinatore non
+        risponde l'errore viene solo segnalato: la voce vecchia resta in cache fino alla scadenza (--cache_ttl).
+        :param versions: dizionario chiave -> versione scritta
+        """
+        if not self.coordinator_cache or not versions:
+            return
+        try:
+            response = requests.post(f"http://{self.coordinator_url}/cache_invalidate", json={"versions": versions})
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to invalidate the coordinator cache: {e}")
+
+    def put(self, key, value, ttl=None, consistency=None):
+        """
+        Scrive un valore direttamente sulle repliche responsabili.
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param ttl: durata in secondi dopo la quale la chiave scade (None per nessuna scadenza)
+        :param consistency: ONE, QUORUM, ALL o numero di repliche che devono confermare (None per il quorum del cluster)
+        :return: esito e livello di consistenza raggiunto, nello stesso formato del coordinatore, None se il
+                 livello di consistenza non è stato raggiunto
+        :raises ValueError: se il livello di consistenza non è valido o supera il fattore di replicazione, o se ttl
+                            non è un numero positivo
+        """
+        level = parse_consistency(consistency, self.replication_factor)
+        ttl = parse_ttl(ttl)
+        self.check_topology()
+        if ttl:
+            value = with_ttl(value, ttl)
+        nodes, pending = self.write_nodes(key)
+        version = self.clock.now()
+        success, acks = self.replication.replicate_write(key, value, nodes, version, level, with_acks=True,
+                                                         pending=pending)
+        # Anche una scrittura fallita può essere stata applicata su alcune repliche
+        self.invalidate_cache({key: version})
+        if success:
+            return {"status": "success", "consistency": {"level": level or QUORUM, "achieved": acks}}
+        print(f"Failed to PUT data: consistency level {level or QUORUM} not reached for key {key} ({acks} replicas)")
+        return None
+
+    def get(self, key, fresh=False, consistency=None, with_consistency=False):
+        """
+        Legge un valore direttamente dalle repliche responsabili.
+        :param key: chiave da leggere
+        :param fresh: ignorato, le letture vanno sempre alle repliche
+        :param consistency: ONE, QUORUM, ALL o numero di repliche che devono rispondere (None per il quorum del cluster)
+        :param with_consistency: se True restituisce la tupla (valore, livello di consistenza raggiunto)
+        :return: valore della chiave se il livello di consistenza è stato raggiunto, None altrimenti
+        :raises ValueError: se il livello di consistenza non è valido o supera il fattore di replicazione
+        """
+        level = parse_consistency(consistency, self.replication_factor)
+        self.check_topology()
+        try:
+            value, found = self.replication.get_from_replicas(key, self.ring.get_nodes(key, self.replication_factor),
+                                                              level=level, with_acks=True)
+        except ConsistencyUnavailable as e:
+            print(f"Failed to GET data: {e}")
+            value, found = None, e.achieved
+        value = live_value(value)
+        return (value, {"level": level or QUORUM, "achieved": found}) if with_consistency else value
+
+    def mput(self, items):
+        """
+        Scrive più valori con una richiesta bulk per replica.
+        :param items: dizionario chiave-valore da scrivere
+        :return: esito complessivo e per ogni chiave, nello stesso formato del coordinatore
+        """
+        self.check_topology()
+        targets = {key: self.write_nodes(key) for key in items}
+        key_nodes = {key: nodes for key, (nodes, _) in targets.items()}
+        versions = {key: self.clock.now() for key in items}
+        results = self.replication.replicate_write_many(items, key_nodes, versions,
+                                                        pending={key: pending for key, (_, pending) in targets.items()})
+        self.invalidate_cache(versions)
+        return {
+            "status": "success" if all(results.values()) else "failure",
+            "results": {key: "success" if ok else "failure" for key, ok in results.items()},
+        }
+
+    def mget(self, keys):
+        """
+        Legge più valori con una richiesta bulk per replica.
+        :param keys: lista delle chiavi da leggere
+        :return: dizionario chiave-valore (None per le chiavi non trovate)
+        """
+        self.check_topology()
+        key_nodes = {key: self.ring.get_nodes(key, self.replication_factor) for key in keys}
+        values = self.replication.get_many_from_replicas(key_nodes)
+        return {key: live_value(value) for key, value in values.items()}
 
 
 # Esempio di utilizzo del client
@@ -52,20 +357,61 @@ if __name__ == "__main__":
     # Parsing degli argomenti da linea di comando
     parser = argparse.ArgumentParser(description="Client for interacting with the distributed storage system")
     parser.add_argument('--coordinator_address', required=True, help='The address of the coordinator (IP:port)')
-    parser.add_argument('--operation', required=True, choices=['put', 'get'], help='The operation to perform')
-    parser.add_argument('--key', required=True, help='The key to operate on')
-    parser.add_argument('--value', help='The value to put')  # Optional argument for PUT operation
+    parser.add_argument('--operation', required=True, choices=['put', 'get', 'mput', 'mget', 'scan', 'put_blob', 'get_blob'], help='The operation to perform')
+    parser.add_argument('--key', required=True, help='The key to operate on (comma separated for mput/mget, key prefix for scan)')
+    parser.add_argument('--value', help='The value to put (comma separated for mput)')  # Optional argument for PUT operation
+    parser.add_argument('--file', help='For put_blob: file to upload; for get_blob: file to write the value to')
+    parser.add_argument('--ttl', type=float, help='For put: seconds after which the key expires')
+    parser.add_argument('--consistency', help='For put/get: ONE, QUORUM, ALL or a number of replicas (default: the coordinator quorum)')
+    parser.add_argument('--fresh', action='store_true', help='For get: bypass the coordinator read cache and read a quorum of replicas')
+    parser.add_argument('--smart', action='store_true', help='Fetch the ring from the coordinator and talk to the replicas directly')
 
     args = parser.parse_args()
 
-    client = Client(coordinator_url=args.coordinator_address)
+    client = SmartClient(coordinator_url=args.coordinator_address) if args.smart else Client(coordinator_url=args.coordinator_address)
 
     if args.operation == 'put':
         if args.value is None:
             print("PUT operation requires a value.")
         else:
-            response = client.put(args.key, args.value)
-            print(f"PUT Response: {response}")
+            try:
+                response = client.put(args.key, args.value, args.ttl, args.consistency)
+                print(f"PUT Response: {response}")
+            except ValueError as e:
+                parser.error(str(e))
     elif args.operation == 'get':
-        response = client.get(args.key)
-        print(f"GET Response: {response}")
+        try:
+            response, consistency = client.get(args.key, fresh=args.fresh, consistency=args.consistency,
+                                               with_consistency=True)
+            print(f"GET Response: {response} (consistency: {consistency})")
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.operation == 'mput':
+        keys = args.key.split(',')
+        values = args.value.split(',') if args.value is not None else []
+        if len(keys) != len(values):
+            print("MPUT operation requires one value per key.")
+        else:
+            response = client.mput(dict(zip(keys, values)))
+            print(f"MPUT Response: {response}")
+    elif args.operation == 'mget':
+        response = client.mget(args.key.split(','))
+        print(f"MGET Response: {response}")
+    elif args.operation == 'scan':
+        for key, value in client.scan(prefix=args.key):
+            print(f"{key}: {value}")
+    elif args.operation == 'put_blob':
+        if args.file is None:
+            print("PUT_BLOB operation requires a file.")
+        else:
+            with open(args.file, 'rb') as f:
+                response = client.put_blob(args.key, f)
+            print(f"PUT_BLOB Response: {response}")
+    elif args.operation == 'get_blob':
+        if args.file is None:
+            response = client.get_blob(args.key)
+            print(f"GET_BLOB Response: {len(response) if response is not None else None} bytes")
+        else:
+            with open(args.file, 'wb') as f:
+                response = client.get_blob(args.key, f)
+            print(f"GET_BLOB Response: {response}")
@@ -1,22 +1,30 @@
+import bisect
 import hashlib
-import logging
 import threading
 
+MAX_TOKEN = (1 << 128) - 1  # token massimo dello spazio MD5
+
 
 class ConsistentHashing:
     """
     Questa classe rappresenta la struttura dati per la consistent hashing.
     """
-    def __init__(self, num_virtual_nodes=3):
+    def __init__(self, num_virtual_nodes=3, preference_size=3):
         """
         Inizializza la struttura dati per la consistent hashing.
         :param num_virtual_nodes: numero di repliche virtuali per ogni nodo
+        :param preference_size: numero di nodi fisici distinti precalcolati per ogni posizione del ring
         """
         self.num_virtual_nodes = num_virtual_nodes
+        self.preference_size = preference_size
         self.ring = {}  # dizionario che mappa l'hash di un nodo al nodo stesso
         self.sorted_nodes = []  # lista ordinata degli hash dei nodi
         self.nodes_status = {}  # dizionario che mappa lo stato di un nodo (online/offline)
+        self.weights = {}  # dizionario che mappa ogni nodo al suo peso
         self.lock = threading.Lock()  # lock per garantire la consistenza della struttura dati
+        # Tabella delle preference list: per ogni posizione del ring, la tupla dei prossimi nodi fisici online.
+        # Viene pubblicata insieme alla lista dei token come unica tupla, così le letture non richiedono il lock.
+        self._lookup = ([], [])
 
     @staticmethod
     def _hash(key):
@@ -25,20 +33,93 @@ class ConsistentHashing:
         :param key: chiave da hashare
         :return: intero rappresentante l'hash MD5 della chiave
         """
-        return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest(), 'big')
+
+    def _walk(self, sorted_nodes, start_idx, count, online_only=True):
+        """
+        Percorre il ring a partire da start_idx e raccoglie i primi count nodi fisici online distinti.
+        :param sorted_nodes: lista ordinata degli hash dei nodi
+        :param start_idx: indice da cui iniziare la ricerca
+        :param count: numero di nodi da raccogliere
+        :param online_only: se False vengono considerati anche i nodi offline
+        :return: tupla dei nodi trovati (può contenerne meno di count se non ci sono abbastanza nodi online)
+        """
+        nodes = []
+        size = len(sorted_nodes)
+        for step in range(size):
+            node = self.ring[sorted_nodes[(start_idx + step) % size]]
+            if (self.nodes_status.get(node, False) or not online_only) and node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+        return tuple(nodes)
 
-    def add_node(self, node):
+    def _affected_positions(self, sorted_nodes, idx, node):
+        """
+        Restituisce le posizioni del ring la cui preference list può contenere il token in posizione idx.
+        Si risale il ring all'indietro finché non si incontrano preference_size nodi online diversi da node.
+        :param sorted_nodes: lista ordinata degli hash dei nodi
+        :param idx: posizione del token di node
+        :param node: nodo di cui è cambiato lo stato
+        :return: insieme degli indici da ricalcolare
+        """
+        size = len(sorted_nodes)
+        affected = {idx}
+        seen = set()
+        for step in range(1, size):
+            j = (idx - step) % size
+            other = self.ring[sorted_nodes[j]]
+            if other != node and self.nodes_status[other]:
+                seen.add(other)
+            if len(seen) >= self.preference_size:
+                break
+            affected.add(j)
+        return affected
+
+    def _refresh(self, sorted_nodes, preference, node):
+        """
+        Ricalcola in modo incrementale le voci della tabella influenzate da un cambio di stato di node.
+        :param sorted_nodes: lista ordinata degli hash dei nodi
+        :param preference: tabella delle preference list da aggiornare
+        :param node: nodo aggiunto, rimosso o tornato online
+        """
+        affected = set()
+        for i, node_hash in enumerate(sorted_nodes):
+            if self.ring[node_hash] == node:
+                affected |= self._affected_positions(sorted_nodes, i, node)
+        for i in affected:
+            preference[i] = self._walk(sorted_nodes, i, self.preference_size)
+
+    def virtual_nodes(self, weight=1.0):
+        """
+        Restituisce il numero di repliche virtuali di un nodo con il peso indicato.
+        :param weight: peso del nodo (1 = nodo standard)
+        :return: numero di token del nodo sul ring (almeno 1)
+        """
+        return max(1, round(self.num_virtual_nodes * weight))
+
+    def add_node(self, node, weight=1.0):
         """
         Aggiunge un nodo al ring di consistent hashing con le repliche virtuali corrispondenti.
+        Se il nodo è già presente nel ring viene semplicemente riportato online.
         :param node: coppia indirizzo-porta del nodo da aggiungere
+        :param weight: peso del nodo: il numero di repliche virtuali è proporzionale al peso, così un nodo con
+                       peso 2 possiede circa il doppio delle chiavi di un nodo con peso 1
         """
         with self.lock:
-            for i in range(self.num_virtual_nodes):
-                node_hash = self._hash(f"{node}-{i}")  # calcola l'hash del nodo concatenato con un indice virtuale
-                self.ring[node_hash] = node  # mappa l'hash del nodo al nodo stesso
-                self.sorted_nodes.append(node_hash)  # aggiunge l'hash del nodo alla lista ordinata
+            sorted_nodes, preference = list(self._lookup[0]), list(self._lookup[1])
+            if node not in self.nodes_status:
+                self.weights[node] = weight
+                for i in range(self.virtual_nodes(weight)):
+                    node_hash = self._hash(f"{node}-{i}")  # calcola l'hash del nodo concatenato con un indice virtuale
+                    self.ring[node_hash] = node  # mappa l'hash del nodo al nodo stesso
+                    idx = bisect.bisect_left(sorted_nodes, node_hash)
+                    sorted_nodes.insert(idx, node_hash)  # inserisce l'hash mantenendo la lista ordinata
+                    preference.insert(idx, ())
             self.nodes_status[node] = True  # imposta lo stato del nodo come online
-            self.sorted_nodes.sort()  # riordina la lista degli hash dei nodi
+            self._refresh(sorted_nodes, preference, node)
+            self.sorted_nodes = sorted_nodes
+            self._lookup = (sorted_nodes, preference)
 
     def remove_node(self, node):
         """
@@ -46,37 +127,132 @@ class ConsistentHashing:
         :param node: coppia indirizzo-porta del nodo da rimuovere
         """
         with self.lock:
-            if node in self.nodes_status:
+            if node in self.nodes_status and self.nodes_status[node]:
                 self.nodes_status[node] = False  # imposta lo stato del nodo come offline
+                sorted_nodes, preference = self._lookup[0], list(self._lookup[1])
+                self._refresh(sorted_nodes, preference, node)
+                self._lookup = (sorted_nodes, preference)
+
+    def decommission_node(self, node):
+        """
+        Elimina definitivamente un nodo dal ring, insieme alle sue repliche virtuali, per ridurre la capacità
+        del cluster. A differenza di remove_node il nodo non viene solo marcato offline.
+        :param node: coppia indirizzo-porta del nodo da eliminare
+        """
+        with self.lock:
+            if node not in self.nodes_status:
+                return
+            sorted_nodes, preference = list(self._lookup[0]), list(self._lookup[1])
+            if self.nodes_status[node]:
+                # Una volta offline il nodo non compare più in nessuna preference list
+                self.nodes_status[node] = False
+                self._refresh(sorted_nodes, preference, node)
+            keep = [i for i, node_hash in enumerate(sorted_nodes) if self.ring[node_hash] != node]
+            sorted_nodes = [sorted_nodes[i] for i in keep]
+            preference = [preference[i] for i in keep]
+            self.sorted_nodes = sorted_nodes
+            self._lookup = (sorted_nodes, preference)
+            # Le voci di self.ring restano: letture concorrenti possono usare ancora la lista dei token precedente
+            self.nodes_status = {other: status for other, status in self.nodes_status.items() if other != node}
+            self.weights.pop(node, None)
+
+    def copy(self):
+        """
+        Restituisce una copia indipendente del ring, usata per calcolare il ring dopo un cambio di membership
+        senza modificare quello in uso.
+        :return: nuova istanza di ConsistentHashing
+        """
+        with self.lock:
+            other = ConsistentHashing(self.num_virtual_nodes, self.preference_size)
+            other.ring = dict(self.ring)
+            other.nodes_status = dict(self.nodes_status)
+            other.weights = dict(self.weights)
+            other.sorted_nodes = list(self.sorted_nodes)
+            other._lookup = (list(self._lookup[0]), list(self._lookup[1]))
+            return other
+
+    def topology(self):
+        """
+        Restituisce una descrizione serializzabile del ring, da cui un client può ricostruirlo con from_topology.
+        :return: dizionario con parametri, token, stato e peso dei nodi
+        """
+        sorted_nodes = self._lookup[0]
+        return {
+            "num_virtual_nodes": self.num_virtual_nodes,
+            "preference_size": self.preference_size,
+            "tokens": [[token, self.ring[token]] for token in sorted_nodes],
+            "nodes": dict(self.nodes_status),
+            "weights": dict(self.weights),
+        }
+
+    @classmethod
+    def from_topology(cls, topology):
+        """
+        Ricostruisce un ring a partire dalla descrizione restituita da topology.
+        :param topology: dizionario con parametri, token, stato e peso dei nodi
+        :return: nuova istanza di ConsistentHashing
+        """
+        ring = cls(topology['num_virtual_nodes'], topology['preference_size'])
+        ring.nodes_status = dict(topology['nodes'])
+        ring.weights = dict(topology['weights'])
+        sorted_nodes = []
+        for token, node in topology['tokens']:
+            ring.ring[token] = node
+            sorted_nodes.append(token)
+        preference = [ring._walk(sorted_nodes, i, ring.preference_size) for i in range(len(sorted_nodes))]
+        ring.sorted_nodes = sorted_nodes
+        ring._lookup = (sorted_nodes, preference)
+        return ring
+
+    def get_ranges(self):
+        """
+        Restituisce gli intervalli di token del ring con i nodi responsabili di ciascuno.
+        L'intervallo che attraversa lo zero viene diviso in due parti.
+        :return: lista di tuple (primo token, ultimo token, tupla dei nodi responsabili), estremi inclusi
+        """
+        sorted_nodes, preference = self._lookup
+        ranges = []
+        for i, node_hash in enumerate(sorted_nodes):
+            if i == 0:
+                ranges.append((0, node_hash, preference[0]))
+                if sorted_nodes[-1] < MAX_TOKEN:
+                    ranges.append((sorted_nodes[-1] + 1, MAX_TOKEN, preference[0]))
+            else:
+                ranges.append((sorted_nodes[i - 1] + 1, node_hash, preference[i]))
+        return ranges
+
+    def get_owners(self, key, count):
+        """
+        Restituisce i proprietari naturali della chiave, compresi i nodi offline. Serve a sapere a quali nodi
+        offline erano destinate le scritture, per registrarne gli hint.
+        :param key: chiave per la quale trovare i nodi corrispondenti
+        :param count: numero di nodi da restituire
+        :return: lista di coppie indirizzo-porta dei nodi proprietari della chiave
+        """
+        sorted_nodes = self._lookup[0]
+        if not sorted_nodes:
+            return []
+        start_idx = bisect.bisect_left(sorted_nodes, self._hash(key)) % len(sorted_nodes)
+        return list(self._walk(sorted_nodes, start_idx, count, online_only=False))
 
     def get_nodes(self, key, count):
         """
         Restituisce i nodi corrispondenti alla chiave fornita, utile per la replica dei dati.
+        Il token di partenza viene trovato con una ricerca binaria e i nodi vengono letti dalla tabella
+        precalcolata; il ring viene percorso solo se count supera preference_size.
         :param key: chiave per la quale trovare i nodi corrispondenti
         :param count: numero di nodi da restituire
         :return: lista di coppie indirizzo-porta dei nodi corrispondenti alla chiave
         """
-        nodes = []
-        key_hash = self._hash(key)
-        logging.info(f"Hash dei nodi: {self.sorted_nodes}")
+        sorted_nodes, preference = self._lookup
+        if not sorted_nodes:
+            return []
 
-        # Trova l'indice del nodo a partire dal quale cercare i nodi corrispondenti alla chiave
-        for i, node_hash in enumerate(self.sorted_nodes):
-            if key_hash <= node_hash:
-                start_idx = i
-                break
-        else:
+        # Trova l'indice del primo token maggiore o uguale all'hash della chiave
+        start_idx = bisect.bisect_left(sorted_nodes, self._hash(key))
+        if start_idx == len(sorted_nodes):
             start_idx = 0
-            
-        logging.info(f"Start index for key '{key}' with hash {key_hash}: {start_idx}")
-
-        # Trova i nodi corrispondenti alla chiave
-        while len(nodes) < count :
-            node = self.ring[self.sorted_nodes[start_idx % len(self.sorted_nodes)]]
-            logging.info(f"Nodo: {node}")
-            logging.info(f"hash: {self.sorted_nodes[start_idx % len(self.sorted_nodes)]}")
-            if self.nodes_status[node] and node not in nodes:  # Assicurati che il nodo non sia duplicato
-                nodes.append(node)
-            start_idx += 1
-        logging.info(f"Responsible nodes for key '{key}': {nodes}")
-        return nodes
+
+        if count <= self.preference_size:
+            return list(preference[start_idx][:count])
+        return list(self._walk(sorted_nodes, start_idx, count))
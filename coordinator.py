@@ -1,9 +1,26 @@
 import argparse
+import base64
+import heapq
+import itertools
+import json
+import requests
 import threading
 import logging
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify
+from blob import CHUNK_SIZE, CODECS, IDENTITY, ValueTooLarge, accepts, compress, decompress, limit_size
 from consistent_hashing import ConsistentHashing
-from replication import Replication
+from expiry import live_value, parse_ttl, with_ttl
+from replication import QUORUM, ConsistencyUnavailable, Replication, StreamsExhausted, iter_raw, parse_consistency
+from anti_entropy import AntiEntropy
+from versioning import HybridLogicalClock
+from hinted_handoff import HintStore, HintedHandoff
+from rebalancing import Rebalancer
+from read_cache import ReadCache
+from metrics import HotKeys, Metrics
+from replica_selection import ReplicaSelector
+from transport import NodeTransport
+from wire import WireTransport
 import time
 
 # Configura il logging
@@ -13,7 +30,14 @@ class Coordinator:
     """
     Questa classe rappresenta il coordinatore del sistema di storage distribuito.
     """
-    def __init__(self, nodes_list, replication_factor, quorum_write, quorum_read, address):
+    def __init__(self, nodes_list, replication_factor, quorum_write, quorum_read, address,
+                 max_workers=32, max_connections_per_node=10, rpc_timeout=5.0, anti_entropy_interval=30,
+                 hints_dir=None, max_memory_hints=10000, max_hints=1000000,
+                 rebalance_batch_size=500, rebalance_rate=5000, num_virtual_nodes=3, node_weights=None,
+                 wire_port_offset=0, cache_max_bytes=0, cache_ttl=0, scan_batch_size=500,
+                 hot_keys=20, hedge_percentile=95, write_batch_size=64, write_batch_delay=0.0005,
+                 max_value_size=64 * 1024 * 1024, compression='deflate', compression_threshold=64 * 1024,
+                 max_blob_streams=8, transport=None, clock=None):
         """
         Inizializza il coordinatore con la lista di nodi e il fattore di replicazione specificati.
         :param nodes_list: lista che contiene coppie indirizzo-porta dei nodi iniziali
@@ -21,61 +45,584 @@ class Coordinator:
         :param quorum_write: quorum di scrittura
         :param quorum_read: quorum di lettura
         :param address: indirizzo del coordinatore (IP:porta)
+        :param max_workers: numero massimo di thread dell'executor condiviso per le richieste alle repliche
+        :param max_connections_per_node: numero massimo di connessioni keep-alive verso ciascun nodo
+        :param rpc_timeout: timeout (in secondi) di ogni richiesta verso un nodo
+        :param anti_entropy_interval: intervallo (in secondi) tra due cicli di anti-entropy, 0 per disattivarla
+        :param hints_dir: directory in cui scrivere gli hint oltre la soglia in memoria
+        :param max_memory_hints: numero massimo di hint tenuti in memoria
+        :param max_hints: numero massimo di hint complessivi
+        :param rebalance_batch_size: numero di chiavi per richiesta durante il ribilanciamento
+        :param rebalance_rate: chiavi al secondo trasferite durante il ribilanciamento (0 per non limitarle)
+        :param num_virtual_nodes: numero di repliche virtuali di un nodo con peso 1
+        :param node_weights: dizionario nodo -> peso (i nodi assenti hanno peso 1)
+        :param wire_port_offset: se maggiore di 0, le operazioni sulle repliche usano il protocollo binario dei nodi
+                                 sulla porta HTTP + wire_port_offset
+        :param cache_max_bytes: dimensione massima in byte della cache delle letture, 0 per disattivarla
+        :param cache_ttl: durata (in secondi) delle voci della cache, 0 per non farle scadere
+        :param scan_batch_size: numero di chiavi lette da ciascun nodo per richiesta durante una scansione
+        :param hot_keys: numero di chiavi più richieste riportate su /metrics
+        :param hedge_percentile: percentile delle latenze di lettura oltre il quale una lettura viene duplicata su
+                                 un'altra replica, 0 per disattivare le hedged read
+        :param write_batch_size: numero massimo di scritture verso lo stesso nodo raggruppate in una richiesta bulk,
+                                 0 per inviare ogni scrittura separatamente
+        :param write_batch_delay: attesa massima (in secondi) di una scrittura prima dell'invio del suo blocco
+        :param max_value_size: dimensione massima (in byte) di un blob ricevuto, 0 per non limitarla
+        :param compression: codifica con cui comprimere i blob ("identity" per non comprimerli)
+        :param compression_threshold: dimensione (in byte) oltre la quale un blob viene compresso
+        :param max_blob_streams: numero massimo di upload di blob contemporanei, oltre il quale /blob risponde 503
+        :param transport: trasporto verso i nodi (default: NodeTransport con pool di connessioni HTTP); le simulazioni
+                          passano un trasporto virtuale con la stessa interfaccia
+        :param clock: orologio in secondi usato per le versioni e per le statistiche delle repliche al posto
+                      dell'orologio di sistema (per le simulazioni con tempo virtuale)
         """
-        self.hash_ring = ConsistentHashing()
+        self.hash_ring = ConsistentHashing(num_virtual_nodes=num_virtual_nodes, preference_size=replication_factor)
+        node_weights = node_weights or {}
         self.replication_factor = replication_factor
         self.quorum_write = quorum_write
         self.quorum_read = quorum_read
-        self.replication = Replication(self.quorum_write, self.quorum_read)
+        self.metrics = Metrics()  # contatori e latenze esposti su /metrics
+        self.hot_keys = HotKeys(k=hot_keys)
+        # Executor e pool di connessioni condivisi da tutte le operazioni del coordinatore
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='replication')
+        self.transport = transport if transport is not None else NodeTransport(
+            max_connections_per_node=max_connections_per_node, read_timeout=rpc_timeout)
+        self.hints = HintStore(hints_dir=hints_dir, max_memory_hints=max_memory_hints, max_hints=max_hints)
+        self.wire = WireTransport(wire_port_offset, timeout=rpc_timeout) if wire_port_offset > 0 else None
+        self.replication = Replication(self.quorum_write, self.quorum_read, transport=self.transport, executor=self.executor,
+                                       hints=self.hints, wire=self.wire, metrics=self.metrics,
+                                       selector=ReplicaSelector(hedge_percentile=hedge_percentile, clock=clock),
+                                       write_batch_size=write_batch_size, write_batch_delay=write_batch_delay,
+                                       replication_factor=replication_factor, max_streams=max_blob_streams)
+        self.handoff = HintedHandoff(self.hints, self.replication)
         self.address = address
         self.node_offline = False  # Flag per indicare se un nodo è offline
+        self.clock = HybridLogicalClock(clock)  # assegna la versione a ogni scrittura
+        self.anti_entropy = AntiEntropy(self.hash_ring, self.transport, interval=anti_entropy_interval)
+        self.rebalancer = Rebalancer(self.transport, batch_size=rebalance_batch_size, max_keys_per_second=rebalance_rate)
+        self.rebalance_lock = threading.Lock()  # un solo cambio di membership alla volta
+        self.restoring = set()  # nodi con un restore_node_with_retry in corso
+        self.restoring_lock = threading.Lock()
+        self.pending_ring = None  # ring futuro durante un ribilanciamento, riceve le scritture doppie
+        self.rebalance_status = {"state": "idle"}
+        self.cache = ReadCache(cache_max_bytes, cache_ttl) if cache_max_bytes > 0 else None
+        self.scan_batch_size = scan_batch_size
+        self.max_value_size = max_value_size
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.epoch = 0  # incrementato a ogni cambio del ring o dei quorum, segnala ai client che la topologia è cambiata
 
         # Aggiunge i nodi iniziali al ring di consistent hashing
         for node in nodes_list:
             logging.info(f"Adding node {node} to the ring.")
-            self.hash_ring.add_node(node)
+            self.hash_ring.add_node(node, node_weights.get(node, 1.0))
 
-    def put(self, key, value):
+    def put(self, key, value, ttl=None, level=None, with_acks=False):
         """
         Scrive il valore della chiave su più nodi.
         :param key: chiave da scrivere
         :param value: valore da scrivere
-        :return: True se almeno quorum_write scritture hanno avuto successo, False altrimenti
+        :param ttl: durata in secondi dopo la quale la chiave scade (None per nessuna scadenza)
+        :param level: livello di consistenza della scrittura (vedi parse_consistency), None per quorum_write
+        :param with_acks: se True restituisce la tupla (esito, repliche che hanno confermato)
+        :return: True se il livello di consistenza è stato raggiunto, False altrimenti
         """
-        responsible_nodes = self.hash_ring.get_nodes(key, self.replication_factor)
-        logging.info(f"Responsible nodes for key '{key}': {responsible_nodes}")
-        return self.replication.replicate_write(key, value, responsible_nodes)
+        self.hot_keys.add(key)
+        # La scadenza viene calcolata qui, una volta sola, così tutte le repliche scadono nello stesso istante
+        if ttl:
+            value = with_ttl(value, ttl)
+        responsible_nodes, pending = self.write_nodes(key)
+        version = self.clock.now()
+        self.hint_offline_owners({key: value}, {key: version})
+        success, acks = self.replication.replicate_write(key, value, responsible_nodes, version, level, with_acks=True,
+                                                         pending=pending)
+        self.update_cache({key: value}, {key: version}, {key: success})
+        return (success, acks) if with_acks else success
 
-    def get(self, key):
+    def get(self, key, use_cache=True, level=None, with_acks=False):
         """
         Legge il valore della chiave da più nodi e restituisce la prima risposta valida ricevuta.
         :param key: chiave da leggere
-        :return: valore della chiave se almeno quorum_read letture hanno avuto successo, None altrimenti
+        :param use_cache: se False la chiave viene letta dalle repliche anche se è in cache
+        :param level: livello di consistenza della lettura (vedi parse_consistency), None per quorum_read; con un
+                      livello esplicito la chiave viene letta dalle repliche anche se è in cache
+        :param with_acks: se True restituisce la tupla (valore, repliche che hanno restituito la chiave), con
+                          None al posto del numero di repliche se il valore viene dalla cache
+        :return: valore della chiave, None se nessuna replica la restituisce
+        :raises ConsistencyUnavailable: se il livello di consistenza non può essere raggiunto
+        """
+        self.hot_keys.add(key)
+        if self.cache is not None and use_cache and level is None:
+            value = self.cache.get(key)
+            if value is not None:
+                value = live_value(value)
+                if value is not None:
+                    return (value, None) if with_acks else value
+                self.cache.invalidate(key)  # scaduta mentre era in cache
+
+        responsible_nodes = self.read_nodes(key)
+
+        # Ottiene il valore della chiave da almeno quorum_read nodi o da quorum_read - 1 nodi se un nodo è offline.
+        # Le repliche non allineate vengono riparate in background dal servizio di anti-entropy.
+        record, found = self.replication.get_from_replicas(key, responsible_nodes, with_version=True, level=level,
+                                                           with_acks=True)
+        # Una lettura più debole del quorum potrebbe restituire un valore vecchio: non entra in cache
+        if self.cache is not None and level in (None, QUORUM):
+            self.fill_cache(key, record)
+        value = live_value(record[0]) if record is not None else None
+        return (value, found) if with_acks else value
+
+    def mput(self, items):
+        """
+        Scrive più chiavi raggruppandole per nodo responsabile, con una richiesta bulk per nodo.
+        :param items: dizionario chiave-valore da scrivere
+        :return: dizionario che mappa ogni chiave a True se il quorum di scrittura è stato raggiunto
+        """
+        for key in items:
+            self.hot_keys.add(key)
+        targets = {key: self.write_nodes(key) for key in items}
+        key_nodes = {key: nodes for key, (nodes, _) in targets.items()}
+        versions = {key: self.clock.now() for key in items}
+        self.hint_offline_owners(items, versions)
+        results = self.replication.replicate_write_many(items, key_nodes, versions,
+                                                        pending={key: pending for key, (_, pending) in targets.items()})
+        self.update_cache(items, versions, results)
+        return results
+
+    def mget(self, keys):
+        """
+        Legge più chiavi raggruppandole per nodo responsabile, con una richiesta bulk per nodo.
+        :param keys: lista delle chiavi da leggere
+        :return: dizionario che mappa ogni chiave al suo valore, o a None se il quorum non è stato raggiunto
+        """
+        for key in keys:
+            self.hot_keys.add(key)
+        key_nodes = {key: self.read_nodes(key) for key in keys}
+        values = self.replication.get_many_from_replicas(key_nodes)
+        return {key: live_value(value) for key, value in values.items()}
+
+    def node_keys(self, node, start, end, prefix, after):
+        """
+        Legge in ordine le chiavi di un nodo, una pagina alla volta. Se il nodo non risponde lo stream termina
+        e le sue chiavi vengono lette dalle altre repliche.
+        :param node: coppia indirizzo-porta del nodo
+        :param start: prima chiave del range (inclusa, None per nessun limite)
+        :param end: fine del range (esclusa, None per nessun limite)
+        :param prefix: prefisso delle chiavi (None per tutte)
+        :param after: chiave da cui proseguire (None per iniziare dalla prima)
+        :return: generatore di record [chiave, valore, versione] in ordine di chiave
+        """
+        while True:
+            try:
+                response = self.transport.post(node, '/keys', json={
+                    "start": start, "end": end, "prefix": prefix, "after": after, "limit": self.scan_batch_size,
+                })
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Failed to scan keys of node {node}: {e}")
+                return
+            data = response.json()
+            yield from data['records']
+            if data['next'] is None:
+                return
+            after = data['next']
+
+    def scan(self, start=None, end=None, prefix=None, after=None):
+        """
+        Scorre in ordine le chiavi del cluster unendo gli stream ordinati dei nodi online. Una chiave presente su
+        più repliche viene restituita una sola volta, con il valore della versione più recente. In memoria resta
+        al più una pagina per nodo.
+        :param start: prima chiave del range (inclusa, None per nessun limite)
+        :param end: fine del range (esclusa, None per nessun limite)
+        :param prefix: prefisso delle chiavi (None per tutte)
+        :param after: chiave da cui proseguire (None per iniziare dalla prima)
+        :return: generatore di tuple (chiave, valore) in ordine di chiave
+        """
+        streams = [self.node_keys(node, start, end, prefix, after)
+                   for node, online in self.hash_ring.nodes_status.items() if online]
+        current = None
+        for record in heapq.merge(*streams, key=lambda record: record[0]):
+            if current is not None and record[0] != current[0]:
+                value = live_value(current[1])
+                if value is not None:
+                    yield current[0], value
+                current = None
+            if current is None or record[2] > current[2]:
+                current = record
+        if current is not None:
+            value = live_value(current[1])
+            if value is not None:
+                yield current[0], value
+
+    @staticmethod
+    def encode_cursor(key):
+        """
+        Codifica il cursore opaco che permette di riprendere una scansione dopo la chiave indicata.
+        :param key: ultima chiave restituita
+        :return: cursore (stringa base64 url-safe)
+        """
+        return base64.urlsafe_b64encode(json.dumps({"after": key}).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decodifica un cursore prodotto da encode_cursor.
+        :param cursor: cursore ricevuto dal client (None o stringa vuota per la prima pagina)
+        :return: chiave da cui proseguire, None per la prima pagina
+        :raises ValueError: se il cursore non è valido
+        """
+        if not cursor:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))['after']
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f"invalid cursor: {cursor}") from e
+
+    def scan_page(self, start=None, end=None, prefix=None, after=None, limit=1000):
+        """
+        Produce una pagina di una scansione: le coppie chiave-valore seguite dal cursore della pagina successiva.
+        :param start: prima chiave del range (inclusa, None per nessun limite)
+        :param end: fine del range (esclusa, None per nessun limite)
+        :param prefix: prefisso delle chiavi (None per tutte)
+        :param after: chiave da cui proseguire, ottenuta con decode_cursor
+        :param limit: numero massimo di chiavi della pagina, 0 per scorrere tutte le chiavi
+        :return: generatore di dizionari {"key", "value"}, l'ultimo è {"cursor"} (None se la scansione è finita)
         """
+        count, last = 0, None
+        for key, value in self.scan(start, end, prefix, after):
+            if limit and count == limit:
+                yield {"cursor": self.encode_cursor(last)}
+                return
+            yield {"key": key, "value": value}
+            count, last = count + 1, key
+        yield {"cursor": None}
 
-        responsible_nodes = self.hash_ring.get_nodes(key, self.replication_factor)
+    def fill_cache(self, key, result):
+        """
+        Inserisce in cache il risultato di una lettura dalle repliche.
+        :param key: chiave letta
+        :param result: tupla (valore, versione), None se la lettura non ha raggiunto il quorum
+        :return: valore letto, None se la lettura non ha raggiunto il quorum
+        """
+        if result is None:
+            return None
+        self.cache.put(key, *result)
+        return result[0]
 
-        # Ottiene il valore della chiave da almeno quorum_read nodi o da quorum_read - 1 nodi se un nodo è offline
-        value = self.replication.get_from_replicas(key, responsible_nodes)
+    def update_cache(self, items, versions, results):
+        """
+        Aggiorna la cache dopo una scrittura. Le chiavi la cui scrittura non ha raggiunto il quorum vengono
+        rimosse, perché le repliche potrebbero avere sia il valore nuovo sia quello vecchio.
+        :param items: dizionario chiave-valore scritto
+        :param versions: dizionario chiave-versione
+        :param results: dizionario chiave -> True se il quorum di scrittura è stato raggiunto
+        """
+        if self.cache is None:
+            return
+        for key, value in items.items():
+            if results[key]:
+                self.cache.put(key, value, versions[key])
+            else:
+                self.cache.invalidate(key)
 
-        # Propaga il valore ai nodi che non ce l'hanno se il nodo è offline
-        if value is not None:
-            if self.node_offline:
-                self.propagate_value(key, value, responsible_nodes)
-            return value
-        return None
+    def invalidate_cache(self, versions):
+        """
+        Invalida le chiavi scritte direttamente sulle repliche, ad esempio dallo SmartClient o da un import bulk,
+        che altrimenti resterebbero in cache con il valore vecchio.
+        :param versions: dizionario chiave -> versione scritta
+        """
+        if self.cache is None:
+            return
+        for key, version in versions.items():
+            self.cache.invalidate(key, version)
+
+    def flush_cache(self, before):
+        """
+        Rimuove dalla cache le chiavi dei range che hanno cambiato proprietario rispetto al ring before.
+        :param before: copia del ring prima del cambio
+        """
+        if self.cache is not None:
+            moved = Rebalancer.moving_ranges(before, self.hash_ring)
+            self.cache.invalidate_ranges([r for ranges in moved.values() for r in ranges])
 
-    def propagate_value(self, key, value, responsible_nodes):
+    def get_topology(self):
+        """
+        Restituisce la topologia del cluster pubblicata per i client che instradano le richieste direttamente ai nodi.
+        :return: dizionario con epoca, ring, ring futuro durante un ribilanciamento, fattore di replica, quorum e
+                 presenza della cache delle letture (i client che scrivono sulle repliche devono invalidarla)
         """
-        Propaga il valore ai nodi che non ce l'hanno.
-        :param key: chiave da replicare
-        :param value: valore da replicare
-        :param responsible_nodes: nodi responsabili della chiave
+        pending_ring = self.pending_ring
+        return {
+            "epoch": self.epoch,
+            "ring": self.hash_ring.topology(),
+            "pending_ring": pending_ring.topology() if pending_ring is not None else None,
+            "replication_factor": self.replication_factor,
+            "quorum_write": self.replication.quorum_write,
+            "quorum_read": self.replication.quorum_read,
+            "cache": self.cache is not None,
+        }
+
+    def read_nodes(self, key):
+        """
+        Restituisce i nodi da cui leggere la chiave, misurando il tempo del lookup sul ring.
+        :param key: chiave da leggere
+        :return: lista dei nodi responsabili
+        """
+        began = time.perf_counter()
+        nodes = self.hash_ring.get_nodes(key, self.replication_factor)
+        self.metrics.observe('ring_lookup', time.perf_counter() - began)
+        return nodes
+
+    def write_nodes(self, key):
+        """
+        Restituisce i nodi a cui inviare una scrittura. Durante un ribilanciamento la scrittura va anche ai nuovi
+        proprietari della chiave, così i range in trasferimento non perdono gli aggiornamenti; le loro conferme si
+        aggiungono al livello richiesto invece di sostituire quelle dei proprietari attuali (vedi required_replicas).
+        :param key: chiave da scrivere
+        :return: tupla (lista dei nodi responsabili, numero di nuovi proprietari in coda alla lista)
+        """
+        began = time.perf_counter()
+        nodes = self.hash_ring.get_nodes(key, self.replication_factor)
+        pending = []
+        pending_ring = self.pending_ring
+        if pending_ring is not None:
+            pending = [node for node in pending_ring.get_nodes(key, self.replication_factor) if node not in nodes]
+        self.metrics.observe('ring_lookup', time.perf_counter() - began)
+        return nodes + pending, len(pending)
+
+    def put_blob(self, key, chunks, encoding=IDENTITY):
+        """
+        Scrive un blob su più nodi in streaming. Un blob ricevuto non compresso viene compresso con la codifica
+        configurata se supera compression_threshold; un blob già compresso dal client viene inoltrato così com'è.
+        :param key: chiave da scrivere
+        :param chunks: iterabile dei blocchi del corpo della richiesta
+        :param encoding: codifica con cui il client ha inviato il corpo
+        :return: True se almeno quorum_write scritture hanno avuto successo, False altrimenti
+        :raises ValueTooLarge: se il corpo supera max_value_size
+        :raises StreamsExhausted: se max_blob_streams upload sono già in corso
         """
-        for node in responsible_nodes:
-            # Se il nodo non ha il valore, lo scriviamo di nuovo
-            if not self.replication.has_value(node, key):
-                self.replication.replicate_write(key, value, [node])
+        self.hot_keys.add(key)
+        chunks = limit_size(chunks, self.max_value_size)
+        if encoding == IDENTITY and self.compression != IDENTITY:
+            # Legge l'inizio del corpo per decidere se comprimerlo: i valori piccoli restano non compressi
+            head = bytearray()
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= self.compression_threshold:
+                    break
+            compressible = len(head) >= self.compression_threshold
+            chunks = itertools.chain([bytes(head)] if head else [], chunks)
+            if compressible:
+                encoding = self.compression
+                chunks = compress(chunks, encoding)
+        version = self.clock.now()
+        nodes, pending = self.write_nodes(key)
+        success = self.replication.replicate_stream(key, chunks, nodes, version, encoding, pending)
+        if self.cache is not None:
+            self.cache.invalidate(key)
+        return success
+
+    def get_blob(self, key, accept_encoding=None):
+        """
+        Individua la replica più recente tra quorum_read repliche e ne inoltra il blob in streaming. Se il client non
+        accetta la codifica con cui il blob è memorizzato, il blob viene decompresso al volo.
+        :param key: chiave da leggere
+        :param accept_encoding: header Accept-Encoding del client
+        :return: tupla (stato HTTP, header, generatore dei blocchi); i blocchi sono None se la lettura non è riuscita
+        """
+        self.hot_keys.add(key)
+        located = self.replication.newest_replica(key, self.read_nodes(key))
+        if located is None:
+            return 503, {}, None
+        node, version = located
+        if node is None:
+            return 404, {}, None
+        response = self.replication.stream_from_node(node, key)
+        if response is None:
+            return 503, {}, None
+        if response.status_code != 200:
+            response.close()
+            return response.status_code, {}, None
+        encoding = response.headers.get('Content-Encoding', IDENTITY)
+        headers = {"X-Version": str(version)}
+        chunks = iter_raw(response)
+        if accepts(accept_encoding, encoding):
+            headers["Content-Length"] = response.headers['Content-Length']
+            if encoding != IDENTITY:
+                headers["Content-Encoding"] = encoding
+        else:
+            chunks = decompress(chunks, encoding)
+        return 200, headers, chunks
+
+    def get_metrics(self, buckets=False):
+        """
+        Restituisce le metriche del coordinatore.
+        :param buckets: se True include i conteggi per bucket degli istogrammi
+        :return: dizionario con contatori, istogrammi, chiavi più richieste e stato di cache, hint e read repair
+        """
+        snapshot = self.metrics.snapshot(buckets)
+        snapshot["hot_keys"] = self.hot_keys.hottest()
+        snapshot["gauges"] = {
+            "epoch": self.epoch,
+            "hints_pending": self.hints.count(),
+            "hints_dropped": self.hints.dropped,
+            "read_repair_pending": self.replication.read_repair.queue.qsize(),
+            "read_repaired": self.replication.read_repair.repaired,
+            "read_repair_dropped": self.replication.read_repair.dropped,
+            "transport_failures": self.transport.failures,
+        }
+        snapshot["replicas"] = self.replication.selector.stats()
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.stats()
+        return snapshot
+
+    def hint_offline_owners(self, items, versions):
+        """
+        Registra gli hint per i proprietari naturali delle chiavi che sono offline: le loro scritture vanno ad
+        altri nodi e verranno rinviate quando tornano online.
+        :param items: dizionario chiave-valore scritto
+        :param versions: dizionario chiave-versione
+        """
+        if not self.node_offline:
+            return
+        for key, value in items.items():
+            for node in self.hash_ring.get_owners(key, self.replication_factor):
+                if not self.hash_ring.nodes_status[node]:
+                    self.hints.add(node, key, value, versions[key])
+
+    def restore_node(self, node_id):
+        """
+        Riammette un nodo tornato online: gli rinvia gli hint a blocchi, lo riporta online nel ring e rinvia gli
+        hint accumulati nel frattempo. Se il primo rinvio fallisce il nodo resta offline, altrimenti le letture
+        con livello ONE potrebbero essere servite da una replica a cui mancano le scritture degli hint.
+        Se tutti i nodi sono online ripristina i quorum configurati.
+        :param node_id: identificatore del nodo tornato online
+        :return: True se il nodo è stato riammesso
+        """
+        if node_id not in self.hash_ring.nodes_status:
+            logging.error(f"Unknown node {node_id} reported online.")
+            return False
+        if not self.handoff.replay(node_id):
+            logging.warning(f"Node {node_id} stays offline: hint replay failed.")
+            return False
+        before = self.hash_ring.copy()
+        self.hash_ring.add_node(node_id)
+        self.flush_cache(before)
+        self.handoff.replay(node_id)
+        if all(self.hash_ring.nodes_status.values()):
+            self.node_offline = False
+            self.replication.reset_quorum(self.quorum_write, self.quorum_read)
+        self.epoch += 1
+        logging.info(f"Node {node_id} restored and marked as online.")
+        return True
+
+    def restore_node_with_retry(self, node_id, delay=1.0, max_delay=30.0):
+        """
+        Riammette un nodo con restore_node, ritentando con attesa crescente finché il rinvio degli hint non riesce:
+        il nodo di tolleranza ai guasti notifica il ritorno online una sola volta. Le notifiche dello stesso nodo
+        ricevute mentre i tentativi sono in corso vengono ignorate.
+        :param node_id: identificatore del nodo tornato online
+        :param delay: attesa (in secondi) prima del secondo tentativo, raddoppiata a ogni tentativo fallito
+        :param max_delay: attesa massima tra due tentativi
+        :return: True se il nodo è stato riammesso, False se non fa più parte del ring o un altro thread lo sta
+                 già riammettendo
+        """
+        with self.restoring_lock:
+            if node_id in self.restoring:
+                return False
+            self.restoring.add(node_id)
+        try:
+            while not self.restore_node(node_id):
+                if node_id not in self.hash_ring.nodes_status:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+            return True
+        finally:
+            with self.restoring_lock:
+                self.restoring.discard(node_id)
+
+    def join_node(self, node_id, weight=1.0):
+        """
+        Aggiunge un nuovo nodo al cluster a caldo. I range che passano al nuovo nodo vengono trasferiti in
+        background e il ring viene aggiornato solo alla fine del trasferimento.
+        :param node_id: coppia indirizzo-porta del nuovo nodo
+        :param weight: peso del nodo nel ring
+        :return: True se il ribilanciamento è stato avviato
+        """
+        if not self.rebalance_lock.acquire(blocking=False):
+            logging.error(f"Cannot add node {node_id}: a rebalance is already running.")
+            return False
+        if node_id in self.hash_ring.nodes_status:
+            self.rebalance_lock.release()
+            logging.error(f"Cannot add node {node_id}: it is already in the ring.")
+            return False
+        target = self.hash_ring.copy()
+        target.add_node(node_id, weight)
+        self.start_rebalance(target, lambda: self.hash_ring.add_node(node_id, weight), f"join {node_id}")
+        return True
+
+    def decommission_node(self, node_id):
+        """
+        Elimina un nodo dal cluster a caldo. I suoi range vengono trasferiti in background ai nuovi proprietari
+        e il nodo esce dal ring solo alla fine del trasferimento; da quel momento può essere spento.
+        :param node_id: coppia indirizzo-porta del nodo da eliminare
+        :return: True se il ribilanciamento è stato avviato
+        """
+        if not self.rebalance_lock.acquire(blocking=False):
+            logging.error(f"Cannot decommission node {node_id}: a rebalance is already running.")
+            return False
+        if node_id not in self.hash_ring.nodes_status or len(self.hash_ring.nodes_status) <= self.replication_factor:
+            self.rebalance_lock.release()
+            logging.error(f"Cannot decommission node {node_id}: unknown node or too few nodes left.")
+            return False
+        target = self.hash_ring.copy()
+        target.decommission_node(node_id)
+        self.start_rebalance(target, lambda: self.hash_ring.decommission_node(node_id), f"decommission {node_id}")
+        return True
+
+    def start_rebalance(self, target, switch, operation):
+        """
+        Avvia il trasferimento dei dati verso il ring target in un thread in background. Va chiamato con
+        rebalance_lock acquisito, che viene rilasciato alla fine del trasferimento.
+        :param target: ring dopo il cambio di membership
+        :param switch: funzione che applica il cambio di membership al ring in uso
+        :param operation: descrizione dell'operazione, riportata nello stato del ribilanciamento
+        """
+        # Le scritture doppie iniziano prima della copia dei dati
+        self.pending_ring = target
+        self.epoch += 1
+        self.rebalance_status = {"state": "running", "operation": operation}
+
+        def run():
+            try:
+                moved = self.rebalancer.run(self.hash_ring, target)
+                before = self.hash_ring.copy()
+                switch()  # pubblica il nuovo ring in modo atomico
+                self.flush_cache(before)
+                # I vecchi proprietari liberano in blocco le partizioni dei range ceduti
+                self.rebalancer.drop_released(before, self.hash_ring)
+                self.rebalance_status = {"state": "done", "operation": operation, "keys_moved": moved}
+                logging.info(f"Rebalance '{operation}' completed, {moved} keys moved.")
+            except requests.exceptions.RequestException as e:
+                self.rebalance_status = {"state": "failed", "operation": operation, "error": str(e)}
+                logging.error(f"Rebalance '{operation}' failed: {e}")
+            finally:
+                self.pending_ring = None
+                self.epoch += 1
+                self.rebalance_lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_rebalance_status(self):
+        """
+        Restituisce lo stato dell'ultimo ribilanciamento.
+        :return: dizionario con stato, operazione e chiavi trasferite
+        """
+        status = dict(self.rebalance_status)
+        if status["state"] == "running":
+            status["keys_moved"] = self.rebalancer.keys_moved
+        return status
 
     def remove_node(self, node_id):
         """
@@ -83,33 +630,115 @@ class Coordinator:
         :param node_id: identificatore del nodo da rimuovere
         :return: None
         """
+        if node_id not in self.hash_ring.nodes_status:
+            # Nodo già eliminato dal cluster con decommission_node
+            logging.info(f"Ignoring failure of node {node_id}, which is not in the ring.")
+            return
+        before = self.hash_ring.copy()
         self.hash_ring.remove_node(node_id)
+        self.flush_cache(before)
         self.node_offline = True
         self.replication.update_quorum(self.quorum_write, self.quorum_read)
+        self.epoch += 1
         logging.info(f"Node {node_id} removed and marked as offline.")
 
     def start(self):
 
         # Crea l'istanza dell'applicazione Flask
         app = Flask(__name__)
+        self.metrics.instrument(app)
 
         # Endpoint per PUT (scrittura)
         @app.route('/put/<key>', methods=['PUT'])
         def put(key):
             value = request.json['value']
-            if coordinator.put(key, value):
-                return jsonify({"status": "success"})
+            try:
+                level = parse_consistency(request.json.get('consistency'), coordinator.replication_factor)
+                ttl = parse_ttl(request.json.get('ttl'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            success, acks = coordinator.put(key, value, ttl, level, with_acks=True)
+            consistency = {"level": level or QUORUM, "achieved": acks}
+            if success:
+                return jsonify({"status": "success", "consistency": consistency})
             else:
-                return jsonify({"status": "failure"}), 500
+                return jsonify({"status": "failure", "consistency": consistency}), 500
 
         # Endpoint per GET (lettura)
         @app.route('/get/<key>', methods=['GET'])
         def get(key):
-            value = coordinator.get(key)
+            # Con ?fresh=1 la chiave viene letta dalle repliche con il quorum anche se è in cache;
+            # ?consistency=ONE|QUORUM|ALL|<repliche> sceglie quante repliche devono rispondere
+            try:
+                level = parse_consistency(request.args.get('consistency'), coordinator.replication_factor)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            try:
+                value, acks = coordinator.get(key, use_cache=request.args.get('fresh') != '1', level=level,
+                                              with_acks=True)
+            except ConsistencyUnavailable as e:
+                # La chiave può esistere: non si risponde 404 ma 503, come per un quorum non raggiunto
+                return jsonify({"value": None, "error": str(e),
+                                "consistency": {"level": level or QUORUM, "achieved": e.achieved}}), 503
+            # Il livello raggiunto è il numero di repliche che hanno restituito la chiave (None se letta dalla cache)
+            consistency = {"level": level or QUORUM, "achieved": acks}
             if value is not None:
-                return jsonify({"value": value})
+                return jsonify({"value": value, "consistency": consistency})
             else:
-                return jsonify({"value": None}), 404
+                return jsonify({"value": None, "consistency": consistency}), 404
+
+        # Endpoint per scrivere un blob: il corpo viene inoltrato alle repliche a blocchi, senza leggerlo per intero
+        @app.route('/blob/<key>', methods=['PUT'])
+        def put_blob(key):
+            encoding = request.headers.get('Content-Encoding', IDENTITY)
+            if encoding != IDENTITY and encoding not in CODECS:
+                return jsonify({"error": f"Unsupported encoding {encoding}"}), 415
+            if coordinator.max_value_size and (request.content_length or 0) > coordinator.max_value_size:
+                return jsonify({"error": "Value too large"}), 413
+            try:
+                success = coordinator.put_blob(key, iter(lambda: request.stream.read(CHUNK_SIZE), b''), encoding)
+            except ValueTooLarge as e:
+                return jsonify({"error": str(e)}), 413
+            except StreamsExhausted as e:
+                return jsonify({"error": str(e)}), 503
+            if success:
+                return jsonify({"status": "success"})
+            return jsonify({"status": "failure"}), 500
+
+        # Endpoint per leggere un blob in streaming
+        @app.route('/blob/<key>', methods=['GET'])
+        def get_blob(key):
+            status, headers, chunks = coordinator.get_blob(key, request.headers.get('Accept-Encoding'))
+            if chunks is None:
+                return jsonify({"value": None}), status
+            return Response(chunks, headers=headers, mimetype='application/octet-stream')
+
+        # Endpoint per MPUT (scrittura di più chiavi)
+        @app.route('/mput', methods=['PUT'])
+        def mput():
+            results = coordinator.mput(request.json['items'])
+            return jsonify({
+                "status": "success" if all(results.values()) else "failure",
+                "results": {key: "success" if ok else "failure" for key, ok in results.items()},
+            })
+
+        # Endpoint per MGET (lettura di più chiavi)
+        @app.route('/mget', methods=['POST'])
+        def mget():
+            return jsonify({"values": coordinator.mget(request.json['keys'])})
+
+        # Endpoint per la scansione ordinata delle chiavi: la pagina viene inviata in streaming come JSON lines,
+        # l'ultima riga contiene il cursore della pagina successiva
+        @app.route('/scan', methods=['GET'])
+        def scan():
+            try:
+                after = coordinator.decode_cursor(request.args.get('cursor'))
+                limit = int(request.args.get('limit', 1000))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            lines = coordinator.scan_page(request.args.get('start'), request.args.get('end'),
+                                          request.args.get('prefix'), after, limit)
+            return Response((json.dumps(line) + '\n' for line in lines), mimetype='application/x-ndjson')
 
         # Endpoint per notificare un nodo offline
         @app.route('/node_offline', methods=['POST'])
@@ -118,6 +747,56 @@ class Coordinator:
             coordinator.remove_node(node_id)
             return jsonify({"status": "node removed"})
 
+        # Endpoint per notificare un nodo tornato online
+        @app.route('/node_online', methods=['POST'])
+        def notify_node_online():
+            node_id = request.json['node']
+            # Il rinvio degli hint può richiedere tempo: viene eseguito in background
+            threading.Thread(target=coordinator.restore_node_with_retry, args=(node_id,), daemon=True).start()
+            return jsonify({"status": "node restore started"})
+
+        # Endpoint per aggiungere un nodo al cluster a caldo
+        @app.route('/add_node', methods=['POST'])
+        def add_node():
+            if coordinator.join_node(request.json['node'], request.json.get('weight', 1.0)):
+                return jsonify({"status": "rebalance started"}), 202
+            return jsonify({"status": "failure"}), 409
+
+        # Endpoint per eliminare un nodo dal cluster a caldo
+        @app.route('/decommission_node', methods=['POST'])
+        def decommission_node():
+            if coordinator.decommission_node(request.json['node']):
+                return jsonify({"status": "rebalance started"}), 202
+            return jsonify({"status": "failure"}), 409
+
+        # Endpoint per la topologia del cluster; con ?epoch=N restituisce solo l'epoca se non è cambiata
+        @app.route('/topology', methods=['GET'])
+        def topology():
+            if request.args.get('epoch') == str(coordinator.epoch):
+                return jsonify({"epoch": coordinator.epoch})
+            return jsonify(coordinator.get_topology())
+
+        # Endpoint per invalidare le chiavi scritte direttamente sulle repliche
+        @app.route('/cache_invalidate', methods=['POST'])
+        def cache_invalidate():
+            coordinator.invalidate_cache(request.json['versions'])
+            return jsonify({"status": "success"})
+
+        # Endpoint per i contatori della cache delle letture
+        @app.route('/cache_stats', methods=['GET'])
+        def cache_stats():
+            return jsonify(coordinator.cache.stats() if coordinator.cache is not None else {})
+
+        # Endpoint per le metriche; con ?buckets=1 include i bucket degli istogrammi, che si possono sommare tra processi
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            return jsonify(coordinator.get_metrics(request.args.get('buckets') == '1'))
+
+        # Endpoint per lo stato del ribilanciamento
+        @app.route('/rebalance_status', methods=['GET'])
+        def rebalance_status():
+            return jsonify(coordinator.get_rebalance_status())
+
         # Avvia il server Flask con l'indirizzo e la porta specificati
         app.run(host=self.address.split(':')[0], port=int(self.address.split(':')[1]))
 
@@ -132,10 +811,37 @@ if __name__ == '__main__':
     parser.add_argument('--replication_factor', type=int, default=3, help='Replication factor')
     parser.add_argument('--quorum_write', type=int, default=2, help='Quorum write value')
     parser.add_argument('--quorum_read', type=int, default=2, help='Quorum read value')
+    parser.add_argument('--max_workers', type=int, default=32, help='Size of the shared executor used for replica requests')
+    parser.add_argument('--max_connections_per_node', type=int, default=10, help='Keep-alive connections kept open to each node')
+    parser.add_argument('--rpc_timeout', type=float, default=5.0, help='Timeout in seconds of each request to a node')
+    parser.add_argument('--anti_entropy_interval', type=float, default=30, help='Seconds between Merkle-tree anti-entropy rounds (0 disables it)')
+    parser.add_argument('--hints_dir', help='Directory where hinted-handoff hints are spilled once over --max_memory_hints')
+    parser.add_argument('--max_memory_hints', type=int, default=10000, help='Hints kept in memory before spilling to disk')
+    parser.add_argument('--max_hints', type=int, default=1000000, help='Maximum number of pending hints')
+    parser.add_argument('--rebalance_batch_size', type=int, default=500, help='Keys per request when streaming ranges between nodes')
+    parser.add_argument('--rebalance_rate', type=int, default=5000, help='Maximum keys per second moved by a rebalance (0 disables the limit)')
+    parser.add_argument('--num_virtual_nodes', type=int, default=3, help='Virtual nodes (ring tokens) per node of weight 1')
+    parser.add_argument('--node_weights', type=str, default='', help='Node weights as IP:port=weight pairs separated by commas (default weight 1)')
+    parser.add_argument('--wire_port_offset', type=int, default=0, help='Talk to nodes with the binary protocol on their HTTP port plus this offset (0 uses HTTP)')
+    parser.add_argument('--cache_max_bytes', type=int, default=0, help='Size in bytes of the coordinator read cache (0 disables it)')
+    parser.add_argument('--cache_ttl', type=float, default=0, help='Seconds a cached value stays valid (0 means no expiry)')
+    parser.add_argument('--scan_batch_size', type=int, default=500, help='Keys fetched from each node per request during a key scan')
+    parser.add_argument('--hot_keys', type=int, default=20, help='Number of hottest keys reported on /metrics')
+    parser.add_argument('--hedge_percentile', type=float, default=95, help='Duplicate a read on another replica once it is slower than this percentile of recent reads (0 disables hedging)')
+    parser.add_argument('--write_batch_size', type=int, default=64, help='Maximum writes to the same node coalesced into one bulk request (0 sends every write on its own)')
+    parser.add_argument('--write_batch_delay', type=float, default=0.5, help='Milliseconds a write may wait for its batch to fill before it is sent')
+    parser.add_argument('--max_value_size', type=int, default=64 * 1024 * 1024, help='Maximum size in bytes of a blob received on /blob (0 disables the limit)')
+    parser.add_argument('--compression', choices=['identity', *CODECS], default='deflate', help='Encoding used to compress blobs stored by the coordinator (identity disables it)')
+    parser.add_argument('--compression_threshold', type=int, default=64 * 1024, help='Blobs smaller than this many bytes are stored uncompressed')
+    parser.add_argument('--max_blob_streams', type=int, default=8, help='Concurrent blob uploads; further uploads get 503 (each one holds a thread or connection per replica)')
+    parser.add_argument('--access_log', action='store_true', help='Log every HTTP request (off by default, it costs throughput)')
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded', help='Serving mode: Flask worker threads or a single asyncio event loop')
 
     args = parser.parse_args()
 
     nodes = args.nodes.split(',')  # Converte la stringa di nodi in una lista
+    # Converte la stringa dei pesi "nodo=peso,..." in un dizionario
+    node_weights = {node: float(weight) for node, weight in (item.rsplit('=', 1) for item in args.node_weights.split(',') if item)}
 
     coordinator = Coordinator(
         nodes_list=nodes,
@@ -143,13 +849,54 @@ if __name__ == '__main__':
         quorum_write=args.quorum_write,
         quorum_read=args.quorum_read,
         address=args.address,
+        max_workers=args.max_workers,
+        max_connections_per_node=args.max_connections_per_node,
+        rpc_timeout=args.rpc_timeout,
+        anti_entropy_interval=args.anti_entropy_interval,
+        hints_dir=args.hints_dir,
+        max_memory_hints=args.max_memory_hints,
+        max_hints=args.max_hints,
+        rebalance_batch_size=args.rebalance_batch_size,
+        rebalance_rate=args.rebalance_rate,
+        num_virtual_nodes=args.num_virtual_nodes,
+        node_weights=node_weights,
+        wire_port_offset=args.wire_port_offset,
+        cache_max_bytes=args.cache_max_bytes,
+        cache_ttl=args.cache_ttl,
+        scan_batch_size=args.scan_batch_size,
+        hot_keys=args.hot_keys,
+        hedge_percentile=args.hedge_percentile,
+        write_batch_size=args.write_batch_size,
+        write_batch_delay=args.write_batch_delay / 1000,
+        max_value_size=args.max_value_size,
+        compression=args.compression,
+        compression_threshold=args.compression_threshold,
+        max_blob_streams=args.max_blob_streams,
     )
 
-    threading.Thread(target=coordinator.start, daemon=True).start()
+    # Il log di ogni richiesta formatta una riga per operazione: le metriche su /metrics lo sostituiscono
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
-    # Mantieni il main thread attivo
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Stopping coordinator.")
+    # Avvia il servizio di anti-entropy in background
+    if args.anti_entropy_interval > 0:
+        coordinator.anti_entropy.start()
+
+    if args.mode == 'async':
+        # Import locale: aiohttp serve solo per la modalità asincrona
+        from async_coordinator import AsyncCoordinator
+        AsyncCoordinator(
+            coordinator,
+            max_connections_per_node=args.max_connections_per_node,
+            rpc_timeout=args.rpc_timeout,
+            access_log=args.access_log,
+        ).start()
+    else:
+        threading.Thread(target=coordinator.start, daemon=True).start()
+
+        # Mantieni il main thread attivo
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Stopping coordinator.")
@@ -0,0 +1,171 @@
+import random
+
+ENTRY_OVERHEAD = 200  # byte stimati per chiave oltre a chiave e valore (record, indici, metadati)
+DIGEST_OVERHEAD = 150  # byte stimati per il digest di una chiave eliminata, oltre alla chiave
+EVICTED_SHARE = 0.1  # quota di max_memory riservata ai digest delle chiavi eliminate
+LFU_INIT = 5  # contatore LFU di una chiave appena scritta, così non viene subito eliminata
+LFU_LOG_FACTOR = 10  # più è alto, più accessi servono per incrementare un contatore già alto
+LFU_DECAY_TIME = 60  # secondi senza accessi dopo i quali il contatore LFU diminuisce di 1
+
+# Politiche di eliminazione selezionabili con --eviction_policy
+NOEVICTION = 'noeviction'
+POLICIES = (NOEVICTION, 'allkeys-lru', 'allkeys-lfu', 'volatile-lru', 'volatile-lfu', 'volatile-ttl')
+
+
+class MemoryFull(Exception):
+    """
+    Eccezione sollevata quando una scrittura supera la memoria massima del nodo e la politica è noeviction.
+    """
+
+
+class KeyMeta:
+    """
+    Metadati di una chiave usati per stimare la memoria e scegliere le chiavi da eliminare.
+    """
+    __slots__ = ('size', 'access', 'counter', 'expires')
+
+    def __init__(self, size, now, expires=None):
+        """
+        :param size: dimensione stimata della chiave in byte
+        :param now: istante della scrittura
+        :param expires: istante di scadenza, None se la chiave non scade
+        """
+        self.size = size
+        self.access = now  # ultimo accesso
+        self.counter = LFU_INIT  # contatore logaritmico degli accessi
+        self.expires = expires
+
+    def decayed_counter(self, now):
+        """
+        Restituisce il contatore LFU ridotto in base al tempo trascorso dall'ultimo accesso.
+        :param now: istante attuale
+        :return: contatore
+        """
+        return max(self.counter - int((now - self.access) / LFU_DECAY_TIME), 0)
+
+    def touch(self, now):
+        """
+        Registra un accesso. L'incremento del contatore è probabilistico (1 / (contatore * LFU_LOG_FACTOR + 1)),
+        così un contatore di 8 bit distingue chiavi con milioni di accessi. Viene chiamato senza lock dalle letture:
+        un aggiornamento perso rende solo meno precisa l'approssimazione.
+        :param now: istante dell'accesso
+        """
+        counter = self.decayed_counter(now)
+        if counter < 255 and random.random() < 1.0 / (max(counter - LFU_INIT, 0) * LFU_LOG_FACTOR + 1):
+            counter += 1
+        self.counter = counter
+        self.access = now
+
+
+class KeySampler:
+    """
+    Insieme di chiavi da cui estrarre campioni casuali in O(1): una lista con la posizione di ogni chiave,
+    da cui una chiave viene rimossa spostando al suo posto l'ultima.
+    """
+    def __init__(self):
+        """
+        Inizializza un insieme vuoto.
+        """
+        self.keys = []
+        self.positions = {}  # chiave -> posizione nella lista
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        """
+        Aggiunge una chiave, se non è già presente.
+        :param key: chiave
+        """
+        if key not in self.positions:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+
+    def discard(self, key):
+        """
+        Rimuove una chiave, se presente.
+        :param key: chiave
+        """
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        last = self.keys.pop()
+        if position < len(self.keys):
+            self.keys[position] = last
+            self.positions[last] = position
+
+    def choice(self, rnd=random):
+        """
+        Estrae una chiave a caso.
+        :param rnd: generatore casuale
+        :return: chiave, None se l'insieme è vuoto
+        """
+        try:
+            return self.keys[rnd.randrange(len(self.keys))]
+        except (IndexError, ValueError):
+            return None  # insieme vuoto, o ridotto da una scrittura concorrente (il campionamento non prende lock)
+
+
+class EvictionPolicy:
+    """
+    Sceglie le chiavi da eliminare quando il nodo supera la memoria massima, per campionamento come Redis:
+    invece di mantenere un ordinamento esatto di tutte le chiavi, esamina samples chiavi casuali e restituisce
+    la peggiore secondo la politica (meno usata di recente, meno usata, più vicina alla scadenza). Le politiche
+    volatile-* considerano prima le chiavi con scadenza e passano a tutte le chiavi solo se non ce ne sono.
+    """
+    def __init__(self, policy=NOEVICTION, samples=5, rnd=None):
+        """
+        :param policy: una delle POLICIES
+        :param samples: chiavi esaminate per ogni eliminazione
+        :param rnd: generatore casuale (default: modulo random)
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.samples = samples
+        self.rnd = rnd or random
+        self.volatile_first = policy.startswith('volatile-')
+        self.criterion = policy.split('-')[-1]  # lru, lfu o ttl
+
+    def score(self, meta, now):
+        """
+        Punteggio di una chiave: più è alto, prima la chiave viene eliminata.
+        :param meta: metadati della chiave
+        :param now: istante attuale
+        :return: punteggio
+        """
+        if self.criterion == 'lfu':
+            return (255 - meta.decayed_counter(now), now - meta.access)
+        if self.criterion == 'ttl' and meta.expires is not None:
+            return (1, -meta.expires)
+        if self.criterion == 'ttl':
+            return (0, now - meta.access)  # senza scadenza: solo dopo tutte le chiavi volatili, in ordine LRU
+        return (now - meta.access,)
+
+    def pick(self, partitions, now):
+        """
+        Sceglie la chiave da eliminare.
+        :param partitions: partizioni del nodo
+        :param now: istante attuale
+        :return: tupla (partizione, chiave), None se non c'è nessuna chiave eliminabile
+        """
+        if self.policy == NOEVICTION:
+            return None
+        pools = ['volatile', 'all_keys'] if self.volatile_first else ['all_keys']
+        for pool in pools:
+            candidates = [(partition, getattr(partition, pool)) for partition in partitions]
+            weights = [len(sampler) for _, sampler in candidates]
+            if not any(weights):
+                continue
+            best, best_score = None, None
+            for partition, sampler in self.rnd.choices(candidates, weights, k=self.samples):
+                key = sampler.choice(self.rnd)
+                meta = partition.meta.get(key) if key is not None else None
+                if meta is None:
+                    continue  # chiave cancellata nel frattempo
+                score = self.score(meta, now)
+                if best_score is None or score > best_score:
+                    best, best_score = (partition, key), score
+            if best is not None:
+                return best
+        return None
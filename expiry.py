@@ -0,0 +1,178 @@
+import math
+import time
+
+EXPIRES_FIELD = '$expires'  # campo che identifica un valore con scadenza, riservato
+
+
+def with_ttl(value, ttl, now=None):
+    """
+    Avvolge un valore nella forma con scadenza {"$expires": istante, "value": valore}. La scadenza è un istante
+    assoluto calcolato da chi scrive, così tutte le repliche (e i trasferimenti di read repair, anti-entropy,
+    hinted handoff e ribilanciamento, che copiano il valore così com'è) fanno scadere la chiave nello stesso momento.
+    :param value: valore da scrivere
+    :param ttl: durata in secondi
+    :param now: istante attuale (default: time.time())
+    :return: valore con scadenza
+    """
+    return {EXPIRES_FIELD: (time.time() if now is None else now) + ttl, 'value': value}
+
+
+def parse_ttl(ttl):
+    """
+    Valida la durata di una scrittura ricevuta da un client.
+    :param ttl: durata in secondi (None per nessuna scadenza)
+    :return: durata in secondi, None se ttl è None
+    :raises ValueError: se ttl non è un numero positivo: una durata nulla o negativa scriverebbe un valore già
+                        scaduto, cioè una cancellazione nascosta
+    """
+    if ttl is None:
+        return None
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or not math.isfinite(ttl) or ttl <= 0:
+        raise ValueError(f"ttl must be a positive number of seconds, got {ttl!r}")
+    return ttl
+
+
+def expires_at(value):
+    """
+    Restituisce la scadenza di un valore.
+    :param value: valore memorizzato
+    :return: istante di scadenza (secondi dall'epoca), None se il valore non scade
+    """
+    if isinstance(value, dict) and EXPIRES_FIELD in value:
+        return value[EXPIRES_FIELD]
+    return None
+
+
+def is_expired(value, now=None):
+    """
+    Verifica se un valore è scaduto.
+    :param value: valore memorizzato
+    :param now: istante attuale (default: time.time())
+    :return: True se il valore ha una scadenza già passata
+    """
+    expires = expires_at(value)
+    return expires is not None and expires <= (time.time() if now is None else now)
+
+
+def live_value(value, now=None):
+    """
+    Restituisce il valore da consegnare al client, senza la forma con scadenza.
+    :param value: valore memorizzato
+    :param now: istante attuale (default: time.time())
+    :return: valore originale, None se è scaduto
+    """
+    if expires_at(value) is None:
+        return value
+    return None if is_expired(value, now) else value.get('value')
+
+
+class TimingWheel:
+    """
+    Timing wheel gerarchica per le scadenze delle chiavi. Ogni livello ha slots posizioni; una posizione del
+    livello l copre slots^l tick, quindi una chiave viene inserita nel livello più basso che contiene la sua
+    scadenza e scende di livello quando la ruota inferiore completa un giro. Inserimento e cancellazione costano
+    O(1) e l'avanzamento esamina solo le chiavi in scadenza, senza scansioni dell'intero keyspace.
+    Non è thread-safe: ogni partizione del nodo ha la propria ruota, protetta dal lock della partizione.
+    """
+    def __init__(self, tick=0.1, slots=64, levels=4, now=None):
+        """
+        Inizializza una ruota vuota.
+        :param tick: risoluzione della ruota in secondi
+        :param slots: posizioni per livello
+        :param levels: numero di livelli (orizzonte = tick * slots^levels, oltre le chiavi attendono in overflow)
+        :param now: istante attuale (default: time.time())
+        """
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [{} for _ in range(levels)]  # livello -> posizione -> insieme di chiavi
+        self.overflow = set()  # chiavi oltre l'orizzonte dell'ultimo livello
+        self.entries = {}  # chiave -> (tick di scadenza, livello, posizione)
+        self.current = int((time.time() if now is None else now) / tick)  # ultimo tick elaborato
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _place(self, key, deadline, earliest):
+        """
+        Inserisce una chiave nel livello che contiene la sua scadenza.
+        :param key: chiave
+        :param deadline: tick di scadenza
+        :param earliest: primo tick non ancora elaborato, a cui va anticipata una scadenza già passata
+        """
+        due = max(deadline, earliest)
+        delta = due - self.current
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span:
+                slot = (due // (span // self.slots)) % self.slots
+                self.wheels[level].setdefault(slot, set()).add(key)
+                self.entries[key] = (deadline, level, slot)
+                return
+            span *= self.slots
+        self.overflow.add(key)
+        self.entries[key] = (deadline, self.levels, None)
+
+    def schedule(self, key, expires):
+        """
+        Registra o aggiorna la scadenza di una chiave.
+        :param key: chiave
+        :param expires: istante di scadenza (secondi dall'epoca)
+        """
+        self.cancel(key)
+        self._place(key, -int(-expires // self.tick), self.current + 1)  # arrotondato al tick successivo
+
+    def cancel(self, key):
+        """
+        Rimuove la scadenza di una chiave, se presente.
+        :param key: chiave
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        _, level, slot = entry
+        if level == self.levels:
+            self.overflow.discard(key)
+            return
+        keys = self.wheels[level][slot]
+        keys.discard(key)
+        if not keys:
+            del self.wheels[level][slot]
+
+    def _cascade(self, level, slot):
+        """
+        Ridistribuisce nei livelli inferiori le chiavi di una posizione.
+        :param level: livello della posizione (len(wheels) per l'overflow)
+        :param slot: posizione
+        """
+        if level == self.levels:
+            keys, self.overflow = self.overflow, set()
+        else:
+            keys = self.wheels[level].pop(slot, ())
+        # Il cascade avviene prima di elaborare il tick corrente, che quindi può ancora ricevere chiavi
+        for key in keys:
+            self._place(key, self.entries[key][0], self.current)
+
+    def advance(self, now=None):
+        """
+        Fa avanzare la ruota fino all'istante indicato.
+        :param now: istante attuale (default: time.time())
+        :return: lista delle chiavi scadute
+        """
+        target = int((time.time() if now is None else now) / self.tick)
+        expired = []
+        if not self.entries:
+            self.current = max(self.current, target)
+            return expired
+        while self.current < target:
+            self.current += 1
+            # Quando una ruota completa un giro, la posizione successiva del livello superiore scende di livello
+            span = self.slots ** self.levels
+            for level in range(self.levels, 0, -1):
+                if self.current % span == 0:
+                    self._cascade(level, (self.current // span) % self.slots)
+                span //= self.slots
+            for key in self.wheels[0].pop(self.current % self.slots, ()):
+                del self.entries[key]
+                expired.append(key)
+        return expired
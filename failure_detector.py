@@ -0,0 +1,132 @@
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from statistics import NormalDist
+
+
+class PhiAccrualFailureDetector:
+    """
+    Failure detector phi-accrual. Per ogni nodo mantiene la storia degli intervalli tra due heartbeat e calcola
+    il livello di sospetto phi = -log10(P(il prossimo heartbeat arrivi dopo il tempo trascorso)), assumendo
+    intervalli distribuiti normalmente. Un nodo è sospettato quando phi supera la soglia.
+    Poiché phi cresce con il tempo trascorso, per ogni nodo si calcola l'istante in cui phi raggiungerà la soglia
+    e lo si inserisce in un heap di scadenze: il controllo costa in proporzione ai nodi scaduti, non al numero di nodi.
+    """
+    def __init__(self, threshold=8.0, expected_interval=1.0, min_std_dev=0.2, acceptable_pause=1.0, window_size=100):
+        """
+        Inizializza il failure detector.
+        :param threshold: soglia di phi oltre la quale un nodo è sospettato (8 = una probabilità su 10^8 di errore)
+        :param expected_interval: intervallo atteso (in secondi) tra due heartbeat, usato finché non c'è storia
+        :param min_std_dev: deviazione standard minima degli intervalli, evita sospetti per piccoli ritardi
+        :param acceptable_pause: ritardo (in secondi) tollerato in più rispetto all'intervallo medio
+        :param window_size: numero di intervalli considerati per ogni nodo
+        """
+        self.threshold = threshold
+        self.expected_interval = expected_interval
+        self.min_std_dev = min_std_dev
+        self.acceptable_pause = acceptable_pause
+        self.window_size = window_size
+        # Numero di deviazioni standard oltre la media a cui phi raggiunge la soglia
+        self.threshold_z = NormalDist().inv_cdf(1 - 10 ** -threshold)
+        self.intervals = {}  # nodo -> deque degli ultimi intervalli tra heartbeat
+        self.last_arrival = {}  # nodo -> istante (monotonic) dell'ultimo heartbeat
+        self.deadlines = {}  # nodo -> istante in cui phi raggiunge la soglia
+        # Heap di tuple (scadenza, nodo): ogni heartbeat aggiunge una voce e quelle superate vengono scartate quando
+        # arrivano in cima, quindi l'heap contiene poche voci per nodo
+        self.heap = []
+        self.lock = threading.Lock()
+
+    def _stats(self, node):
+        """
+        Restituisce media e deviazione standard degli intervalli del nodo. Va chiamato con il lock acquisito.
+        :param node: id del nodo
+        :return: tupla (media, deviazione standard)
+        """
+        intervals = self.intervals[node]
+        mean = sum(intervals) / len(intervals)
+        variance = sum((x - mean) ** 2 for x in intervals) / len(intervals)
+        return mean + self.acceptable_pause, max(math.sqrt(variance), self.min_std_dev)
+
+    def _schedule(self, node, now):
+        """
+        Calcola la nuova scadenza del nodo e la inserisce nell'heap. Va chiamato con il lock acquisito.
+        :param node: id del nodo
+        :param now: istante dell'ultimo heartbeat
+        """
+        mean, std_dev = self._stats(node)
+        deadline = now + mean + std_dev * self.threshold_z
+        self.deadlines[node] = deadline
+        heapq.heappush(self.heap, (deadline, node))
+
+    def watch(self, node, grace, now=None):
+        """
+        Inizia a controllare un nodo che non ha ancora inviato heartbeat: viene sospettato se non ne invia
+        nessuno entro grace secondi.
+        :param node: id del nodo
+        :param grace: tempo concesso (in secondi) per il primo heartbeat
+        :param now: istante di riferimento (default: time.monotonic())
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.deadlines[node] = now + grace
+            heapq.heappush(self.heap, (now + grace, node))
+
+    def heartbeat(self, node, now=None):
+        """
+        Registra l'arrivo di un heartbeat.
+        :param node: id del nodo
+        :param now: istante di arrivo (default: time.monotonic())
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if node not in self.intervals:
+                # Nessuna storia: si parte dall'intervallo atteso
+                self.intervals[node] = deque([self.expected_interval], maxlen=self.window_size)
+            elif node in self.deadlines:
+                # L'assenza di un nodo sospettato non rappresenta un intervallo normale e non entra nella storia
+                self.intervals[node].append(now - self.last_arrival[node])
+            self.last_arrival[node] = now
+            self._schedule(node, now)
+
+    def phi(self, node, now=None):
+        """
+        Calcola il livello di sospetto attuale del nodo.
+        :param node: id del nodo
+        :param now: istante di riferimento (default: time.monotonic())
+        :return: valore di phi (0 se il nodo non ha mai inviato heartbeat)
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if node not in self.last_arrival:
+                return 0.0
+            mean, std_dev = self._stats(node)
+            elapsed = now - self.last_arrival[node]
+        p_later = 1 - NormalDist(mean, std_dev).cdf(elapsed)
+        return -math.log10(p_later) if p_later > 0 else math.inf
+
+    def expired(self, now=None):
+        """
+        Estrae i nodi il cui phi ha superato la soglia dall'ultimo controllo. Un nodo sospettato non viene
+        restituito di nuovo finché non riprende a inviare heartbeat.
+        :param now: istante di riferimento (default: time.monotonic())
+        :return: lista dei nodi sospettati
+        """
+        now = time.monotonic() if now is None else now
+        suspected = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, node = heapq.heappop(self.heap)
+                if self.deadlines.get(node) == deadline:
+                    del self.deadlines[node]
+                    suspected.append(node)
+        return suspected
+
+    def next_deadline(self):
+        """
+        Restituisce la prima scadenza nell'heap (può riferirsi a una voce non più valida).
+        :return: istante della prima scadenza, None se l'heap è vuoto
+        """
+        with self.lock:
+            return self.heap[0][0] if self.heap else None
@@ -1,11 +1,15 @@
 import argparse
 import logging
+import queue
 import requests
 import threading
 import time
 
 from flask import Flask, request, jsonify
 
+from failure_detector import PhiAccrualFailureDetector
+from metrics import Metrics
+
 # Configura il logging
 logging.basicConfig(level=logging.INFO)
 
@@ -15,19 +19,31 @@ class FaultTolerance:
     Classe che rappresenta il nodo di tolleranza ai guasti del sistema di storage distribuito.
     """
 
-    def __init__(self, address, all_nodes, coordinator_address):
+    def __init__(self, address, all_nodes, coordinator_address, detector=None, initial_grace=25, clock=None):
         """
         Inizializza il nodo di tolleranza ai guasti con l'indirizzo, la lista di tutti i nodi e l'indirizzo del coordinatore.
         param address: indirizzo del nodo di tolleranza ai guasti (IP:porta)
         param all_nodes: lista di tutti gli indirizzi (IP:porta) dei nodi
         param coordinator_address: indirizzo del coordinatore (IP:porta)
+        param detector: failure detector phi-accrual (default: PhiAccrualFailureDetector con i parametri di default)
+        param initial_grace: secondi concessi ai nodi iniziali per inviare il primo heartbeat
+        param clock: orologio in secondi usato sia per i timestamp degli heartbeat sia per il failure detector, al posto
+                     di time.time e time.monotonic (per le simulazioni con tempo virtuale)
         """
+        self.wall_clock = clock or time.time  # orologio dei timestamp inviati dai nodi
+        self.monotonic_clock = clock or time.monotonic  # orologio del failure detector
         self.address = address # Indirizzo del nodo di tolleranza ai guasti
         self.all_nodes = all_nodes  # lista di tutti gli id dei nodi
         self.coordinator_address = coordinator_address
         self.confirmed_failures = set()  # Set per tenere traccia dei nodi segnalati come offline
         self.lock = threading.Lock()
-        self.heartbeat_table = {node: time.time() for node in self.all_nodes}  # Inizializzare heartbeat_table con node_id come chiave e 0 come valore
+        self.heartbeat_table = {node: self.wall_clock() for node in self.all_nodes}  # Inizializzare heartbeat_table con node_id come chiave e 0 come valore
+        self.detector = detector if detector is not None else PhiAccrualFailureDetector()
+        self.metrics = Metrics()  # contatori e latenze esposti su /metrics
+        # Le notifiche al coordinatore vengono inviate da un solo thread, fuori dal lock e nell'ordine in cui avvengono
+        self.notifications = queue.Queue()
+        for node in self.all_nodes:
+            self.detector.watch(node, initial_grace, now=self.monotonic_clock())
 
     def update_heartbeat_table(self, node, timestamp):
         """
@@ -35,30 +51,60 @@ class FaultTolerance:
         param node: id del nodo da aggiornare (IP:porta)
         param timestamp: timestamp dell'heartbeat del nodo
         """
+        self.detector.heartbeat(node, now=self.monotonic_clock())
+        # Ritardo di consegna dell'heartbeat (i processi sono sullo stesso orologio o su orologi sincronizzati)
+        self.metrics.observe('heartbeat.lag', max(self.wall_clock() - timestamp, 0))
         with self.lock:
+            previous = self.heartbeat_table.get(node)
             self.heartbeat_table[node] = timestamp
+            recovered = node in self.confirmed_failures
+            self.confirmed_failures.discard(node)
+        if previous is not None and timestamp > previous:
+            self.metrics.observe('heartbeat.interval', timestamp - previous)
+        if recovered:
+            self.metrics.incr('recoveries')
+            # Gli heartbeat sono ripresi: il coordinatore viene avvisato dal thread delle notifiche
+            self.notifications.put((self.notify_coordinator_online, node))
+
+    def check_once(self):
+        """
+        Esamina i nodi scaduti nel failure detector e accoda la notifica al coordinatore per quelli il cui livello
+        di sospetto ha superato la soglia.
+        return: secondi fino alla prossima scadenza (al massimo 1, almeno 0.01)
+        """
+        for node in self.detector.expired(now=self.monotonic_clock()):
+            with self.lock:
+                if node in self.confirmed_failures:
+                    continue
+                self.confirmed_failures.add(node)  # Aggiungi il nodo al set dei fallimenti confermati
+            self.metrics.incr('failures_detected')
+            self.notifications.put((self.notify_coordinator, node))
+        next_deadline = self.detector.next_deadline()
+        delay = 1 if next_deadline is None else next_deadline - self.monotonic_clock()
+        return min(max(delay, 0.01), 1)
 
     def check_heartbeat_table(self):
         """
-        Controlla periodicamente la tabella degli heartbeat e notifica il coordinator se un nodo non invia un heartbeat
-        in un determinato delta di tempo, in questo caso 25 secondi.
+        Controlla le scadenze del failure detector e notifica il coordinator quando il livello di sospetto di un
+        nodo supera la soglia. Il thread si sveglia alla prima scadenza (al massimo ogni secondo) ed esamina solo
+        i nodi scaduti.
         """
         while True:
-            with self.lock:
-                current_time = time.time()
-                for node, timestamp in self.heartbeat_table.items():
-                    if current_time - timestamp > 25:
-                        self.notify_coordinator(node)
-                        self.confirmed_failures.add(node)  # Aggiungi il nodo al set dei fallimenti confermati
-            time.sleep(1)
+            time.sleep(self.check_once())
+
+    def send_notifications(self):
+        """
+        Invia al coordinatore le notifiche in coda, una alla volta.
+        """
+        while True:
+            notify, node = self.notifications.get()
+            notify(node)
 
     def notify_coordinator(self, node):
         """
         Notifica il coordinatore di un nodo offline.
         param node: id del nodo da notificare (IP:porta)
         """
-        if node in self.confirmed_failures:
-            return  # Se il nodo è già stato segnalato, non fare nulla
         try:
             response = requests.post(f"http://{self.coordinator_address}/node_offline", json={"node": node})
             response.raise_for_status()  # Crea un eccezione se la request non va a buon fine, se l'eccezione viene sollevata allora si passa direttamente al blocco except, ALTRIMENTI si va avanti nel blocco try
@@ -66,11 +112,24 @@ class FaultTolerance:
         except requests.exceptions.RequestException as e:
             print(f"Failed to notify coordinator: {e}")
 
+    def notify_coordinator_online(self, node):
+        """
+        Notifica il coordinatore che un nodo segnalato come offline ha ripreso a inviare heartbeat.
+        param node: id del nodo tornato online (IP:porta)
+        """
+        try:
+            response = requests.post(f"http://{self.coordinator_address}/node_online", json={"node": node})
+            response.raise_for_status()
+            print(f"Coordinator notified of node {node} recovery")
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to notify coordinator: {e}")
+
     def start(self):
         """
         Avvia il nodo di tolleranza ai guasti.
         """
         app = Flask(__name__)
+        self.metrics.instrument(app)
 
         # Endpoint per ricevere gli heartbeat dai nodi
         @app.route('/heartbeat', methods=['POST'])
@@ -81,8 +140,20 @@ class FaultTolerance:
             self.update_heartbeat_table(node, timestamp)
             return jsonify({"status": "ok"})
 
+        # Endpoint per le metriche, con il livello di sospetto attuale di ogni nodo
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            snapshot = self.metrics.snapshot(request.args.get('buckets') == '1')
+            with self.lock:
+                suspected = sorted(self.confirmed_failures)
+            now = self.monotonic_clock()
+            snapshot["phi"] = {node: round(self.detector.phi(node, now), 3) for node in self.all_nodes}
+            snapshot["suspected"] = suspected
+            return jsonify(snapshot)
+
         # Avvia un thread per controllare periodicamente la tabella degli heartbeat
         threading.Thread(target=self.check_heartbeat_table, daemon=True).start()
+        threading.Thread(target=self.send_notifications, daemon=True).start()
 
         try:
             # Avvia il server Flask con l'indirizzo e la porta specificati
@@ -96,6 +167,12 @@ if __name__ == '__main__':
     parser.add_argument('--address', required=True, help='The address of the fault tolerance node (IP:port)')
     parser.add_argument('--all_nodes', required=True, type=str, help='A JSON string representing a list of all IP:port addresses of the nodes in the system ')
     parser.add_argument('--coordinator_address', required=True, help='The address of the coordinator node (IP:port)')
+    parser.add_argument('--phi_threshold', type=float, default=8.0, help='Phi-accrual suspicion level above which a node is reported offline')
+    parser.add_argument('--heartbeat_interval', type=float, default=1.0, help='Expected seconds between two heartbeats of a node')
+    parser.add_argument('--min_std_dev', type=float, default=0.2, help='Minimum standard deviation of heartbeat intervals')
+    parser.add_argument('--acceptable_pause', type=float, default=1.0, help='Extra heartbeat delay in seconds tolerated before suspicion grows')
+    parser.add_argument('--initial_grace', type=float, default=25, help='Seconds the initial nodes have to send their first heartbeat')
+    parser.add_argument('--access_log', action='store_true', help='Log every HTTP request (off by default, it costs throughput)')
 
     args = parser.parse_args()
 
@@ -105,9 +182,20 @@ if __name__ == '__main__':
     fault_tolerance = FaultTolerance(
         address=args.address,
         all_nodes=all_nodes,
-        coordinator_address=args.coordinator_address
+        coordinator_address=args.coordinator_address,
+        detector=PhiAccrualFailureDetector(
+            threshold=args.phi_threshold,
+            expected_interval=args.heartbeat_interval,
+            min_std_dev=args.min_std_dev,
+            acceptable_pause=args.acceptable_pause,
+        ),
+        initial_grace=args.initial_grace,
     )
 
+    # Il log di ogni richiesta formatta una riga per heartbeat: le metriche su /metrics lo sostituiscono
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
     try:
         fault_tolerance.start()
         print("Fault tolerance node started")
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+
+def _move_lines(src, dst):
+    """
+    Accoda le righe di un file a un altro e cancella il primo.
+    :param src: file da spostare
+    :param dst: file di destinazione (creato se non esiste)
+    """
+    with open(src) as f, open(dst, 'a') as out:
+        out.writelines(f)
+    os.remove(src)
+
+
+class HintStore:
+    """
+    Memorizza gli hint delle scritture destinate a repliche non raggiungibili, per rinviarle quando il nodo torna
+    online. Gli hint restano in memoria (uno per chiave, il più recente) finché non superano max_memory_hints;
+    oltre questa soglia vengono scritti su disco in un file JSONL per nodo. Oltre max_hints vengono scartati e la
+    riparazione è lasciata all'anti-entropy.
+    """
+    def __init__(self, hints_dir=None, max_memory_hints=10000, max_hints=1000000):
+        """
+        Inizializza lo store degli hint.
+        :param hints_dir: directory in cui scrivere gli hint oltre la soglia in memoria (None per non usare il disco)
+        :param max_memory_hints: numero massimo di hint tenuti in memoria
+        :param max_hints: numero massimo di hint complessivi (memoria + disco)
+        """
+        self.hints_dir = hints_dir
+        self.max_memory_hints = max_memory_hints
+        self.max_hints = max_hints
+        self.memory = {}  # nodo -> OrderedDict chiave -> (valore, versione)
+        self.memory_count = 0
+        self.disk_count = {}  # nodo -> numero di hint su disco
+        self.dropped = 0  # hint scartati per superamento di max_hints
+        self.lock = threading.Lock()
+        if hints_dir is not None:
+            os.makedirs(hints_dir, exist_ok=True)
+            for name in os.listdir(hints_dir):
+                for suffix in ('.jsonl', '.jsonl.replay'):
+                    if name.endswith(suffix) and '%' not in name:
+                        # Nome nel formato precedente (host_porta): la porta segue l'ultimo '_'
+                        host, _, port = name[:-len(suffix)].rpartition('_')
+                        if host and port.isdigit():
+                            _move_lines(os.path.join(hints_dir, name), self._path(f"{host}:{port}") + suffix[6:])
+            for name in os.listdir(hints_dir):
+                if name.endswith('.jsonl.replay'):
+                    # Rinvio interrotto da un riavvio: gli hint tornano nel file del nodo
+                    _move_lines(os.path.join(hints_dir, name), os.path.join(hints_dir, name[:-7]))
+            for name in os.listdir(hints_dir):
+                if name.endswith('.jsonl'):
+                    with open(os.path.join(hints_dir, name)) as f:
+                        self.disk_count[unquote(name[:-6])] = sum(1 for _ in f)
+
+    def _path(self, node):
+        """
+        Restituisce il file degli hint su disco di un nodo. Il nome è l'indirizzo codificato con quote, quindi
+        reversibile qualunque carattere contenga l'host.
+        :param node: coppia indirizzo-porta del nodo
+        :return: percorso del file
+        """
+        return os.path.join(self.hints_dir, quote(node, safe='') + '.jsonl')
+
+    def count(self, node=None):
+        """
+        Restituisce il numero di hint in attesa.
+        :param node: nodo di cui contare gli hint (None per tutti i nodi)
+        :return: numero di hint
+        """
+        with self.lock:
+            if node is None:
+                return self.memory_count + sum(self.disk_count.values())
+            return len(self.memory.get(node, ())) + self.disk_count.get(node, 0)
+
+    def add(self, node, key, value, version):
+        """
+        Registra un hint per una scrittura non consegnata.
+        :param node: nodo a cui la scrittura era destinata
+        :param key: chiave scritta
+        :param value: valore scritto
+        :param version: versione del valore
+        """
+        with self.lock:
+            pending = self.memory.setdefault(node, OrderedDict())
+            if key in pending:
+                if pending[key][1] <= version:
+                    pending[key] = (value, version)
+                return
+            if self.memory_count + sum(self.disk_count.values()) >= self.max_hints:
+                self.dropped += 1
+            elif self.memory_count < self.max_memory_hints:
+                pending[key] = (value, version)
+                self.memory_count += 1
+            elif self.hints_dir is not None:
+                with open(self._path(node), 'a') as f:
+                    f.write(json.dumps([key, value, version]) + '\n')
+                self.disk_count[node] = self.disk_count.get(node, 0) + 1
+            else:
+                self.dropped += 1
+
+    def drain(self, node, batch_size=500):
+        """
+        Estrae gli hint di un nodo a blocchi. Ogni blocco è un dizionario chiave -> (valore, versione);
+        gli hint su disco vengono letti in streaming e il file viene cancellato alla fine.
+        :param node: nodo di cui estrarre gli hint
+        :param batch_size: numero massimo di hint per blocco
+        :return: generatore di blocchi di hint
+        """
+        with self.lock:
+            pending = self.memory.pop(node, OrderedDict())
+            self.memory_count -= len(pending)
+            replay_path = None
+            if self.hints_dir is not None and self.disk_count.pop(node, 0):
+                # Il file viene rinominato così i nuovi hint finiscono in un file nuovo
+                replay_path = self._path(node) + '.replay'
+                os.replace(self._path(node), replay_path)
+
+        batch = {}
+        for key, record in pending.items():
+            batch[key] = record
+            if len(batch) >= batch_size:
+                yield batch
+                batch = {}
+        if replay_path is not None:
+            with open(replay_path) as f:
+                for line in f:
+                    key, value, version = json.loads(line)
+                    if key not in batch or batch[key][1] < version:
+                        batch[key] = (value, version)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = {}
+            os.remove(replay_path)
+        if batch:
+            yield batch
+
+
+class HintedHandoff:
+    """
+    Rinvia gli hint a un nodo tornato online, con scritture bulk a blocchi.
+    """
+    def __init__(self, hint_store, replication, batch_size=500):
+        """
+        Inizializza il servizio di hinted handoff.
+        :param hint_store: store degli hint
+        :param replication: istanza di Replication usata per le scritture bulk
+        :param batch_size: numero di hint per richiesta bulk
+        """
+        self.hint_store = hint_store
+        self.replication = replication
+        self.batch_size = batch_size
+        self.replayed = 0  # hint consegnati
+
+    def replay(self, node):
+        """
+        Consegna al nodo tutti i suoi hint. Se una scrittura bulk fallisce, gli hint del blocco vengono
+        registrati di nuovo da Replication e il rinvio si interrompe.
+        :param node: nodo tornato online
+        :return: True se tutti gli hint sono stati consegnati
+        """
+        delivered = 0
+        batches = self.hint_store.drain(node, self.batch_size)
+        for batch in batches:
+            items = {key: value for key, (value, _) in batch.items()}
+            versions = {key: version for key, (_, version) in batch.items()}
+            if not self.replication.write_many_to_node(node, items, versions):
+                # Il blocco fallito è già stato registrato di nuovo da Replication; si rimettono in coda i restanti
+                logging.error(f"Hint replay to {node} interrupted after {delivered} hints")
+                for pending in batches:
+                    for key, (value, version) in pending.items():
+                        self.hint_store.add(node, key, value, version)
+                self.replayed += delivered
+                return False
+            delivered += len(batch)
+        self.replayed += delivered
+        logging.info(f"Replayed {delivered} hints to node {node}")
+        return True
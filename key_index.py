@@ -0,0 +1,89 @@
+import bisect
+
+
+class SortedKeyIndex:
+    """
+    Indice ordinato delle chiavi di un nodo, per le scansioni per range e per prefisso. Le chiavi sono divise in
+    blocchi ordinati di al più 2 * load chiavi, così un inserimento sposta al massimo un blocco invece dell'intera
+    lista e la ricerca del punto di partenza di una scansione è una doppia ricerca binaria.
+    """
+    def __init__(self, keys=(), load=1000):
+        """
+        Inizializza l'indice.
+        :param keys: chiavi iniziali (in qualsiasi ordine)
+        :param load: dimensione di riferimento dei blocchi
+        """
+        self.load = load
+        ordered = sorted(keys)
+        self.blocks = [ordered[i:i + load] for i in range(0, len(ordered), load)]
+        self.maxes = [block[-1] for block in self.blocks]  # ultima chiave di ogni blocco
+        self.size = len(ordered)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key):
+        """
+        Aggiunge una chiave, se non è già presente.
+        :param key: chiave da aggiungere
+        """
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            self.size += 1
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[i]
+        pos = bisect.bisect_left(block, key)
+        if pos < len(block) and block[pos] == key:
+            return
+        block.insert(pos, key)
+        self.maxes[i] = block[-1]
+        self.size += 1
+        if len(block) > 2 * self.load:
+            # Divide il blocco in due metà
+            self.blocks[i:i + 1] = [block[:self.load], block[self.load:]]
+            self.maxes[i:i + 1] = [block[self.load - 1], block[-1]]
+
+    def remove(self, key):
+        """
+        Rimuove una chiave, se presente.
+        :param key: chiave da rimuovere
+        """
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.blocks):
+            return
+        block = self.blocks[i]
+        pos = bisect.bisect_left(block, key)
+        if pos == len(block) or block[pos] != key:
+            return
+        del block[pos]
+        self.size -= 1
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+
+    def iterate(self, start=None, after=None):
+        """
+        Scorre le chiavi in ordine a partire da start (inclusa) o dalla chiave successiva ad after.
+        :param start: prima chiave da restituire (None per iniziare dalla prima)
+        :param after: chiave già restituita, da cui proseguire (ha la precedenza su start se è maggiore)
+        :return: generatore di chiavi in ordine
+        """
+        inclusive = True
+        if after is not None and (start is None or after >= start):
+            start, inclusive = after, False
+        if start is None:
+            i, pos = 0, 0
+        else:
+            find = bisect.bisect_left if inclusive else bisect.bisect_right
+            i = find(self.maxes, start)
+            pos = find(self.blocks[i], start) if i < len(self.blocks) else 0
+        while i < len(self.blocks):
+            block = self.blocks[i]
+            while pos < len(block):
+                yield block[pos]
+                pos += 1
+            i, pos = i + 1, 0
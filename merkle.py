@@ -0,0 +1,183 @@
+import hashlib
+import json
+
+from blob import digest_default
+from consistent_hashing import ConsistentHashing
+
+TOKEN_BITS = 128  # dimensione in bit dei token MD5 del ring
+
+
+class MerkleTree:
+    """
+    Merkle tree sullo spazio dei token del ring, mantenuto in modo incrementale. Le foglie suddividono lo spazio
+    dei token in 2^depth intervalli uguali; l'hash di una foglia è lo XOR dei digest delle coppie chiave-valore
+    che contiene e l'hash di un nodo interno è lo XOR dei figli, quindi ogni aggiornamento costa O(depth).
+    I livelli sopra le radici delle 2^partition_bits partizioni non vengono mantenuti ma calcolati alla lettura:
+    così i sottoalberi di partizioni diverse sono disgiunti e si possono aggiornare in parallelo, ciascuno con il
+    lock della propria partizione.
+    """
+    def __init__(self, depth=12, partition_bits=0):
+        """
+        Inizializza un albero vuoto.
+        :param depth: profondità dell'albero (numero di foglie = 2^depth)
+        :param partition_bits: numero di bit del token che identificano la partizione (al più depth)
+        """
+        if not 0 <= partition_bits <= depth:
+            raise ValueError(f"partition_bits must be between 0 and the depth {depth}, got {partition_bits}")
+        self.depth = depth
+        self.partition_bits = partition_bits
+        self.top = 1 << partition_bits  # indice della radice della prima partizione
+        self.num_leaves = 1 << depth
+        self.tree = [0] * (2 * self.num_leaves)  # albero in forma di array: la radice è in 1, le foglie da num_leaves
+        self.buckets = {}  # foglia -> dizionario chiave -> (token, digest)
+
+    @staticmethod
+    def encode(key, value):
+        """
+        Codifica una coppia chiave-valore nella forma su cui viene calcolato il digest.
+        :param key: chiave
+        :param value: valore (serializzabile in JSON, i Blob sono rappresentati dal loro etag)
+        :return: byte codificati
+        """
+        return key.encode('utf-8') + b'\0' + json.dumps(value, sort_keys=True, separators=(',', ':'),
+                                                         default=digest_default).encode('utf-8')
+
+    @staticmethod
+    def digest(key, value, payload=None):
+        """
+        Calcola il digest di una coppia chiave-valore.
+        :param key: chiave
+        :param value: valore (serializzabile in JSON, i Blob sono rappresentati dal loro etag)
+        :param payload: forma codificata con encode, se già calcolata
+        :return: digest come intero
+        """
+        if payload is None:
+            payload = MerkleTree.encode(key, value)
+        return int.from_bytes(hashlib.md5(payload).digest(), 'big')
+
+    def leaf_of(self, token):
+        """
+        Restituisce la foglia che contiene il token.
+        :param token: token del ring
+        :return: indice della foglia
+        """
+        return token >> (TOKEN_BITS - self.depth)
+
+    def leaf_span(self, leaf):
+        """
+        Restituisce l'intervallo di token [inizio, fine] coperto dalla foglia.
+        :param leaf: indice della foglia
+        :return: tupla (primo token, ultimo token)
+        """
+        width = 1 << (TOKEN_BITS - self.depth)
+        return leaf * width, (leaf + 1) * width - 1
+
+    def _apply(self, leaf, delta):
+        """
+        Propaga una variazione XOR dalla foglia alla radice della sua partizione.
+        :param leaf: indice della foglia
+        :param delta: variazione da applicare
+        """
+        i = self.num_leaves + leaf
+        while i >= self.top:
+            self.tree[i] ^= delta
+            i >>= 1
+
+    def update(self, key, value, token=None, digest=None):
+        """
+        Aggiorna l'albero dopo la scrittura di una chiave.
+        :param key: chiave scritta
+        :param value: nuovo valore
+        :param token: token della chiave, se già calcolato
+        :param digest: digest della coppia chiave-valore, se già calcolato
+        """
+        if token is None:
+            token = ConsistentHashing._hash(key)
+        if digest is None:
+            digest = self.digest(key, value)
+        leaf = self.leaf_of(token)
+        bucket = self.buckets.setdefault(leaf, {})
+        old = bucket.get(key)
+        bucket[key] = (token, digest)
+        self._apply(leaf, digest ^ (old[1] if old is not None else 0))
+
+    def load(self, entries):
+        """
+        Costruisce in blocco un albero vuoto all'avvio: inserisce i digest nelle foglie e calcola i nodi interni una
+        sola volta, invece di propagare ogni chiave fino alla radice.
+        :param entries: iterabile di tuple (chiave, token, digest) con chiavi distinte
+        """
+        for key, token, digest in entries:
+            leaf = self.leaf_of(token)
+            self.buckets.setdefault(leaf, {})[key] = (token, digest)
+            self.tree[self.num_leaves + leaf] ^= digest
+        for i in range(self.num_leaves - 1, self.top - 1, -1):
+            self.tree[i] = self.tree[2 * i] ^ self.tree[2 * i + 1]
+
+    def remove(self, key, token=None):
+        """
+        Aggiorna l'albero dopo la cancellazione di una chiave.
+        :param key: chiave cancellata
+        :param token: token della chiave, se già calcolato
+        """
+        leaf = self.leaf_of(token if token is not None else ConsistentHashing._hash(key))
+        bucket = self.buckets.get(leaf, {})
+        old = bucket.pop(key, None)
+        if old is not None:
+            self._apply(leaf, old[1])
+
+    def hashes(self, indices):
+        """
+        Restituisce gli hash dei nodi dell'albero richiesti. Gli hash sopra le radici delle partizioni sono lo XOR
+        delle radici sottostanti.
+        :param indices: indici dei nodi (1 = radice)
+        :return: lista degli hash nello stesso ordine
+        """
+        result = []
+        for i in indices:
+            if i >= self.top:
+                result.append(self.tree[i])
+                continue
+            shift = self.partition_bits - (i.bit_length() - 1)
+            value = 0
+            for j in range(i << shift, (i + 1) << shift):
+                value ^= self.tree[j]
+            result.append(value)
+        return result
+
+    def digests(self, leaves, ranges):
+        """
+        Restituisce i digest delle chiavi contenute nelle foglie indicate e nei range di token indicati.
+        :param leaves: indici delle foglie
+        :param ranges: lista di intervalli di token [inizio, fine] (estremi inclusi)
+        :return: dizionario chiave -> digest
+        """
+        result = {}
+        for leaf in leaves:
+            for key, (token, digest) in self.buckets.get(leaf, {}).items():
+                if any(start <= token <= end for start, end in ranges):
+                    result[key] = digest
+        return result
+
+    def scan(self, ranges, after=-1, limit=500):
+        """
+        Restituisce le chiavi contenute nei range di token indicati, in ordine di token e a partire dal token
+        successivo ad after, così una scansione lunga può proseguire a blocchi.
+        :param ranges: lista di intervalli di token [inizio, fine] (estremi inclusi, non sovrapposti)
+        :param after: ultimo token già restituito (-1 per iniziare dal primo)
+        :param limit: numero massimo di chiavi restituite
+        :return: lista di coppie (token, chiave) ordinate per token
+        """
+        found = []
+        for start, end in sorted(ranges):
+            start = max(start, after + 1)
+            if start > end:
+                continue
+            for leaf in range(self.leaf_of(start), self.leaf_of(end) + 1):
+                bucket = self.buckets.get(leaf)
+                if not bucket:
+                    continue
+                found.extend(sorted((token, key) for key, (token, _) in bucket.items() if start <= token <= end))
+                if len(found) >= limit:
+                    return found[:limit]
+        return found
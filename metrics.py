@@ -0,0 +1,259 @@
+import random
+import threading
+import time
+
+SUB_BUCKET_BITS = 8  # precisione dell'istogramma: errore relativo massimo di circa 1 / 2^(SUB_BUCKET_BITS - 1)
+
+
+class LatencyHistogram:
+    """
+    Istogramma delle latenze in stile HDR: i valori (in microsecondi) sono raccolti in bucket log-lineari,
+    così l'errore relativo di ogni percentile è costante e la memoria non dipende dal numero di campioni.
+    """
+    def __init__(self):
+        """
+        Inizializza un istogramma vuoto.
+        """
+        self.counts = {}  # indice del bucket -> numero di campioni
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        """
+        Calcola il bucket di un valore: i valori piccoli hanno un bucket ciascuno, quelli più grandi vengono
+        divisi in 2^(SUB_BUCKET_BITS - 1) bucket per ogni potenza di 2.
+        :param value: valore intero non negativo
+        :return: indice del bucket
+        """
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @staticmethod
+    def _highest_value(index):
+        """
+        Restituisce il valore più alto che cade nel bucket.
+        :param index: indice del bucket
+        :return: limite superiore del bucket
+        """
+        if index < 1 << SUB_BUCKET_BITS:
+            return index
+        half = 1 << (SUB_BUCKET_BITS - 1)
+        shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+        mantissa = (index & (half - 1)) + half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, micros):
+        """
+        Registra una latenza.
+        :param micros: latenza in microsecondi
+        """
+        micros = max(int(micros), 0)
+        index = self._index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += micros
+        self.min = micros if self.min is None else min(self.min, micros)
+        self.max = max(self.max, micros)
+
+    def merge(self, other):
+        """
+        Somma all'istogramma i campioni di un altro istogramma.
+        :param other: istanza di LatencyHistogram
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        Restituisce il percentile richiesto.
+        :param p: percentile tra 0 e 100
+        :return: latenza in microsecondi (limite superiore del bucket), 0 se l'istogramma è vuoto
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Riassume l'istogramma.
+        :return: dizionario con numero di campioni, media, minimo, massimo e percentili in microsecondi
+        """
+        return {
+            "count": self.count,
+            "mean_us": round(self.total / self.count, 1) if self.count else 0,
+            "min_us": self.min or 0,
+            "p50_us": self.percentile(50),
+            "p95_us": self.percentile(95),
+            "p99_us": self.percentile(99),
+            "p999_us": self.percentile(99.9),
+            "max_us": self.max,
+        }
+
+    def buckets(self):
+        """
+        Restituisce i conteggi per bucket, che a differenza dei percentili si possono sommare tra più processi.
+        :return: dizionario limite superiore del bucket (in microsecondi) -> numero di campioni
+        """
+        return {self._highest_value(index): self.counts[index] for index in sorted(self.counts)}
+
+
+class Metrics:
+    """
+    Registro delle metriche di un processo: contatori e istogrammi delle latenze identificati per nome.
+    Registrare un campione costa un'acquisizione di lock e qualche operazione intera, senza formattare stringhe,
+    quindi la raccolta può restare sempre attiva.
+    """
+    def __init__(self):
+        """
+        Inizializza un registro vuoto.
+        """
+        self.counters = {}  # nome -> valore
+        self.histograms = {}  # nome -> LatencyHistogram
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def incr(self, name, amount=1):
+        """
+        Incrementa un contatore.
+        :param name: nome del contatore
+        :param amount: incremento
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        """
+        Registra una durata nell'istogramma indicato.
+        :param name: nome dell'istogramma
+        :param seconds: durata in secondi
+        """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds * 1e6)
+
+    def snapshot(self, buckets=False):
+        """
+        Restituisce lo stato attuale delle metriche.
+        :param buckets: se True include i conteggi per bucket di ogni istogramma
+        :return: dizionario con uptime, contatori e riepilogo degli istogrammi
+        """
+        with self.lock:
+            histograms = {}
+            for name, histogram in sorted(self.histograms.items()):
+                histograms[name] = histogram.summary()
+                if buckets:
+                    histograms[name]["buckets"] = histogram.buckets()
+            return {
+                "uptime_s": round(time.monotonic() - self.started, 1),
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": histograms,
+            }
+
+    def instrument(self, app):
+        """
+        Registra su un'applicazione Flask la misura del tempo di gestione di ogni richiesta, per endpoint,
+        e il conteggio delle risposte per classe di stato.
+        :param app: applicazione Flask
+        """
+        from flask import g, request
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def stop_timer(response):
+            started = g.pop('metrics_started', None)
+            if started is not None:
+                self.observe(f"request.{request.endpoint}", time.perf_counter() - started)
+                self.incr(f"responses.{response.status_code // 100}xx")
+            return response
+
+
+class HotKeys:
+    """
+    Rilevamento delle chiavi più richieste: un count-min sketch stima la frequenza di ogni chiave in memoria
+    costante e un piccolo dizionario tiene le k chiavi con la stima più alta. I contatori vengono dimezzati a
+    intervalli regolari, così la classifica riflette il traffico recente.
+    """
+    def __init__(self, k=20, width=2048, depth=4, decay_interval=60):
+        """
+        Inizializza il tracker.
+        :param k: numero di chiavi calde mantenute
+        :param width: numero di contatori per riga dello sketch
+        :param depth: numero di righe (funzioni di hash) dello sketch
+        :param decay_interval: intervallo (in secondi) tra due dimezzamenti dei contatori, 0 per non dimezzarli
+        """
+        self.k = k
+        self.width = width
+        self.rows = [[0] * width for _ in range(depth)]
+        self.salts = [random.getrandbits(64) for _ in range(depth)]
+        self.top = {}  # chiave -> frequenza stimata
+        self.floor = 0  # stima più bassa tra le chiavi in top (può essere più bassa del vero minimo)
+        self.decay_interval = decay_interval
+        self.next_decay = time.monotonic() + decay_interval
+        self.lock = threading.Lock()
+
+    def add(self, key, count=1):
+        """
+        Registra un accesso alla chiave.
+        :param key: chiave acceduta
+        :param count: numero di accessi
+        """
+        with self.lock:
+            if self.decay_interval and time.monotonic() >= self.next_decay:
+                self._decay()
+            estimate = None
+            for row, salt in zip(self.rows, self.salts):
+                i = hash((salt, key)) % self.width
+                row[i] += count
+                if estimate is None or row[i] < estimate:
+                    estimate = row[i]
+            if key in self.top or len(self.top) < self.k:
+                self.top[key] = estimate
+            elif estimate > self.floor:
+                coldest = min(self.top, key=self.top.get)
+                if estimate > self.top[coldest]:
+                    del self.top[coldest]
+                    self.top[key] = estimate
+                self.floor = min(self.top.values())
+
+    def _decay(self):
+        """
+        Dimezza tutti i contatori. Va chiamato con il lock acquisito.
+        """
+        for row in self.rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> 1
+        self.top = {key: estimate >> 1 for key, estimate in self.top.items() if estimate > 1}
+        self.floor >>= 1
+        self.next_decay = time.monotonic() + self.decay_interval
+
+    def hottest(self, n=None):
+        """
+        Restituisce le chiavi più richieste.
+        :param n: numero di chiavi da restituire (default: k)
+        :return: lista di coppie [chiave, frequenza stimata] in ordine decrescente
+        """
+        with self.lock:
+            ranked = sorted(self.top.items(), key=lambda item: item[1], reverse=True)
+        return [[key, estimate] for key, estimate in ranked[:n or self.k]]
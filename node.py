@@ -1,9 +1,29 @@
 import argparse
+import json
+import logging
+import math
 import requests
+import struct
 import threading
 import time
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+
+from blob import CHUNK_SIZE, CODECS, IDENTITY, Blob, digest_default, from_json, json_default
+from consistent_hashing import ConsistentHashing
+from eviction import (DIGEST_OVERHEAD, ENTRY_OVERHEAD, EVICTED_SHARE, NOEVICTION, POLICIES, EvictionPolicy, KeyMeta,
+                      MemoryFull)
+from expiry import expires_at, is_expired, with_ttl
+from key_index import SortedKeyIndex
+from merkle import MerkleTree
+from metrics import Metrics
+from partitions import PartitionMap
+from storage import DictStorage, LogStorage
+from wire import WireServer
+
+# Metadati salvati dallo storage insieme a ogni chiave: digest del Merkle tree, dimensione stimata, scadenza (NaN se
+# la chiave non scade). All'avvio bastano a ricostruire Merkle tree e contabilità della memoria senza leggere i valori.
+KEY_META = struct.Struct('>16sQd')
 
 
 class Node:
@@ -11,25 +31,277 @@ class Node:
     Classe che rappresenta il singolo nodo/DB del sistema di storage distribuito.
     """
 
-    def __init__(self, node, fault_tolerance_address):
+    def __init__(self, node, fault_tolerance_address, storage=None, merkle_depth=12, heartbeat_interval=1.0, wire_port_offset=0,
+                 inject_latency=0, max_value_size=64 * 1024 * 1024, max_blob_memory=256 * 1024 * 1024, num_partitions=16,
+                 max_memory=0, eviction_policy=NOEVICTION, eviction_samples=5, expiry_tick=0.1):
         """
         Inizializza il nodo con l'indirizzo del nodo stesso e l'indirizzo del nodo di tolleranza ai guasti.
         param node: indirizzo del nodo (IP:porta)
         param fault_tolerance_address: indirizzo del nodo di tolleranza ai guasti (IP:porta)
+        param storage: backend di storage dei dati (default: dizionario in memoria)
+        param merkle_depth: profondità del Merkle tree usato per l'anti-entropy
+        param heartbeat_interval: intervallo (in secondi) tra due heartbeat
+        param wire_port_offset: se maggiore di 0, il nodo ascolta anche con il protocollo binario sulla porta HTTP + wire_port_offset
+        param inject_latency: ritardo artificiale (in secondi) aggiunto a ogni richiesta, per simulare un nodo lento nei test
+        param max_value_size: dimensione massima (in byte) di un blob
+        param max_blob_memory: memoria massima (in byte) occupata dai blob in ricezione; oltre questa soglia le nuove
+                               scritture vengono rifiutate, così una raffica di valori grandi non esaurisce la memoria
+        param num_partitions: numero di partizioni in cui sono divisi i dati del nodo, ciascuna con il proprio lock
+                              (potenza di 2, al più 2^merkle_depth)
+        param max_memory: memoria massima stimata (in byte) occupata dalle chiavi, 0 per non limitarla
+        param eviction_policy: politica applicata oltre max_memory: noeviction rifiuta le scritture, le altre
+                               eliminano chiavi scelte per campionamento (vedi eviction.py)
+        param eviction_samples: chiavi esaminate per ogni eliminazione
+        param expiry_tick: risoluzione (in secondi) delle timing wheel che eliminano le chiavi scadute
         """
+        self.inject_latency = inject_latency
+        self.max_value_size = max_value_size
+        self.max_blob_memory = max_blob_memory
+        self.blob_memory = 0  # byte dei blob in ricezione
+        self.blob_memory_lock = threading.Lock()
+        self.wire_port_offset = wire_port_offset
+        self.heartbeat_interval = heartbeat_interval
         self.fault_tolerance_address = fault_tolerance_address  # indirizzo del nodo di tolleranza ai guasti
         self.node = node  # coppia indirizzo-porta del nodo
-        self.data = {}  # dizionario che contiene i dati del nodo
-        self.lock = threading.Lock()  # Un oggetto di lock per garantire che l'accesso ai dati condivisi sia thread-safe
+        self.storage = storage if storage is not None else DictStorage()  # backend che contiene i dati del nodo
+        # Partizioni allineate ai range di token: le scritture prendono solo il lock della partizione della chiave,
+        # le letture nessun lock, perché i record vengono sostituiti e mai modificati
+        if num_partitions > 1 << merkle_depth:
+            raise ValueError(f"The number of partitions must be at most 2^merkle_depth = {1 << merkle_depth}, got {num_partitions}")
+        self.partitions = PartitionMap(num_partitions, expiry_tick)
+        self.max_memory = max_memory
+        self.eviction = EvictionPolicy(eviction_policy, eviction_samples)
+        self.expiry_tick = expiry_tick
+        self.metrics = Metrics()  # contatori e latenze esposti su /metrics
+        # Merkle tree dei dati, aggiornato a ogni scrittura; ogni partizione aggiorna solo il proprio sottoalbero
+        self.merkle = MerkleTree(merkle_depth, self.partitions.bits)
+        # Lo storage contiene per ogni chiave il record [valore, versione] e i metadati KEY_META: i valori vengono
+        # letti solo per le chiavi senza metadati (scritte da una versione precedente o non ancora nei file hint)
+        keys = []
+        digests = []
+        now = time.time()
+        for key, meta in self.storage.items_meta():
+            token = ConsistentHashing._hash(key)
+            if meta is None:
+                record = self.storage.get(key)
+                if record is None:
+                    continue
+                payload = MerkleTree.encode(key, record)
+                digest, size = MerkleTree.digest(key, record, payload), self.entry_size(record, payload)
+                expires = expires_at(record[0])
+            else:
+                digest, size, expires = self.decode_meta(meta)
+            digests.append((key, token, digest))
+            partition = self.partitions.of_token(token)
+            partition.keys += 1
+            self._track(partition, key, expires, size, now)
+            keys.append(key)
+        self.merkle.load(digests)
+        self.key_index = SortedKeyIndex(keys)  # chiavi in ordine, per le scansioni per range e per prefisso
+        self.key_index_lock = threading.Lock()  # l'indice ordinato è condiviso tra le partizioni
+
+    @staticmethod
+    def entry_size(record, payload):
+        """
+        Stima la memoria occupata da una chiave.
+        param record: record [valore, versione]
+        param payload: coppia chiave-record codificata con MerkleTree.encode
+        return: dimensione stimata in byte
+        """
+        value = record[0]
+        return len(payload) + (len(value) if isinstance(value, Blob) else 0) + ENTRY_OVERHEAD
+
+    @staticmethod
+    def encode_meta(digest, size, expires):
+        """
+        Codifica i metadati di una chiave salvati dallo storage.
+        param digest: digest della chiave nel Merkle tree
+        param size: dimensione stimata in byte
+        param expires: istante di scadenza, None se la chiave non scade
+        return: byte codificati
+        """
+        return KEY_META.pack(digest.to_bytes(16, 'big'), size, math.nan if expires is None else expires)
 
-    def store(self, key, value):
+    @staticmethod
+    def decode_meta(meta):
         """
-        Metodo per memorizzare un valore associato ad una chiave.
+        Decodifica i metadati scritti con encode_meta.
+        param meta: byte codificati
+        return: tupla (digest, dimensione, scadenza o None)
+        """
+        digest, size, expires = KEY_META.unpack(meta)
+        return int.from_bytes(digest, 'big'), size, None if math.isnan(expires) else expires
+
+    def memory_used(self):
+        """
+        Restituisce la memoria stimata occupata dalle chiavi del nodo, compresi i digest delle chiavi eliminate.
+        return: dimensione in byte
+        """
+        return sum(partition.bytes + partition.evicted_bytes for partition in self.partitions)
+
+    def _prepare(self, key, value, version):
+        """
+        Prepara la scrittura di una chiave fuori dal lock: calcola token, partizione, record, digest del Merkle tree
+        e dimensione, così la sezione critica contiene solo il confronto delle versioni e l'aggiornamento delle strutture.
         param key: chiave del valore da memorizzare
         param value: valore da memorizzare
+        param version: versione del valore
+        return: tupla (partizione, (token, record, digest, dimensione, metadati per lo storage))
+        """
+        token = ConsistentHashing._hash(key)
+        record = [from_json(value), version]  # i blob arrivano in JSON da read repair, anti-entropy e ribilanciamento
+        payload = MerkleTree.encode(key, record)
+        digest, size = MerkleTree.digest(key, record, payload), self.entry_size(record, payload)
+        return self.partitions.of_token(token), (token, record, digest, size,
+                                                 self.encode_meta(digest, size, expires_at(record[0])))
+
+    def _reserve(self, size):
+        """
+        Con la politica noeviction rifiuta le scritture che porterebbero il nodo oltre max_memory.
+        param size: dimensione stimata dei dati da scrivere
+        """
+        if self.max_memory and self.eviction.policy == NOEVICTION and self.memory_used() + size > self.max_memory:
+            self.metrics.incr('eviction.rejected')
+            raise MemoryFull(f"node memory limit of {self.max_memory} bytes reached")
+
+    def _track(self, partition, key, expires, size, now):
+        """
+        Aggiorna dimensione, metadati, campionatori e scadenza di una chiave scritta. Va chiamato con il lock della
+        partizione acquisito.
+        param partition: partizione della chiave
+        param key: chiave scritta
+        param expires: istante di scadenza del valore scritto, None se non scade
+        param size: dimensione stimata della chiave
+        param now: istante della scrittura
+        """
+        meta = partition.meta.get(key)
+        if meta is None:
+            meta = partition.meta[key] = KeyMeta(0, now)
+            partition.all_keys.add(key)
+        else:
+            meta.touch(now)  # una scrittura conta come un accesso
+        partition.bytes += size - meta.size
+        meta.size = size
+        meta.expires = expires
+        if expires is None:
+            partition.volatile.discard(key)
+            partition.wheel.cancel(key)
+        else:
+            partition.volatile.add(key)
+            partition.wheel.schedule(key, expires)
+
+    def _remove(self, partition, key, token=None, keep_digest=False):
+        """
+        Cancella una chiave presente nel nodo. Va chiamato con il lock della partizione acquisito.
+        param partition: partizione della chiave
+        param key: chiave da cancellare
+        param token: token della chiave, se già calcolato
+        param keep_digest: se True la chiave resta nel Merkle tree (e nella timing wheel, che la toglierà alla
+                           scadenza), così l'anti-entropy non la ricopia dalle altre repliche dopo un'eliminazione
+                           (vedi _evict)
+        """
+        self.storage.delete(key)
+        if not keep_digest:
+            self.merkle.remove(key, token)
+            partition.wheel.cancel(key)
+        with self.key_index_lock:
+            self.key_index.remove(key)
+        partition.keys -= 1
+        partition.bytes -= partition.meta.pop(key).size
+        partition.all_keys.discard(key)
+        partition.volatile.discard(key)
+
+    def _evict(self, partition, key):
+        """
+        Elimina una chiave per liberare memoria conservandone il digest nel Merkle tree, così l'anti-entropy non la
+        ricopia dalle altre repliche. Chiave e versione restano in partition.evicted, conteggiate in memory_used, per
+        ignorare le copie della stessa versione (read repair, anti-entropy, hint) finché il digest non viene dimenticato.
+        Va chiamato con il lock della partizione acquisito.
+        param partition: partizione della chiave
+        param key: chiave da eliminare
         """
-        with self.lock:
-            self.data[key] = value
+        token = ConsistentHashing._hash(key)
+        version = self.storage.get(key)[1]
+        self._remove(partition, key, token, keep_digest=True)
+        size = len(key) + DIGEST_OVERHEAD
+        partition.evicted[key] = (token, version, size)
+        partition.evicted_bytes += size
+
+    def _forget(self, partition, key, token=None):
+        """
+        Toglie dal Merkle tree e dalla timing wheel una chiave non più presente nello storage (eliminata per liberare
+        memoria). Va chiamato con il lock della partizione acquisito.
+        param partition: partizione della chiave
+        param key: chiave
+        param token: token della chiave, se già calcolato
+        """
+        entry = partition.evicted.pop(key, None)
+        if entry is not None:
+            partition.evicted_bytes -= entry[2]
+            token = entry[0]
+        self.merkle.remove(key, token)
+        partition.wheel.cancel(key)
+
+    def _apply(self, partition, key, write):
+        """
+        Scrive il record se la sua versione non è più vecchia di quella memorizzata. Va chiamato con il lock della
+        partizione acquisito.
+        param partition: partizione della chiave
+        param key: chiave del valore da memorizzare
+        param write: tupla (token, record [valore, versione], digest, dimensione, metadati) preparata con _prepare
+        return: True se il record è stato scritto, False se il nodo ha già una versione più recente
+        """
+        token, record, digest, size, meta = write
+        partition.writes += 1
+        value, version = record
+        current = self.storage.get(key)
+        if current is None and key in partition.evicted:
+            if partition.evicted[key][1] >= version:
+                return False  # copia di una chiave eliminata per liberare memoria
+            self._forget(partition, key, token)  # scrittura più recente dell'eliminazione
+        if current is not None:
+            if current[1] > version:
+                return False
+            # A parità di versione vince il valore maggiore, così tutte le repliche convergono allo stesso
+            if current[1] == version and (json.dumps(current[0], sort_keys=True, default=digest_default) >=
+                                          json.dumps(value, sort_keys=True, default=digest_default)):
+                return False
+        now = time.time()
+        if is_expired(value, now):
+            # Valore già scaduto, ad esempio copiato in ritardo da un'altra replica: sostituisce comunque la versione
+            # precedente, che va cancellata
+            if current is not None:
+                self._remove(partition, key, token)
+            return False
+        if current is None:
+            with self.key_index_lock:
+                self.key_index.add(key)
+            partition.keys += 1
+        self.storage.put(key, record, meta)
+        self.merkle.update(key, record, token, digest)
+        self._track(partition, key, expires_at(value), size, now)
+        return True
+
+    def store(self, key, value, version=0):
+        """
+        Metodo per memorizzare un valore associato ad una chiave. Una scrittura con versione più vecchia di quella
+        già memorizzata viene ignorata, così repliche, read repair e anti-entropy non possono sovrascrivere dati più recenti.
+        param key: chiave del valore da memorizzare
+        param value: valore da memorizzare
+        param version: versione del valore assegnata dal coordinatore
+        return: True se il valore è stato scritto
+        :raises MemoryFull: se il nodo ha raggiunto max_memory e la politica è noeviction
+        """
+        partition, write = self._prepare(key, value, version)
+        self._reserve(write[3])
+        began = time.perf_counter()
+        with partition.lock:
+            waited = time.perf_counter() - began
+            applied = self._apply(partition, key, write)
+        self.metrics.observe('lock_wait.store', waited)
+        if self.max_memory:
+            self.evict()
+        return applied
 
     def retrieve(self, key):
         """
@@ -37,20 +309,267 @@ class Node:
         param key: chiave del valore da recuperare
         return: valore associato alla chiave
         """
-        with self.lock:
-            return self.data.get(key)
+        record = self.retrieve_versioned(key)
+        return record[0] if record is not None else None
+
+    def retrieve_versioned(self, key):
+        """
+        Metodo per recuperare un valore insieme alla sua versione, senza lock.
+        param key: chiave del valore da recuperare
+        return: lista [valore, versione], None se la chiave non è presente
+        """
+        return self._live(key, self.storage.get(key))
+
+    def _live(self, key, record):
+        """
+        Conta una lettura e nasconde i record scaduti che la timing wheel non ha ancora eliminato.
+        param key: chiave letta
+        param record: record letto dallo storage, None se assente
+        return: record, None se assente o scaduto
+        """
+        partition = self.partitions.of_token(ConsistentHashing._hash(key))
+        partition.reads += 1
+        if record is None:
+            return None
+        now = time.time()
+        if is_expired(record[0], now):
+            self.metrics.incr('expiry.expired_on_read')
+            return None
+        if self.max_memory:
+            meta = partition.meta.get(key)
+            if meta is not None:
+                meta.touch(now)
+        return record
+
+    def store_many(self, items, versions=None):
+        """
+        Metodo per memorizzare più coppie chiave-valore con una sola acquisizione del lock per partizione.
+        param items: dizionario chiave-valore da memorizzare
+        param versions: dizionario chiave-versione (le chiavi assenti hanno versione 0)
+        """
+        versions = versions or {}
+        grouped = {}  # partizione -> lista di (chiave, scrittura preparata)
+        size = 0
+        for key, value in items.items():
+            partition, write = self._prepare(key, value, versions.get(key, 0))
+            grouped.setdefault(partition, []).append((key, write))
+            size += write[3]
+        self._reserve(size)
+        waited = 0
+        for partition, writes in grouped.items():
+            began = time.perf_counter()
+            with partition.lock:
+                waited += time.perf_counter() - began
+                for key, write in writes:
+                    self._apply(partition, key, write)
+        self.metrics.observe('lock_wait.store_many', waited)
+        if self.max_memory:
+            self.evict()
+
+    def retrieve_many(self, keys):
+        """
+        Metodo per recuperare i valori associati a più chiavi, senza lock.
+        param keys: lista delle chiavi da recuperare
+        return: dizionario chiave -> [valore, versione] con le sole chiavi presenti nel nodo
+        """
+        records = {}
+        for key, record in self.storage.get_many(keys).items():
+            record = self._live(key, record)
+            if record is not None:
+                records[key] = record
+        return records
+
+    def merkle_hashes(self, indices):
+        """
+        Metodo per leggere gli hash di alcuni nodi del Merkle tree. Non prende lock: un hash letto durante una
+        scrittura viene corretto dal confronto dei digest o dal round successivo di anti-entropy.
+        param indices: indici dei nodi dell'albero (1 = radice)
+        return: lista degli hash nello stesso ordine
+        """
+        return self.merkle.hashes(indices)
+
+    def merkle_digests(self, leaves, ranges):
+        """
+        Metodo per leggere i digest delle chiavi di alcune foglie del Merkle tree, limitati ai range indicati.
+        param leaves: indici delle foglie
+        param ranges: lista di intervalli di token [inizio, fine]
+        return: dizionario chiave -> digest
+        """
+        grouped = {}  # partizione -> foglie della partizione
+        for leaf in leaves:
+            start, _ = self.merkle.leaf_span(leaf)
+            grouped.setdefault(self.partitions.of_token(start), []).append(leaf)
+        digests = {}
+        for partition, partition_leaves in grouped.items():
+            with partition.lock:
+                digests.update(self.merkle.digests(partition_leaves, ranges))
+        return digests
+
+    def scan_range(self, ranges, after=-1, limit=500):
+        """
+        Metodo per esportare a blocchi le chiavi di alcuni range di token, usato per spostare i dati tra i nodi.
+        param ranges: lista di intervalli di token [inizio, fine]
+        param after: ultimo token già esportato (-1 per iniziare dal primo)
+        param limit: numero massimo di chiavi esportate
+        return: tupla (dizionario chiave -> [valore, versione], token da cui proseguire o None se la scansione è finita)
+        """
+        found = []
+        # Le partizioni sono in ordine di token, quindi la scansione procede una partizione alla volta
+        for partition, clipped in self.partitions.overlapping(ranges):
+            if partition.end <= after:
+                continue
+            with partition.lock:
+                found.extend(self.merkle.scan(clipped, after, limit - len(found)))
+            if len(found) == limit:
+                break
+        records = self.storage.get_many([key for _, key in found])
+        return records, (found[-1][0] if len(found) == limit else None)
+
+    def drop_ranges(self, ranges):
+        """
+        Metodo per cancellare le chiavi di alcuni range di token, usato dopo un ribilanciamento per liberare i range
+        che il nodo non replica più. Ogni partizione coinvolta viene bloccata una sola volta.
+        param ranges: lista di intervalli di token [inizio, fine]
+        return: numero di chiavi cancellate
+        """
+        dropped = 0
+        for partition, clipped in self.partitions.overlapping(ranges):
+            with partition.lock:
+                after = -1
+                while after is not None:
+                    found = self.merkle.scan(clipped, after, 1000)
+                    for token, key in found:
+                        if key in partition.meta:
+                            self._remove(partition, key, token)
+                            dropped += 1
+                        else:
+                            # Chiave eliminata per liberare memoria, rimasta solo nel Merkle tree
+                            self._forget(partition, key, token)
+                    after = found[-1][0] if len(found) == 1000 else None
+        return dropped
+
+    def expire(self, now=None):
+        """
+        Metodo per eliminare le chiavi scadute: fa avanzare la timing wheel di ogni partizione, che restituisce solo
+        le chiavi in scadenza.
+        param now: istante attuale (default: time.time())
+        return: numero di chiavi eliminate
+        """
+        now = time.time() if now is None else now
+        expired = 0
+        for partition in self.partitions:
+            with partition.lock:
+                for key in partition.wheel.advance(now):
+                    if key in partition.meta:
+                        self._remove(partition, key)
+                        expired += 1
+                    else:
+                        self._forget(partition, key)  # chiave già eliminata per liberare memoria
+        if expired:
+            self.metrics.incr('expiry.expired', expired)
+        return expired
+
+    def expire_loop(self):
+        """
+        Metodo eseguito da un thread dedicato per eliminare le chiavi scadute a ogni tick.
+        """
+        while True:
+            time.sleep(self.expiry_tick)
+            self.expire()
+
+    def evict(self):
+        """
+        Metodo per eliminare chiavi secondo la politica configurata finché la memoria stimata non torna sotto
+        max_memory. Le chiavi eliminate restano nel Merkle tree (vedi _evict); quando i loro digest superano la quota
+        EVICTED_SHARE di max_memory, o non ci sono più chiavi eliminabili, vengono dimenticati i digest più vecchi
+        e quelle chiavi possono essere ricopiate dalle altre repliche.
+        return: numero di chiavi eliminate
+        """
+        evicted = forgotten = 0
+        while self.memory_used() > self.max_memory:
+            candidate = None
+            if sum(partition.evicted_bytes for partition in self.partitions) <= self.max_memory * EVICTED_SHARE:
+                candidate = self.eviction.pick(self.partitions, time.time())
+            if candidate is None:
+                partition = max(self.partitions, key=lambda p: p.evicted_bytes)
+                if not partition.evicted:
+                    break
+                with partition.lock:
+                    if partition.evicted:
+                        self._forget(partition, next(iter(partition.evicted)))
+                        forgotten += 1
+                continue
+            partition, key = candidate
+            with partition.lock:
+                if key in partition.meta:
+                    self._evict(partition, key)
+                    evicted += 1
+        if evicted:
+            self.metrics.incr('eviction.evicted', evicted)
+        if forgotten:
+            self.metrics.incr('eviction.digests_forgotten', forgotten)
+        return evicted
+
+    def scan_keys(self, start=None, end=None, prefix=None, after=None, limit=1000):
+        """
+        Metodo per leggere a pagine le chiavi in ordine lessicografico, limitate a un range e/o a un prefisso.
+        param start: prima chiave del range (inclusa, None per nessun limite)
+        param end: fine del range (esclusa, None per nessun limite)
+        param prefix: prefisso delle chiavi (None per tutte)
+        param after: ultima chiave della pagina precedente (None per la prima pagina)
+        param limit: numero massimo di chiavi della pagina
+        return: tupla (lista di [chiave, valore, versione] in ordine, chiave da cui proseguire o None se la scansione è finita)
+        """
+        if prefix is not None and (start is None or start < prefix):
+            start = prefix
+        keys = []
+        more = False
+        with self.key_index_lock:
+            for key in self.key_index.iterate(start, after):
+                if (end is not None and key >= end) or (prefix is not None and not key.startswith(prefix)):
+                    break
+                if len(keys) == limit:
+                    more = True
+                    break
+                keys.append(key)
+        # I valori vengono letti fuori dal lock dell'indice; una chiave cancellata nel frattempo viene saltata
+        page = [[key, record[0], record[1]] for key, record in self.retrieve_many(keys).items()]
+        return page, (keys[-1] if more else None)
+
+    def reserve_blob_memory(self, size):
+        """
+        Riserva la memoria per un blocco di un blob in ricezione.
+        param size: byte da riservare
+        return: True se la memoria è disponibile, False se la scrittura va rifiutata
+        """
+        with self.blob_memory_lock:
+            if self.blob_memory + size > self.max_blob_memory:
+                return False
+            self.blob_memory += size
+            return True
+
+    def release_blob_memory(self, size):
+        """
+        Rilascia la memoria riservata per un blob.
+        param size: byte da rilasciare
+        """
+        with self.blob_memory_lock:
+            self.blob_memory -= size
 
     def send_heartbeat(self):
         """
         Metodo per inviare un heartbeat al nodo di tolleranza ai guasti.
         """
         while True:
-            time.sleep(5)
+            time.sleep(self.heartbeat_interval)
             current_time = time.time()
+            began = time.perf_counter()
             try:
                 response = requests.post(f"http://{self.fault_tolerance_address}/heartbeat", json={"node": self.node, "timestamp": current_time})
                 response.raise_for_status()
+                self.metrics.observe('heartbeat.send', time.perf_counter() - began)
             except requests.exceptions.RequestException as e:
+                self.metrics.incr('heartbeat.errors')
                 print(f"Failed to send heartbeat to fault tolerance node: {e} by node {self.node}")
 
     def start(self):
@@ -60,27 +579,156 @@ class Node:
         # Avvio dei thread per l'invio e il controllo degli heartbeat
         threading.Thread(target=self.send_heartbeat, daemon=True).start()
 
+        # Avvio del listener del protocollo binario usato dal coordinatore al posto di HTTP
+        if self.wire_port_offset > 0:
+            host, port = self.node.split(':')
+            wire_server = WireServer(self, host, int(port) + self.wire_port_offset)
+            threading.Thread(target=wire_server.serve_forever, daemon=True).start()
+
+        # Avvio del thread che elimina le chiavi scadute
+        threading.Thread(target=self.expire_loop, daemon=True).start()
+
         # Creazione dell'app Flask per gestire le richieste di heartbeat
         app = Flask(__name__)
+        app.json.default = json_default  # i Blob vengono restituiti nella loro forma JSON
+        self.metrics.instrument(app)
+
+        # Nodo lento simulato: il ritardo si applica a tutte le richieste ricevute
+        if self.inject_latency > 0:
+            app.before_request(lambda: time.sleep(self.inject_latency))
+
+        # Oltre max_memory con la politica noeviction le scritture vengono rifiutate
+        @app.errorhandler(MemoryFull)
+        def memory_full(e):
+            return jsonify({"error": str(e)}), 507
 
-        # Endpoint per PUT (scrittura)
+        # Endpoint per PUT (scrittura); con ttl (in secondi) la chiave scade, il coordinatore invia invece il valore
+        # già nella forma con scadenza
         @app.route('/put', methods=['PUT'])
         def put_data():
             data = request.get_json()
             key = data['key']
             value = data['value']
-            self.store(key, value)
-            return jsonify({"status": "ok"})
+            if data.get('ttl'):
+                value = with_ttl(value, data['ttl'])
+            applied = self.store(key, value, data.get('version', 0))
+            return jsonify({"status": "ok", "applied": applied})
 
-        # Endpoint per GET (lettura)
+        # Endpoint per GET (lettura); con digest=1 restituisce solo la versione
         @app.route('/get', methods=['GET'])
         def get_data():
             key = request.args.get('key')
-            value = self.retrieve(key)
-            if value is not None:
-                return jsonify({"key": key, "value": value})
-            else:
+            record = self.retrieve_versioned(key)
+            if record is None:
+                return jsonify({"error": "Key not found"}), 404
+            if request.args.get('digest'):
+                return jsonify({"key": key, "version": record[1]})
+            return jsonify({"key": key, "value": record[0], "version": record[1]})
+
+        # Endpoint per scrivere un blob: il corpo viene letto a blocchi e memorizzato così com'è (eventualmente compresso)
+        @app.route('/blob/<key>', methods=['PUT'])
+        def put_blob(key):
+            encoding = request.headers.get('Content-Encoding', IDENTITY)
+            if encoding != IDENTITY and encoding not in CODECS:
+                return jsonify({"error": f"Unsupported encoding {encoding}"}), 415
+            if (request.content_length or 0) > self.max_value_size:
+                return jsonify({"error": "Value too large"}), 413
+            buffer = bytearray()
+            try:
+                for chunk in iter(lambda: request.stream.read(CHUNK_SIZE), b''):
+                    if len(buffer) + len(chunk) > self.max_value_size:
+                        return jsonify({"error": "Value too large"}), 413
+                    if not self.reserve_blob_memory(len(chunk)):
+                        self.metrics.incr('blob.rejected')
+                        return jsonify({"error": "Too many large values in flight"}), 503
+                    buffer += chunk
+                applied = self.store(key, Blob(buffer, encoding), int(request.headers.get('X-Version', 0)))
+            except OSError as e:
+                # Il mittente ha interrotto l'invio (ad esempio perché il valore supera il limite del coordinatore)
+                return jsonify({"error": f"Incomplete body: {e}"}), 400
+            finally:
+                self.release_blob_memory(len(buffer))
+            return jsonify({"status": "ok", "applied": applied, "size": len(buffer)})
+
+        # Endpoint per leggere un blob: il contenuto viene inviato a blocchi con la codifica con cui è memorizzato
+        @app.route('/blob/<key>', methods=['GET'])
+        def get_blob(key):
+            record = self.retrieve_versioned(key)
+            if record is None:
                 return jsonify({"error": "Key not found"}), 404
+            value, version = record
+            if not isinstance(value, Blob):
+                return jsonify({"error": "Value is not a blob"}), 409
+            headers = {"X-Version": str(version), "Content-Length": str(len(value))}
+            if value.encoding != IDENTITY:
+                headers["Content-Encoding"] = value.encoding
+            return Response(value.chunks(), headers=headers, mimetype='application/octet-stream')
+
+        # Endpoint per MPUT (scrittura di più chiavi)
+        @app.route('/mput', methods=['PUT'])
+        def mput_data():
+            data = request.get_json()
+            self.store_many(data['items'], data.get('versions'))
+            return jsonify({"status": "ok", "count": len(data['items'])})
+
+        # Endpoint per MGET (lettura di più chiavi); per le chiavi in digest_keys restituisce solo la versione
+        @app.route('/mget', methods=['POST'])
+        def mget_data():
+            data = request.get_json()
+            digest_keys = data.get('digest_keys', [])
+            full = self.retrieve_many(data['keys'])
+            digests = self.retrieve_many(digest_keys)
+            return jsonify({
+                "values": {key: record[0] for key, record in full.items()},
+                "versions": {key: record[1] for records in (full, digests) for key, record in records.items()},
+            })
+
+        # Endpoint per esportare a blocchi i range di token (ribilanciamento)
+        @app.route('/scan', methods=['POST'])
+        def scan_data():
+            data = request.get_json()
+            records, next_token = self.scan_range(data['ranges'], data.get('after', -1), data.get('limit', 500))
+            return jsonify({
+                "values": {key: record[0] for key, record in records.items()},
+                "versions": {key: record[1] for key, record in records.items()},
+                "next": next_token,
+            })
+
+        # Endpoint per cancellare i range di token che il nodo non replica più (fine del ribilanciamento)
+        @app.route('/drop', methods=['POST'])
+        def drop_data():
+            dropped = self.drop_ranges(request.get_json()['ranges'])
+            return jsonify({"status": "ok", "dropped": dropped})
+
+        # Endpoint per la scansione ordinata delle chiavi, a pagine
+        @app.route('/keys', methods=['POST'])
+        def scan_keys():
+            data = request.get_json()
+            records, next_key = self.scan_keys(data.get('start'), data.get('end'), data.get('prefix'),
+                                               data.get('after'), data.get('limit', 1000))
+            return jsonify({"records": records, "next": next_key})
+
+        # Endpoint per le metriche; con ?buckets=1 include i bucket degli istogrammi
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            snapshot = self.metrics.snapshot(request.args.get('buckets') == '1')
+            snapshot["gauges"] = {"keys": len(self.key_index), "blob_memory": self.blob_memory,
+                                  "memory": self.memory_used(), "max_memory": self.max_memory,
+                                  "volatile_keys": sum(len(partition.volatile) for partition in self.partitions)}
+            snapshot["partitions"] = [partition.stats() for partition in self.partitions]
+            return jsonify(snapshot)
+
+        # Endpoint per leggere gli hash del Merkle tree (anti-entropy)
+        @app.route('/merkle/hashes', methods=['POST'])
+        def merkle_hashes():
+            indices = request.get_json()['indices']
+            return jsonify({"depth": self.merkle.depth, "hashes": self.merkle_hashes(indices)})
+
+        # Endpoint per leggere i digest delle chiavi di alcune foglie (anti-entropy)
+        @app.route('/merkle/digests', methods=['POST'])
+        def merkle_digests():
+            data = request.get_json()
+            return jsonify({"digests": self.merkle_digests(data['leaves'], data['ranges'])})
 
         # Avvio del server Flask con l'indirizzo e la porta del nodo
         app.run(host=self.node.split(':')[0], port=int(self.node.split(':')[1]))
@@ -90,15 +738,46 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Node for fault tolerance system")
     parser.add_argument('--node', required=True, help='The address of the node (IP:port)')
     parser.add_argument('--fault_tolerance_address', required=True, help='The address of the fault tolerance node (IP:port)')
+    parser.add_argument('--data_dir', help='Directory of the persistent log-structured storage (default: in-memory storage)')
+    parser.add_argument('--merkle_depth', type=int, default=12, help='Depth of the Merkle tree used for anti-entropy')
+    parser.add_argument('--heartbeat_interval', type=float, default=1.0, help='Seconds between two heartbeats sent to the fault tolerance node')
+    parser.add_argument('--wire_port_offset', type=int, default=0, help='Also serve the binary protocol on the HTTP port plus this offset (0 disables it)')
+    parser.add_argument('--inject_latency', type=float, default=0, help='Artificial delay in seconds added to every request, to test a slow node')
+    parser.add_argument('--max_value_size', type=int, default=64 * 1024 * 1024, help='Maximum size in bytes of a blob value')
+    parser.add_argument('--max_blob_memory', type=int, default=256 * 1024 * 1024, help='Memory in bytes for blobs being received; further blob writes are refused with 503')
+    parser.add_argument('--partitions', type=int, default=16, help='Number of data partitions, each with its own write lock (power of 2, at most 2^merkle_depth)')
+    parser.add_argument('--max_memory', type=int, default=0, help='Estimated memory in bytes for the keys of the node (0 disables the limit)')
+    parser.add_argument('--eviction_policy', choices=POLICIES, default=NOEVICTION, help='What to do above --max_memory: refuse writes (noeviction) or evict sampled keys')
+    parser.add_argument('--eviction_samples', type=int, default=5, help='Keys sampled for each eviction')
+    parser.add_argument('--expiry_tick', type=float, default=0.1, help='Resolution in seconds of the timing wheels that reclaim expired keys')
+    parser.add_argument('--access_log', action='store_true', help='Log every HTTP request (off by default, it costs throughput)')
 
     args = parser.parse_args()
 
     node = Node(
         node=args.node,
-        fault_tolerance_address=args.fault_tolerance_address
+        fault_tolerance_address=args.fault_tolerance_address,
+        storage=LogStorage(args.data_dir) if args.data_dir else None,
+        merkle_depth=args.merkle_depth,
+        heartbeat_interval=args.heartbeat_interval,
+        wire_port_offset=args.wire_port_offset,
+        inject_latency=args.inject_latency,
+        max_value_size=args.max_value_size,
+        max_blob_memory=args.max_blob_memory,
+        num_partitions=args.partitions,
+        max_memory=args.max_memory,
+        eviction_policy=args.eviction_policy,
+        eviction_samples=args.eviction_samples,
+        expiry_tick=args.expiry_tick,
     )
 
+    # Il log di ogni richiesta formatta una riga per operazione: le metriche su /metrics lo sostituiscono
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
     try:
         node.start()
     except KeyboardInterrupt:
         print("Error starting node.")
+    finally:
+        node.storage.close()
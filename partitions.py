@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+
+from eviction import KeySampler
+from expiry import TimingWheel
+from merkle import TOKEN_BITS
+
+
+def clip_ranges(ranges, start, end):
+    """
+    Restringe una lista di intervalli di token all'intervallo [start, end].
+    :param ranges: lista di intervalli di token [inizio, fine] (estremi inclusi)
+    :param start: primo token dell'intervallo
+    :param end: ultimo token dell'intervallo
+    :return: lista degli intervalli non vuoti risultanti, ordinata
+    """
+    clipped = []
+    for range_start, range_end in sorted(ranges):
+        range_start, range_end = max(range_start, start), min(range_end, end)
+        if range_start <= range_end:
+            clipped.append((range_start, range_end))
+    return clipped
+
+
+class Partition:
+    """
+    Partizione dei dati di un nodo: un intervallo contiguo di token del ring, allineato alle foglie del Merkle tree,
+    con il proprio lock per le scritture, i propri contatori, la propria timing wheel delle scadenze e i metadati
+    usati per l'eliminazione delle chiavi. Le letture non prendono il lock.
+    """
+    def __init__(self, index, bits, expiry_tick=0.1):
+        """
+        Inizializza la partizione.
+        :param index: indice della partizione
+        :param bits: numero di bit del token che identificano la partizione (2^bits partizioni)
+        :param expiry_tick: risoluzione (in secondi) della timing wheel delle scadenze
+        """
+        width = 1 << (TOKEN_BITS - bits)
+        self.index = index
+        self.start = index * width  # primo token della partizione
+        self.end = (index + 1) * width - 1  # ultimo token della partizione
+        self.lock = threading.Lock()  # serializza le scritture sulle chiavi della partizione
+        self.keys = 0  # chiavi memorizzate
+        self.bytes = 0  # dimensione stimata delle chiavi in byte
+        self.meta = {}  # chiave -> KeyMeta
+        self.all_keys = KeySampler()  # chiavi campionabili per l'eliminazione
+        self.volatile = KeySampler()  # chiavi con scadenza, campionabili per le politiche volatile-*
+        self.evicted = OrderedDict()  # chiave eliminata -> (token, versione, byte), dalla più vecchia
+        self.evicted_bytes = 0  # dimensione stimata dei digest delle chiavi eliminate
+        self.wheel = TimingWheel(expiry_tick)  # scadenze delle chiavi della partizione
+        # Contatori aggiornati senza lock (le letture non lo prendono): sono indicativi
+        self.reads = 0
+        self.writes = 0
+
+    def stats(self):
+        """
+        Restituisce i contatori della partizione.
+        :return: dizionario con intervallo di token, chiavi, byte, chiavi con scadenza, chiavi eliminate di cui resta
+                 il digest, letture e scritture
+        """
+        return {"index": self.index, "range": [self.start, self.end], "keys": self.keys, "bytes": self.bytes,
+                "volatile": len(self.volatile), "evicted": len(self.evicted), "evicted_bytes": self.evicted_bytes,
+                "reads": self.reads, "writes": self.writes}
+
+
+class PartitionMap:
+    """
+    Divide lo spazio dei token in 2^bits partizioni uguali.
+    """
+    def __init__(self, num_partitions=16, expiry_tick=0.1):
+        """
+        Crea le partizioni.
+        :param num_partitions: numero di partizioni, potenza di 2
+        :param expiry_tick: risoluzione (in secondi) delle timing wheel delle scadenze
+        """
+        if num_partitions < 1 or num_partitions & (num_partitions - 1):
+            raise ValueError(f"The number of partitions must be a power of 2, got {num_partitions}")
+        self.bits = num_partitions.bit_length() - 1
+        self.partitions = [Partition(index, self.bits, expiry_tick) for index in range(num_partitions)]
+
+    def __iter__(self):
+        return iter(self.partitions)
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def of_token(self, token):
+        """
+        Restituisce la partizione che contiene il token.
+        :param token: token del ring
+        :return: partizione
+        """
+        return self.partitions[token >> (TOKEN_BITS - self.bits)]
+
+    def overlapping(self, ranges):
+        """
+        Restituisce le partizioni che intersecano gli intervalli indicati, in ordine di token, con gli intervalli
+        ristretti a ciascuna partizione.
+        :param ranges: lista di intervalli di token [inizio, fine] (estremi inclusi)
+        :return: lista di tuple (partizione, intervalli ristretti alla partizione)
+        """
+        result = []
+        for partition in self.partitions:
+            clipped = clip_ranges(ranges, partition.start, partition.end)
+            if clipped:
+                result.append((partition, clipped))
+        return result
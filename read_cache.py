@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from consistent_hashing import ConsistentHashing
+
+ENTRY_OVERHEAD = 100  # byte stimati per voce oltre a chiave e valore (dizionario, tupla, interi)
+
+
+class ReadCache:
+    """
+    Cache LRU delle letture del coordinatore, limitata in byte. Ogni voce conserva la versione del valore:
+    una voce viene sostituita solo da una versione uguale o più recente, così una lettura lenta non può
+    sovrascrivere il valore di una scrittura completata nel frattempo.
+    """
+    def __init__(self, max_bytes, ttl=0):
+        """
+        Inizializza la cache.
+        :param max_bytes: dimensione massima stimata della cache in byte
+        :param ttl: durata (in secondi) di una voce, 0 per non farle scadere
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # chiave -> (valore, versione, token, dimensione, scadenza)
+        self.size = 0  # dimensione stimata delle voci in byte
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Restituisce il valore in cache della chiave.
+        :param key: chiave da leggere
+        :return: valore in cache, None se la chiave non è in cache o la voce è scaduta
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[4] is not None and entry[4] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None or entry[0] is None:  # assente, scaduta o segnaposto di invalidate
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, version):
+        """
+        Inserisce o aggiorna il valore di una chiave, se la versione non è più vecchia di quella in cache.
+        :param key: chiave
+        :param value: valore letto o scritto
+        :param version: versione del valore
+        """
+        size = len(key) + len(json.dumps(value)) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self.lock:
+            current = self.entries.get(key)
+            if current is not None:
+                if current[1] > version:
+                    return
+                self._remove(key)
+            self.entries[key] = (value, version, ConsistentHashing._hash(key), size, expires)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """
+        Rimuove una voce. Va chiamato con il lock acquisito.
+        :param key: chiave da rimuovere
+        """
+        entry = self.entries.pop(key)
+        self.size -= entry[3]
+
+    def invalidate(self, key, version=None):
+        """
+        Rimuove la chiave dalla cache. Con una versione la voce viene sostituita da un segnaposto senza valore con
+        quella versione: una lettura iniziata prima della scrittura non può rimettere in cache il valore vecchio,
+        mentre la prima lettura della versione scritta (o di una successiva) lo sostituisce.
+        :param key: chiave da rimuovere
+        :param version: versione di una scrittura avvenuta senza passare dal coordinatore (None per rimuovere e basta)
+        """
+        with self.lock:
+            current = self.entries.get(key)
+            if current is not None:
+                if version is not None and current[1] >= version:
+                    return  # la cache ha già la versione scritta o una più recente
+                self._remove(key)
+                self.invalidations += 1
+            if version is None:
+                return
+            size = len(key) + ENTRY_OVERHEAD
+            expires = time.monotonic() + self.ttl if self.ttl > 0 else None
+            self.entries[key] = (None, version, ConsistentHashing._hash(key), size, expires)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_ranges(self, ranges):
+        """
+        Rimuove le chiavi i cui token cadono negli intervalli indicati, ad esempio quelli che cambiano proprietario.
+        :param ranges: lista di intervalli di token [inizio, fine]
+        """
+        if not ranges:
+            return
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if any(start <= entry[2] <= end for start, end in ranges)]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def stats(self):
+        """
+        Restituisce i contatori della cache.
+        :return: dizionario con voci, byte occupati, hit, miss, evizioni e invalidazioni
+        """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
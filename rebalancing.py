@@ -0,0 +1,150 @@
+import logging
+import time
+
+import requests
+
+
+class Rebalancer:
+    """
+    Sposta i dati tra i nodi quando cambia la membership del ring. Confrontando il ring in uso con quello
+    futuro calcola esattamente quali range di token cambiano proprietario e li trasferisce a blocchi, con una
+    velocità massima configurabile, leggendo da tutti i proprietari attuali e scrivendo sui nuovi proprietari.
+    """
+    def __init__(self, transport, batch_size=500, max_keys_per_second=5000):
+        """
+        Inizializza il servizio di ribilanciamento.
+        :param transport: trasporto con pool di connessioni verso i nodi
+        :param batch_size: numero massimo di chiavi trasferite per richiesta
+        :param max_keys_per_second: velocità massima di trasferimento (0 per non limitarla)
+        """
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_keys_per_second = max_keys_per_second
+        self.keys_moved = 0  # chiavi trasferite dal ribilanciamento in corso o dall'ultimo completato
+
+    @staticmethod
+    def moving_ranges(current, target):
+        """
+        Calcola i range di token che cambiano proprietario passando dal ring current al ring target.
+        Per ogni range, ogni nuovo proprietario riceve i dati da tutti i proprietari attuali: una chiave che manca
+        su una replica (una scrittura sotto il quorum con l'hint ancora in attesa, una chiave rimossa dall'eviction)
+        viene comunque copiata da un'altra prima che drop_released la cancelli dai proprietari uscenti. Il nuovo
+        proprietario applica le versioni, quindi le copie ricevute più volte non hanno effetto.
+        :param current: ring in uso
+        :param target: ring dopo il cambio di membership
+        :return: dizionario (nodo sorgente, nodo destinazione) -> lista di intervalli di token [inizio, fine]
+        """
+        old, new = sorted(current.get_ranges()), sorted(target.get_ranges())
+        moves = {}
+        i = j = 0
+        while i < len(old) and j < len(new):
+            # Intersezione tra il range i del ring attuale e il range j del ring futuro
+            start, end = max(old[i][0], new[j][0]), min(old[i][1], new[j][1])
+            old_nodes, new_nodes = old[i][2], new[j][2]
+            if start <= end:
+                for node in new_nodes:
+                    if node not in old_nodes:
+                        for source in old_nodes:
+                            ranges = moves.setdefault((source, node), [])
+                            if ranges and ranges[-1][1] + 1 == start:
+                                ranges[-1] = (ranges[-1][0], end)  # unisce i range adiacenti
+                            else:
+                                ranges.append((start, end))
+            old_end, new_end = old[i][1], new[j][1]
+            if old_end <= new_end:
+                i += 1
+            if new_end <= old_end:
+                j += 1
+        return moves
+
+    @staticmethod
+    def released_ranges(current, target):
+        """
+        Calcola i range di token che ogni nodo smette di replicare passando dal ring current al ring target.
+        :param current: ring in uso
+        :param target: ring dopo il cambio di membership
+        :return: dizionario nodo -> lista di intervalli di token [inizio, fine]
+        """
+        old, new = sorted(current.get_ranges()), sorted(target.get_ranges())
+        released = {}
+        i = j = 0
+        while i < len(old) and j < len(new):
+            start, end = max(old[i][0], new[j][0]), min(old[i][1], new[j][1])
+            if start <= end:
+                for node in old[i][2]:
+                    if node not in new[j][2]:
+                        ranges = released.setdefault(node, [])
+                        if ranges and ranges[-1][1] + 1 == start:
+                            ranges[-1] = (ranges[-1][0], end)  # unisce i range adiacenti
+                        else:
+                            ranges.append((start, end))
+            old_end, new_end = old[i][1], new[j][1]
+            if old_end <= new_end:
+                i += 1
+            if new_end <= old_end:
+                j += 1
+        return released
+
+    def drop_released(self, before, after):
+        """
+        Chiede ai nodi di cancellare i range che non replicano più dopo il cambio di membership. Va chiamato solo
+        dopo un run completato, che ha copiato i range da tutti i vecchi proprietari. È un'operazione di pulizia:
+        un nodo che non risponde conserva i dati, che non vengono più letti.
+        :param before: ring prima del cambio
+        :param after: ring dopo il cambio
+        :return: numero di chiavi cancellate
+        """
+        dropped = 0
+        for node, ranges in self.released_ranges(before, after).items():
+            try:
+                response = self.transport.post(node, "/drop", json={"ranges": ranges})
+                response.raise_for_status()
+                count = response.json()['dropped']
+                dropped += count
+                logging.info(f"Dropped {count} keys in {len(ranges)} released ranges from {node}")
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Failed to drop released ranges from {node}: {e}")
+        return dropped
+
+    def stream(self, source, target, ranges):
+        """
+        Trasferisce le chiavi dei range indicati dal nodo source al nodo target, a blocchi di batch_size chiavi.
+        Il nodo target applica le versioni, quindi le scritture ricevute nel frattempo non vengono sovrascritte.
+        :param source: nodo da cui leggere le chiavi
+        :param target: nodo su cui scriverle
+        :param ranges: lista di intervalli di token [inizio, fine]
+        :return: numero di chiavi trasferite
+        """
+        moved = 0
+        started = time.monotonic()
+        after = -1
+        while after is not None:
+            response = self.transport.post(source, "/scan", json={"ranges": ranges, "after": after, "limit": self.batch_size})
+            response.raise_for_status()
+            data = response.json()
+            if data['values']:
+                response = self.transport.put(target, "/mput", json={"items": data['values'], "versions": data['versions']})
+                response.raise_for_status()
+                moved += len(data['values'])
+                self.keys_moved += len(data['values'])
+            after = data['next']
+            if self.max_keys_per_second > 0:
+                # Limita la velocità per non sottrarre banda e CPU al traffico dei client
+                delay = moved / self.max_keys_per_second - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        return moved
+
+    def run(self, current, target):
+        """
+        Trasferisce tutti i range che cambiano proprietario. Solleva un'eccezione di requests se un trasferimento
+        fallisce: in quel caso il ring non cambia e nessun range viene cancellato dai vecchi proprietari.
+        :param current: ring in uso
+        :param target: ring dopo il cambio di membership
+        :return: numero di chiavi trasferite, contando una volta ogni vecchio proprietario da cui sono state lette
+        """
+        self.keys_moved = 0
+        for (source, target_node), ranges in self.moving_ranges(current, target).items():
+            moved = self.stream(source, target_node, ranges)
+            logging.info(f"Rebalance {source} -> {target_node}: {len(ranges)} ranges, {moved} keys")
+        return self.keys_moved
@@ -0,0 +1,132 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class ReplicaSelector:
+    """
+    Classifica le repliche di una chiave in base alla latenza recente (media mobile esponenziale) e alle
+    richieste ancora in corso verso ciascun nodo, così le letture vanno ai nodi più veloci e meno carichi.
+    Calcola anche il ritardo dopo il quale una lettura lenta viene duplicata su un'altra replica (hedged read):
+    il percentile configurato delle latenze di lettura recenti.
+    """
+    def __init__(self, alpha=0.2, hedge_percentile=95, window_size=1000, min_samples=20, recovery_interval=2.0,
+                 failure_penalty=1.0, clock=None):
+        """
+        Inizializza il selettore.
+        :param alpha: peso dell'ultimo campione nella media mobile esponenziale
+        :param hedge_percentile: percentile delle latenze di lettura oltre il quale inviare la richiesta duplicata,
+                                 0 per disattivare le hedged read
+        :param window_size: numero di latenze di lettura recenti su cui calcolare il percentile
+        :param min_samples: campioni necessari prima di inviare richieste duplicate
+        :param recovery_interval: secondi dopo i quali la latenza stimata di un nodo senza nuovi campioni si
+                                  dimezza, così un nodo lento che non riceve più letture viene riprovato
+        :param failure_penalty: latenza minima (secondi) attribuita a un nodo la cui richiesta è fallita
+        :param clock: orologio monotono in secondi (default: time.monotonic), sostituibile con un orologio virtuale
+        """
+        self.clock = clock or time.monotonic
+        self.alpha = alpha
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.recovery_interval = recovery_interval
+        self.failure_penalty = failure_penalty
+        self.latency = {}  # nodo -> latenza media (secondi)
+        self.updated = {}  # nodo -> istante (monotonic) dell'ultimo campione
+        self.outstanding = {}  # nodo -> richieste in corso
+        self.samples = deque(maxlen=window_size)  # latenze di lettura recenti di tutti i nodi
+        self.delay = None  # ritardo delle hedged read, ricalcolato ogni min_samples campioni
+        self.since_update = 0
+        self.hedges = 0  # richieste duplicate inviate
+        self.hedge_wins = 0  # richieste duplicate che hanno completato la lettura prima di quella originale
+        self.lock = threading.Lock()
+
+    def begin(self, node):
+        """
+        Registra l'invio di una richiesta al nodo.
+        :param node: coppia indirizzo-porta del nodo
+        """
+        with self.lock:
+            self.outstanding[node] = self.outstanding.get(node, 0) + 1
+
+    def end(self, node, seconds, read=True, failed=False):
+        """
+        Registra il completamento (o il fallimento) di una richiesta al nodo.
+        :param node: coppia indirizzo-porta del nodo
+        :param seconds: durata della richiesta
+        :param read: True se la richiesta era una lettura, usata anche per il ritardo delle hedged read
+        :param failed: True se la richiesta è fallita; un nodo irraggiungibile risponde subito con un errore, quindi
+                       invece della durata si raddoppia la latenza stimata (almeno failure_penalty)
+        """
+        with self.lock:
+            self.outstanding[node] = max(self.outstanding.get(node, 1) - 1, 0)
+            previous = self.latency.get(node)
+            if failed:
+                self.latency[node] = max(2 * (previous or 0.0), seconds, self.failure_penalty)
+            elif previous is None:
+                self.latency[node] = seconds
+            else:
+                self.latency[node] = previous + self.alpha * (seconds - previous)
+            self.updated[node] = self.clock()
+            if read and not failed and self.hedge_percentile > 0:
+                self.samples.append(seconds)
+                self.since_update += 1
+                if self.since_update >= self.min_samples:
+                    self.since_update = 0
+                    ordered = sorted(self.samples)
+                    self.delay = ordered[min(math.ceil(self.hedge_percentile / 100 * len(ordered)), len(ordered)) - 1]
+
+    def score(self, node, now):
+        """
+        Calcola il punteggio di un nodo (più basso è migliore). Va chiamato con il lock acquisito.
+        :param node: coppia indirizzo-porta del nodo
+        :param now: istante di riferimento (monotonic)
+        :return: latenza stimata moltiplicata per le richieste in corso più una (0 per un nodo mai misurato)
+        """
+        latency = self.latency.get(node, 0.0)
+        if latency:
+            latency *= 0.5 ** ((now - self.updated[node]) / self.recovery_interval)
+        return latency * (1 + self.outstanding.get(node, 0))
+
+    def rank(self, nodes):
+        """
+        Ordina le repliche dalla migliore alla peggiore; a parità di punteggio resta l'ordine del ring.
+        :param nodes: lista dei nodi responsabili
+        :return: nuova lista ordinata
+        """
+        now = self.clock()
+        with self.lock:
+            return sorted(nodes, key=lambda node: self.score(node, now))
+
+    def hedge_delay(self):
+        """
+        Restituisce il ritardo dopo il quale duplicare una lettura.
+        :return: secondi, None se le hedged read sono disattivate o non ci sono ancora abbastanza campioni
+        """
+        return self.delay if self.hedge_percentile > 0 else None
+
+    def record_hedge(self, won):
+        """
+        Registra l'esito di una richiesta duplicata.
+        :param won: True se la richiesta duplicata ha completato la lettura prima di quella originale
+        """
+        with self.lock:
+            self.hedges += 1
+            if won:
+                self.hedge_wins += 1
+
+    def stats(self):
+        """
+        Restituisce lo stato del selettore.
+        :return: dizionario con latenza media e richieste in corso per nodo, ritardo e contatori delle hedged read
+        """
+        now = self.clock()
+        with self.lock:
+            return {
+                "nodes": {node: {"latency_ms": round(latency * 1000, 3), "outstanding": self.outstanding.get(node, 0),
+                                 "score_ms": round(self.score(node, now) * 1000, 3)}
+                          for node, latency in sorted(self.latency.items())},
+                "hedge_delay_ms": round(self.delay * 1000, 3) if self.delay is not None else None,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
@@ -1,100 +1,771 @@
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import logging
+import queue
+import threading
+import time
+from urllib.parse import quote
+
+from blob import CHUNK_SIZE, IDENTITY
+from metrics import Metrics
+from replica_selection import ReplicaSelector
+from transport import NodeTransport
+from wire import WireError
+from write_batching import WriteBatcher
+
+MISSING = -1  # versione che indica che il nodo non ha la chiave
+STREAM_QUEUE_SIZE = 8  # blocchi di un blob in attesa per ciascuna replica
+STREAM_ABORT = object()  # segnala a una replica che la scrittura del blob è stata interrotta
+
+# Livelli di consistenza che un client può chiedere per una singola lettura o scrittura, oltre a un numero di repliche
+ONE = 'ONE'
+QUORUM = 'QUORUM'  # il quorum configurato sul coordinatore (--quorum_write/--quorum_read)
+ALL = 'ALL'
+CONSISTENCY_LEVELS = (ONE, QUORUM, ALL)
+
+
+class StreamAborted(Exception):
+    """
+    Eccezione sollevata nello stream verso una replica quando la scrittura di un blob viene interrotta.
+    """
+
+
+class StreamsExhausted(Exception):
+    """
+    Eccezione sollevata quando tutti gli slot per gli upload di blob sono occupati.
+    """
+
+
+class ConsistencyUnavailable(Exception):
+    """
+    Eccezione sollevata quando una lettura non può raggiungere il livello di consistenza richiesto: le repliche
+    online sono meno di quelle necessarie, oppure la chiave è stata trovata solo su alcune delle repliche richieste.
+    """
+    def __init__(self, message, achieved):
+        """
+        :param message: descrizione dell'errore
+        :param achieved: repliche che hanno restituito la chiave
+        """
+        super().__init__(message)
+        self.achieved = achieved
+
+
+def count_found(versions):
+    """
+    Conta le repliche che hanno risposto con la chiave.
+    :param versions: dizionario nodo -> versione letta (MISSING se la chiave non c'è)
+    :return: numero di repliche che hanno la chiave
+    """
+    return sum(1 for version in versions.values() if version != MISSING)
+
+
+def parse_consistency(level, replication_factor=None):
+    """
+    Valida il livello di consistenza ricevuto da un client.
+    :param level: ONE, QUORUM o ALL (senza distinzione tra maiuscole e minuscole), un numero di repliche, None
+    :param replication_factor: fattore di replicazione, oltre il quale un numero di repliche non è mai raggiungibile
+                               (None per non controllarlo)
+    :return: livello normalizzato (nome in maiuscolo o numero di repliche), None per il quorum configurato
+    :raises ValueError: se il livello non è valido o supera il fattore di replicazione
+    """
+    if level is None or level == '':
+        return None
+    if isinstance(level, str) and level.upper() in CONSISTENCY_LEVELS:
+        return level.upper()
+    if isinstance(level, str) and level.isdigit():
+        level = int(level)
+    if not isinstance(level, int) or isinstance(level, bool) or level < 1:
+        raise ValueError(f"invalid consistency level {level}, expected {', '.join(CONSISTENCY_LEVELS)} or a number of replicas")
+    if replication_factor is not None and level > replication_factor:
+        raise ValueError(f"consistency level {level} exceeds the replication factor {replication_factor}")
+    return level
+
+
+def required_replicas(level, quorum, replicas, replication_factor=None, pending=0):
+    """
+    Calcola il numero di repliche che devono rispondere per soddisfare un livello di consistenza. ALL richiede tutte
+    le replication_factor repliche anche se alcune sono offline (e quindi non raggiungibile finché non tornano), più
+    gli eventuali nuovi proprietari durante un ribilanciamento.
+    Durante un ribilanciamento, come per i range pendenti di Cassandra, ogni nuovo proprietario aggiunge una conferma
+    a quelle richieste: anche se tutti i nuovi proprietari confermano, il livello viene raggiunto sui proprietari
+    attuali, da cui leggono le letture, e R + W > N continua a valere.
+    :param level: livello restituito da parse_consistency, None per il quorum configurato
+    :param quorum: quorum configurato
+    :param replicas: numero di repliche a cui è diretta la richiesta
+    :param replication_factor: fattore di replicazione (None per considerare solo le repliche della richiesta)
+    :param pending: numero di nuovi proprietari tra le repliche della richiesta
+    :return: numero di risposte necessarie
+    """
+    if level is None or level == QUORUM:
+        return quorum + pending
+    if level == ONE:
+        return 1 + pending
+    if level == ALL:
+        return max(replicas, (replication_factor or 0) + pending, 1)
+    return level + pending
+
+
+def iter_raw(response):
+    """
+    Restituisce il corpo di una risposta in streaming così come è stato inviato, senza decomprimerlo, e chiude la
+    risposta alla fine.
+    :param response: risposta HTTP aperta con stream=True
+    :return: generatore dei blocchi
+    """
+    try:
+        yield from response.raw.stream(CHUNK_SIZE, decode_content=False)
+    finally:
+        response.close()
+
+
+def split_reads(key_nodes):
+    """
+    Divide le letture di più chiavi per nodo: il primo nodo responsabile di ogni chiave restituisce il valore,
+    gli altri solo la versione.
+    :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+    :return: tupla (nodo -> chiavi da leggere per intero, nodo -> chiavi di cui leggere solo la versione)
+    """
+    full, digest = {}, {}
+    for key, nodes in key_nodes.items():
+        if nodes:
+            full.setdefault(nodes[0], []).append(key)
+            for node in nodes[1:]:
+                digest.setdefault(node, []).append(key)
+    return full, digest
+
+
+class ReadRepair:
+    """
+    Coda di riparazioni in background: le repliche trovate non aggiornate durante una lettura vengono riscritte
+    da thread dedicati, così la latenza della GET non include la riparazione.
+    """
+    def __init__(self, write_to_node, max_pending=10000, workers=2):
+        """
+        Inizializza la coda e avvia i thread di riparazione.
+        :param write_to_node: funzione (nodo, chiave, valore, versione) usata per riscrivere una replica
+        :param max_pending: numero massimo di riparazioni in attesa; oltre questa soglia vengono scartate
+        :param workers: numero di thread di riparazione
+        """
+        self.write_to_node = write_to_node
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.repaired = 0  # repliche riscritte
+        self.dropped = 0  # riparazioni scartate perché la coda era piena (le recupera l'anti-entropy)
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, key, value, version, nodes):
+        """
+        Accoda la riparazione delle repliche non aggiornate di una chiave, senza bloccare.
+        :param key: chiave da riparare
+        :param value: valore più recente
+        :param version: versione del valore più recente
+        :param nodes: repliche da riscrivere
+        """
+        try:
+            self.queue.put_nowait((key, value, version, nodes))
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        """
+        Esegue le riparazioni accodate.
+        """
+        while True:
+            key, value, version, nodes = self.queue.get()
+            for node in nodes:
+                if self.write_to_node(node, key, value, version):
+                    self.repaired += 1
 
 
 class Replication:
     """
     Classe per la gestione della replicazione dei dati.
     """
-    def __init__(self, quorum_write, quorum_read):
+    def __init__(self, quorum_write, quorum_read, transport=None, executor=None, hints=None, wire=None, metrics=None,
+                 selector=None, write_batch_size=0, write_batch_delay=0.0005, replication_factor=None, max_streams=8):
         """
         Inizializza la classe Replication con i parametri di quorum specificati.
         :param quorum_write: quorum di scrittura
         :param quorum_read: quorum di lettura
+        :param transport: trasporto con pool di connessioni keep-alive verso i nodi
+        :param executor: executor condiviso usato per tutte le richieste verso le repliche
+        :param hints: HintStore in cui registrare le scritture non consegnate (None per disattivare l'hinted handoff)
+        :param wire: WireTransport del protocollo binario, usato al posto di HTTP per get, put, mget e mput (None per usare HTTP)
+        :param metrics: registro in cui misurare le RPC verso le repliche e l'attesa dei quorum
+        :param selector: ReplicaSelector che sceglie le repliche da cui leggere e il ritardo delle hedged read
+        :param write_batch_size: numero massimo di scritture raggruppate in una richiesta bulk per nodo, 0 per inviare
+                                 ogni scrittura con una richiesta separata
+        :param write_batch_delay: attesa massima (in secondi) di una scrittura prima dell'invio del suo blocco
+        :param replication_factor: fattore di replicazione, il numero di conferme richiesto dal livello ALL
+        :param max_streams: numero massimo di upload di blob contemporanei; oltre questo limite replicate_stream
+                            solleva StreamsExhausted
         """
         self.quorum_write = quorum_write
         self.quorum_read = quorum_read
+        self.replication_factor = replication_factor
+        self.transport = transport if transport is not None else NodeTransport()
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=32, thread_name_prefix='replication')
+        self.hints = hints
+        self.wire = wire
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.selector = selector if selector is not None else ReplicaSelector()
+        self.read_repair = ReadRepair(self.write_to_node)
+        self.write_batch_size = write_batch_size
+        self.write_batch_delay = write_batch_delay
+        self.batcher = WriteBatcher(self.write_many_to_node, self.executor, max_batch=write_batch_size,
+                                    max_delay=write_batch_delay, metrics=self.metrics) if write_batch_size > 0 else None
+        # Un upload di blob occupa un thread per replica finché il client non ha inviato tutto il corpo: gli upload
+        # hanno un executor separato, dimensionato per i proprietari attuali e futuri di max_streams upload, così un
+        # client lento non toglie thread alle altre richieste verso le repliche
+        self.max_streams = max_streams
+        self.stream_slots = threading.BoundedSemaphore(max_streams)
+        self.stream_executor = ThreadPoolExecutor(max_workers=max_streams * 2 * (replication_factor or 3),
+                                                  thread_name_prefix='stream')
 
-    @staticmethod
-    def write_to_node(node, key, value):
+    def write_to_node(self, node, key, value, version=0):
         """
         Scrive il valore di una chiave su un nodo.
         :param node: coppia indirizzo-porta del nodo su cui scrivere il valore
         :param key: chiave da scrivere
         :param value: valore da scrivere
+        :param version: versione del valore
         :return: True se la scrittura ha avuto successo, False altrimenti
         """
-        url = f"http://{node}/put"  # costruisce l'URL per la richiesta PUT
+        began = time.perf_counter()
+        failed = False
+        self.selector.begin(node)
         try:
-            response = requests.put(url, json={"key": key, "value": value})  # invia una richiesta PUT al nodo
-            response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
-            logging.info(f"Successfully wrote to node {node}: {response.json()}")
+            if self.wire is not None:
+                self.wire.put(node, key, value, version)
+            else:
+                response = self.transport.put(node, "/put", json={"key": key, "value": value, "version": version})  # invia una richiesta PUT al nodo
+                response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+            self.metrics.observe('rpc.put', time.perf_counter() - began)
             return True  # restituisce True se la richiesta ha avuto esito positivo
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, WireError) as e:
+            failed = True
+            self.metrics.incr('rpc.put.errors')
             logging.error(f"Failed to write to node {node}: {e}")
+            if self.hints is not None:
+                self.hints.add(node, key, value, version)  # la scrittura verrà rinviata quando il nodo torna online
             return False  # restituisce False se la richiesta ha avuto esito negativo
+        finally:
+            self.selector.end(node, time.perf_counter() - began, read=False, failed=failed)
 
-    def replicate_write(self, key, value, nodes):
+    def replicate_write(self, key, value, nodes, version=0, level=None, with_acks=False, pending=0):
         """
-        Replica il valore di una chiave su più nodi.
+        Replica il valore di una chiave su più nodi. La scrittura è confermata appena il numero di repliche
+        richiesto dal livello di consistenza ha risposto; le scritture verso le altre repliche proseguono in
+        background e, se falliscono, vengono registrate come hint.
         :param key: chiave da scrivere
         :param value: valore da scrivere
         :param nodes: lista di coppie indirizzo-porta dei nodi su cui replicare il valore
-        :return: True se almeno quorum_write scritture hanno avuto successo, False altrimenti
+        :param version: versione del valore
+        :param level: livello di consistenza (vedi parse_consistency), None per quorum_write
+        :param with_acks: se True restituisce la tupla (esito, repliche che hanno confermato)
+        :param pending: numero di nuovi proprietari in nodes durante un ribilanciamento (vedi required_replicas)
+        :return: True se il livello di consistenza è stato raggiunto, False altrimenti
         """
-        with ThreadPoolExecutor() as executor:
-            future_to_node = {executor.submit(self.write_to_node, node, key, value): node for node in nodes}
-            success_count = 0
-            for future in as_completed(future_to_node):
-                if future.result():
-                    success_count += 1
-                if success_count >= self.quorum_write:
-                    break
-        logging.info(f" wrote to {success_count} nodes")
-        logging.info(f" quorum write {self.quorum_write}")
-        return success_count >= self.quorum_write
+        required = required_replicas(level, self.quorum_write, len(nodes), self.replication_factor, pending)
+        began = time.perf_counter()
+        if self.batcher is not None:
+            # Le scritture concorrenti verso lo stesso nodo viaggiano insieme in una richiesta bulk
+            future_to_node = {self.batcher.submit(node, key, value, version): node for node in nodes}
+        else:
+            future_to_node = {self.executor.submit(self.write_to_node, node, key, value, version): node for node in nodes}
+        success_count = 0
+        for future in as_completed(future_to_node):
+            if future.result():
+                success_count += 1
+            if success_count >= required:
+                break
+        self.metrics.observe('quorum.write', time.perf_counter() - began)
+        success = success_count >= required
+        return (success, success_count) if with_acks else success
 
-    @staticmethod
-    def read_from_node(node, key):
+    def read_from_node(self, node, key, digest=False):
         """
-        Legge il valore di una chiave da un nodo.
+        Legge il valore di una chiave da un nodo, oppure solo la sua versione.
         :param node: coppia indirizzo-porta del nodo da cui leggere il valore
         :param key: chiave da leggere
-        :return: valore della chiave se la lettura ha avuto successo, None altrimenti
+        :param digest: se True il nodo restituisce solo la versione
+        :return: tupla (valore, versione), (None, MISSING) se il nodo non ha la chiave, None in caso di errore
         """
-        url = f"http://{node}/get"  # costruisce l'URL per la richiesta GET
+        params = {"key": key, "digest": 1} if digest else {"key": key}
+        name = 'rpc.digest' if digest else 'rpc.get'
+        began = time.perf_counter()
+        failed = False
+        self.selector.begin(node)
         try:
-            response = requests.get(url, params={"key": key})  # invia una richiesta GET al nodo
-            if response.status_code == 404:
-                logging.info(f"Node {node} does not have the key {key} (not an error).")
-                return None
-            response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
-            logging.info(f"Successfully read from node {node}: {response.json()}")
-            return response.json().get('value')  # restituisce il valore della chiave se la richiesta ha avuto successo
-        except requests.exceptions.RequestException as e:
+            if self.wire is not None:
+                record = self.wire.get(node, key, digest)
+            else:
+                response = self.transport.get(node, "/get", params=params)  # invia una richiesta GET al nodo
+                if response.status_code == 404:
+                    record = None
+                else:
+                    response.raise_for_status()  # solleva un'eccezione se la richiesta ha avuto esito negativo
+                    data = response.json()
+                    record = data.get('value'), data['version']
+            self.metrics.observe(name, time.perf_counter() - began)
+            # Se il nodo non ha la chiave non è un errore
+            return record if record is not None else (None, MISSING)
+        except (requests.exceptions.RequestException, WireError) as e:
+            failed = True
+            self.metrics.incr(f"{name}.errors")
             logging.error(f"Failed to read from node {node}: {e}")
             return None  # restituisce None se la richiesta ha avuto esito negativo
+        finally:
+            self.selector.end(node, time.perf_counter() - began, failed=failed)
 
-    def get_from_replicas(self, key, nodes):
+    def get_from_replicas(self, key, nodes, with_version=False, level=None, with_acks=False):
         """
-        Legge il valore di una chiave da più nodi e restituisce la prima risposta valida ricevuta.
+        Legge il valore di una chiave con read_quorum.
         :param key: chiave da leggere
         :param nodes: lista di coppie indirizzo-porta dei nodi da cui leggere il valore
-        :param reduced_quorum: indica se usare un quorum ridotto
-        :return: valore della chiave se almeno quorum_read letture hanno avuto successo, None altrimenti
+        :param with_version: se True restituisce la tupla (valore, versione)
+        :param level: livello di consistenza (vedi parse_consistency), None per quorum_read
+        :param with_acks: se True restituisce la tupla (risultato, repliche che hanno restituito la chiave)
+        :return: valore della chiave, None se nessuna replica la restituisce
+        :raises ConsistencyUnavailable: se il livello di consistenza non può essere raggiunto
+        """
+        required = required_replicas(level, self.quorum_read, len(nodes), self.replication_factor)
+        if required > len(nodes):
+            raise ConsistencyUnavailable(f"consistency level {level or QUORUM} needs {required} replicas, "
+                                         f"{len(nodes)} online", 0)
+        record, found = self.read_quorum(key, nodes, required)
+        if record is None and found:
+            raise ConsistencyUnavailable(f"key found on {found} replicas, consistency level {level or QUORUM} "
+                                         f"needs {required}", found)
+        result = record if with_version or record is None else record[0]
+        return (result, found) if with_acks else result
+
+    def read_quorum(self, key, nodes, required):
         """
-        with ThreadPoolExecutor() as executor:
-            future_to_node = {executor.submit(self.read_from_node, node, key): node for node in nodes}
-            responses = []
-            for future in as_completed(future_to_node):
+        Legge il valore di una chiave dalle required repliche migliori secondo il ReplicaSelector: il valore
+        completo viene richiesto solo alla prima, alle altre solo la versione. Se una replica fallisce o non ha la
+        chiave la richiesta passa alla replica successiva; se una risposta tarda oltre il ritardo delle hedged
+        read la stessa richiesta viene inviata anche alla replica successiva e vale la prima risposta.
+        Se la replica che ha restituito il valore non ha la versione più recente, il valore viene riletto dal
+        nodo che ce l'ha. Le repliche non aggiornate vengono riparate in background.
+        :param key: chiave da leggere
+        :param nodes: lista di coppie indirizzo-porta dei nodi da cui leggere il valore
+        :param required: numero di repliche che devono restituire la chiave
+        :return: tupla ((valore, versione), repliche che hanno restituito la chiave); il record è None se le
+                 repliche che hanno la chiave sono meno di required
+        """
+        if not nodes:
+            return None, 0
+        began = time.perf_counter()
+        ranked = self.selector.rank(nodes)
+        spare = iter(ranked[required:])  # repliche da usare in caso di errore o per le hedged read
+        pending = {}  # future -> (nodo, solo versione)
+        for i, node in enumerate(ranked[:required]):
+            pending[self.executor.submit(self.read_from_node, node, key, i > 0)] = (node, i > 0)
+        versions = {}  # nodo -> versione letta
+        record = None  # (valore, versione) letto per intero
+        hedge = None  # future della richiesta duplicata
+        delay = self.selector.hedge_delay()
+        hedge_at = began + delay if delay is not None else None  # istante in cui duplicare la lettura
+
+        def send(digest):
+            node = next(spare, None)
+            if node is None:
+                return None
+            future = self.executor.submit(self.read_from_node, node, key, digest)
+            pending[future] = (node, digest)
+            return future
+
+        while pending and not (record is not None and count_found(versions) >= required):
+            timeout = max(hedge_at - time.perf_counter(), 0) if hedge is None and hedge_at is not None else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Nessuna risposta entro il ritardo: duplica la lettura del valore se manca ancora, altrimenti di una versione
+                hedge = send(record is not None) or False
+                if hedge:
+                    self.metrics.incr('hedge.fired')
+                continue
+            for future in done:
+                node, digest = pending.pop(future)
                 result = future.result()
                 if result is not None:
-                    responses.append(result)
-                if len(responses) >= self.quorum_read:
+                    versions[node] = result[1]
+                    if not digest and result[1] != MISSING:
+                        record = result
+                if result is None or result[1] == MISSING:
+                    # Errore o chiave assente: si interroga un'altra replica con lo stesso ruolo
+                    send(digest)
+        if hedge:
+            # La richiesta duplicata ha vinto se è terminata mentre una richiesta originale era ancora in corso
+            won = hedge.done() and any(future is not hedge for future in pending)
+            self.selector.record_hedge(won)
+            if won:
+                self.metrics.incr('hedge.won')
+        self.metrics.observe('quorum.read', time.perf_counter() - began)
+        found = count_found(versions)
+        if found < required:
+            return None, found
+
+        latest_node = max(versions, key=versions.get)
+        if record is None or record[1] < versions[latest_node]:
+            self.metrics.incr('read.refetch')
+            record = self.read_from_node(latest_node, key)
+            if record is None or record[1] == MISSING:
+                return None, found
+        value, version = record
+        stale = [node for node, node_version in versions.items() if node_version < version]
+        if stale:
+            self.read_repair.submit(key, value, version, stale)
+        return (value, version), found
+
+    @staticmethod
+    def group_by_node(key_nodes):
+        """
+        Raggruppa le chiavi per nodo, in modo da inviare una sola richiesta bulk a ciascun nodo.
+        :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+        :return: dizionario che mappa ogni nodo alla lista delle chiavi di cui è responsabile
+        """
+        node_keys = {}
+        for key, nodes in key_nodes.items():
+            for node in nodes:
+                node_keys.setdefault(node, []).append(key)
+        return node_keys
+
+    def write_many_to_node(self, node, items, versions=None):
+        """
+        Scrive più coppie chiave-valore su un nodo con una sola richiesta.
+        :param node: coppia indirizzo-porta del nodo su cui scrivere i valori
+        :param items: dizionario chiave-valore da scrivere
+        :param versions: dizionario chiave-versione
+        :return: True se la scrittura ha avuto successo, False altrimenti
+        """
+        began = time.perf_counter()
+        try:
+            if self.wire is not None:
+                self.wire.mput(node, items, versions)
+            else:
+                response = self.transport.put(node, "/mput", json={"items": items, "versions": versions or {}})  # invia una richiesta MPUT al nodo
+                response.raise_for_status()
+            self.metrics.observe('rpc.mput', time.perf_counter() - began)
+            return True
+        except (requests.exceptions.RequestException, WireError) as e:
+            self.metrics.incr('rpc.mput.errors')
+            logging.error(f"Failed to write {len(items)} keys to node {node}: {e}")
+            self.add_hints(node, items, versions)
+            return False
+
+    def add_hints(self, node, items, versions):
+        """
+        Registra gli hint di una scrittura bulk non consegnata.
+        :param node: nodo a cui la scrittura era destinata
+        :param items: dizionario chiave-valore
+        :param versions: dizionario chiave-versione
+        """
+        if self.hints is not None:
+            versions = versions or {}
+            for key, value in items.items():
+                self.hints.add(node, key, value, versions.get(key, 0))
+
+    def replicate_write_many(self, items, key_nodes, versions=None, level=None, pending=None):
+        """
+        Replica più chiavi inviando una richiesta bulk per nodo e applica il quorum di scrittura a ogni chiave.
+        :param items: dizionario chiave-valore da scrivere
+        :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+        :param versions: dizionario chiave-versione
+        :param level: livello di consistenza (vedi parse_consistency), None per quorum_write
+        :param pending: dizionario chiave -> numero di nuovi proprietari tra i suoi nodi durante un ribilanciamento
+        :return: dizionario che mappa ogni chiave a True se il livello di consistenza è stato raggiunto
+        """
+        versions = versions or {}
+        pending = pending or {}
+        began = time.perf_counter()
+        node_keys = self.group_by_node(key_nodes)
+        future_to_node = {
+            self.executor.submit(self.write_many_to_node, node, {key: items[key] for key in keys},
+                                 {key: versions[key] for key in keys if key in versions}): node
+            for node, keys in node_keys.items()
+        }
+        success_count = {key: 0 for key in items}
+        for future in as_completed(future_to_node):
+            if future.result():
+                for key in node_keys[future_to_node[future]]:
+                    success_count[key] += 1
+        self.metrics.observe('quorum.write_many', time.perf_counter() - began)
+        return {key: count >= required_replicas(level, self.quorum_write, len(key_nodes[key]), self.replication_factor,
+                                                pending.get(key, 0))
+                for key, count in success_count.items()}
+
+    def read_many_from_node(self, node, keys, digest_keys=()):
+        """
+        Legge i valori di più chiavi da un nodo con una sola richiesta.
+        :param node: coppia indirizzo-porta del nodo da cui leggere i valori
+        :param keys: lista delle chiavi da leggere per intero
+        :param digest_keys: lista delle chiavi di cui leggere solo la versione
+        :return: tupla (chiave -> valore, chiave -> versione) con le chiavi presenti nel nodo, None in caso di errore
+        """
+        began = time.perf_counter()
+        try:
+            if self.wire is not None:
+                result = self.wire.mget(node, keys, list(digest_keys))
+            else:
+                response = self.transport.post(node, "/mget", json={"keys": keys, "digest_keys": list(digest_keys)})  # invia una richiesta MGET al nodo
+                response.raise_for_status()
+                data = response.json()
+                result = data['values'], data['versions']
+            self.metrics.observe('rpc.mget', time.perf_counter() - began)
+            return result
+        except (requests.exceptions.RequestException, WireError) as e:
+            self.metrics.incr('rpc.mget.errors')
+            logging.error(f"Failed to read {len(keys) + len(digest_keys)} keys from node {node}: {e}")
+            return None
+
+    def collect_many(self, key_nodes, responses):
+        """
+        Raccoglie le versioni e i valori restituiti da una lettura bulk e individua i valori da rileggere perché
+        il primo nodo responsabile non aveva la versione più recente.
+        :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+        :param responses: dizionario nodo -> risposta di read_many_from_node (None in caso di errore)
+        :return: tupla (chiave -> nodo -> versione, chiave -> (valore, versione), nodo -> chiavi da rileggere)
+        """
+        full, digest = split_reads(key_nodes)
+        versions = {key: {} for key in key_nodes}
+        records = {}
+        for node, response in responses.items():
+            if response is None:
+                continue
+            values, node_versions = response
+            for key in full.get(node, []) + digest.get(node, []):
+                versions[key][node] = node_versions.get(key, MISSING)
+            for key, value in values.items():
+                records[key] = (value, node_versions[key])
+
+        refetch = {}
+        for key, key_versions in versions.items():
+            if count_found(key_versions) >= self.quorum_read:
+                latest_node = max(key_versions, key=key_versions.get)
+                if key not in records or records[key][1] < key_versions[latest_node]:
+                    refetch.setdefault(latest_node, []).append(key)
+        return versions, records, refetch
+
+    def finish_many(self, versions, records, refetched):
+        """
+        Applica il quorum di lettura a ogni chiave e accoda la riparazione delle repliche non aggiornate.
+        :param versions: dizionario chiave -> nodo -> versione
+        :param records: dizionario chiave -> (valore, versione)
+        :param refetched: dizionario nodo -> risposta delle riletture
+        :return: dizionario che mappa ogni chiave al suo valore, o a None se il quorum non è stato raggiunto
+        """
+        for response in refetched.values():
+            if response is not None:
+                values, node_versions = response
+                for key, value in values.items():
+                    records[key] = (value, node_versions[key])
+
+        results = {}
+        for key, key_versions in versions.items():
+            if count_found(key_versions) < self.quorum_read or key not in records:
+                results[key] = None
+                continue
+            value, version = records[key]
+            stale = [node for node, node_version in key_versions.items() if node_version < version]
+            if stale:
+                self.read_repair.submit(key, value, version, stale)
+            results[key] = value
+        return results
+
+    def _read_many(self, full, digest=None):
+        """
+        Esegue in parallelo le letture bulk verso più nodi.
+        :param full: dizionario nodo -> chiavi da leggere per intero
+        :param digest: dizionario nodo -> chiavi di cui leggere solo la versione
+        :return: dizionario nodo -> risposta di read_many_from_node
+        """
+        digest = digest or {}
+        future_to_node = {
+            self.executor.submit(self.read_many_from_node, node, full.get(node, []), digest.get(node, [])): node
+            for node in set(full) | set(digest)
+        }
+        return {future_to_node[future]: future.result() for future in as_completed(future_to_node)}
+
+    def get_many_from_replicas(self, key_nodes):
+        """
+        Legge più chiavi inviando una richiesta bulk per nodo e applica il quorum di lettura a ogni chiave.
+        Ogni nodo restituisce il valore delle chiavi di cui è il primo responsabile e solo la versione delle altre.
+        :param key_nodes: dizionario che mappa ogni chiave alla lista dei nodi responsabili
+        :return: dizionario che mappa ogni chiave al suo valore, o a None se il quorum non è stato raggiunto
+        """
+        began = time.perf_counter()
+        full, digest = split_reads(key_nodes)
+        versions, records, refetch = self.collect_many(key_nodes, self._read_many(full, digest))
+        self.metrics.observe('quorum.read_many', time.perf_counter() - began)
+        return self.finish_many(versions, records, self._read_many(refetch) if refetch else {})
+
+    def stream_to_node(self, node, key, chunks, version, encoding=IDENTITY):
+        """
+        Scrive un blob su un nodo inviandone il contenuto a blocchi (chunked transfer encoding).
+        :param node: coppia indirizzo-porta del nodo
+        :param key: chiave da scrivere
+        :param chunks: iterabile dei blocchi del blob, già codificati con encoding
+        :param version: versione del valore
+        :param encoding: codifica del contenuto
+        :return: True se la scrittura ha avuto successo, False altrimenti
+        """
+        headers = {"X-Version": str(version)}
+        if encoding != IDENTITY:
+            headers["Content-Encoding"] = encoding
+        began = time.perf_counter()
+        try:
+            response = self.transport.put(node, f"/blob/{quote(key, safe='')}", data=chunks, headers=headers)
+            response.raise_for_status()
+            self.metrics.observe('rpc.put_blob', time.perf_counter() - began)
+            return True
+        except (requests.exceptions.RequestException, StreamAborted) as e:
+            self.metrics.incr('rpc.put_blob.errors')
+            logging.error(f"Failed to stream blob {key} to node {node}: {e}")
+            return False
+
+    def _feed(self, feed):
+        """
+        Restituisce i blocchi accodati per una replica fino alla fine dello stream.
+        :param feed: coda dei blocchi della replica
+        :return: generatore dei blocchi
+        """
+        while True:
+            try:
+                chunk = feed.get(timeout=self.transport.timeout[1])
+            except queue.Empty:
+                raise StreamAborted("timed out waiting for the next chunk")
+            if chunk is None:
+                return
+            if chunk is STREAM_ABORT:
+                raise StreamAborted("write aborted")
+            yield chunk
+
+    def _offer(self, feed, chunk):
+        """
+        Accoda un blocco per una replica, attendendo al massimo il timeout delle RPC.
+        :param feed: coda dei blocchi della replica
+        :param chunk: blocco da accodare (None per la fine dello stream)
+        :return: True se il blocco è stato accodato, False se la replica non sta leggendo
+        """
+        try:
+            feed.put(chunk, timeout=self.transport.timeout[1])
+            return True
+        except queue.Full:
+            return False
+
+    @staticmethod
+    def _abort(feed):
+        """
+        Interrompe lo stream di una replica, svuotando la coda se necessario.
+        :param feed: coda dei blocchi della replica
+        """
+        while True:
+            try:
+                feed.put_nowait(STREAM_ABORT)
+                return
+            except queue.Full:
+                try:
+                    feed.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def replicate_stream(self, key, chunks, nodes, version, encoding=IDENTITY, pending=0):
+        """
+        Replica un blob inoltrando ogni blocco a tutte le repliche appena viene letto, senza tenere in memoria
+        l'intero valore; la replica più lenta limita la velocità dell'upload. I blob non consegnati non generano
+        hint: le repliche vengono riallineate dall'anti-entropy.
+        :param key: chiave da scrivere
+        :param chunks: iterabile dei blocchi del blob; un'eccezione sollevata durante la lettura (ad esempio
+                       ValueTooLarge) interrompe tutte le scritture e viene propagata
+        :param nodes: lista dei nodi responsabili
+        :param version: versione del valore
+        :param encoding: codifica del contenuto
+        :param pending: numero di nuovi proprietari in nodes durante un ribilanciamento (vedi required_replicas)
+        :return: True se almeno quorum_write scritture hanno avuto successo, False altrimenti
+        :raises StreamsExhausted: se max_streams upload sono già in corso (il corpo non viene letto)
+        """
+        if not self.stream_slots.acquire(blocking=False):
+            self.metrics.incr('blob.rejected')
+            raise StreamsExhausted(f"{self.max_streams} blob uploads already in progress")
+        required = required_replicas(None, self.quorum_write, len(nodes), self.replication_factor, pending)
+        began = time.perf_counter()
+        feeds = {node: queue.Queue(maxsize=STREAM_QUEUE_SIZE) for node in nodes}
+        futures = {node: self.stream_executor.submit(self.stream_to_node, node, key, self._feed(feed), version, encoding)
+                   for node, feed in feeds.items()}
+        # Lo slot viene liberato quando terminano tutti gli stream, anche quelli ancora in corso dopo il quorum
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def release(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.stream_slots.release()
+
+        if not futures:
+            self.stream_slots.release()
+        for future in futures.values():
+            future.add_done_callback(release)
+        try:
+            for chunk in chunks:
+                for node, feed in list(feeds.items()):
+                    # Una replica che ha già risposto (con un errore) o che non legge più viene abbandonata
+                    if futures[node].done() or not self._offer(feed, chunk):
+                        self._abort(feed)
+                        del feeds[node]
+        except BaseException:
+            for feed in feeds.values():
+                self._abort(feed)
+            raise
+        for feed in feeds.values():
+            self._offer(feed, None)
+        success_count = 0
+        for future in as_completed(futures.values()):
+            if future.result():
+                success_count += 1
+            if success_count >= required:
+                break
+        self.metrics.observe('quorum.write_blob', time.perf_counter() - began)
+        return success_count >= required
+
+    def newest_replica(self, key, nodes):
+        """
+        Individua la replica con la versione più recente di una chiave leggendo solo le versioni; il contenuto dei
+        blob viene poi letto in streaming da quella replica.
+        :param key: chiave da leggere
+        :param nodes: lista dei nodi responsabili
+        :return: tupla (nodo, versione), (None, MISSING) se la chiave non esiste, None se il quorum non è stato raggiunto
+        """
+        began = time.perf_counter()
+        future_to_node = {self.executor.submit(self.read_from_node, node, key, True): node
+                          for node in self.selector.rank(nodes)}
+        versions = {}  # in ordine di risposta: a parità di versione vince la replica più veloce
+        for future in as_completed(future_to_node):
+            record = future.result()
+            if record is not None:
+                versions[future_to_node[future]] = record[1]
+                if len(versions) >= self.quorum_read:
                     break
-            if len(responses) >= self.quorum_read:
-                return responses[0]
+        self.metrics.observe('quorum.read_blob', time.perf_counter() - began)
+        if len(versions) < self.quorum_read:
+            return None
+        node = max(versions, key=versions.get)
+        return (node, versions[node]) if versions[node] != MISSING else (None, MISSING)
+
+    def stream_from_node(self, node, key):
+        """
+        Apre la lettura in streaming di un blob da un nodo.
+        :param node: coppia indirizzo-porta del nodo
+        :param key: chiave da leggere
+        :return: risposta HTTP aperta (da chiudere dopo l'uso), None se il nodo non è raggiungibile
+        """
+        try:
+            return self.transport.get(node, f"/blob/{quote(key, safe='')}", stream=True)
+        except requests.exceptions.RequestException as e:
+            self.metrics.incr('rpc.get_blob.errors')
+            logging.error(f"Failed to read blob {key} from node {node}: {e}")
             return None
 
     def has_value(self, node, key):
@@ -104,8 +775,22 @@ class Replication:
         :param node: nodo su cui verificare la chiave
         :return: True se il nodo ha il valore, False altrimenti
         """
-        return self.read_from_node(node, key) is not None
+        result = self.read_from_node(node, key, digest=True)
+        return result is not None and result[1] != MISSING
     
+    def reset_quorum(self, quorum_write, quorum_read, replication_factor=None):
+        """
+        Ripristina i parametri di quorum configurati quando tutti i nodi sono di nuovo online.
+        :param quorum_write: quorum di scrittura
+        :param quorum_read: quorum di lettura
+        :param replication_factor: nuovo fattore di replicazione (None per lasciarlo invariato)
+        """
+        self.quorum_write = quorum_write
+        self.quorum_read = quorum_read
+        if replication_factor is not None:
+            self.replication_factor = replication_factor
+        logging.info(f"Restored quorum write {self.quorum_write} and quorum read {self.quorum_read}")
+
     def update_quorum(self, quorum_write, quorum_read):
         """
         Aggiorna i parametri di quorum per la scrittura e la lettura se un nodo va offline.
@@ -0,0 +1,122 @@
+import argparse
+import statistics
+
+from consistent_hashing import ConsistentHashing, MAX_TOKEN
+from rebalancing import Rebalancer
+
+TOKEN_SPACE = MAX_TOKEN + 1  # numero di token dello spazio MD5
+
+
+def parse_weights(text):
+    """
+    Converte la stringa dei pesi nel formato "nodo=peso,nodo=peso" in un dizionario.
+    :param text: stringa dei pesi (può essere vuota)
+    :return: dizionario nodo -> peso
+    """
+    weights = {}
+    for item in filter(None, text.split(',')):
+        node, weight = item.rsplit('=', 1)
+        weights[node] = float(weight)
+    return weights
+
+
+def build_ring(nodes, num_virtual_nodes, weights, replication_factor):
+    """
+    Costruisce un ring con i nodi e i pesi indicati.
+    :param nodes: lista dei nodi
+    :param num_virtual_nodes: numero di repliche virtuali di un nodo con peso 1
+    :param weights: dizionario nodo -> peso (i nodi assenti hanno peso 1)
+    :param replication_factor: numero di repliche di ogni chiave
+    :return: istanza di ConsistentHashing
+    """
+    ring = ConsistentHashing(num_virtual_nodes=num_virtual_nodes, preference_size=replication_factor)
+    for node in nodes:
+        ring.add_node(node, weights.get(node, 1.0))
+    return ring
+
+
+def ownership(ring):
+    """
+    Calcola la frazione dello spazio dei token di cui ogni nodo è replica primaria e quella che memorizza
+    come replica qualsiasi.
+    :param ring: istanza di ConsistentHashing
+    :return: tupla (dizionario nodo -> frazione primaria, dizionario nodo -> frazione memorizzata)
+    """
+    primary = {node: 0 for node in ring.nodes_status}
+    stored = {node: 0 for node in ring.nodes_status}
+    for start, end, nodes in ring.get_ranges():
+        primary[nodes[0]] += end - start + 1
+        for node in nodes:
+            stored[node] += end - start + 1
+    return ({node: span / TOKEN_SPACE for node, span in primary.items()},
+            {node: span / TOKEN_SPACE for node, span in stored.items()})
+
+
+def moved_fraction(current, target):
+    """
+    Calcola la frazione delle chiavi il cui insieme di repliche cambia passando dal ring current al ring target.
+    :param current: ring in uso
+    :param target: ring dopo il cambio di membership
+    :return: frazione delle chiavi da spostare (tra 0 e 1)
+    """
+    ranges = sorted(r for pair_ranges in Rebalancer.moving_ranges(current, target).values() for r in pair_ranges)
+    # Unione dei range: lo stesso range può passare a più nuovi proprietari
+    moved, last_end = 0, -1
+    for start, end in ranges:
+        start = max(start, last_end + 1)
+        if start <= end:
+            moved += end - start + 1
+            last_end = end
+    return moved / TOKEN_SPACE
+
+
+def report(nodes, num_virtual_nodes, weights, replication_factor, num_keys):
+    """
+    Stampa l'analisi di bilanciamento del ring per un numero di repliche virtuali.
+    :param nodes: lista dei nodi
+    :param num_virtual_nodes: numero di repliche virtuali di un nodo con peso 1
+    :param weights: dizionario nodo -> peso
+    :param replication_factor: numero di repliche di ogni chiave
+    :param num_keys: numero di chiavi usato per stimare le chiavi spostate
+    """
+    ring = build_ring(nodes, num_virtual_nodes, weights, replication_factor)
+    primary, stored = ownership(ring)
+    total_weight = sum(weights.get(node, 1.0) for node in nodes)
+    # Carico relativo: quota posseduta rispetto a quella attesa in base al peso (1 = perfettamente bilanciato)
+    load = {node: primary[node] * total_weight / weights.get(node, 1.0) for node in nodes}
+
+    print(f"\nvirtual nodes per unit of weight: {num_virtual_nodes} ({len(ring.sorted_nodes)} tokens)")
+    print(f"{'node':>24} {'weight':>7} {'primary %':>10} {'stored %':>9} {'load':>6}")
+    for node in nodes:
+        print(f"{node:>24} {weights.get(node, 1.0):>7.2f} {primary[node] * 100:>10.2f} {stored[node] * 100:>9.2f} {load[node]:>6.2f}")
+    print(f"load std dev: {statistics.pstdev(load.values()):.3f}, "
+          f"max load: {max(load.values()):.2f}x, min load: {min(load.values()):.2f}x")
+
+    joined = ring.copy()
+    joined.add_node("new-node")
+    fraction = moved_fraction(ring, joined)
+    print(f"add one node:    {fraction * 100:6.2f}% of keys move (~{round(fraction * num_keys)} of {num_keys})")
+    left = ring.copy()
+    left.decommission_node(nodes[0])
+    fraction = moved_fraction(ring, left)
+    print(f"remove {nodes[0]}: {fraction * 100:6.2f}% of keys move (~{round(fraction * num_keys)} of {num_keys})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ownership balance of the consistent hashing ring for candidate virtual node counts")
+    parser.add_argument('--nodes', type=str, default='5', help='Number of nodes, or comma separated node addresses (IP:port)')
+    parser.add_argument('--weights', type=str, default='', help='Node weights as node=weight pairs separated by commas')
+    parser.add_argument('--virtual_nodes', type=str, default='3,16,64,256', help='Comma separated virtual node counts to compare')
+    parser.add_argument('--replication_factor', type=int, default=3, help='Replication factor')
+    parser.add_argument('--keys', type=int, default=1000000, help='Number of keys used to estimate how many keys move')
+
+    args = parser.parse_args()
+
+    if args.nodes.isdigit():
+        nodes = [f"10.0.0.{i + 1}:8000" for i in range(int(args.nodes))]
+    else:
+        nodes = args.nodes.split(',')
+    weights = parse_weights(args.weights)
+
+    for num_virtual_nodes in map(int, args.virtual_nodes.split(',')):
+        report(nodes, num_virtual_nodes, weights, args.replication_factor, args.keys)
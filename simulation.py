@@ -0,0 +1,904 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import queue
+import random
+import selectors
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+from async_coordinator import AsyncCoordinator
+from benchmark import UniformGenerator, Workload, ZipfianGenerator, print_report
+from coordinator import Coordinator
+from eviction import MemoryFull
+from failure_detector import PhiAccrualFailureDetector
+from fault_tolerance import FaultTolerance
+from metrics import LatencyHistogram
+from node import Node
+from replication import ConsistencyUnavailable, parse_consistency
+
+COORDINATOR = 'coordinator:5000'  # indirizzo virtuale del coordinatore
+FAULT_TOLERANCE = 'fault-tolerance:5001'  # indirizzo virtuale del nodo di tolleranza ai guasti
+
+
+def node_address(index):
+    """
+    Restituisce l'indirizzo virtuale di un nodo simulato.
+    :param index: indice del nodo
+    :return: indirizzo IP:porta
+    """
+    return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}:6000"
+
+
+def parse_distribution(spec, rnd):
+    """
+    Interpreta la descrizione di una distribuzione di latenze, con i tempi in millisecondi:
+    const:MS, uniform:MIN:MAX, exp:MEDIA, lognormal:MEDIANA:SIGMA.
+    :param spec: descrizione della distribuzione
+    :param rnd: generatore casuale da cui estrarre i campioni
+    :return: funzione senza argomenti che restituisce un campione in secondi
+    :raises ValueError: se la descrizione non è valida
+    """
+    name, _, rest = spec.partition(':')
+    try:
+        params = [float(param) for param in rest.split(':')] if rest else []
+    except ValueError:
+        raise ValueError(f"Invalid latency distribution {spec!r}") from None
+    if name == 'const' and len(params) == 1:
+        seconds = params[0] / 1000
+        return lambda: seconds
+    if name == 'uniform' and len(params) == 2:
+        low, high = params[0] / 1000, params[1] / 1000
+        return lambda: rnd.uniform(low, high)
+    if name == 'exp' and len(params) == 1 and params[0] > 0:
+        rate = 1000 / params[0]
+        return lambda: rnd.expovariate(rate)
+    if name == 'lognormal' and len(params) == 2 and params[0] > 0:
+        mu, sigma = math.log(params[0] / 1000), params[1]
+        return lambda: rnd.lognormvariate(mu, sigma)
+    raise ValueError(f"Invalid latency distribution {spec!r}, expected const:MS, uniform:MIN:MAX, exp:MEAN "
+                     f"or lognormal:MEDIAN:SIGMA")
+
+
+def parse_schedule(spec):
+    """
+    Interpreta la descrizione di un guasto pianificato AT:FOR:AMOUNT.
+    :param spec: descrizione del guasto
+    :return: tupla (istante d'inizio, durata, quantità); durata 0 per un guasto permanente
+    :raises ValueError: se la descrizione non è valida
+    """
+    try:
+        at, duration, amount = (float(part) for part in spec.split(':'))
+    except ValueError:
+        raise ValueError(f"Invalid fault schedule {spec!r}, expected AT:FOR:AMOUNT") from None
+    return at, duration, amount
+
+
+class VirtualTimeSelector(selectors.DefaultSelector):
+    """
+    Selector dell'event loop simulato: non attende mai l'I/O, ma fa avanzare l'orologio virtuale fino al primo
+    timer in scadenza. Il tempo virtuale passa quindi solo da un evento al successivo e una simulazione dura
+    quanto il calcolo che esegue.
+    """
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0  # tempo virtuale in secondi
+
+    def select(self, timeout=None):
+        # Nessun altro thread pianifica callback sull'event loop, quindi il self-pipe non va controllato
+        if timeout is None:
+            raise RuntimeError("Simulation deadlock: no scheduled events")
+        self.now += timeout
+        return []
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop asyncio con orologio virtuale: asyncio.sleep, i timeout e i timer avanzano il tempo simulato
+    invece di attendere. Con un solo thread e latenze estratte da generatori con seme, l'ordine degli eventi
+    e quindi l'intera esecuzione sono riproducibili.
+    """
+    def __init__(self):
+        self.virtual = VirtualTimeSelector()
+        super().__init__(self.virtual)
+
+    def time(self):
+        return self.virtual.now
+
+
+class VirtualNetwork:
+    """
+    Rete simulata tra coordinatore, nodo di tolleranza ai guasti e nodi: ogni messaggio ha una latenza estratta
+    da una distribuzione e può andare perso; i nodi possono essere spenti o isolati in una partizione.
+    """
+    def __init__(self, latency, loss=0.0, rnd=None):
+        """
+        Inizializza la rete.
+        :param latency: funzione che restituisce la latenza (in secondi) di un messaggio
+        :param loss: probabilità che un messaggio vada perso
+        :param rnd: generatore casuale delle perdite
+        """
+        self.latency = latency
+        self.loss = loss
+        self.rnd = rnd or random.Random()
+        self.node_latency = {}  # indirizzo -> distribuzione che sostituisce quella di default per i suoi messaggi
+        self.crashed = set()  # indirizzi spenti
+        self.groups = {}  # indirizzo -> lato della partizione corrente (gli assenti sono nel lato 0)
+        self.messages = 0
+        self.dropped = 0  # messaggi persi per la probabilità di perdita
+
+    def connected(self, source, target):
+        """
+        Verifica se due indirizzi possono comunicare.
+        :param source: mittente
+        :param target: destinatario
+        :return: True se entrambi sono accesi e dallo stesso lato della partizione
+        """
+        return (source not in self.crashed and target not in self.crashed
+                and self.groups.get(source, 0) == self.groups.get(target, 0))
+
+    def delay(self, source, target):
+        """
+        Estrae la latenza di un messaggio.
+        :param source: mittente
+        :param target: destinatario
+        :return: latenza in secondi, None se il messaggio va perso
+        """
+        self.messages += 1
+        if self.loss and self.rnd.random() < self.loss:
+            self.dropped += 1
+            return None
+        sample = self.node_latency.get(target) or self.node_latency.get(source) or self.latency
+        return sample()
+
+
+def dispatch(node, path, params=None, body=None):
+    """
+    Esegue una richiesta sul nodo chiamando gli stessi metodi degli endpoint HTTP di Node.start.
+    :param node: istanza di Node
+    :param path: percorso dell'endpoint
+    :param params: parametri della query
+    :param body: corpo JSON della richiesta
+    :return: tupla (status HTTP, corpo JSON della risposta)
+    """
+    try:
+        if path == '/put':
+            applied = node.store(body['key'], body['value'], body.get('version', 0))
+            return 200, {"status": "ok", "applied": applied}
+        if path == '/get':
+            key = params['key']
+            record = node.retrieve_versioned(key)
+            if record is None:
+                return 404, {"error": "Key not found"}
+            if params.get('digest'):
+                return 200, {"key": key, "version": record[1]}
+            return 200, {"key": key, "value": record[0], "version": record[1]}
+        if path == '/mput':
+            node.store_many(body['items'], body.get('versions'))
+            return 200, {"status": "ok", "count": len(body['items'])}
+        if path == '/mget':
+            full = node.retrieve_many(body['keys'])
+            digests = node.retrieve_many(body.get('digest_keys', []))
+            return 200, {"values": {key: record[0] for key, record in full.items()},
+                         "versions": {key: record[1] for records in (full, digests) for key, record in records.items()}}
+        if path == '/scan':
+            records, next_token = node.scan_range(body['ranges'], body.get('after', -1), body.get('limit', 500))
+            return 200, {"values": {key: record[0] for key, record in records.items()},
+                         "versions": {key: record[1] for key, record in records.items()}, "next": next_token}
+        if path == '/drop':
+            return 200, {"status": "ok", "dropped": node.drop_ranges(body['ranges'])}
+        if path == '/merkle/hashes':
+            return 200, {"depth": node.merkle.depth, "hashes": node.merkle_hashes(body['indices'])}
+        if path == '/merkle/digests':
+            return 200, {"digests": node.merkle_digests(body['leaves'], body['ranges'])}
+    except MemoryFull as e:
+        return 507, {"error": str(e)}
+    return 404, {"error": f"Endpoint {path} is not simulated"}
+
+
+class SimResponse:
+    """
+    Risposta di SimSession, con l'interfaccia della risposta aiohttp usata da AsyncReplication.
+    """
+    def __init__(self, url, status, body):
+        self.url = url
+        self.status = status
+        self.body = body
+
+    async def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientError(f"{self.status} {self.body.get('error')} for {self.url}")
+
+
+class SimRequest:
+    """
+    Richiesta in corso di SimSession, usata come context manager asincrono come quelle di aiohttp.
+    """
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+
+    async def __aenter__(self):
+        return await self.coroutine
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class SimSession:
+    """
+    Sessione HTTP virtuale con l'interfaccia della ClientSession di aiohttp usata da AsyncReplication: la
+    richiesta e la risposta attraversano la VirtualNetwork e la richiesta viene eseguita sul nodo in memoria.
+    Una richiesta persa o verso un nodo irraggiungibile fallisce con asyncio.TimeoutError allo scadere del timeout,
+    come una richiesta reale verso un host che non risponde.
+    """
+    def __init__(self, network, nodes, source, timeout):
+        """
+        :param network: istanza di VirtualNetwork
+        :param nodes: dizionario indirizzo -> Node
+        :param source: indirizzo del mittente
+        :param timeout: timeout (in secondi) di ogni richiesta
+        """
+        self.network = network
+        self.nodes = nodes
+        self.source = source
+        self.timeout = timeout
+
+    def get(self, url, params=None, **kwargs):
+        return SimRequest(self.request(url, params=params))
+
+    def put(self, url, json=None, **kwargs):
+        return SimRequest(self.request(url, body=json))
+
+    def post(self, url, json=None, **kwargs):
+        return SimRequest(self.request(url, body=json))
+
+    async def close(self):
+        pass
+
+    async def _hop(self, source, target, deadline):
+        """
+        Trasmette un messaggio e ne attende l'arrivo.
+        :param source: mittente
+        :param target: destinatario
+        :param deadline: istante virtuale di scadenza della richiesta
+        :return: True se il messaggio è arrivato prima della scadenza
+        """
+        loop = asyncio.get_running_loop()
+        delay = self.network.delay(source, target)
+        if delay is not None and loop.time() + delay <= deadline:
+            await asyncio.sleep(delay)
+            if self.network.connected(source, target):
+                return True
+        await asyncio.sleep(max(deadline - loop.time(), 0))
+        return False
+
+    async def request(self, url, params=None, body=None):
+        """
+        Esegue una richiesta verso un nodo simulato.
+        :param url: URL della richiesta (http://nodo/percorso)
+        :param params: parametri della query
+        :param body: corpo JSON
+        :return: istanza di SimResponse
+        :raises asyncio.TimeoutError: se la richiesta o la risposta non arrivano entro il timeout
+        """
+        parts = urlsplit(url)
+        node = parts.netloc
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        if not await self._hop(self.source, node, deadline):
+            raise asyncio.TimeoutError(f"Request to {url} timed out")
+        # La richiesta è stata eseguita dal nodo anche se la risposta va persa, come in una rete reale
+        status, data = dispatch(self.nodes[node], parts.path, params, body)
+        if not await self._hop(node, self.source, deadline):
+            raise asyncio.TimeoutError(f"Response from {url} timed out")
+        return SimResponse(url, status, data)
+
+
+class SimHTTPResponse:
+    """
+    Risposta di SimTransport, con l'interfaccia della risposta requests usata da anti-entropy e hinted handoff.
+    """
+    def __init__(self, url, status, body):
+        self.url = url
+        self.status_code = status
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} {self.body.get('error')} for {self.url}", response=self)
+
+
+class SimTransport:
+    """
+    Trasporto virtuale con l'interfaccia di NodeTransport, usato dai servizi sincroni del coordinatore
+    (anti-entropy, rinvio degli hint, ribilanciamento). Le richieste vengono eseguite subito, senza far avanzare il
+    tempo virtuale: un ciclo di anti-entropy o un rinvio di hint è un'azione istantanea di cui si contano le
+    richieste. Un nodo irraggiungibile o un messaggio perso sollevano requests.exceptions.ConnectionError.
+    """
+    def __init__(self, network, nodes, source):
+        """
+        :param network: istanza di VirtualNetwork
+        :param nodes: dizionario indirizzo -> Node
+        :param source: indirizzo del mittente
+        """
+        self.network = network
+        self.nodes = nodes
+        self.source = source
+        self.requests = 0
+        self.failures = 0
+
+    def _request(self, node, path, params=None, json=None, **kwargs):
+        self.requests += 1
+        url = f"http://{node}{path}"
+        if (self.network.delay(self.source, node) is None or self.network.delay(node, self.source) is None
+                or not self.network.connected(self.source, node)):
+            self.failures += 1
+            raise requests.exceptions.ConnectionError(f"Node {node} unreachable for {url}")
+        status, data = dispatch(self.nodes[node], path, params, json)
+        return SimHTTPResponse(url, status, data)
+
+    def put(self, node, path, **kwargs):
+        return self._request(node, path, **kwargs)
+
+    def get(self, node, path, **kwargs):
+        return self._request(node, path, **kwargs)
+
+    def post(self, node, path, **kwargs):
+        return self._request(node, path, **kwargs)
+
+    def close(self):
+        pass
+
+
+class SimReadRepair:
+    """
+    Sostituisce la coda di ReadRepair, i cui thread renderebbero la simulazione non deterministica: ogni replica
+    non aggiornata viene riscritta da un task sull'event loop virtuale, con le stesse latenze delle altre richieste.
+    """
+    def __init__(self, replication):
+        """
+        :param replication: istanza di AsyncReplication con cui riscrivere le repliche
+        """
+        self.replication = replication
+        self.queue = queue.Queue()  # sempre vuota, per le statistiche del coordinatore
+        self.submitted = 0  # repliche da riparare
+        self.repaired = 0  # repliche riscritte
+        self.dropped = 0
+
+    def submit(self, key, value, version, nodes):
+        for node in nodes:
+            self.submitted += 1
+            task = asyncio.ensure_future(self.repair(node, key, value, version))
+            self.replication.background.add(task)
+            task.add_done_callback(self.replication.background.discard)
+
+    async def repair(self, node, key, value, version):
+        if await self.replication.write_to_node(node, key, value, version):
+            self.repaired += 1
+
+
+class SimFaultTolerance(FaultTolerance):
+    """
+    Nodo di tolleranza ai guasti della simulazione: le notifiche al coordinatore attraversano la rete virtuale
+    invece di essere inviate con HTTP.
+    """
+    def __init__(self, simulation, *args, **kwargs):
+        """
+        :param simulation: istanza di Simulation che consegna le notifiche
+        """
+        super().__init__(*args, **kwargs)
+        self.simulation = simulation
+
+    def notify_coordinator(self, node):
+        self.simulation.notify(node, online=False)
+
+    def notify_coordinator_online(self, node):
+        self.simulation.notify(node, online=True)
+
+
+class Simulation:
+    """
+    Cluster simulato in un solo processo: N istanze di Node, il Coordinator con la sua replicazione asincrona,
+    il ring di consistent hashing e il nodo di tolleranza ai guasti, collegati da una rete virtuale e guidati da un
+    event loop con tempo virtuale. Il codice di quorum, hedged read, read repair, hinted handoff, anti-entropy e
+    failure detection è quello reale; cambiano solo trasporto e orologio. Con lo stesso seme due esecuzioni
+    producono gli stessi risultati.
+    """
+    def __init__(self, num_nodes=100, seed=42, latency='lognormal:0.5:0.5', loss=0.0, slow_nodes=0,
+                 slow_latency='lognormal:20:1', replication_factor=3, quorum_write=2, quorum_read=2,
+                 num_virtual_nodes=3, merkle_depth=8, rpc_timeout=1.0, hedge_percentile=95, write_batch_size=0,
+                 heartbeat_interval=1.0, phi_threshold=8.0, acceptable_pause=1.0, anti_entropy_interval=0):
+        """
+        Crea il cluster.
+        :param num_nodes: numero di nodi
+        :param seed: seme di tutti i generatori casuali
+        :param latency: distribuzione delle latenze dei messaggi (vedi parse_distribution)
+        :param loss: probabilità che un messaggio vada perso
+        :param slow_nodes: numero di nodi lenti, i cui messaggi seguono slow_latency
+        :param slow_latency: distribuzione delle latenze dei nodi lenti
+        :param replication_factor: numero di repliche per ogni chiave
+        :param quorum_write: quorum di scrittura
+        :param quorum_read: quorum di lettura
+        :param num_virtual_nodes: repliche virtuali di ogni nodo nel ring
+        :param merkle_depth: profondità dei Merkle tree dei nodi (alberi piccoli contengono la memoria con molti nodi)
+        :param rpc_timeout: timeout (in secondi) di ogni richiesta verso un nodo
+        :param hedge_percentile: percentile delle hedged read, 0 per disattivarle
+        :param write_batch_size: scritture raggruppate per nodo, 0 per inviarle una alla volta
+        :param heartbeat_interval: intervallo (in secondi) tra due heartbeat di un nodo
+        :param phi_threshold: soglia del failure detector phi-accrual
+        :param acceptable_pause: ritardo (in secondi) degli heartbeat tollerato dal failure detector
+        :param anti_entropy_interval: intervallo (in secondi) tra due cicli di anti-entropy, 0 per disattivarla
+        """
+        # Generatori separati, così cambiare ad esempio i guasti non sposta le latenze o il carico
+        self.rnd_network = random.Random(f"{seed}-network")
+        self.rnd_faults = random.Random(f"{seed}-faults")
+        self.rnd_workload = random.Random(f"{seed}-workload")
+        self.loop = VirtualEventLoop()
+        asyncio.set_event_loop(self.loop)
+        clock = self.loop.time
+
+        self.addresses = [node_address(i) for i in range(num_nodes)]
+        self.nodes = {address: Node(address, FAULT_TOLERANCE, merkle_depth=merkle_depth, num_partitions=1)
+                      for address in self.addresses}
+        self.network = VirtualNetwork(parse_distribution(latency, self.rnd_network), loss, self.rnd_network)
+        for address in self.rnd_faults.sample(self.addresses, slow_nodes):
+            self.network.node_latency[address] = parse_distribution(slow_latency, self.rnd_network)
+        self.transport = SimTransport(self.network, self.nodes, COORDINATOR)
+        self.coordinator = Coordinator(self.addresses, replication_factor, quorum_write, quorum_read, COORDINATOR,
+                                       rpc_timeout=rpc_timeout, anti_entropy_interval=anti_entropy_interval,
+                                       num_virtual_nodes=num_virtual_nodes, hedge_percentile=hedge_percentile,
+                                       write_batch_size=write_batch_size, transport=self.transport, clock=clock)
+        self.frontend = AsyncCoordinator(self.coordinator, rpc_timeout=rpc_timeout, clock=clock)
+        self.replication = self.frontend.replication
+        self.replication.session = SimSession(self.network, self.nodes, COORDINATOR, rpc_timeout)
+        self.read_repair = SimReadRepair(self.replication)
+        self.coordinator.replication.read_repair = self.read_repair
+        detector = PhiAccrualFailureDetector(threshold=phi_threshold, expected_interval=heartbeat_interval,
+                                             acceptable_pause=acceptable_pause)
+        self.fault_tolerance = SimFaultTolerance(self, FAULT_TOLERANCE, self.addresses, COORDINATOR, detector=detector,
+                                                 initial_grace=5 * heartbeat_interval, clock=clock)
+        self.heartbeat_interval = heartbeat_interval
+        self.anti_entropy_interval = anti_entropy_interval
+        self.anti_entropy_rounds = 0
+
+        self.events = []  # guasti e rilevamenti, per il report
+        self.failed_since = {}  # nodo -> istante da cui non raggiunge il nodo di tolleranza ai guasti
+        self.detection_times = LatencyHistogram()  # microsecondi tra il guasto e il sospetto
+        self.false_suspicions = 0  # nodi sospettati mentre erano raggiungibili
+        self.faults = 0  # guasti di singoli nodi (spegnimenti e isolamenti)
+
+    def event(self, description):
+        """
+        Registra un evento nel report.
+        :param description: descrizione dell'evento
+        """
+        self.events.append({"second": round(self.loop.time(), 3), "event": description})
+        logging.info(f"[{self.loop.time():.3f}s] {description}")
+
+    # Guasti
+
+    def mark_failed(self, nodes):
+        """
+        Registra l'istante da cui i nodi non sono più raggiungibili dal nodo di tolleranza ai guasti.
+        :param nodes: nodi guasti
+        """
+        for node in nodes:
+            if node not in self.failed_since and not self.network.connected(node, FAULT_TOLERANCE):
+                self.failed_since[node] = self.loop.time()
+                self.faults += 1
+
+    def mark_recovered(self, nodes):
+        """
+        Dimentica il guasto dei nodi di nuovo raggiungibili.
+        :param nodes: nodi ripristinati
+        """
+        for node in nodes:
+            if self.network.connected(node, FAULT_TOLERANCE):
+                self.failed_since.pop(node, None)
+
+    def crash(self, count, duration):
+        """
+        Spegne nodi scelti a caso tra quelli accesi; i nodi spenti conservano i dati, come dopo il riavvio di un
+        processo con storage persistente.
+        :param count: numero di nodi da spegnere
+        :param duration: secondi dopo i quali riaccenderli, 0 per lasciarli spenti
+        """
+        alive = [node for node in self.addresses if node not in self.network.crashed]
+        nodes = self.rnd_faults.sample(alive, min(int(count), len(alive)))
+        self.network.crashed.update(nodes)
+        self.mark_failed(nodes)
+        self.event(f"crashed {len(nodes)} nodes" + (f" for {duration:g}s" if duration else ""))
+        if duration:
+            self.loop.call_later(duration, self.recover, nodes)
+
+    def recover(self, nodes):
+        """
+        Riaccende i nodi spenti.
+        :param nodes: nodi da riaccendere
+        """
+        self.network.crashed.difference_update(nodes)
+        self.mark_recovered(nodes)
+        self.event(f"recovered {len(nodes)} nodes")
+
+    def partition(self, fraction, duration):
+        """
+        Isola una frazione dei nodi, scelti a caso, dal coordinatore, dal nodo di tolleranza ai guasti e dagli altri
+        nodi.
+        :param fraction: frazione dei nodi da isolare
+        :param duration: secondi dopo i quali riparare la partizione, 0 per non ripararla
+        """
+        nodes = self.rnd_faults.sample(self.addresses, round(fraction * len(self.addresses)))
+        for node in nodes:
+            self.network.groups[node] = 1
+        self.mark_failed(nodes)
+        self.event(f"partitioned {len(nodes)} nodes" + (f" for {duration:g}s" if duration else ""))
+        if duration:
+            self.loop.call_later(duration, self.heal, nodes)
+
+    def heal(self, nodes):
+        """
+        Riporta i nodi isolati dallo stesso lato del resto del cluster.
+        :param nodes: nodi isolati
+        """
+        for node in nodes:
+            self.network.groups.pop(node, None)
+        self.mark_recovered(nodes)
+        self.event(f"healed partition of {len(nodes)} nodes")
+
+    # Heartbeat e failure detection
+
+    def heartbeat(self, node):
+        """
+        Invia l'heartbeat di un nodo acceso al nodo di tolleranza ai guasti e pianifica il successivo.
+        :param node: indirizzo del nodo
+        """
+        if node not in self.network.crashed:
+            delay = self.network.delay(node, FAULT_TOLERANCE)
+            if delay is not None:
+                self.loop.call_later(delay, self.deliver_heartbeat, node, self.loop.time())
+        self.loop.call_later(self.heartbeat_interval, self.heartbeat, node)
+
+    def deliver_heartbeat(self, node, timestamp):
+        """
+        Consegna un heartbeat, se il mittente è ancora raggiungibile.
+        :param node: indirizzo del nodo
+        :param timestamp: istante di invio
+        """
+        if self.network.connected(node, FAULT_TOLERANCE):
+            self.fault_tolerance.update_heartbeat_table(node, timestamp)
+            self.send_notifications()
+
+    def check_failures(self):
+        """
+        Esegue un controllo del failure detector e pianifica il successivo alla prima scadenza.
+        """
+        delay = self.fault_tolerance.check_once()
+        self.send_notifications()
+        self.loop.call_later(delay, self.check_failures)
+
+    def send_notifications(self):
+        """
+        Invia le notifiche accodate dal nodo di tolleranza ai guasti.
+        """
+        while True:
+            try:
+                notify, node = self.fault_tolerance.notifications.get_nowait()
+            except queue.Empty:
+                return
+            notify(node)
+
+    def notify(self, node, online):
+        """
+        Invia al coordinatore la notifica di un nodo offline o di nuovo online; una notifica persa non viene
+        ripetuta, come in FaultTolerance.notify_coordinator.
+        :param node: indirizzo del nodo
+        :param online: True se il nodo è tornato online
+        """
+        if not online:
+            since = self.failed_since.get(node)
+            if since is None:
+                self.false_suspicions += 1
+                self.event(f"false suspicion of {node}")
+            else:
+                self.detection_times.record((self.loop.time() - since) * 1e6)
+        delay = self.network.delay(FAULT_TOLERANCE, COORDINATOR)
+        if delay is not None and self.network.connected(FAULT_TOLERANCE, COORDINATOR):
+            self.loop.call_later(delay, self.apply_notification, node, online)
+
+    def apply_notification(self, node, online, delay=1.0):
+        """
+        Applica sul coordinatore la notifica del nodo di tolleranza ai guasti.
+        :param node: indirizzo del nodo
+        :param online: True se il nodo è tornato online
+        :param delay: attesa prima di ritentare un ritorno online fallito, come Coordinator.restore_node_with_retry
+        """
+        if online:
+            if not self.coordinator.restore_node(node) and node in self.coordinator.hash_ring.nodes_status:
+                # Rinvio degli hint fallito: il nodo resta offline e si ritenta nel tempo virtuale
+                self.loop.call_later(delay, self.apply_notification, node, online, min(delay * 2, 30.0))
+        else:
+            self.coordinator.remove_node(node)
+
+    def anti_entropy(self):
+        """
+        Esegue un ciclo di anti-entropy e pianifica il successivo.
+        """
+        self.coordinator.anti_entropy.run_once()
+        self.anti_entropy_rounds += 1
+        self.loop.call_later(self.anti_entropy_interval, self.anti_entropy)
+
+    # Carico di lavoro
+
+    def load(self, record_count, value_size):
+        """
+        Scrive tutte le chiavi direttamente sui nodi responsabili, prima dell'inizio della simulazione.
+        :param record_count: numero di chiavi
+        :param value_size: dimensione dei valori in byte
+        """
+        payload = 'x' * value_size
+        for index in range(record_count):
+            key = Workload.key(index)
+            version = self.coordinator.clock.now()
+            for node in self.coordinator.read_nodes(key):
+                self.nodes[node].store(key, {"seq": 0, "field0": payload}, version)
+
+    async def client(self, keys, read_proportion, value_size, read_level, write_level, interval, stop_at, results):
+        """
+        Esegue le operazioni di un client fino all'istante stop_at, come Workload.worker.
+        :param keys: generatore degli indici delle chiavi
+        :param read_proportion: frazione delle operazioni che sono letture
+        :param value_size: dimensione dei valori in byte
+        :param read_level: livello di consistenza delle letture, None per quorum_read
+        :param write_level: livello di consistenza delle scritture, None per quorum_write
+        :param interval: secondi tra due richieste del client in open loop, 0 per il closed loop
+        :param stop_at: istante virtuale di fine dell'esecuzione
+        :param results: dizionario con istogrammi, errori, letture non aggiornate e operazioni per secondo
+        """
+        rnd = self.rnd_workload
+        payload = 'x' * value_size
+        intended = rnd.random() * interval
+        running = set()  # richieste ancora in corso in open loop
+        while True:
+            if interval:
+                await asyncio.sleep(max(intended - self.loop.time(), 0))
+                began = intended
+                intended += interval
+            else:
+                began = self.loop.time()
+            if began >= stop_at:
+                break
+            key = Workload.key(keys.next(rnd))
+            operation = "read" if rnd.random() < read_proportion else "update"
+            request = self.operation(operation, key, payload, read_level, write_level, began, results)
+            if interval:
+                # In open loop le richieste partono agli istanti previsti senza attendere le risposte
+                task = asyncio.ensure_future(request)
+                running.add(task)
+                task.add_done_callback(running.discard)
+            else:
+                await request
+        if running:
+            await asyncio.gather(*running)
+
+    async def operation(self, operation, key, payload, read_level, write_level, began, results):
+        """
+        Esegue una lettura o un aggiornamento e ne registra latenza ed esito.
+        :param operation: "read" o "update"
+        :param key: chiave
+        :param payload: contenuto dei valori scritti
+        :param read_level: livello di consistenza delle letture
+        :param write_level: livello di consistenza delle scritture
+        :param began: istante previsto della richiesta, da cui si misura la latenza
+        :param results: dizionario dei risultati (vedi client)
+        """
+        if operation == "read":
+            acked = results["acked"].get(key, 0)
+            try:
+                value = await self.frontend.get(key, use_cache=False, level=read_level)
+            except ConsistencyUnavailable:
+                value = None
+            ok = value is not None
+            if ok and value["seq"] < acked:
+                results["stale_reads"] += 1
+        else:
+            results["seq"] += 1
+            seq = results["seq"]
+            ok = await self.frontend.put(key, {"seq": seq, "field0": payload}, level=write_level)
+            if ok:
+                results["acked"][key] = max(results["acked"].get(key, 0), seq)
+        finished = self.loop.time()
+        results["histograms"][operation].record((finished - began) * 1e6)
+        if not ok:
+            results["errors"][operation] += 1
+        second = int(finished)
+        results["timeline"][second] = results["timeline"].get(second, 0) + 1
+
+    async def main(self, duration, clients, target, keys, read_proportion, value_size, read_level, write_level,
+                   crashes, partitions):
+        """
+        Avvia heartbeat, failure detection, anti-entropy, guasti pianificati e client, e attende la fine dei client.
+        :return: dizionario dei risultati dei client
+        """
+        for node in self.addresses:
+            self.loop.call_later(self.rnd_faults.random() * self.heartbeat_interval, self.heartbeat, node)
+        self.loop.call_soon(self.check_failures)
+        if self.anti_entropy_interval > 0:
+            self.loop.call_later(self.anti_entropy_interval, self.anti_entropy)
+        for at, fault_duration, count in crashes:
+            self.loop.call_later(at, self.crash, count, fault_duration)
+        for at, fault_duration, fraction in partitions:
+            self.loop.call_later(at, self.partition, fraction, fault_duration)
+
+        results = {"histograms": {"read": LatencyHistogram(), "update": LatencyHistogram()},
+                   "errors": {"read": 0, "update": 0}, "timeline": {}, "stale_reads": 0, "seq": 0, "acked": {}}
+        interval = clients / target if target > 0 else 0
+        await asyncio.gather(*(self.client(keys, read_proportion, value_size, read_level, write_level, interval,
+                                           duration, results) for _ in range(clients)))
+        await self.replication.close()
+        return results
+
+    def run(self, duration=60, clients=16, target=1000, record_count=10000, read_proportion=0.95,
+            distribution='zipfian', value_size=100, read_level=None, write_level=None, crashes=(), partitions=()):
+        """
+        Esegue la simulazione.
+        :param duration: durata virtuale (in secondi) della fase di esecuzione
+        :param clients: client concorrenti
+        :param target: operazioni al secondo complessive in open loop, 0 per il closed loop
+        :param record_count: numero di chiavi caricate prima dell'esecuzione
+        :param read_proportion: frazione delle operazioni che sono letture
+        :param distribution: distribuzione delle chiavi, 'zipfian' o 'uniform'
+        :param value_size: dimensione dei valori in byte
+        :param read_level: livello di consistenza delle letture (vedi parse_consistency)
+        :param write_level: livello di consistenza delle scritture (vedi parse_consistency)
+        :param crashes: lista di tuple (istante, durata, numero di nodi) dei nodi da spegnere
+        :param partitions: lista di tuple (istante, durata, frazione dei nodi) delle partizioni
+        :return: report con operazioni, guasti, riparazioni e traffico di rete
+        """
+        started = time.perf_counter()
+        self.load(record_count, value_size)
+        keys = ZipfianGenerator(record_count) if distribution == 'zipfian' else UniformGenerator(record_count)
+        try:
+            results = self.loop.run_until_complete(self.main(duration, clients, target, keys, read_proportion,
+                                                             value_size, read_level, write_level, crashes, partitions))
+        finally:
+            # Heartbeat, riparazioni e richieste ancora in corso vengono interrotti
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+        elapsed = self.loop.time()
+        wall = time.perf_counter() - started
+
+        operations, total = {}, LatencyHistogram()
+        for name in ("read", "update"):
+            histogram = results["histograms"][name]
+            total.merge(histogram)
+            errors = results["errors"][name]
+            operations[name] = dict(histogram.summary(), errors=errors, ops_per_sec=round(histogram.count / elapsed, 1),
+                                    success_rate=round(1 - errors / histogram.count, 6) if histogram.count else None)
+        errors = sum(op["errors"] for op in operations.values())
+        operations["total"] = dict(total.summary(), errors=errors, ops_per_sec=round(total.count / elapsed, 1),
+                                   success_rate=round(1 - errors / total.count, 6) if total.count else None)
+        timeline = [0] * (int(duration) + 1)
+        for second, count in results["timeline"].items():
+            timeline[min(second, len(timeline) - 1)] += count
+
+        undetected = sum(1 for node in self.failed_since
+                         if node not in self.fault_tolerance.confirmed_failures)
+        return {
+            "run": {"seconds": round(elapsed, 3), "operations": operations, "timeline": timeline,
+                    "stale_reads": results["stale_reads"]},
+            "events": self.events,
+            "failure_detection": {"faults": self.faults, "detected": self.detection_times.count,
+                                  "undetected": undetected, "false_suspicions": self.false_suspicions,
+                                  **{field.replace('_us', '_s'): round(value / 1e6, 3)
+                                     for field, value in self.detection_times.summary().items() if field != "count"}},
+            "repair": {"read_repairs": self.read_repair.submitted, "read_repaired": self.read_repair.repaired,
+                       "hints_replayed": self.coordinator.handoff.replayed, "hints_pending": self.coordinator.hints.count(),
+                       "anti_entropy_rounds": self.anti_entropy_rounds,
+                       "anti_entropy_keys": self.coordinator.anti_entropy.keys_repaired,
+                       "background_requests": self.transport.requests},
+            "network": {"messages": self.network.messages, "lost": self.network.dropped},
+            "simulation": {"nodes": len(self.nodes), "virtual_seconds": round(elapsed, 3),
+                           "wall_seconds": round(wall, 3), "speedup": round(elapsed / wall, 1) if wall else None},
+        }
+
+
+def print_simulation(report):
+    """
+    Stampa le sezioni del report specifiche della simulazione.
+    :param report: report di Simulation.run
+    """
+    operations = report["run"]["operations"]
+    print(f"quorum success rate: read {operations['read']['success_rate']}, update {operations['update']['success_rate']}, "
+          f"stale reads {report['run']['stale_reads']}")
+    detection = report["failure_detection"]
+    print(f"failure detection: {detection['detected']}/{detection['faults']} faults detected"
+          + (f" in p50 {detection['p50_s']:.2f}s, max {detection['max_s']:.2f}s"
+             if detection['detected'] else "")
+          + f", {detection['false_suspicions']} false suspicions")
+    repair = report["repair"]
+    print(f"repair traffic: {repair['read_repaired']}/{repair['read_repairs']} read repairs, "
+          f"{repair['hints_replayed']} hints replayed ({repair['hints_pending']} pending), "
+          f"{repair['anti_entropy_keys']} keys in {repair['anti_entropy_rounds']} anti-entropy rounds, "
+          f"{repair['background_requests']} background requests")
+    print(f"network: {report['network']['messages']} messages, {report['network']['lost']} lost")
+    simulation = report["simulation"]
+    print(f"simulated {simulation['virtual_seconds']}s of {simulation['nodes']} nodes in {simulation['wall_seconds']}s "
+          f"({simulation['speedup']}x real time)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Deterministic in-process simulation of a cluster in virtual time")
+    parser.add_argument('--nodes', type=int, default=100, help='Number of simulated nodes')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of every random choice; the same seed gives the same results')
+    parser.add_argument('--duration', type=float, default=60, help='Virtual seconds of the run phase')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent simulated clients')
+    parser.add_argument('--target', type=float, default=1000, help='Open loop: total operations per virtual second (0 runs a closed loop)')
+    parser.add_argument('--records', type=int, default=10000, help='Number of keys loaded before the run')
+    parser.add_argument('--read_proportion', type=float, default=0.95, help='Fraction of reads, the rest are updates')
+    parser.add_argument('--distribution', choices=['zipfian', 'uniform'], default='zipfian', help='Key request distribution')
+    parser.add_argument('--value_size', type=int, default=100, help='Value size in bytes')
+    parser.add_argument('--read_consistency', help='Consistency level of the reads: ONE, QUORUM, ALL or a replica count (default: quorum_read)')
+    parser.add_argument('--write_consistency', help='Consistency level of the writes: ONE, QUORUM, ALL or a replica count (default: quorum_write)')
+    parser.add_argument('--latency', default='lognormal:0.5:0.5', help='One-way message latency in ms: const:MS, uniform:MIN:MAX, exp:MEAN or lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability that a message is lost')
+    parser.add_argument('--slow_nodes', type=int, default=0, help='Number of nodes whose messages follow --slow_latency')
+    parser.add_argument('--slow_latency', default='lognormal:20:1', help='Message latency distribution of the slow nodes')
+    parser.add_argument('--crash', action='append', default=[], help='AT:FOR:COUNT crashes COUNT random nodes at virtual second AT for FOR seconds (0 = forever); repeatable')
+    parser.add_argument('--partition', action='append', default=[], help='AT:FOR:FRACTION cuts off a random FRACTION of the nodes at AT for FOR seconds (0 = forever); repeatable')
+    parser.add_argument('--replication_factor', type=int, default=3, help='Replication factor')
+    parser.add_argument('--quorum_write', type=int, default=2, help='Quorum write value')
+    parser.add_argument('--quorum_read', type=int, default=2, help='Quorum read value')
+    parser.add_argument('--num_virtual_nodes', type=int, default=3, help='Virtual nodes of every node in the ring')
+    parser.add_argument('--merkle_depth', type=int, default=8, help='Depth of the Merkle trees of the nodes')
+    parser.add_argument('--rpc_timeout', type=float, default=1.0, help='Timeout in seconds of every request to a node')
+    parser.add_argument('--hedge_percentile', type=float, default=95, help='Read latency percentile after which a read is hedged, 0 disables hedged reads')
+    parser.add_argument('--write_batch_size', type=int, default=0, help='Writes to the same node coalesced into one bulk request (0 sends them one by one)')
+    parser.add_argument('--heartbeat_interval', type=float, default=1.0, help='Seconds between two heartbeats of a node')
+    parser.add_argument('--phi_threshold', type=float, default=8.0, help='Phi-accrual suspicion level above which a node is reported offline')
+    parser.add_argument('--acceptable_pause', type=float, default=1.0, help='Extra heartbeat delay in seconds tolerated before suspicion grows')
+    parser.add_argument('--anti_entropy_interval', type=float, default=0, help='Virtual seconds between two anti-entropy rounds (0 disables it)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Log the errors of the simulated cluster (one line per failed request)')
+
+    args = parser.parse_args()
+
+    # Con guasti e perdite ogni richiesta fallita scrive una riga di log: si tengono solo gli eventi della simulazione
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+
+    try:
+        crashes = [parse_schedule(spec) for spec in args.crash]
+        partitions = [parse_schedule(spec) for spec in args.partition]
+        read_level = parse_consistency(args.read_consistency, args.replication_factor)
+        write_level = parse_consistency(args.write_consistency, args.replication_factor)
+        simulation = Simulation(args.nodes, args.seed, args.latency, args.loss, args.slow_nodes, args.slow_latency,
+                                args.replication_factor, args.quorum_write, args.quorum_read, args.num_virtual_nodes,
+                                args.merkle_depth, args.rpc_timeout, args.hedge_percentile, args.write_batch_size,
+                                args.heartbeat_interval, args.phi_threshold, args.acceptable_pause,
+                                args.anti_entropy_interval)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Simulating {args.nodes} nodes for {args.duration:g} virtual seconds with {args.clients} clients "
+          f"({'open loop at %g ops/s' % args.target if args.target else 'closed loop'}), seed {args.seed}...")
+    report = simulation.run(args.duration, args.clients, args.target, args.records, args.read_proportion,
+                            args.distribution, args.value_size, read_level, write_level, crashes, partitions)
+    report["config"] = vars(args)
+    print_report(report)
+    print_simulation(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
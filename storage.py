@@ -0,0 +1,559 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from blob import Blob, json_default
+
+# Record del file dati: crc32, numero di sequenza, lunghezza chiave, lunghezza valore, chiave, valore
+HEADER = struct.Struct('>IQII')
+# Voce del file hint: numero di sequenza, lunghezza chiave, offset del valore, lunghezza valore, chiave
+HINT = struct.Struct('>QIQI')
+# File hint con metadati: dopo HINT_MAGIC ogni voce ha anche la lunghezza dei metadati, seguiti da chiave e metadati
+HINT_MAGIC = b'\xffHINT2\n'  # nessun file hint del formato precedente inizia con 0xff (numero di sequenza < 2^56)
+HINT_META = struct.Struct('>QIQIH')
+TOMBSTONE = 0xFFFFFFFF  # lunghezza valore che marca la cancellazione di una chiave
+BLOB_MARKER = b'\0'  # primo byte dei record [Blob, versione], che nessun JSON può avere
+
+
+def encode_value(value):
+    """
+    Codifica un valore per il file dati: i record [Blob, versione] vengono scritti come marker, lunghezza e JSON di
+    [codifica, versione] seguiti dal contenuto grezzo del blob, tutti gli altri valori in JSON.
+    :param value: valore da codificare
+    :return: byte codificati
+    """
+    if isinstance(value, list) and len(value) == 2 and isinstance(value[0], Blob):
+        header = json.dumps([value[0].encoding, value[1]]).encode('utf-8')
+        return b''.join((BLOB_MARKER, struct.pack('>I', len(header)), header, value[0].data))
+    return json.dumps(value, default=json_default).encode('utf-8')
+
+
+def decode_value(raw):
+    """
+    Decodifica un valore scritto con encode_value; il contenuto di un blob resta una vista sui byte letti.
+    :param raw: byte letti dal file dati
+    :return: valore decodificato
+    """
+    if raw[:1] == BLOB_MARKER:
+        size, = struct.unpack_from('>I', raw, 1)
+        encoding, version = json.loads(bytes(raw[5:5 + size]))
+        return [Blob(memoryview(raw)[5 + size:], encoding), version]
+    return json.loads(raw)
+
+
+class DictStorage:
+    """
+    Backend di storage in memoria basato su un dizionario (default del nodo).
+    """
+    def __init__(self):
+        """
+        Inizializza il dizionario che contiene i dati.
+        """
+        self.data = {}
+
+    def put(self, key, value, meta=None):
+        """
+        Memorizza un valore associato ad una chiave.
+        :param key: chiave del valore da memorizzare
+        :param value: valore da memorizzare
+        :param meta: ignorato, i valori sono già in memoria
+        """
+        self.data[key] = value
+
+    def get(self, key):
+        """
+        Recupera il valore associato ad una chiave.
+        :param key: chiave del valore da recuperare
+        :return: valore associato alla chiave, None se assente
+        """
+        return self.data.get(key)
+
+    def put_many(self, items):
+        """
+        Memorizza più coppie chiave-valore.
+        :param items: dizionario chiave-valore da memorizzare
+        """
+        self.data.update(items)
+
+    def get_many(self, keys):
+        """
+        Recupera i valori associati a più chiavi.
+        :param keys: lista delle chiavi da recuperare
+        :return: dizionario con le sole chiavi presenti
+        """
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def items(self):
+        """
+        Restituisce le coppie chiave-valore memorizzate.
+        :return: generatore di tuple (chiave, valore)
+        """
+        yield from list(self.data.items())
+
+    def items_meta(self):
+        """
+        Restituisce le chiavi memorizzate senza metadati: leggere i valori in memoria non costa nulla.
+        :return: generatore di tuple (chiave, None)
+        """
+        for key in list(self.data):
+            yield key, None
+
+    def delete(self, key):
+        """
+        Cancella una chiave, se presente.
+        :param key: chiave da cancellare
+        """
+        self.data.pop(key, None)
+
+    def close(self):
+        """
+        Non c'è nulla da rilasciare per il backend in memoria.
+        """
+
+
+class Segment:
+    """
+    File dati del log. Il segmento attivo riceve le scritture in append; i segmenti chiusi sono immutabili
+    e vengono letti tramite memory map.
+    """
+    def __init__(self, data_dir, segment_id):
+        """
+        Inizializza il segmento.
+        :param data_dir: directory dei file dati
+        :param segment_id: identificatore numerico del segmento
+        """
+        self.segment_id = segment_id
+        self.path = os.path.join(data_dir, f"{segment_id:08d}.data")
+        self.hint_path = os.path.join(data_dir, f"{segment_id:08d}.hint")
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.dead = 0  # byte occupati da record sovrascritti o cancellati
+        self.hints = []  # voci hint dei record scritti mentre il segmento è attivo
+        self.writer = None
+        self.reader = None
+        self.map = None
+
+    def open_active(self):
+        """
+        Apre il segmento in scrittura (append).
+        """
+        self.writer = open(self.path, 'ab')
+        self.reader = open(self.path, 'rb')
+
+    def seal(self):
+        """
+        Chiude il segmento alle scritture e lo mappa in memoria per le letture.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.reader.close()
+            self.writer = self.reader = None
+        if self.size > 0:
+            with open(self.path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def append(self, data, fsync):
+        """
+        Aggiunge dati in coda al segmento attivo.
+        :param data: byte da scrivere
+        :param fsync: se True forza la scrittura su disco
+        :return: offset a cui sono stati scritti i dati
+        """
+        offset = self.size
+        self.writer.write(data)
+        self.writer.flush()
+        if fsync:
+            os.fsync(self.writer.fileno())
+        self.size += len(data)
+        return offset
+
+    def read(self, offset, length):
+        """
+        Legge length byte a partire da offset.
+        :param offset: posizione di inizio
+        :param length: numero di byte da leggere
+        :return: byte letti
+        """
+        if self.map is not None:
+            return self.map[offset:offset + length]
+        self.reader.seek(offset)
+        return self.reader.read(length)
+
+    def scan(self):
+        """
+        Scandisce il file dati e restituisce le voci hint dei record validi. Un record finale incompleto o
+        corrotto (scrittura interrotta) viene troncato. I metadati non sono nel file dati, quindi mancano.
+        :return: lista di tuple (chiave, sequenza, offset valore, lunghezza valore, None)
+        """
+        entries = []
+        offset = 0
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        while offset + HEADER.size <= len(data):
+            crc, seq, key_len, value_len = HEADER.unpack_from(data, offset)
+            body_len = key_len + (0 if value_len == TOMBSTONE else value_len)
+            end = offset + HEADER.size + body_len
+            if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+                break
+            key = data[offset + HEADER.size:offset + HEADER.size + key_len].decode('utf-8')
+            entries.append((key, seq, offset + HEADER.size + key_len, value_len, None))
+            offset = end
+        if offset < len(data):
+            logging.warning(f"Truncating {len(data) - offset} corrupted bytes at the end of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        self.size = offset
+        return entries
+
+    def write_hints(self, entries):
+        """
+        Scrive il file hint del segmento, usato all'avvio al posto della scansione del file dati.
+        :param entries: lista di tuple (chiave, sequenza, offset valore, lunghezza valore, metadati o None)
+        """
+        tmp_path = self.hint_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HINT_MAGIC)
+            for key, seq, offset, value_len, meta in entries:
+                key_bytes = key.encode('utf-8')
+                meta = meta or b''
+                f.write(HINT_META.pack(seq, len(key_bytes), offset, value_len, len(meta)))
+                f.write(key_bytes)
+                f.write(meta)
+        os.replace(tmp_path, self.hint_path)
+
+    def read_hints(self):
+        """
+        Legge il file hint del segmento, nel formato con metadati o in quello precedente (senza).
+        :return: lista di tuple (chiave, sequenza, offset valore, lunghezza valore, metadati o None)
+        """
+        entries = []
+        with open(self.hint_path, 'rb') as f:
+            data = f.read()
+        if data.startswith(HINT_MAGIC):
+            offset = len(HINT_MAGIC)
+            while offset < len(data):
+                seq, key_len, value_offset, value_len, meta_len = HINT_META.unpack_from(data, offset)
+                offset += HINT_META.size
+                key = data[offset:offset + key_len].decode('utf-8')
+                offset += key_len
+                entries.append((key, seq, value_offset, value_len, data[offset:offset + meta_len] or None))
+                offset += meta_len
+            return entries
+        offset = 0
+        while offset < len(data):
+            seq, key_len, value_offset, value_len = HINT.unpack_from(data, offset)
+            offset += HINT.size
+            entries.append((data[offset:offset + key_len].decode('utf-8'), seq, value_offset, value_len, None))
+            offset += key_len
+        return entries
+
+    def close(self):
+        """
+        Rilascia file e memory map del segmento.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.reader.close()
+        if self.map is not None:
+            self.map.close()
+
+    def remove(self):
+        """
+        Chiude e cancella i file del segmento.
+        """
+        self.close()
+        for path in (self.path, self.hint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def record_size(key_len, value_len):
+    """
+    Calcola la dimensione su disco di un record.
+    :param key_len: lunghezza della chiave in byte
+    :param value_len: lunghezza del valore in byte (TOMBSTONE per le cancellazioni)
+    :return: dimensione del record in byte
+    """
+    return HEADER.size + key_len + (0 if value_len == TOMBSTONE else value_len)
+
+
+class LogStorage:
+    """
+    Backend di storage persistente in stile Bitcask: i record vengono scritti in append su file dati segmentati,
+    un indice in memoria mappa ogni chiave alla posizione del suo valore, e i segmenti chiusi vengono letti
+    tramite memory map. Un thread in background compatta i segmenti eliminando i record non più validi.
+    Insieme a ogni chiave si possono memorizzare dei metadati opachi (per il nodo: digest, dimensione e scadenza),
+    salvati nei file hint, così all'avvio chi usa lo storage li rilegge senza decodificare i valori.
+    """
+    def __init__(self, data_dir, max_segment_size=64 * 1024 * 1024, compaction_interval=60, compaction_ratio=0.5, fsync=False):
+        """
+        Apre (o crea) lo storage nella directory indicata e ricostruisce l'indice dai file hint.
+        :param data_dir: directory dei file dati
+        :param max_segment_size: dimensione (in byte) oltre la quale il segmento attivo viene chiuso
+        :param compaction_interval: intervallo (in secondi) tra due controlli di compattazione
+        :param compaction_ratio: frazione di byte non validi oltre la quale i segmenti chiusi vengono compattati
+        :param fsync: se True ogni scrittura viene forzata su disco
+        """
+        os.makedirs(data_dir, exist_ok=True)
+        self.data_dir = data_dir
+        self.max_segment_size = max_segment_size
+        self.compaction_interval = compaction_interval
+        self.compaction_ratio = compaction_ratio
+        self.fsync = fsync
+        self.lock = threading.RLock()  # protegge indice e segmento attivo
+        self.compaction_lock = threading.Lock()  # una sola compattazione alla volta
+        self.index = {}  # chiave -> (id segmento, offset valore, lunghezza valore, sequenza, metadati o None)
+        self.segments = {}  # id segmento -> Segment
+        self.seq = 0
+        self.next_segment_id = 0
+        self._load()
+        self.active = self._new_segment()
+        self.stopped = threading.Event()
+        threading.Thread(target=self._compaction_loop, daemon=True).start()
+
+    def _new_segment(self):
+        """
+        Crea un nuovo segmento attivo.
+        :return: segmento creato
+        """
+        segment = Segment(self.data_dir, self.next_segment_id)
+        self.next_segment_id += 1
+        segment.open_active()
+        self.segments[segment.segment_id] = segment
+        return segment
+
+    def _load(self):
+        """
+        Ricostruisce l'indice all'avvio: per ogni segmento si usa il file hint se presente, altrimenti si
+        scandisce il file dati (solo l'ultimo segmento attivo, tipicamente) e si scrive il suo hint.
+        A parità di chiave vince il record con numero di sequenza più alto.
+        """
+        ids = sorted(int(name[:-5]) for name in os.listdir(self.data_dir) if name.endswith('.data'))
+        tombstones = set()
+        for segment_id in ids:
+            segment = Segment(self.data_dir, segment_id)
+            self.next_segment_id = segment_id + 1
+            if segment.size == 0:
+                segment.remove()  # segmento attivo rimasto vuoto alla chiusura precedente
+                continue
+            if os.path.exists(segment.hint_path):
+                entries = segment.read_hints()
+            else:
+                entries = segment.scan()
+                segment.write_hints(entries)
+            segment.seal()
+            self.segments[segment_id] = segment
+            for key, seq, offset, value_len, meta in entries:
+                self.seq = max(self.seq, seq)
+                size = record_size(len(key.encode('utf-8')), value_len)
+                current = self.index.get(key)
+                if current is not None and current[3] >= seq:
+                    segment.dead += size
+                    continue
+                if current is not None:
+                    self._mark_dead(key, current)
+                self.index[key] = (segment_id, offset, value_len, seq, meta)
+                if value_len == TOMBSTONE:
+                    tombstones.add(key)
+                else:
+                    tombstones.discard(key)
+        for key in tombstones:
+            self._mark_dead(key, self.index.pop(key))
+        logging.info(f"Loaded {len(self.index)} keys from {len(ids)} segments in {self.data_dir}")
+
+    def _mark_dead(self, key, entry):
+        """
+        Conteggia come non valido il record indicato da entry.
+        :param key: chiave del record
+        :param entry: voce dell'indice del record
+        """
+        segment = self.segments.get(entry[0])
+        if segment is not None:
+            segment.dead += record_size(len(key.encode('utf-8')), entry[2])
+
+    def _append(self, key, value_bytes, meta=None):
+        """
+        Scrive un record nel segmento attivo e aggiorna l'indice. Va chiamato con il lock acquisito.
+        :param key: chiave del record
+        :param value_bytes: valore codificato, None per una cancellazione
+        :param meta: metadati della chiave (byte), None se assenti
+        """
+        key_bytes = key.encode('utf-8')
+        value_len = TOMBSTONE if value_bytes is None else len(value_bytes)
+        self.seq += 1
+        body = struct.pack('>QII', self.seq, len(key_bytes), value_len) + key_bytes + (value_bytes or b'')
+        offset = self.active.append(struct.pack('>I', zlib.crc32(body)) + body, self.fsync)
+        value_offset = offset + HEADER.size + len(key_bytes)
+        self.active.hints.append((key, self.seq, value_offset, value_len, meta))
+
+        current = self.index.get(key)
+        if current is not None:
+            self._mark_dead(key, current)
+        if value_bytes is None:
+            self.active.dead += record_size(len(key_bytes), value_len)
+            self.index.pop(key, None)
+        else:
+            self.index[key] = (self.active.segment_id, value_offset, value_len, self.seq, meta)
+
+        if self.active.size >= self.max_segment_size:
+            self._rotate()
+
+    def _rotate(self):
+        """
+        Chiude il segmento attivo, ne scrive il file hint e ne apre uno nuovo.
+        """
+        sealed = self.active
+        sealed.write_hints(sealed.hints)
+        sealed.hints = []
+        sealed.seal()
+        self.active = self._new_segment()
+
+    def put(self, key, value, meta=None):
+        """
+        Memorizza un valore associato ad una chiave.
+        :param key: chiave del valore da memorizzare
+        :param value: valore da memorizzare (serializzabile in JSON oppure un record [Blob, versione])
+        :param meta: metadati della chiave (byte), restituiti da items_meta
+        """
+        value_bytes = encode_value(value)
+        with self.lock:
+            self._append(key, value_bytes, meta)
+
+    def put_many(self, items):
+        """
+        Memorizza più coppie chiave-valore.
+        :param items: dizionario chiave-valore da memorizzare
+        """
+        encoded = [(key, encode_value(value)) for key, value in items.items()]
+        with self.lock:
+            for key, value_bytes in encoded:
+                self._append(key, value_bytes)
+
+    def get(self, key):
+        """
+        Recupera il valore associato ad una chiave.
+        :param key: chiave del valore da recuperare
+        :return: valore associato alla chiave, None se assente
+        """
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            raw = self.segments[entry[0]].read(entry[1], entry[2])
+        return decode_value(raw)
+
+    def get_many(self, keys):
+        """
+        Recupera i valori associati a più chiavi.
+        :param keys: lista delle chiavi da recuperare
+        :return: dizionario con le sole chiavi presenti
+        """
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def items(self):
+        """
+        Restituisce le coppie chiave-valore memorizzate.
+        :return: generatore di tuple (chiave, valore)
+        """
+        with self.lock:
+            keys = list(self.index)
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                yield key, value
+
+    def items_meta(self):
+        """
+        Restituisce le chiavi memorizzate con i loro metadati, senza leggere i valori.
+        :return: generatore di tuple (chiave, metadati); i metadati sono None per le chiavi scritte senza metadati o
+                 recuperate dalla scansione di un segmento senza file hint (ad esempio dopo un arresto improvviso)
+        """
+        with self.lock:
+            entries = [(key, entry[4]) for key, entry in self.index.items()]
+        yield from entries
+
+    def delete(self, key):
+        """
+        Cancella una chiave scrivendo un record di cancellazione.
+        :param key: chiave da cancellare
+        """
+        with self.lock:
+            if key in self.index:
+                self._append(key, None)
+
+    def compact(self, force=False):
+        """
+        Riscrive i record ancora validi dei segmenti chiusi in un unico segmento e cancella quelli vecchi.
+        La copia avviene fuori dal lock; solo lo scambio finale dell'indice lo richiede.
+        :param force: se True compatta anche sotto la soglia compaction_ratio
+        :return: True se la compattazione è stata eseguita
+        """
+        with self.compaction_lock:
+            with self.lock:
+                sealed = {segment_id: segment for segment_id, segment in self.segments.items() if segment is not self.active}
+                total = sum(segment.size for segment in sealed.values())
+                dead = sum(segment.dead for segment in sealed.values())
+                if not sealed or total == 0 or (not force and dead / total < self.compaction_ratio):
+                    return False
+                live = [(key, entry) for key, entry in self.index.items() if entry[0] in sealed]
+                merged = Segment(self.data_dir, self.next_segment_id)
+                self.next_segment_id += 1
+
+            # Copia dei record validi (i segmenti chiusi sono immutabili)
+            merged.open_active()
+            moved = []
+            for key, entry in live:
+                key_bytes = key.encode('utf-8')
+                value_bytes = sealed[entry[0]].read(entry[1], entry[2])
+                body = struct.pack('>QII', entry[3], len(key_bytes), entry[2]) + key_bytes + value_bytes
+                offset = merged.append(struct.pack('>I', zlib.crc32(body)) + body, False)
+                moved.append((key, entry, (merged.segment_id, offset + HEADER.size + len(key_bytes), entry[2], entry[3],
+                                           entry[4])))
+            if not moved:
+                merged.remove()
+            else:
+                os.fsync(merged.writer.fileno())
+                merged.write_hints([(key, new[3], new[1], new[2], new[4]) for key, _, new in moved])
+                merged.seal()
+
+            with self.lock:
+                for key, old, new in moved:
+                    if self.index.get(key) == old:
+                        self.index[key] = new
+                    else:
+                        merged.dead += record_size(len(key.encode('utf-8')), new[2])
+                if moved:
+                    self.segments[merged.segment_id] = merged
+                for segment_id, segment in sealed.items():
+                    del self.segments[segment_id]
+                    segment.remove()
+            logging.info(f"Compacted {len(sealed)} segments ({total} bytes, {dead} dead) into {merged.size} bytes")
+            return True
+
+    def _compaction_loop(self):
+        """
+        Controlla periodicamente se i segmenti chiusi vanno compattati.
+        """
+        while not self.stopped.wait(self.compaction_interval):
+            try:
+                self.compact()
+            except OSError as e:
+                logging.error(f"Compaction failed in {self.data_dir}: {e}")
+
+    def close(self):
+        """
+        Ferma la compattazione, scrive il file hint del segmento attivo e chiude i file.
+        """
+        self.stopped.set()
+        with self.compaction_lock, self.lock:
+            self.active.write_hints(self.active.hints)
+            for segment in self.segments.values():
+                segment.close()
@@ -0,0 +1,81 @@
+import math
+import random
+import unittest
+
+from expiry import TimingWheel
+
+
+class TimingWheelTest(unittest.TestCase):
+    """
+    Confronta la timing wheel con un riferimento banale (chiave -> tick di scadenza). Ruote piccole (4 posizioni,
+    3 livelli, orizzonte di 64 tick) fanno passare le chiavi per tutti i livelli, per il cascade e per l'overflow.
+    """
+    TICK = 0.5
+
+    def make_wheel(self, now=1000.0):
+        return TimingWheel(tick=self.TICK, slots=4, levels=3, now=now)
+
+    def test_matches_reference(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            now = 1000.0 + rng.random() * 100
+            wheel = self.make_wheel(now)
+            current = int(now / self.TICK)  # ultimo tick elaborato dal riferimento
+            due = {}  # riferimento: chiave -> tick in cui deve scadere
+            for _ in range(2000):
+                op = rng.random()
+                key = f"k{rng.randrange(200)}"
+                if op < 0.5:
+                    expires = now + rng.uniform(-5, 120)  # oltre l'orizzonte finisce in overflow
+                    wheel.schedule(key, expires)
+                    # Una scadenza già passata viene anticipata al primo tick non ancora elaborato
+                    due[key] = max(math.ceil(expires / self.TICK), current + 1)
+                elif op < 0.65:
+                    wheel.cancel(key)
+                    due.pop(key, None)
+                else:
+                    now += rng.uniform(0, 15)
+                    target = int(now / self.TICK)
+                    expired = wheel.advance(now)
+                    self.assertEqual(len(expired), len(set(expired)), f"seed {seed}: duplicate expiry")
+                    expected = {key for key, tick in due.items() if tick <= target}
+                    self.assertEqual(set(expired), expected, f"seed {seed}, tick {target}")
+                    for key in expected:
+                        del due[key]
+                    current = max(current, target)
+                self.assertEqual(len(wheel), len(due))
+
+    def test_overflow_cascades_to_exact_tick(self):
+        wheel = self.make_wheel(now=0)
+        wheel.schedule('far', 100 * self.TICK)  # oltre l'orizzonte di 64 tick
+        for tick in range(1, 100):
+            self.assertEqual(wheel.advance(tick * self.TICK), [], f"expired early at tick {tick}")
+        self.assertEqual(wheel.advance(100 * self.TICK), ['far'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_past_deadline_expires_on_next_tick(self):
+        wheel = self.make_wheel(now=100)
+        wheel.schedule('old', 50)
+        self.assertEqual(wheel.advance(100), [])
+        self.assertEqual(wheel.advance(100 + self.TICK), ['old'])
+
+    def test_reschedule_replaces_deadline(self):
+        wheel = self.make_wheel(now=0)
+        wheel.schedule('k', 2)
+        wheel.schedule('k', 40)
+        self.assertEqual(wheel.advance(39), [])
+        self.assertEqual(wheel.advance(40), ['k'])
+
+    def test_cancel(self):
+        wheel = self.make_wheel(now=0)
+        wheel.schedule('k', 10)
+        wheel.schedule('far', 1000)
+        wheel.cancel('k')
+        wheel.cancel('far')
+        wheel.cancel('missing')
+        self.assertEqual(wheel.advance(2000), [])
+        self.assertEqual(len(wheel), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
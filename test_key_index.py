@@ -0,0 +1,72 @@
+import random
+import unittest
+
+from key_index import SortedKeyIndex
+
+
+def expected_iterate(keys, start=None, after=None):
+    """
+    Riferimento di SortedKeyIndex.iterate su un insieme ordinato.
+    """
+    ordered = sorted(keys)
+    if after is not None and (start is None or after >= start):
+        return [key for key in ordered if key > after]
+    return [key for key in ordered if start is None or key >= start]
+
+
+class SortedKeyIndexTest(unittest.TestCase):
+    """
+    Confronta l'indice con un set ordinato. Blocchi piccoli (load 2 o 3) fanno dividere e svuotare spesso i blocchi.
+    """
+    def test_matches_sorted_set(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            initial = {f"k{rng.randrange(300):03d}" for _ in range(rng.randrange(20))}
+            index = SortedKeyIndex(initial, load=rng.choice((2, 3)))
+            keys = set(initial)
+            for step in range(1500):
+                key = f"k{rng.randrange(300):03d}"
+                if rng.random() < 0.6:
+                    index.add(key)
+                    keys.add(key)
+                else:
+                    index.remove(key)
+                    keys.discard(key)
+                self.assertEqual(len(index), len(keys))
+                if step % 50 == 0:
+                    self.assertEqual(list(index.iterate()), sorted(keys), f"seed {seed}, step {step}")
+                # Limiti presenti o assenti, anche prima della prima e dopo l'ultima chiave
+                start = rng.choice((None, f"k{rng.randrange(-5, 305):03d}", ''))
+                after = rng.choice((None, f"k{rng.randrange(-5, 305):03d}", 'z'))
+                self.assertEqual(list(index.iterate(start, after)), expected_iterate(keys, start, after),
+                                 f"seed {seed}, step {step}, start {start!r}, after {after!r}")
+
+    def test_empty(self):
+        index = SortedKeyIndex()
+        self.assertEqual(list(index.iterate()), [])
+        self.assertEqual(list(index.iterate('a', 'b')), [])
+        index.remove('a')
+        self.assertEqual(len(index), 0)
+
+    def test_add_and_remove_are_idempotent(self):
+        index = SortedKeyIndex(['b', 'a'], load=2)
+        index.add('a')
+        index.remove('c')
+        self.assertEqual(list(index.iterate()), ['a', 'b'])
+        self.assertEqual(len(index), 2)
+
+    def test_pagination_with_after(self):
+        keys = [f"k{i:04d}" for i in range(1000)]
+        index = SortedKeyIndex(reversed(keys), load=7)
+        pages, after = [], None
+        while True:
+            page = [key for _, key in zip(range(33), index.iterate('k0100', after))]
+            if not page:
+                break
+            pages.extend(page)
+            after = page[-1]
+        self.assertEqual(pages, keys[100:])
+
+
+if __name__ == '__main__':
+    unittest.main()
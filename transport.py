@@ -0,0 +1,92 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class NodeTransport:
+    """
+    Classe che gestisce le connessioni HTTP keep-alive verso i nodi, con un pool di connessioni per nodo.
+    """
+    def __init__(self, max_connections_per_node=10, connect_timeout=1.0, read_timeout=5.0):
+        """
+        Inizializza il trasporto con i limiti di connessioni e i timeout per ogni RPC.
+        :param max_connections_per_node: numero massimo di connessioni aperte verso ciascun nodo
+        :param connect_timeout: timeout (in secondi) per stabilire la connessione
+        :param read_timeout: timeout (in secondi) per ricevere la risposta
+        """
+        self.max_connections_per_node = max_connections_per_node
+        self.timeout = (connect_timeout, read_timeout)
+        self.sessions = {}  # dizionario che mappa un nodo alla sua sessione keep-alive
+        self.lock = threading.Lock()  # lock per la creazione delle sessioni
+        self.failures = 0  # numero di richieste fallite per errori di rete o timeout
+
+    def session(self, node):
+        """
+        Restituisce la sessione keep-alive associata al nodo, creandola se non esiste.
+        :param node: coppia indirizzo-porta del nodo
+        :return: sessione requests dedicata al nodo
+        """
+        session = self.sessions.get(node)
+        if session is not None:
+            return session
+        with self.lock:
+            session = self.sessions.get(node)
+            if session is None:
+                session = requests.Session()
+                # pool_block=True fa attendere una connessione libera invece di aprirne di nuove oltre il limite
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections_per_node, pool_block=True)
+                session.mount(f"http://{node}/", adapter)
+                self.sessions[node] = session
+            return session
+
+    def _request(self, method, node, path, **kwargs):
+        """
+        Invia una richiesta al nodo con il timeout di default e conta quelle fallite.
+        :param method: metodo HTTP ("get", "put" o "post")
+        :param node: coppia indirizzo-porta del nodo
+        :param path: percorso dell'endpoint
+        :return: risposta HTTP del nodo
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return getattr(self.session(node), method)(f"http://{node}{path}", **kwargs)
+        except requests.exceptions.RequestException:
+            self.failures += 1
+            raise
+
+    def put(self, node, path, **kwargs):
+        """
+        Invia una richiesta PUT al nodo riutilizzando una connessione del pool.
+        :param node: coppia indirizzo-porta del nodo
+        :param path: percorso dell'endpoint (es. "/put")
+        :return: risposta HTTP del nodo
+        """
+        return self._request('put', node, path, **kwargs)
+
+    def get(self, node, path, **kwargs):
+        """
+        Invia una richiesta GET al nodo riutilizzando una connessione del pool.
+        :param node: coppia indirizzo-porta del nodo
+        :param path: percorso dell'endpoint (es. "/get")
+        :return: risposta HTTP del nodo
+        """
+        return self._request('get', node, path, **kwargs)
+
+    def post(self, node, path, **kwargs):
+        """
+        Invia una richiesta POST al nodo riutilizzando una connessione del pool.
+        :param node: coppia indirizzo-porta del nodo
+        :param path: percorso dell'endpoint
+        :return: risposta HTTP del nodo
+        """
+        return self._request('post', node, path, **kwargs)
+
+    def close(self):
+        """
+        Chiude tutte le sessioni aperte.
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
@@ -0,0 +1,40 @@
+import threading
+import time
+
+LOGICAL_BITS = 16  # bit riservati al contatore logico
+
+
+class HybridLogicalClock:
+    """
+    Hybrid logical clock usato dal coordinatore per assegnare una versione a ogni scrittura.
+    La versione è un intero che combina il tempo fisico in millisecondi (bit alti) e un contatore logico
+    (bit bassi): è sempre crescente anche se l'orologio di sistema torna indietro.
+    """
+    def __init__(self, clock=None):
+        """
+        Inizializza l'orologio.
+        :param clock: funzione che restituisce il tempo fisico in secondi (default: time.time), sostituibile con un
+                      orologio virtuale nelle simulazioni
+        """
+        self.clock = clock or time.time
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def now(self):
+        """
+        Restituisce una nuova versione, strettamente maggiore di tutte quelle già emesse o osservate.
+        :return: versione come intero
+        """
+        physical = int(self.clock() * 1000) << LOGICAL_BITS
+        with self.lock:
+            self.last = physical if physical > self.last else self.last + 1
+            return self.last
+
+    def observe(self, version):
+        """
+        Fa avanzare l'orologio oltre una versione ricevuta da un altro componente.
+        :param version: versione osservata
+        """
+        with self.lock:
+            if version > self.last:
+                self.last = version
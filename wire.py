@@ -0,0 +1,446 @@
+import itertools
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from blob import json_default
+
+# Ogni frame è composto da un header (lunghezza del corpo, id della richiesta, codice) seguito dal corpo.
+# Nelle richieste il codice è l'opcode, nelle risposte è lo stato.
+FRAME = struct.Struct('>IIB')
+U32 = struct.Struct('>I')
+U64 = struct.Struct('>Q')
+
+# Opcode delle richieste
+OP_GET = 1  # chiave -> versione, valore
+OP_DIGEST = 2  # chiave -> versione
+OP_PUT = 3  # chiave, versione, valore -> applicato
+OP_MGET = 4  # chiavi, chiavi di cui leggere solo la versione -> record
+OP_MPUT = 5  # record -> nessun corpo
+OPCODE_NAMES = {OP_GET: 'get', OP_DIGEST: 'digest', OP_PUT: 'put', OP_MGET: 'mget', OP_MPUT: 'mput'}
+
+# Stati delle risposte
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_ERROR = 2
+
+
+class WireError(Exception):
+    """
+    Errore di comunicazione con un nodo tramite il protocollo binario.
+    """
+
+
+def pack_str(text):
+    """
+    Codifica una stringa come lunghezza (4 byte) seguita dai byte UTF-8.
+    :param text: stringa da codificare
+    :return: byte codificati
+    """
+    data = text.encode('utf-8')
+    return U32.pack(len(data)) + data
+
+
+def pack_value(value):
+    """
+    Codifica un valore come lunghezza (4 byte) seguita dal suo JSON compatto.
+    :param value: valore serializzabile in JSON
+    :return: byte codificati
+    """
+    return pack_str(json.dumps(value, separators=(',', ':'), default=json_default))
+
+
+class Reader:
+    """
+    Legge in sequenza i campi del corpo di un frame.
+    """
+    def __init__(self, data):
+        """
+        :param data: corpo del frame
+        """
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def u8(self):
+        """
+        :return: intero senza segno di 1 byte
+        """
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def u32(self):
+        """
+        :return: intero senza segno di 4 byte
+        """
+        value, = U32.unpack_from(self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def u64(self):
+        """
+        :return: intero senza segno di 8 byte
+        """
+        value, = U64.unpack_from(self.data, self.pos)
+        self.pos += 8
+        return value
+
+    def text(self):
+        """
+        :return: stringa codificata con pack_str
+        """
+        size = self.u32()
+        value = bytes(self.data[self.pos:self.pos + size]).decode('utf-8')
+        self.pos += size
+        return value
+
+    def value(self):
+        """
+        :return: valore codificato con pack_value
+        """
+        return json.loads(self.text())
+
+
+def read_frame(rfile):
+    """
+    Legge un frame completo da uno stream.
+    :param rfile: file binario associato al socket
+    :return: tupla (id della richiesta, codice, corpo), None se la connessione è stata chiusa
+    """
+    header = rfile.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None
+    size, request_id, code = FRAME.unpack(header)
+    body = rfile.read(size)
+    if len(body) < size:
+        return None
+    return request_id, code, body
+
+
+class WireServer:
+    """
+    Listener del protocollo binario di un nodo. Ogni connessione TCP persistente ha un thread che legge i frame;
+    le richieste vengono eseguite da un pool di thread e le risposte, con l'id della richiesta, vengono inviate
+    appena pronte, anche fuori ordine.
+    """
+    def __init__(self, node, host, port, workers=8):
+        """
+        Inizializza il listener.
+        :param node: istanza di Node che esegue le operazioni
+        :param host: indirizzo su cui ascoltare
+        :param port: porta su cui ascoltare
+        :param workers: numero di thread che eseguono le richieste
+        """
+        self.node = node
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wire')
+
+    def handle(self, opcode, body):
+        """
+        Esegue una richiesta sul nodo.
+        :param opcode: opcode della richiesta
+        :param body: corpo della richiesta
+        :return: tupla (stato, corpo della risposta)
+        """
+        began = time.perf_counter()
+        if self.node.inject_latency > 0:
+            time.sleep(self.node.inject_latency)
+        try:
+            return self._handle(opcode, body)
+        finally:
+            self.node.metrics.observe(f"wire.{OPCODE_NAMES.get(opcode, 'unknown')}", time.perf_counter() - began)
+
+    def _handle(self, opcode, body):
+        """
+        Decodifica ed esegue una richiesta sul nodo.
+        :param opcode: opcode della richiesta
+        :param body: corpo della richiesta
+        :return: tupla (stato, corpo della risposta)
+        """
+        reader = Reader(body)
+        if opcode in (OP_GET, OP_DIGEST):
+            record = self.node.retrieve_versioned(reader.text())
+            if record is None:
+                return STATUS_NOT_FOUND, b''
+            if opcode == OP_DIGEST:
+                return STATUS_OK, U64.pack(record[1])
+            return STATUS_OK, U64.pack(record[1]) + pack_value(record[0])
+        if opcode == OP_PUT:
+            key, version, value = reader.text(), reader.u64(), reader.value()
+            return STATUS_OK, bytes([self.node.store(key, value, version)])
+        if opcode == OP_MGET:
+            keys = [reader.text() for _ in range(reader.u32())]
+            digest_keys = [reader.text() for _ in range(reader.u32())]
+            records = self.node.retrieve_many(keys + digest_keys)
+            digest = set(digest_keys) - set(keys)
+            parts = [U32.pack(len(records))]
+            for key, (value, version) in records.items():
+                parts.append(pack_str(key) + U64.pack(version))
+                parts.append(b'\0' if key in digest else b'\1' + pack_value(value))
+            return STATUS_OK, b''.join(parts)
+        if opcode == OP_MPUT:
+            items, versions = {}, {}
+            for _ in range(reader.u32()):
+                key = reader.text()
+                versions[key] = reader.u64()
+                items[key] = reader.value()
+            self.node.store_many(items, versions)
+            return STATUS_OK, b''
+        return STATUS_ERROR, f"unknown opcode {opcode}".encode('utf-8')
+
+    def serve_connection(self, sock):
+        """
+        Serve una connessione finché il client non la chiude.
+        :param sock: socket della connessione
+        """
+        send_lock = threading.Lock()
+
+        def respond(request_id, opcode, body):
+            try:
+                status, payload = self.handle(opcode, body)
+            except Exception as e:
+                status, payload = STATUS_ERROR, str(e).encode('utf-8')
+            try:
+                with send_lock:
+                    sock.sendall(FRAME.pack(len(payload), request_id, status) + payload)
+            except OSError:
+                pass  # il client ha chiuso la connessione
+
+        with sock, sock.makefile('rb') as rfile:
+            while True:
+                frame = read_frame(rfile)
+                if frame is None:
+                    break
+                self.executor.submit(respond, *frame)
+
+    def serve_forever(self):
+        """
+        Accetta le connessioni e avvia un thread per ciascuna.
+        """
+        server = socket.create_server((self.host, self.port))
+        logging.info(f"Wire protocol listening on {self.host}:{self.port}")
+        while True:
+            sock, _ = server.accept()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.serve_connection, args=(sock,), daemon=True).start()
+
+
+class WireConnection:
+    """
+    Connessione TCP persistente verso un nodo. Più thread possono inviare richieste contemporaneamente senza
+    attendere le risposte precedenti; un thread dedicato legge le risposte e le associa alle richieste tramite id.
+    """
+    def __init__(self, host, port, connect_timeout=1.0):
+        """
+        Apre la connessione.
+        :param host: indirizzo del nodo
+        :param port: porta del protocollo binario del nodo
+        :param connect_timeout: timeout (in secondi) per stabilire la connessione
+        """
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.ids = itertools.count(1)
+        self.pending = {}  # id della richiesta -> Future della risposta
+        self.lock = threading.Lock()  # protegge pending e l'invio dei frame
+        self.closed = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def request(self, opcode, body):
+        """
+        Invia una richiesta senza attendere la risposta.
+        :param opcode: opcode della richiesta
+        :param body: corpo della richiesta
+        :return: tupla (id della richiesta, Future che riceve la tupla (stato, corpo))
+        """
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise WireError("connection closed")
+            request_id = next(self.ids) & 0xFFFFFFFF
+            self.pending[request_id] = future
+            try:
+                self.sock.sendall(FRAME.pack(len(body), request_id, opcode) + body)
+            except OSError as e:
+                self.pending.pop(request_id, None)
+                raise WireError(str(e))
+        return request_id, future
+
+    def cancel(self, request_id):
+        """
+        Dimentica una richiesta la cui risposta non è più attesa.
+        :param request_id: id della richiesta
+        """
+        with self.lock:
+            self.pending.pop(request_id, None)
+
+    def _read_loop(self):
+        """
+        Legge le risposte e completa le richieste corrispondenti. Alla chiusura della connessione tutte le
+        richieste in attesa falliscono.
+        """
+        try:
+            with self.sock.makefile('rb') as rfile:
+                while True:
+                    frame = read_frame(rfile)
+                    if frame is None:
+                        break
+                    request_id, status, body = frame
+                    with self.lock:
+                        future = self.pending.pop(request_id, None)
+                    if future is not None:
+                        future.set_result((status, body))
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.closed = True
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_exception(WireError("connection closed"))
+
+    def close(self):
+        """
+        Chiude la connessione.
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class WireTransport:
+    """
+    Client del protocollo binario verso i nodi, con poche connessioni persistenti per nodo condivise da tutti
+    i thread del coordinatore. Il listener di un nodo è sulla porta HTTP del nodo più port_offset.
+    """
+    def __init__(self, port_offset, connections_per_node=2, connect_timeout=1.0, timeout=5.0):
+        """
+        Inizializza il trasporto binario.
+        :param port_offset: differenza tra la porta binaria e la porta HTTP di ogni nodo
+        :param connections_per_node: numero di connessioni persistenti verso ciascun nodo
+        :param connect_timeout: timeout (in secondi) per stabilire una connessione
+        :param timeout: timeout (in secondi) di ogni richiesta
+        """
+        self.port_offset = port_offset
+        self.connections_per_node = connections_per_node
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.connections = {}  # nodo -> lista di connessioni
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def connection(self, node):
+        """
+        Restituisce una connessione verso il nodo, scelta a rotazione; le connessioni chiuse vengono riaperte.
+        :param node: coppia indirizzo-porta HTTP del nodo
+        :return: istanza di WireConnection
+        """
+        index = next(self.counter) % self.connections_per_node
+        connections = self.connections.get(node)
+        if connections is not None and connections[index] is not None and not connections[index].closed:
+            return connections[index]
+        with self.lock:
+            connections = self.connections.setdefault(node, [None] * self.connections_per_node)
+            if connections[index] is None or connections[index].closed:
+                host, port = node.rsplit(':', 1)
+                try:
+                    connections[index] = WireConnection(host, int(port) + self.port_offset, self.connect_timeout)
+                except OSError as e:
+                    raise WireError(f"cannot connect to {node}: {e}")
+            return connections[index]
+
+    def call(self, node, opcode, body):
+        """
+        Invia una richiesta al nodo e ne attende la risposta.
+        :param node: coppia indirizzo-porta HTTP del nodo
+        :param opcode: opcode della richiesta
+        :param body: corpo della richiesta
+        :return: tupla (stato, corpo della risposta)
+        """
+        connection = self.connection(node)
+        request_id, future = connection.request(opcode, body)
+        try:
+            status, payload = future.result(self.timeout)
+        except FutureTimeoutError:
+            connection.cancel(request_id)
+            raise WireError(f"request to {node} timed out")
+        if status == STATUS_ERROR:
+            raise WireError(bytes(payload).decode('utf-8'))
+        return status, payload
+
+    def get(self, node, key, digest=False):
+        """
+        Legge una chiave dal nodo.
+        :param node: coppia indirizzo-porta HTTP del nodo
+        :param key: chiave da leggere
+        :param digest: se True legge solo la versione
+        :return: tupla (valore, versione), None se il nodo non ha la chiave
+        """
+        status, payload = self.call(node, OP_DIGEST if digest else OP_GET, pack_str(key))
+        if status == STATUS_NOT_FOUND:
+            return None
+        reader = Reader(payload)
+        version = reader.u64()
+        return (None if digest else reader.value()), version
+
+    def put(self, node, key, value, version):
+        """
+        Scrive una chiave sul nodo.
+        :param node: coppia indirizzo-porta HTTP del nodo
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param version: versione del valore
+        :return: True se il nodo ha applicato la scrittura
+        """
+        _, payload = self.call(node, OP_PUT, pack_str(key) + U64.pack(version) + pack_value(value))
+        return bool(payload[0])
+
+    def mget(self, node, keys, digest_keys=()):
+        """
+        Legge più chiavi dal nodo con una sola richiesta.
+        :param node: coppia indirizzo-porta HTTP del nodo
+        :param keys: chiavi da leggere per intero
+        :param digest_keys: chiavi di cui leggere solo la versione
+        :return: tupla (chiave -> valore, chiave -> versione) con le chiavi presenti nel nodo
+        """
+        body = [U32.pack(len(keys))] + [pack_str(key) for key in keys]
+        body += [U32.pack(len(digest_keys))] + [pack_str(key) for key in digest_keys]
+        _, payload = self.call(node, OP_MGET, b''.join(body))
+        reader = Reader(payload)
+        values, versions = {}, {}
+        for _ in range(reader.u32()):
+            key = reader.text()
+            versions[key] = reader.u64()
+            if reader.u8():
+                values[key] = reader.value()
+        return values, versions
+
+    def mput(self, node, items, versions=None):
+        """
+        Scrive più chiavi sul nodo con una sola richiesta.
+        :param node: coppia indirizzo-porta HTTP del nodo
+        :param items: dizionario chiave-valore da scrivere
+        :param versions: dizionario chiave-versione (le chiavi assenti hanno versione 0)
+        """
+        versions = versions or {}
+        body = [U32.pack(len(items))]
+        body += [pack_str(key) + U64.pack(versions.get(key, 0)) + pack_value(value) for key, value in items.items()]
+        self.call(node, OP_MPUT, b''.join(body))
+
+    def close(self):
+        """
+        Chiude tutte le connessioni aperte.
+        """
+        with self.lock:
+            for connections in self.connections.values():
+                for connection in connections:
+                    if connection is not None:
+                        connection.close()
+            self.connections.clear()
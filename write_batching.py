@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Metrics
+
+
+def merge_batch(batch):
+    """
+    Unisce le scritture di un blocco in un'unica richiesta bulk; se la stessa chiave compare più volte
+    viene inviata la versione più recente (a parità di versione l'ultima accodata).
+    :param batch: lista di tuple (chiave, valore, versione, future)
+    :return: tupla (dizionario chiave-valore, dizionario chiave-versione)
+    """
+    items, versions = {}, {}
+    for key, value, version, _ in batch:
+        if key not in versions or version >= versions[key]:
+            items[key] = value
+            versions[key] = version
+    return items, versions
+
+
+class WriteBatcher:
+    """
+    Raggruppa le scritture dirette allo stesso nodo (group commit): le scritture vengono accodate per nodo e un thread
+    dedicato le invia con una sola richiesta bulk quando il blocco raggiunge max_batch scritture oppure quando la
+    più vecchia attende da max_delay secondi. Ogni scrittura ha il proprio Future, così il quorum resta per chiave.
+    """
+    def __init__(self, write_many, executor, max_batch=64, max_delay=0.0005, max_in_flight=4, metrics=None):
+        """
+        Inizializza il batcher.
+        :param write_many: funzione (nodo, items, versions) -> bool che invia una scrittura bulk
+        :param executor: executor su cui vengono inviati i blocchi
+        :param max_batch: numero massimo di scritture per richiesta
+        :param max_delay: attesa massima (in secondi) di una scrittura prima dell'invio del blocco
+        :param max_in_flight: numero massimo di blocchi in corso verso lo stesso nodo
+        :param metrics: registro in cui contare i blocchi inviati e misurare l'attesa in coda
+        """
+        self.write_many = write_many
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_in_flight = max_in_flight
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.queues = {}  # nodo -> (lista di scritture in attesa, condition, semaforo dei blocchi in corso)
+        self.lock = threading.Lock()
+
+    def _queue(self, node):
+        """
+        Restituisce la coda del nodo, creandola e avviando il suo thread alla prima scrittura.
+        :param node: coppia indirizzo-porta del nodo
+        :return: tupla (lista di scritture in attesa, condition, semaforo dei blocchi in corso)
+        """
+        with self.lock:
+            entry = self.queues.get(node)
+            if entry is None:
+                entry = self.queues[node] = ([], threading.Condition(), threading.Semaphore(self.max_in_flight))
+                threading.Thread(target=self._flusher, args=(node, entry), daemon=True,
+                                 name=f"write-batch-{node}").start()
+            return entry
+
+    def submit(self, node, key, value, version=0):
+        """
+        Accoda la scrittura di una chiave su un nodo.
+        :param node: coppia indirizzo-porta del nodo
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param version: versione del valore
+        :return: Future che vale True se la scrittura ha avuto successo, False altrimenti
+        """
+        pending, condition, _ = self._queue(node)
+        future = Future()
+        with condition:
+            pending.append((key, value, version, future, time.monotonic()))
+            # Il thread va svegliato solo quando inizia un nuovo blocco o quando il blocco è pieno
+            if len(pending) == 1 or len(pending) >= self.max_batch:
+                condition.notify()
+        return future
+
+    def _flusher(self, node, entry):
+        """
+        Attende che un blocco sia pieno o scaduto e lo invia sull'executor.
+        :param node: coppia indirizzo-porta del nodo
+        :param entry: coda del nodo
+        """
+        pending, condition, in_flight = entry
+        while True:
+            with condition:
+                while not pending:
+                    condition.wait()
+                deadline = pending[0][4] + self.max_delay
+                while len(pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    condition.wait(remaining)
+                batch = pending[:self.max_batch]
+                del pending[:self.max_batch]
+            # Con max_in_flight blocchi già in corso le nuove scritture continuano ad accumularsi nella coda
+            in_flight.acquire()
+            now = time.monotonic()
+            self.metrics.observe('write_batch.wait', now - batch[0][4])
+            self.executor.submit(self._flush, node, [write[:4] for write in batch], in_flight)
+
+    def _flush(self, node, batch, in_flight):
+        """
+        Invia un blocco di scritture e completa i Future dei chiamanti.
+        :param node: coppia indirizzo-porta del nodo
+        :param batch: lista di tuple (chiave, valore, versione, future)
+        :param in_flight: semaforo dei blocchi in corso verso il nodo
+        """
+        ok = False
+        try:
+            items, versions = merge_batch(batch)
+            ok = self.write_many(node, items, versions)
+        except Exception as e:
+            logging.error(f"Failed to flush {len(batch)} writes to node {node}: {e}")
+        finally:
+            in_flight.release()
+            self.metrics.incr('write_batch.flushes')
+            self.metrics.incr('write_batch.writes', len(batch))
+            for _, _, _, future in batch:
+                future.set_result(ok)
+
+
+class AsyncWriteBatcher:
+    """
+    Versione per l'event loop di WriteBatcher: le scritture vengono accodate per nodo e inviate con una sola
+    richiesta bulk quando il blocco è pieno oppure allo scadere di un timer di max_delay secondi.
+    """
+    def __init__(self, write_many, max_batch=64, max_delay=0.0005, metrics=None):
+        """
+        Inizializza il batcher.
+        :param write_many: coroutine (nodo, items, versions) -> bool che invia una scrittura bulk
+        :param max_batch: numero massimo di scritture per richiesta
+        :param max_delay: attesa massima (in secondi) di una scrittura prima dell'invio del blocco
+        :param metrics: registro in cui contare i blocchi inviati
+        """
+        self.write_many = write_many
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pending = {}  # nodo -> lista di scritture in attesa
+        self.timers = {}  # nodo -> timer che invia il blocco corrente
+        self.background = set()  # blocchi in corso
+
+    async def write(self, node, key, value, version=0):
+        """
+        Accoda la scrittura di una chiave su un nodo e ne attende l'esito.
+        :param node: coppia indirizzo-porta del nodo
+        :param key: chiave da scrivere
+        :param value: valore da scrivere
+        :param version: versione del valore
+        :return: True se la scrittura ha avuto successo, False altrimenti
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self.pending.setdefault(node, [])
+        pending.append((key, value, version, future))
+        if len(pending) >= self.max_batch:
+            self._flush(node)
+        elif len(pending) == 1:
+            self.timers[node] = loop.call_later(self.max_delay, self._flush, node)
+        return await future
+
+    def _flush(self, node):
+        """
+        Toglie dalla coda il blocco corrente del nodo e lo invia in un task.
+        :param node: coppia indirizzo-porta del nodo
+        """
+        timer = self.timers.pop(node, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(node, [])
+        if batch:
+            task = asyncio.ensure_future(self._send(node, batch))
+            self.background.add(task)
+            task.add_done_callback(self.background.discard)
+
+    async def _send(self, node, batch):
+        """
+        Invia un blocco di scritture e completa i Future dei chiamanti.
+        :param node: coppia indirizzo-porta del nodo
+        :param batch: lista di tuple (chiave, valore, versione, future)
+        """
+        ok = False
+        try:
+            items, versions = merge_batch(batch)
+            ok = await self.write_many(node, items, versions)
+        except Exception as e:
+            logging.error(f"Failed to flush {len(batch)} writes to node {node}: {e}")
+        finally:
+            self.metrics.incr('write_batch.flushes')
+            self.metrics.incr('write_batch.writes', len(batch))
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_result(ok)
+
+    async def close(self):
+        """
+        Invia i blocchi ancora in coda e attende quelli in corso.
+        """
+        for node in list(self.pending):
+            self._flush(node)
+        if self.background:
+            await asyncio.gather(*self.background, return_exceptions=True)